@@ -0,0 +1,138 @@
+"""
+Асинхронный доступ к базе данных для сервисов на asyncio
+
+Запросы выполняются в отдельном пуле потоков, у каждого запроса свое соединение из пула.
+В режиме WAL (его включает db.init_db) читатели работают параллельно и не мешают записи.
+Отмена задачи или истечение таймаута прерывают выполняющийся запрос SQLite (Connection.interrupt),
+после чего соединение возвращается в пул.
+
+    async with adb.AsyncDB(pool_size=4, timeout=5) as store:
+        orders = await store.get_orders(customer="иван", limit=50)
+        async for rows in store.iter_query("SELECT * FROM order_items"):
+            ...
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import db
+
+# Размер пула соединений и потоков по умолчанию
+POOL_SIZE = 4
+
+
+class AsyncDB:
+    """Асинхронный фасад над db.py с пулом соединений к базе db.DB_NAME"""
+
+    def __init__(self, pool_size=POOL_SIZE, timeout=None):
+        self.timeout = timeout # Таймаут запроса по умолчанию в секундах (None - без ограничения)
+        self.executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="adb")
+        # Соединения переходят между потоками пула, но в каждый момент используются одним запросом
+        self.connections = [db.get_connection(check_same_thread=False) for _ in range(pool_size)]
+        self.pool = asyncio.Queue()
+        for conn in self.connections:
+            self.pool.put_nowait(conn)
+        self.running = {} # соединение -> последний запущенный на нем запрос
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        """Дожидается выполняющихся запросов и закрывает соединения"""
+        await asyncio.get_running_loop().run_in_executor(None, self.executor.shutdown)
+        for conn in self.connections:
+            conn.close()
+
+    async def run(self, func, *args, timeout=None):
+        """
+        Выполняет func(conn, *args) в пуле потоков на свободном соединении и возвращает результат.
+        При отмене или таймауте (asyncio.TimeoutError) выполняющийся запрос прерывается.
+        """
+        conn = await self.pool.get() # Ждем свободное соединение: так ограничивается число одновременных запросов
+        return await self._call(conn, func, args, timeout, release=True)
+
+    async def _call(self, conn, func, args, timeout, release=False):
+        timeout = self.timeout if timeout is None else timeout
+        future = self.running[conn] = asyncio.get_running_loop().run_in_executor(self.executor, func, conn, *args)
+        if release:
+            # Соединение возвращается в пул только после того, как поток действительно закончил работу с ним
+            future.add_done_callback(lambda _: self.pool.put_nowait(conn))
+        try:
+            # shield: при отмене ожидания сам запрос не бросаем, а прерываем через interrupt
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        except (asyncio.CancelledError, asyncio.TimeoutError):
+            conn.interrupt() # Запрос завершится ошибкой "interrupted" в своем потоке
+            future.add_done_callback(_consume_exception)
+            raise
+
+    async def fetch(self, query, params=(), timeout=None):
+        """Выполняет SELECT запрос и возвращает все строки"""
+        return await self.run(_fetch, query, tuple(params), timeout=timeout)
+
+    async def execute(self, query, params=(), timeout=None):
+        """Выполняет изменяющий запрос в отдельной транзакции, возвращает lastrowid"""
+        return await self.run(_execute, query, tuple(params), timeout=timeout)
+
+    async def iter_query(self, query, params=(), chunk_size=db.IMPORT_BATCH_SIZE, timeout=None):
+        """Асинхронно выдает результаты запроса списками по chunk_size строк; timeout - на каждую пачку"""
+        conn = await self.pool.get() # Соединение занято до конца чтения, чтобы курсор не делил его с другими
+        cursor = None
+        try:
+            cursor = await self._call(conn, lambda conn: conn.execute(query, tuple(params)), (), timeout)
+            while True:
+                rows = await self._call(conn, lambda conn: cursor.fetchmany(chunk_size), (), timeout)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            # Если чтение пачки прервано, курсор можно закрыть только после того, как поток закончит с ним
+            running = self.running.get(conn)
+            if running is not None and not running.done():
+                await asyncio.wait([running])
+            if cursor is not None:
+                cursor.close()
+            self.pool.put_nowait(conn)
+
+    async def get_customers(self, name="", phone="", email="", limit=None, offset=0, timeout=None):
+        """Клиенты с фильтрами, как db.find_customers, с постраничной выборкой"""
+        return await self._fetch_query(db.customers_query(name, phone, email), limit, offset, timeout)
+
+    async def get_products(self, name="", price_min=None, price_max=None, limit=None, offset=0, timeout=None):
+        """Товары с фильтрами, как db.find_products"""
+        return await self._fetch_query(db.products_query(name, price_min, price_max), limit, offset, timeout)
+
+    async def get_orders(self, customer="", product="", date_min="", date_max="", limit=None, offset=0,
+                         timeout=None):
+        """Заказы с фильтрами в виде строк db.get_all_orders"""
+        def fetch(conn):
+            # Запрос строится в потоке пула: выбор источников обращается к базе через то же соединение
+            query = db.orders_query(customer, product, date_min, date_max, conn=conn)
+            if limit is not None:
+                query.limit(limit, offset)
+            return _fetch(conn, *query.build())
+        return await self.run(fetch, timeout=timeout)
+
+    async def get_order(self, order_id, timeout=None):
+        """Заказ с позициями (объект Order) или None"""
+        return await self.run(db.read_order, order_id, timeout=timeout)
+
+    async def _fetch_query(self, query, limit, offset, timeout):
+        if limit is not None:
+            query.limit(limit, offset)
+        return await self.fetch(*query.build(), timeout=timeout)
+
+
+def _fetch(conn, query, params):
+    return conn.execute(query, params).fetchall()
+
+
+def _execute(conn, query, params):
+    with conn:
+        return conn.execute(query, params).lastrowid
+
+
+def _consume_exception(future):
+    # Ошибку прерванного запроса уже некому получить; забираем ее, чтобы asyncio не писал о ней в лог
+    if not future.cancelled():
+        future.exception()
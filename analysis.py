@@ -3,27 +3,125 @@
 Использует matplotlib для создания графиков
 """
 import matplotlib.pyplot as plt # Библиотека для построения графиков
+import matplotlib.dates as mdates
+from matplotlib.figure import Figure
 import db
+import memprof
+import topk
 from datetime import datetime # Модуль для работы с датами и временем
 
+# Сколько товаров в топе, за сколько дней строится динамика заказов и за сколько месяцев - выручка
+TOP_LIMIT = 10
+DYNAMICS_DAYS = 30
+REVENUE_MONTHS = 12
 
+# Подписи товаров длиннее стольких символов на графике сокращаются
+LABEL_CHARS = 20
 
-def generate_sales_report():
+# Номер дня из базы (db.to_day) плюс это смещение - дата matplotlib (при эпохе по умолчанию смещение 0)
+DAY_OFFSET = mdates.date2num(datetime(1970, 1, 1))
+
+# Начало имени файла отчета (дальше - дата и время создания)
+FILE_PREFIXES = {"top_products": "top_товаров", "orders_dynamics": "динамика_заказов", "revenue": "выручка"}
+
+
+def top_products(limit=10):
     """
-    Генерирует отчет по топу товаров по количеству заказов
-    Возвращает имя файла с отчетом
+    Возвращает топ товаров по количеству заказов: список (название, количество заказов)
     """
-    # Получаем данные из БД
     # Получаем количество заказов по каждому товару и сортируем по убыванию количества
-    query = """
-    SELECT products.name, COUNT(orders.id) as order_count
-    FROM orders
+    # Группировка идет по индексу позиций заказа idx_order_items_product
+    # Удаленные заказы и заказы удаленных клиентов не учитываются
+    # (позиции с полями заказа - под псевдонимом orders, как в условии ACTIVE_ORDERS)
+    query = f"""
+    SELECT products.name, COUNT(orders.order_id) as order_count
+    FROM {{order_lines}} AS orders
     JOIN products ON products.id = orders.product_id
-    GROUP BY products.name
+    WHERE {db.ACTIVE_ORDERS}
+    GROUP BY orders.product_id
     ORDER BY order_count DESC
-    LIMIT 10
+    LIMIT ?
+    """
+    return db.fetch_query(db.with_archive(query), (limit,)) # Топ за все время - вместе с архивом
+
+
+def orders_by_day(days=30):
+    """
+    Возвращает число заказов по дням за последние days дней: список (номер дня, количество).
+    Номер дня - как в базе (db.to_day); строкой ГГГГ-ММ-ДД его делает db.day_text
+    """
+    # Выборка по дате идет по частичному индексу idx_orders_date (только неудаленные заказы).
+    # Первый день периода вычисляется отдельно: по нему решается, нужен ли архив
+    date_min = db.fetch_query("SELECT date('now', ?)", (f"-{int(days)} days",))[0][0]
+    query = f"""
+    SELECT date, COUNT(id) as order_count
+    FROM {{orders}} AS orders
+    WHERE {db.ACTIVE_ORDERS} AND date >= ?
+    GROUP BY date
+    ORDER BY date
+    """
+    return db.fetch_query(db.with_archive(query, date_min), (db.to_day(date_min),))
+
+
+def revenue_by_month(months=12):
+    """
+    Выручка по месяцам за последние months месяцев (включая текущий):
+    список (месяц 'ГГГГ-ММ', выручка по ценам продажи, выручка по ценам прайса на дату заказа).
+    Разница между ними - скидки и цены, измененные в заказах вручную
+    """
+    # Цена прайса на дату заказа - поиск по ключу истории цен для каждой позиции (db.PRICE_AT_ORDER_DATE).
+    # Позиции без истории (товар удален окончательно) считаются по цене продажи
+    date_min = db.fetch_query("SELECT date('now', 'start of month', ?)", (f"-{int(months) - 1} months",))[0][0]
+    list_price = db.PRICE_AT_ORDER_DATE.format(product="orders.product_id")
+    query = f"""
+    SELECT strftime('%Y-%m', {db.day_sql('orders.date')}) AS month,
+           ROUND(SUM(orders.quantity * orders.unit_price), 2) AS revenue,
+           ROUND(SUM(orders.quantity * COALESCE({list_price}, orders.unit_price)), 2) AS list_revenue
+    FROM {{order_lines}} AS orders
+    WHERE {db.ACTIVE_ORDERS} AND orders.date >= ?
+    GROUP BY month
+    ORDER BY month
+    """
+    return db.fetch_query(db.with_archive(query, date_min), (db.to_day(date_min),))
+
+
+def report_data(kind):
+    """
+    Данные отчета kind ("top_products", "orders_dynamics" или "revenue") для графика.
+    Если включены счетчики популярности (topk.py), топ товаров берется из них, и в каждой строке
+    третьим элементом указано возможное завышение числа заказов.
+    """
+    if kind == "top_products":
+        estimate = topk.top_products(TOP_LIMIT)
+        return estimate if estimate is not None else top_products(TOP_LIMIT)
+    if kind == "orders_dynamics":
+        return orders_by_day(DYNAMICS_DAYS)
+    if kind == "revenue":
+        return revenue_by_month(REVENUE_MONTHS)
+    raise ValueError(f"Неизвестный тип отчета: {kind}")
+
+
+def accuracy_note(data):
+    """Подпись о точности топа товаров по счетчикам ('' для точных данных)"""
+    if not data or len(data[0]) < 3:
+        return ""
+    bound = topk.error_bound(data)
+    return f"Оценка по счетчикам: завышение не больше {bound}" if bound else "По счетчикам: значения точные"
+
+
+def report_filename(kind):
+    """Имя PNG-файла для отчета kind с текущими датой и временем"""
+    return f"{FILE_PREFIXES[kind]}_{datetime.now().strftime('%Y%m%d_%H%M')}.png"
+
+
+@memprof.profiled()
+def generate_sales_report():
+    """
+    Генерирует отчет по топу товаров по количеству заказов
+    Возвращает имя файла с отчетом
     """
-    data = db.fetch_query(query)
+    # Получаем данные из БД (или из счетчиков популярности, если они включены)
+    data = report_data("top_products")
 
     if not data:
         return "Нет данных для отчета"
@@ -34,62 +132,181 @@ def generate_sales_report():
     order_counts = [item[1] for item in data]  # Список количеств заказов
 
     # Создание графика
-    plt.figure(figsize=(12, 6)) # Устанавливаем размер графика (ширина x высота)
-    # Строим гистограмму
-    plt.bar(product_names, order_counts, color='skyblue')  # Отображаем столбцы товаров разного цвета
-    plt.title('Топ 10 товаров по количеству заказов', fontsize=14) # Заголовок графика
-    plt.xlabel('Товар', fontsize=12) # Надпись на оси X
-    plt.ylabel('Количество заказов', fontsize=12) # Надпись на оси Y
-    plt.xticks(rotation=45, ha='right', fontsize=10)  # Наклон меток на оси X для удобства чтения
-    plt.tight_layout()  # Автоматически настраивает расположение элементов графика
-
-    # Генерация имени файла с указанием текущего времени
-    filename = f"top_товаров_{datetime.now().strftime('%Y%m%d_%H%M')}.png"
-    plt.savefig(filename) # Сохраняем график в PNG-файл
-    plt.close() # Очищаем графику для последующих построений
+    fig = plt.figure(figsize=(12, 6)) # Устанавливаем размер графика (ширина x высота)
+    try:
+        # Строим гистограмму
+        plt.bar(product_names, order_counts, color='skyblue')  # Отображаем столбцы товаров разного цвета
+        plt.title('Топ 10 товаров по количеству заказов', fontsize=14) # Заголовок графика
+        plt.figtext(0.99, 0.01, accuracy_note(data), ha='right', fontsize=9) # Точность оценки по счетчикам
+        plt.xlabel('Товар', fontsize=12) # Надпись на оси X
+        plt.ylabel('Количество заказов', fontsize=12) # Надпись на оси Y
+        plt.xticks(rotation=45, ha='right', fontsize=10)  # Наклон меток на оси X для удобства чтения
+        plt.tight_layout()  # Автоматически настраивает расположение элементов графика
+
+        # Генерация имени файла с указанием текущего времени
+        filename = report_filename("top_products")
+        plt.savefig(filename) # Сохраняем график в PNG-файл
+    finally:
+        # pyplot хранит все открытые фигуры: без закрытия при ошибке фигура осталась бы в памяти навсегда
+        plt.close(fig)
 
     return filename # Возвращаем имя файла с отчётом
 
 
+@memprof.profiled()
 def generate_orders_dynamics():
     """
     Генерирует отчет по динамике заказов за последние 30 дней
     Возвращает имя файла с отчетом
     """
     # Получаем данные из БД за последние 30 дней
-    query = """
-    SELECT date, COUNT(id) as order_count
-    FROM orders
-    WHERE date >= date('now', '-30 days')
-    GROUP BY date
-    ORDER BY date
-    """
-    data = db.fetch_query(query)
+    data = orders_by_day(DYNAMICS_DAYS)
 
     if not data:
         return "Нет данных для отчета" # Если данных нет, выдаём сообщение
 
     # Подготовка данных для графика
-    dates = [datetime.strptime(item[0], "%Y-%m-%d") for item in data] # Массив дат
+    dates = [item[0] + DAY_OFFSET for item in data] # Массив дат (числа дат matplotlib)
     order_counts = [item[1] for item in data] # Массив чисел заказов
 
     # Создание графика
-    plt.figure(figsize=(12, 6)) # Размер графика
+    fig = plt.figure(figsize=(12, 6)) # Размер графика
+    try:
+        # Рисуем линию динамики заказов (line plot)
+        plt.plot(dates, order_counts, marker='o', linestyle='-', color='green') # Линия зелёного цвета с маркерами точек
+        plt.title('Динамика заказов за последние 30 дней', fontsize=14) # Заголовок графика
+        plt.xlabel('Дата', fontsize=12) # Метка оси X
+        plt.ylabel('Количество заказов', fontsize=12) # Метка оси Y
+        plt.grid(True, linestyle='--', alpha=0.7)  # Включаем сетку на график
+        plt.gca().xaxis_date() # Числа на оси X - даты
+        plt.tight_layout() # Оптимально размещаем элементы графика
+
+        # Форматирование дат на оси X
+        fig.autofmt_xdate() # Автоформатирование расположения дат на оси X
+
+        # Сохранение в файл
+        filename = report_filename("orders_dynamics")
+        plt.savefig(filename) # Сохраняем график в PNG-файл
+    finally:
+        plt.close(fig)  # Очищаем графику, в том числе после ошибки
+
+    return filename # Возвращаем имя файла с отчётом
+
+
+class ReportCharts:
+    """
+    Графики отчетов на одной фигуре для показа в окне программы (холст FigureCanvasTkAgg).
+    Оси, столбцы, линия и подписи создаются один раз; новые данные подставляются в уже созданные
+    элементы, а переключение отчета только меняет видимые оси. И то и другое - лишь перерисовка холста,
+    без построения новой фигуры. Фигура создается без pyplot, поэтому не попадает в список открытых
+    фигур pyplot и освобождается вместе с окном. Запись на диск - только по вызову save.
+    """
+
+    def __init__(self, figure=None):
+        self.figure = figure if figure is not None else Figure(figsize=(12, 6))
+        # Постоянные поля вместо tight/constrained layout: раскладка при каждой перерисовке занимала бы
+        # половину ее времени; место под наклонные подписи рассчитано на LABEL_CHARS символов
+        self.figure.subplots_adjust(left=0.1, right=0.98, top=0.93, bottom=0.32)
+        self.axes = {}
+        self.empty = {} # Надпись "Нет данных" на каждом графике
+        self.data = {}  # Данные, показанные на каждом графике
+        self.current = None
+
+        # Топ товаров: TOP_LIMIT столбцов, лишние скрываются, если товаров меньше
+        ax = self.figure.add_subplot(label="top_products")
+        self.bars = ax.bar(range(TOP_LIMIT), [0] * TOP_LIMIT, color='skyblue')
+        ax.set_title(f'Топ {TOP_LIMIT} товаров по количеству заказов', fontsize=14)
+        ax.set_xlabel('Товар', fontsize=12)
+        ax.set_ylabel('Количество заказов', fontsize=12)
+        self.note = ax.text(1.0, 1.01, "", transform=ax.transAxes, ha="right", va="bottom", fontsize=9)
+        self.axes["top_products"] = ax
+
+        # Динамика заказов: одна линия, даты на оси X хранятся числами matplotlib
+        ax = self.figure.add_subplot(label="orders_dynamics")
+        self.line, = ax.plot([], [], marker='o', linestyle='-', color='green')
+        ax.set_title(f'Динамика заказов за последние {DYNAMICS_DAYS} дней', fontsize=14)
+        ax.set_xlabel('Дата', fontsize=12)
+        ax.set_ylabel('Количество заказов', fontsize=12)
+        ax.grid(True, linestyle='--', alpha=0.7)
+        ax.xaxis.set_major_locator(mdates.AutoDateLocator())
+        ax.xaxis.set_major_formatter(mdates.DateFormatter('%d.%m'))
+        self.axes["orders_dynamics"] = ax
+
+        # Выручка: по ценам продажи и по ценам прайса на дату заказа, месяцы на оси X - по порядку
+        ax = self.figure.add_subplot(label="revenue")
+        self.revenue_lines = (ax.plot([], [], marker='o', color='tab:blue', label='По ценам продажи')[0],
+                              ax.plot([], [], marker='o', linestyle='--', color='tab:orange',
+                                      label='По ценам прайса на дату заказа')[0])
+        ax.set_title(f'Выручка по месяцам за {REVENUE_MONTHS} мес.', fontsize=14)
+        ax.set_xlabel('Месяц', fontsize=12)
+        ax.set_ylabel('Выручка', fontsize=12)
+        ax.grid(True, linestyle='--', alpha=0.7)
+        ax.legend(loc='best')
+        self.axes["revenue"] = ax
+
+        for kind, ax in self.axes.items():
+            self.empty[kind] = ax.text(0.5, 0.5, "Нет данных для отчета", transform=ax.transAxes,
+                                       ha="center", va="center", fontsize=14, visible=False)
+        self.show("top_products")
+
+    def show(self, kind):
+        """Делает видимым график отчета kind (после этого холст нужно перерисовать)"""
+        if kind not in self.axes:
+            raise ValueError(f"Неизвестный тип отчета: {kind}")
+        for name, ax in self.axes.items():
+            ax.set_visible(name == kind)
+        self.current = kind
+
+    def update(self, kind, data):
+        """
+        Подставляет данные report_data(kind) в элементы графика.
+        Возвращает False, если данные не изменились и перерисовывать нечего.
+        """
+        data = list(data)
+        if self.data.get(kind) == data:
+            return False
+        self.data[kind] = data
+        if kind == "top_products":
+            self._update_top_products(data[:TOP_LIMIT])
+        elif kind == "orders_dynamics":
+            self._update_orders_dynamics(data)
+        elif kind == "revenue":
+            self._update_revenue(data)
+        else:
+            raise ValueError(f"Неизвестный тип отчета: {kind}")
+        self.empty[kind].set_visible(not data)
+        return True
 
-    # Рисуем линию динамики заказов (line plot)
-    plt.plot(dates, order_counts, marker='o', linestyle='-', color='green') # Линия зелёного цвета с маркерами точек
-    plt.title('Динамика заказов за последние 30 дней', fontsize=14) # Заголовок графика
-    plt.xlabel('Дата', fontsize=12) # Метка оси X
-    plt.ylabel('Количество заказов', fontsize=12) # Метка оси Y
-    plt.grid(True, linestyle='--', alpha=0.7)  # Включаем сетку на график
-    plt.tight_layout() # Оптимально размещаем элементы графика
+    def _update_top_products(self, data):
+        ax = self.axes["top_products"]
+        for i, bar in enumerate(self.bars):
+            bar.set_height(data[i][1] if i < len(data) else 0)
+            bar.set_visible(i < len(data))
+        labels = [name if len(name) <= LABEL_CHARS else name[:LABEL_CHARS - 1] + "…" for name, *_ in data]
+        ax.set_xticks(range(len(data)), labels, rotation=45, ha='right', fontsize=10)
+        ax.set_xlim(-0.6, max(len(data), 1) - 0.4)
+        ax.set_ylim(0, max((row[1] for row in data), default=0) * 1.1 or 1)
+        self.note.set_text(accuracy_note(data))
 
-    # Форматирование дат на оси X
-    plt.gcf().autofmt_xdate() # Автоформатирование расположения дат на оси X
+    def _update_orders_dynamics(self, data):
+        ax = self.axes["orders_dynamics"]
+        self.line.set_data([day + DAY_OFFSET for day, _ in data],
+                           [count for _, count in data])
+        if data: # Пределы осей по новым данным
+            ax.relim()
+            ax.autoscale_view()
 
-    # Сохранение в файл
-    filename = f"динамика_заказов_{datetime.now().strftime('%Y%m%d_%H%M')}.png"
-    plt.savefig(filename) # Сохраняем график в PNG-файл
-    plt.close()  # Очищаем графику
+    def _update_revenue(self, data):
+        ax = self.axes["revenue"]
+        for line, column in zip(self.revenue_lines, (1, 2)):
+            line.set_data(range(len(data)), [row[column] for row in data])
+        ax.set_xticks(range(len(data)), [row[0] for row in data], rotation=45, ha='right', fontsize=10)
+        if data:
+            ax.relim()
+            ax.autoscale_view()
 
-    return filename # Возвращаем имя файла с отчётом
\ No newline at end of file
+    def save(self, filename=None):
+        """Сохраняет видимый отчет в файл (по умолчанию - report_filename в текущей папке); возвращает имя"""
+        filename = filename or report_filename(self.current)
+        self.figure.savefig(filename)
+        return filename
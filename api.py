@@ -0,0 +1,340 @@
+"""
+Локальный HTTP-сервис только для чтения: данные магазина в формате JSON
+
+    python main.py serve --port 8080
+
+Адреса (все запросы - GET):
+    /customers?name=&phone=&email=&limit=&offset=
+    /products?name=&price_min=&price_max=&limit=&offset=
+    /orders?customer=&product=&date_min=&date_max=&limit=&offset=
+    /orders/<id>
+    /search?q=&limit=
+    /reports/top-products?limit=
+    /reports/orders-by-day?days=
+    /changes?since=&limit=
+
+Списки выдаются постранично (limit по умолчанию DEFAULT_LIMIT, limit=0 - все строки) и передаются
+потоком (chunked), не собирая весь ответ в памяти. У каждого ответа есть ETag - версия данных базы:
+пока в базу никто не пишет, повторный запрос с If-None-Match получает 304, а небольшие ответы
+берутся из кэша в памяти. Запросы обрабатывает пул потоков, у каждого потока свое соединение с базой.
+"""
+import collections
+import itertools
+import json
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+import db
+import analysis
+import journal
+
+# Сколько строк отдается в списке, если limit не указан
+DEFAULT_LIMIT = 100
+
+# Сколько строк читается из базы и отправляется клиенту одним куском
+STREAM_CHUNK_ROWS = 500
+
+# Число потоков, обрабатывающих запросы
+WORKERS = 8
+
+# Кэш ответов: сколько ответов хранить и ответы какого размера (в байтах) в него попадают
+CACHE_ENTRIES = 256
+CACHE_MAX_BYTES = 1024 * 1024
+
+# Сколько секунд держать открытым соединение без запросов (keep-alive занимает поток пула)
+KEEPALIVE_TIMEOUT = 5
+
+# Названия полей JSON для строк каждого списка
+CUSTOMER_FIELDS = ("id", "name", "phone", "email", "address")
+PRODUCT_FIELDS = ("id", "name", "price")
+ORDER_FIELDS = ("id", "customer_name", "customer_phone", "products", "total", "date")
+
+_encode = json.JSONEncoder(ensure_ascii=False).encode
+
+
+class ResponseCache:
+    """Кэш готовых ответов (ключ - адрес с параметрами); записи старой версии данных не используются"""
+
+    def __init__(self, entries=CACHE_ENTRIES):
+        self.entries = entries
+        self.items = collections.OrderedDict() # адрес -> (ETag, тело ответа)
+        self.lock = threading.Lock()
+
+    def get(self, key, etag):
+        with self.lock:
+            item = self.items.get(key)
+            if item is None or item[0] != etag:
+                return None
+            self.items.move_to_end(key) # Недавно использованные записи вытесняются последними
+            return item[1]
+
+    def put(self, key, etag, body):
+        with self.lock:
+            self.items[key] = (etag, body)
+            self.items.move_to_end(key)
+            while len(self.items) > self.entries:
+                self.items.popitem(last=False)
+
+
+# Разбор параметров запроса
+
+def _int_param(params, name, default, minimum=0):
+    value = params.get(name)
+    if value is None or value == "":
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        raise ValueError(f"Параметр {name} должен быть целым числом")
+    if number < minimum:
+        raise ValueError(f"Параметр {name} должен быть не меньше {minimum}")
+    return number
+
+
+def _float_param(params, name):
+    value = params.get(name)
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError(f"Параметр {name} должен быть числом")
+
+
+# Формирование ответов: каждая функция проверяет параметры и возвращает итератор кусков тела (bytes)
+
+def _stream_list(query, fields, params):
+    """Постраничный список строк запроса в виде {"offset", "limit", "items": [...], "count"}"""
+    limit = _int_param(params, "limit", DEFAULT_LIMIT)
+    offset = _int_param(params, "offset", 0)
+    query.limit(limit if limit else -1, offset) # LIMIT -1 в SQLite - без ограничения
+    sql, sql_params = query.build()
+
+    def body():
+        yield f'{{"offset":{offset},"limit":{limit},"items":['.encode()
+        count = 0
+        for rows in db.iter_query(sql, sql_params, chunk_size=STREAM_CHUNK_ROWS):
+            chunk = ",".join(_encode(dict(zip(fields, row))) for row in rows)
+            yield (("," if count else "") + chunk).encode()
+            count += len(rows)
+        yield f'],"count":{count}}}'.encode()
+    return body()
+
+
+def _customers(params):
+    query = db.customers_query(params.get("name", ""), params.get("phone", ""), params.get("email", ""))
+    return _stream_list(query, CUSTOMER_FIELDS, params)
+
+
+def _products(params):
+    query = db.products_query(params.get("name", ""), _float_param(params, "price_min"),
+                              _float_param(params, "price_max"))
+    return _stream_list(query, PRODUCT_FIELDS, params)
+
+
+def _orders(params):
+    query = db.orders_query(params.get("customer", ""), params.get("product", ""),
+                            params.get("date_min", ""), params.get("date_max", ""))
+    return _stream_list(query, ORDER_FIELDS, params)
+
+
+def _order(order_id):
+    conn = db.shared_connection()
+    # Удаленный заказ и заказ удаленного клиента не отдаются, как и в списке /orders
+    if not conn.execute(db.with_archive(f"SELECT 1 FROM {{orders}} AS orders WHERE id=? AND {db.ACTIVE_ORDERS}",
+                                        conn=conn), (order_id,)).fetchone():
+        return None
+    order = db.read_order(conn, order_id)
+    if order is None:
+        return None
+    return iter([_encode({
+        "id": order.id, "customer_id": order.customer_id, "date": order.date, "total": order.total,
+        "items": [{"product_id": item.product_id, "quantity": item.quantity, "unit_price": item.unit_price}
+                  for item in order.items],
+    }).encode()])
+
+
+def _search(params):
+    text = params.get("q", "").strip()
+    if not text:
+        raise ValueError("Не задан текст поиска q")
+    limit = _int_param(params, "limit", 20, minimum=1)
+    customers = db.customers_query().contains(text, "name", "phone", "email").limit(limit).fetch()
+    products = db.products_query().contains(text, "name").limit(limit).fetch()
+    return iter([_encode({
+        "customers": [dict(zip(CUSTOMER_FIELDS, row)) for row in customers],
+        "products": [dict(zip(PRODUCT_FIELDS, row)) for row in products],
+    }).encode()])
+
+
+def _top_products(params):
+    rows = analysis.top_products(_int_param(params, "limit", 10, minimum=1))
+    return iter([_encode([{"name": name, "order_count": count} for name, count in rows]).encode()])
+
+
+def _orders_by_day(params):
+    rows = analysis.orders_by_day(_int_param(params, "days", 30, minimum=1))
+    return iter([_encode([{"date": db.day_text(day), "order_count": count} for day, count in rows]).encode()])
+
+
+def _changes(params):
+    """Изменения после since: {"since", "items": [...], "count", "last_seq"}; last_seq - since следующего запроса"""
+    since = _int_param(params, "since", 0)
+    limit = _int_param(params, "limit", DEFAULT_LIMIT)
+    changes = journal.iter_changes(since, limit or None)
+    first = next(changes, None) # Сразу проверяет, что журнал не очищен дальше since (иначе ответ 400)
+
+    def body():
+        yield f'{{"since":{since},"items":['.encode()
+        count, last_seq = 0, since
+        for change in itertools.chain([first] if first else [], changes):
+            yield (("," if count else "") + _encode(change)).encode()
+            count += 1
+            last_seq = change["seq"]
+        yield f'],"count":{count},"last_seq":{last_seq}}}'.encode()
+    return body()
+
+
+ROUTES = {
+    "/customers": _customers,
+    "/products": _products,
+    "/orders": _orders,
+    "/search": _search,
+    "/reports/top-products": _top_products,
+    "/reports/orders-by-day": _orders_by_day,
+    "/changes": _changes,
+}
+
+_ORDER_PATH = re.compile(r"/orders/(\d+)")
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    """Обработчик запросов к API"""
+    protocol_version = "HTTP/1.1" # keep-alive и передача ответа кусками (chunked)
+    timeout = KEEPALIVE_TIMEOUT
+    # Заголовки и куски ответа копятся в буфере и уходят крупными пакетами (буфер сбрасывается
+    # после каждого ответа); без TCP_NODELAY мелкие пакеты ждали бы подтверждения клиента ~40 мс
+    wbufsize = 64 * 1024
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        # Если параметр передан несколько раз, берется последнее значение
+        params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+
+        etag = f'"{self.server.boot}-{self.server.version.current()}"'
+        if etag in (tag.strip() for tag in self.headers.get("If-None-Match", "").split(",")):
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        cached = self.server.cache.get(self.path, etag)
+        if cached is not None:
+            self._send_body(200, cached, etag)
+            return
+
+        try:
+            route = ROUTES.get(url.path)
+            match = _ORDER_PATH.fullmatch(url.path)
+            if route is not None:
+                chunks = route(params)
+            elif match:
+                chunks = _order(int(match.group(1)))
+            else:
+                chunks = None
+        except ValueError as e:
+            self._send_body(400, _encode({"error": str(e)}).encode())
+            return
+        if chunks is None:
+            self._send_body(404, _encode({"error": "Не найдено"}).encode())
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", "no-cache") # клиент должен перепроверять ответ по ETag
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        # Пока ответ небольшой, копим его для кэша; большие ответы только передаются потоком
+        kept, kept_size = [], 0
+        try:
+            for chunk in chunks:
+                self.wfile.write(b"%X\r\n%s\r\n" % (len(chunk), chunk))
+                if kept is not None:
+                    kept.append(chunk)
+                    kept_size += len(chunk)
+                    if kept_size > CACHE_MAX_BYTES:
+                        kept = None
+            self.wfile.write(b"0\r\n\r\n")
+        except Exception:
+            # Заголовки уже отправлены: сообщить об ошибке кодом ответа нельзя, просто обрываем соединение
+            self.close_connection = True
+            raise
+        if kept is not None:
+            self.server.cache.put(self.path, etag, b"".join(kept))
+
+    def _send_body(self, status, body, etag=None):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        if etag:
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "no-cache")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class ApiServer(HTTPServer):
+    """HTTP-сервер, который обрабатывает соединения в пуле из workers потоков"""
+
+    def __init__(self, address, workers=WORKERS, verbose=False):
+        super().__init__(address, ApiHandler)
+        self.verbose = verbose
+        self.boot = f"{time.time_ns():x}" # ETag прошлого запуска сервера не должен совпасть с новым
+        self.version = db.DataVersion()
+        self.cache = ResponseCache()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="api",
+                                           initializer=_init_worker)
+
+    def process_request(self, request, client_address):
+        self.executor.submit(self._process_request, request, client_address)
+
+    def _process_request(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(wait=True)
+        self.version.close()
+
+
+def _init_worker():
+    # Соединение потока пула только читает: случайная запись через API завершится ошибкой
+    db.shared_connection().execute("PRAGMA query_only = ON")
+
+
+def serve(host="127.0.0.1", port=8080, workers=WORKERS, verbose=True):
+    """Запускает сервер и обслуживает запросы до нажатия Ctrl+C"""
+    server = ApiServer((host, port), workers=workers, verbose=verbose)
+    print(f"API доступно по адресу http://{host}:{server.server_address[1]}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,113 @@
+"""
+Архив старых заказов
+
+    python main.py archive --older-than-days 365   # перенести в архив заказы старше года
+    python main.py archive --before 2024-01-01      # заказы раньше даты
+    python main.py archive --stats                  # сколько заказов в основной базе и в архиве
+
+Заказы с датой раньше границы переносятся вместе с позициями в отдельный файл рядом с основной базой
+(store-archive.db для store.db). Таблица orders и ее индексы становятся меньше, поэтому списки, фильтры
+по дате и отчеты за последние дни читают только недавние заказы. Архив подключается к соединениям
+командой ATTACH, и запросы db.py и analysis.py добавляют архивные заказы (db.with_archive), только если
+диапазон дат начинается раньше границы архива. Архивные заказы только читаются: изменить или удалить
+их из программы нельзя.
+
+Перенос идет пачками по BATCH_SIZE заказов. Пачка сначала копируется в архив (транзакция архива),
+затем удаляется из основной базы (транзакция основной базы). Пока заказ есть в основной базе, запросы
+берут его оттуда, поэтому прерванный перенос не теряет и не удваивает заказы, а следующий запуск
+перезапишет оставшуюся копию. Заказ, измененный между копированием и удалением, остается в основной базе.
+Место в файле основной базы освобождается для новых данных; уменьшить сам файл можно командой VACUUM.
+Резервная копия (backup.py) копирует только основную базу - архив копируйте отдельно.
+"""
+import json
+from datetime import date, timedelta
+import db
+
+# Сколько заказов переносится одной парой транзакций
+BATCH_SIZE = 5000
+
+_ORDER_COLUMNS = "id, customer_id, date, total, deleted_at"
+_ITEM_COLUMNS = "id, order_id, product_id, quantity, unit_price"
+
+
+def _copy_batch(conn, ids_param):
+    """Копирует заказы пачки с позициями в архив (прежняя копия тех же заказов заменяется)"""
+    conn.execute("BEGIN")
+    with conn:
+        conn.execute("DELETE FROM archive.orders WHERE id IN (SELECT value FROM json_each(?))", (ids_param,))
+        conn.execute(f"INSERT INTO archive.orders ({_ORDER_COLUMNS}) SELECT {_ORDER_COLUMNS} FROM main.orders "
+                     "WHERE id IN (SELECT value FROM json_each(?))", (ids_param,))
+        conn.execute(f"INSERT INTO archive.order_items ({_ITEM_COLUMNS}) SELECT {_ITEM_COLUMNS} "
+                     "FROM main.order_items WHERE order_id IN (SELECT value FROM json_each(?))", (ids_param,))
+
+
+def _remove_batch(conn, ids_param):
+    """
+    Удаляет из основной базы заказы пачки, совпадающие со своей копией в архиве; возвращает их число.
+    Позиции удаляются каскадом; признак archiving не дает триггеру записать удаление в журнал изменений.
+    """
+    conn.execute("BEGIN")
+    with conn:
+        conn.execute("UPDATE archive_state SET archiving = 1")
+        c = conn.execute("""DELETE FROM main.orders
+                            WHERE id IN (SELECT value FROM json_each(?))
+                              AND EXISTS (SELECT 1 FROM archive.orders AS copy
+                                          WHERE copy.id = orders.id AND copy.customer_id = orders.customer_id
+                                            AND copy.date = orders.date AND copy.total = orders.total
+                                            AND copy.deleted_at IS orders.deleted_at)""", (ids_param,))
+        conn.execute("UPDATE archive_state SET archiving = 0")
+    return c.rowcount
+
+
+def archive_orders(before, batch_size=BATCH_SIZE, progress=None):
+    """
+    Переносит в архив заказы с датой раньше before ('YYYY-MM-DD' или date).
+    progress(перенесено, всего) вызывается после каждой пачки. Возвращает число перенесенных заказов.
+    Можно вызывать из фонового потока, пока приложение работает с базой.
+    """
+    before = before.isoformat() if isinstance(before, date) else date.fromisoformat(before).isoformat()
+    day = db.to_day(before) # Даты заказов в базе - номера дней
+    conn = db.get_connection()
+    try:
+        db.attach_archive(conn, create=True)
+        # Граница сдвигается до переноса: запросы сразу начинают учитывать архив для дат раньше before,
+        # и перенесенные пачки видны в них с первой же пачки
+        with conn:
+            conn.execute("UPDATE archive_state SET cutoff = ? WHERE cutoff IS NULL OR cutoff < ?", (before, before))
+        total = conn.execute("SELECT COUNT(*) FROM main.orders WHERE date < ?", (day,)).fetchone()[0]
+        moved = 0
+        last_id = 0
+        while True:
+            # Пачки идут по возрастанию id; заказ, оставшийся в основной базе, не выбирается повторно
+            ids = [row[0] for row in conn.execute(
+                "SELECT id FROM main.orders WHERE id > ? AND date < ? ORDER BY id LIMIT ?",
+                (last_id, day, batch_size))]
+            if not ids:
+                break
+            last_id = ids[-1]
+            ids_param = json.dumps(ids)
+            _copy_batch(conn, ids_param)
+            moved += _remove_batch(conn, ids_param)
+            if progress:
+                progress(moved, total)
+        return moved
+    finally:
+        conn.close()
+
+
+def archive_older_than(days, batch_size=BATCH_SIZE, progress=None):
+    """Переносит в архив заказы старше days дней"""
+    return archive_orders(date.today() - timedelta(days=days), batch_size, progress)
+
+
+def stats():
+    """Словарь: граница архива (cutoff), заказов в основной базе (hot) и в архиве (archived)"""
+    conn = db.get_connection()
+    try:
+        hot = conn.execute("SELECT COUNT(*) FROM main.orders").fetchone()[0]
+        # Копии заказов, оставшихся в основной базе, не считаются
+        archived = conn.execute("SELECT COUNT(*) FROM all_orders").fetchone()[0] - hot \
+            if db.attach_archive(conn) else 0
+        return {"cutoff": db.archive_cutoff(conn), "hot": hot, "archived": archived}
+    finally:
+        conn.close()
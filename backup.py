@@ -0,0 +1,135 @@
+"""
+Резервные копии базы данных во время работы приложения
+
+    python main.py backup                        # копия в папку backups
+    python main.py backup --compress --keep 7    # сжатая копия, хранить 7 последних
+    python main.py backup --vacuum               # компактная копия без пустых страниц
+
+Обычный режим использует online backup API SQLite: страницы базы копируются порциями по PAGES_PER_STEP,
+между порциями копирование уступает базу другим соединениям. Вся копия читается из одного снимка
+(открытой транзакции чтения), поэтому в режиме WAL запись в базу во время копирования не блокируется
+и не заставляет копирование начинаться заново. Режим vacuum (VACUUM INTO) записывает копию заново,
+без пустых страниц и с упорядоченными индексами, но одной командой, без хода работы.
+
+Копия сначала пишется во временный файл и получает свое имя только целиком, после проверки
+PRAGMA quick_check. Для восстановления закройте приложение и замените store.db копией
+(сжатую копию распакуйте: gzip -d store-....db.gz).
+"""
+import gzip
+import os
+import shutil
+import sqlite3
+import time
+from datetime import datetime
+import db
+
+# Папка для резервных копий по умолчанию
+BACKUP_DIR = "backups"
+
+# Сколько страниц базы копируется за один шаг и сколько секунд пауза между шагами
+PAGES_PER_STEP = 1024
+STEP_SLEEP = 0.001
+
+# Размер блока при сжатии копии
+COPY_CHUNK = 1024 * 1024
+
+
+def backup_name(compress=False):
+    """Имя файла копии: имя базы и время создания (при сортировке по имени копии идут по времени)"""
+    base = os.path.splitext(os.path.basename(db.DB_NAME))[0]
+    return f"{base}-{datetime.now():%Y%m%d-%H%M%S-%f}.db" + (".gz" if compress else "")
+
+
+def list_backups(directory=BACKUP_DIR):
+    """Копии текущей базы в папке, от старых к новым"""
+    if not os.path.isdir(directory):
+        return []
+    prefix = os.path.splitext(os.path.basename(db.DB_NAME))[0] + "-"
+    names = sorted(name for name in os.listdir(directory)
+                   if name.startswith(prefix) and name.endswith((".db", ".db.gz")))
+    return [os.path.join(directory, name) for name in names]
+
+
+def rotate(directory=BACKUP_DIR, keep=None):
+    """Удаляет старые копии, оставляя keep последних (keep=None - ничего не удаляет). Возвращает удаленные"""
+    if keep is None:
+        return []
+    removed = list_backups(directory)[:-keep] if keep > 0 else list_backups(directory)
+    for path in removed:
+        os.remove(path)
+    return removed
+
+
+def _online_copy(target, progress=None):
+    """Копирует базу порциями страниц из одного снимка; progress(скопировано, всего) - после каждого шага"""
+    source = db.get_connection(check_same_thread=False)
+    dest = sqlite3.connect(target)
+    try:
+        # Открытая транзакция чтения фиксирует снимок базы на время всего копирования
+        source.execute("BEGIN")
+        source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+
+        def step(status, remaining, total):
+            if progress:
+                progress(total - remaining, total)
+            time.sleep(STEP_SLEEP) # Между шагами база свободна для других соединений
+
+        source.backup(dest, pages=PAGES_PER_STEP, progress=step)
+        source.rollback()
+        # Копия получает режим WAL вместе со страницами; файл копии должен быть самодостаточным
+        dest.execute("PRAGMA journal_mode = DELETE")
+    finally:
+        dest.close()
+        source.close()
+
+
+def _vacuum_copy(target):
+    """Записывает компактную копию базы командой VACUUM INTO"""
+    conn = db.get_connection()
+    try:
+        conn.execute("VACUUM INTO ?", (target,))
+    finally:
+        conn.close()
+
+
+def _check(path):
+    """Проверяет, что файл копии - целая база SQLite"""
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        result = conn.execute("PRAGMA quick_check").fetchone()[0]
+    finally:
+        conn.close()
+    if result != "ok":
+        raise RuntimeError(f"Резервная копия повреждена: {result}")
+
+
+def backup(directory=BACKUP_DIR, compress=False, keep=None, vacuum=False, progress=None):
+    """
+    Создает резервную копию базы в папке directory и возвращает путь к ней.
+    compress - сжать копию gzip; keep - сколько последних копий оставить (остальные удаляются);
+    vacuum - компактная копия через VACUUM INTO вместо постраничного копирования;
+    progress(скопировано страниц, всего страниц) - ход копирования (вызывается из потока копирования).
+    Можно вызывать из фонового потока, пока приложение работает с базой.
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, backup_name(compress))
+    plain = os.path.join(directory, f".{os.path.basename(path)}.{os.getpid()}.tmp") # Копия до сжатия
+    temp = plain + ".gz" if compress else plain
+    try:
+        if vacuum:
+            _vacuum_copy(plain)
+        else:
+            _online_copy(plain, progress)
+        _check(plain)
+        if compress:
+            with open(plain, "rb") as src, gzip.open(temp, "wb", compresslevel=6) as dst:
+                shutil.copyfileobj(src, dst, COPY_CHUNK)
+            os.remove(plain)
+        os.replace(temp, path) # Копия появляется под своим именем только целиком
+    except BaseException:
+        for leftover in (temp, plain):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+        raise
+    rotate(directory, keep)
+    return path
@@ -0,0 +1,1001 @@
+"""
+Бенчмарки производительности
+Каждый бенчмарк работает на временной базе с синтетическими данными и не трогает store.db.
+
+Запуск:
+    python bench.py columnar --rows 200000
+    python bench.py fetch --rows 20000
+    python bench.py async --rows 100000
+    python bench.py api --rows 100000
+    python bench.py delete --rows 100000
+    python bench.py backup --rows 500000
+    python bench.py memory --rows 200000
+    python bench.py startup --rows 1000000
+    python bench.py charts --rows 100000
+    python bench.py archive --rows 300000
+    python bench.py topk --rows 300000
+    python bench.py customer-stats --rows 300000
+    python bench.py validation --rows 1000000
+    python bench.py dedup --rows 200000
+    python bench.py dates --rows 500000
+    python bench.py concurrency --rows 100000
+    xvfb-run python bench.py ui --rows 100000
+    python bench.py price-history --rows 1000000
+"""
+import argparse
+import asyncio
+import contextlib
+import csv
+import io
+import multiprocessing
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+import db
+import adb
+import api
+import backup
+import columnar
+import loadtest
+import memprof
+import analysis
+import datagen
+import validation
+import dedup
+import archive
+import csv_io
+import topk
+
+
+@contextlib.contextmanager
+def temp_db():
+    """Временно переключает модуль db на новую пустую базу во временной папке"""
+    old_db_name = db.DB_NAME
+    with tempfile.TemporaryDirectory() as tmpdir:
+        db.DB_NAME = os.path.join(tmpdir, "bench.db")
+        try:
+            db.init_db()
+            yield tmpdir
+        finally:
+            db.close_connections()
+            db.DB_NAME = old_db_name
+
+
+def fill_db(customers, products, orders, seed=1):
+    """Быстро заполняет текущую базу синтетическими клиентами, товарами и заказами"""
+    rnd = random.Random(seed)
+    start = db.to_day("2023-01-01") # Даты заказов в базе - номера дней
+    conn = db.get_connection()
+    with conn:
+        conn.executemany(
+            "INSERT INTO customers (name, phone, email, address, natural_key) VALUES (?, ?, ?, ?, ?)",
+            ((f"Клиент {i}", f"+7916{i:07d}", f"client{i}@example.com", f"Город {i % 100}",
+              f"email:client{i}@example.com") for i in range(customers)))
+        conn.executemany(
+            "INSERT INTO products (name, price, natural_key) VALUES (?, ?, ?)",
+            ((f"Товар {i}", round(rnd.uniform(10, 10000), 2), f"товар {i}") for i in range(products)))
+        conn.executemany(
+            "INSERT INTO orders (id, customer_id, date) VALUES (?, ?, ?)",
+            ((i, rnd.randint(1, customers), start + rnd.randrange(365)) for i in range(1, orders + 1)))
+        # По одной позиции на заказ, цена на момент продажи - текущая цена товара
+        conn.executemany(
+            "INSERT INTO order_items (order_id, product_id, quantity, unit_price) "
+            "SELECT ?, id, ?, price FROM products WHERE id = ?",
+            ((i, rnd.randint(1, 3), rnd.randint(1, products)) for i in range(1, orders + 1)))
+    conn.close()
+
+
+def timed(func, *args, **kwargs):
+    """Выполняет функцию и возвращает (время в секундах, результат)"""
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def print_table(header, rows):
+    """Печатает результаты бенчмарка в виде простой таблицы"""
+    widths = [max(len(str(x)) for x in column) for column in zip(header, *rows)]
+    for row in [header] + rows:
+        print("  ".join(str(x).ljust(width) for x, width in zip(row, widths)))
+
+
+# Бенчмарк: CSV против колоночного формата .npz
+
+def _write_csv(path):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["ID", "ФИО клиента", "Телефон", "Товары", "Сумма", "Дата заказа"])
+        writer.writerows(db.get_all_orders())
+
+
+def _read_csv(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        next(reader)
+        return list(reader)
+
+
+def bench_columnar(args):
+    """Сравнивает размер файла и время записи/чтения заказов в CSV и в .npz"""
+    with temp_db() as tmpdir:
+        fill_db(max(args.rows // 10, 1), 1000, args.rows)
+        csv_path = os.path.join(tmpdir, "orders.csv")
+        npz_path = os.path.join(tmpdir, "orders.npz")
+
+        csv_write, _ = timed(_write_csv, csv_path)
+        csv_read, _ = timed(_read_csv, csv_path)
+        npz_write, _ = timed(columnar.export_dataset, "orders_view", npz_path)
+        npz_read, _ = timed(columnar.read_columns, npz_path)
+
+        print(f"Заказов: {args.rows}")
+        print_table(("Формат", "Запись, с", "Чтение, с", "Размер, КБ"), [
+            ("CSV", f"{csv_write:.3f}", f"{csv_read:.3f}", os.path.getsize(csv_path) // 1024),
+            ("NPZ", f"{npz_write:.3f}", f"{npz_read:.3f}", os.path.getsize(npz_path) // 1024),
+        ])
+
+
+# Бенчмарк: накладные расходы одного вызова fetch_query
+
+def _fetch_query_per_connection(query, params=()):
+    """Прежняя реализация fetch_query: новое соединение на каждый вызов, запрос разбирается заново"""
+    conn = db.get_connection()
+    try:
+        return conn.execute(query, params).fetchall()
+    except sqlite3.Error as e:
+        print(f"Ошибка базы данных: {e}")
+        return []
+    finally:
+        conn.close()
+
+
+def _run_lookups(fetch, calls, products):
+    for i in range(calls):
+        fetch("SELECT id, name, price FROM products WHERE id=?", (i % products + 1,))
+
+
+def _run_builder_lookups(calls, products):
+    for i in range(calls):
+        db.Query("SELECT id, name, price FROM products").where("id = ?", i % products + 1).fetch()
+
+
+def bench_fetch(args):
+    """Сравнивает время одного запроса по ключу: соединение на каждый вызов против долгоживущего соединения"""
+    with temp_db():
+        products = 1000
+        fill_db(10, products, 0)
+        calls = args.rows
+        _run_lookups(db.fetch_query, 100, products) # прогрев: соединение открыто, запрос в кэше
+
+        before, _ = timed(_run_lookups, _fetch_query_per_connection, calls, products)
+        after, _ = timed(_run_lookups, db.fetch_query, calls, products)
+        builder, _ = timed(_run_builder_lookups, calls, products)
+
+        print(f"Вызовов: {calls}")
+        print_table(("Вариант", "Всего, с", "На вызов, мкс"), [
+            ("Соединение на вызов", f"{before:.3f}", f"{before / calls * 1e6:.1f}"),
+            ("Долгоживущее соединение", f"{after:.3f}", f"{after / calls * 1e6:.1f}"),
+            ("Построитель Query", f"{builder:.3f}", f"{builder / calls * 1e6:.1f}"),
+        ])
+
+
+# Бенчмарк: пропускная способность асинхронного доступа при многих одновременных запросах
+
+ASYNC_REQUESTS = 1000
+ASYNC_CONCURRENCY = 64
+
+
+# Сводка за месяц: почти все время уходит на SQLite, который на время запроса отпускает GIL
+_MONTH_SUMMARY = "SELECT COUNT(*), SUM(total) FROM orders WHERE date BETWEEN ? AND ?"
+
+
+def _async_requests(rnd):
+    # Запросы как от HTTP-сервиса: поровну страниц заказов за день и сводок за месяц
+    for i in range(ASYNC_REQUESTS):
+        if i % 2:
+            day = (date(2023, 1, 1) + timedelta(days=rnd.randrange(365))).isoformat()
+            yield "page", day
+        else:
+            month = rnd.randint(1, 12)
+            end = date(2023 + month // 12, month % 12 + 1, 1) - timedelta(days=1)
+            yield "summary", (db.to_day(f"2023-{month:02d}-01"), db.to_day(end.isoformat()))
+
+
+async def _run_async_requests(pool_size):
+    semaphore = asyncio.Semaphore(ASYNC_CONCURRENCY)
+    async with adb.AsyncDB(pool_size=pool_size) as store:
+        async def request(kind, arg):
+            async with semaphore:
+                if kind == "page":
+                    await store.get_orders(date_min=arg, date_max=arg, limit=50)
+                else:
+                    await store.fetch(_MONTH_SUMMARY, arg)
+        await asyncio.gather(*(request(kind, arg) for kind, arg in _async_requests(random.Random(2))))
+
+
+def _run_sync_requests():
+    for kind, arg in _async_requests(random.Random(2)):
+        if kind == "page":
+            db.orders_query(date_min=arg, date_max=arg).limit(50).fetch()
+        else:
+            db.fetch_query(_MONTH_SUMMARY, arg)
+
+
+def bench_async(args):
+    """Сравнивает число запросов в секунду: последовательно и через AsyncDB с разным размером пула"""
+    with temp_db():
+        fill_db(max(args.rows // 10, 1), 1000, args.rows)
+        rows = []
+        elapsed, _ = timed(_run_sync_requests)
+        rows.append(("последовательно (db.py)", f"{elapsed:.3f}", f"{ASYNC_REQUESTS / elapsed:.0f}"))
+        for pool_size in (1, 2, 4, 8):
+            elapsed, _ = timed(asyncio.run, _run_async_requests(pool_size))
+            rows.append((f"AsyncDB, пул {pool_size}", f"{elapsed:.3f}", f"{ASYNC_REQUESTS / elapsed:.0f}"))
+
+        print(f"Заказов: {args.rows}, запросов: {ASYNC_REQUESTS}, одновременно: {ASYNC_CONCURRENCY}")
+        print_table(("Вариант", "Всего, с", "Запросов/с"), rows)
+
+
+# Бенчмарк: задержки HTTP API под нагрузкой
+
+def bench_api(args):
+    """Нагружает HTTP API на временной базе: без кэша у клиента и с перепроверкой по ETag"""
+    with temp_db():
+        fill_db(max(args.rows // 10, 1), 1000, args.rows)
+        server = api.ApiServer(("127.0.0.1", 0), workers=api.WORKERS)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        url = f"http://127.0.0.1:{server.server_address[1]}"
+        try:
+            rows = []
+            for title, etag in (("без ETag", False), ("с If-None-Match", True)):
+                result = loadtest.run(url, requests=2000, concurrency=api.WORKERS, etag=etag)
+                rows.append((title, f"{result['rps']:.0f}", f"{result['p50']:.1f}", f"{result['p99']:.1f}",
+                             result["statuses"]))
+        finally:
+            server.shutdown()
+            thread.join()
+            server.server_close()
+
+        print(f"Заказов: {args.rows}, клиентов: {api.WORKERS}")
+        print_table(("Вариант", "Запросов/с", "p50, мс", "p99, мс", "Коды ответов"), rows)
+
+
+# Бенчмарк: удаление клиента с большим числом заказов
+
+def bench_delete(args):
+    """Время мягкого удаления, восстановления и окончательного (каскадного) удаления клиента со всеми заказами"""
+    with temp_db():
+        fill_db(1, 1000, args.rows) # все заказы принадлежат одному клиенту
+        soft, _ = timed(db.delete_customer, 1, soft=True)
+        hidden = len(db.find_orders()) == 0
+        restore, _ = timed(db.restore_customer, 1)
+        db.delete_customer(1, soft=True)
+        purge, result = timed(db.purge_deleted)
+
+        print(f"Заказов у клиента: {args.rows}, скрыты после мягкого удаления: {hidden}")
+        print_table(("Операция", "Время, с"), [
+            ("мягкое удаление", f"{soft:.4f}"),
+            ("восстановление", f"{restore:.4f}"),
+            (f"окончательное удаление ({result['customers']} клиент, каскад заказов и позиций)", f"{purge:.3f}"),
+        ])
+
+
+# Бенчмарк: резервное копирование во время записи в базу
+
+def _backup_while_writing(run):
+    """Выполняет run() и параллельно добавляет клиентов; возвращает (время run, записей, макс. задержка записи, результат)"""
+    stop = threading.Event()
+    latencies = []
+
+    def writer():
+        conn = db.get_connection()
+        while not stop.is_set():
+            start = time.perf_counter()
+            with conn:
+                conn.execute("INSERT INTO customers (name, phone) VALUES ('Новый', '+70000000000')")
+            latencies.append(time.perf_counter() - start)
+        conn.close()
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    try:
+        seconds, result = timed(run)
+    finally:
+        stop.set()
+        thread.join()
+    return seconds, len(latencies), max(latencies, default=0.0), result
+
+
+def bench_backup(args):
+    """Время резервного копирования в разных режимах и задержка записи в базу во время копирования"""
+    with temp_db() as tmpdir:
+        fill_db(args.rows // 10, 1000, args.rows)
+        target = os.path.join(tmpdir, "backups")
+        modes = [
+            ("без копирования", lambda: time.sleep(1.0)),
+            ("online backup", lambda: backup.backup(target)),
+            ("online backup + gzip", lambda: backup.backup(target, compress=True)),
+            ("VACUUM INTO", lambda: backup.backup(target, vacuum=True)),
+        ]
+        rows = []
+        for name, run in modes:
+            seconds, writes, worst, path = _backup_while_writing(run)
+            size = f"{os.path.getsize(path) / 1e6:.1f}" if path else "-"
+            rows.append((name, f"{seconds:.2f}", size, writes, f"{worst * 1000:.1f}"))
+        print(f"Размер базы: {os.path.getsize(db.DB_NAME) / 1e6:.1f} МБ")
+        print_table(("Режим", "Время, с", "Размер, МБ", "Записей за время", "Макс. задержка записи, мс"), rows)
+
+
+# Бенчмарк: память загрузки списков, импорта, экспорта и отчетов
+
+# Допустимые пики и остатки памяти, байт. Потоковые операции не должны зависеть от числа строк
+MEMORY_LIMITS = {
+    "export_csv": 8 * 1024 * 1024,  # пик: пачки строк, а не вся таблица
+    "import_csv": 16 * 1024 * 1024,  # пик: пачка строк и битовые карты id
+    "report_retained": 1024 * 1024,  # остаток повторных отчетов: фигуры matplotlib закрываются
+}
+
+
+def _load_list_fetchall():
+    rows = db.find_orders()
+    return len(rows)
+
+
+def _load_list_streaming():
+    count = 0
+    for rows in db.iter_query(*db.orders_query().build()):
+        count += len(rows)
+    return count
+
+
+def bench_memory(args):
+    """Пики и остатки памяти (tracemalloc) основных операций; превышение MEMORY_LIMITS - ошибка"""
+    was_enabled = memprof.enabled()
+    memprof.enable()
+    memprof.reset()
+    old_cwd = os.getcwd()
+    try:
+        with temp_db() as tmpdir:
+            fill_db(max(args.rows // 10, 1), 1000, args.rows)
+            with memprof.measure("список заказов: fetchall"):
+                _load_list_fetchall()
+            with memprof.measure("список заказов: пачками"):
+                _load_list_streaming()
+            csv_path = os.path.join(tmpdir, "orders.csv")
+            csv_io.export_csv("orders", csv_path)
+            with open(csv_path, "w", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                writer.writerow(["ID клиента", "ID товара", "Дата"])
+                writer.writerows((i % 100 + 1, i % 1000 + 1, "2023-06-01") for i in range(args.rows))
+            csv_io.import_csv("orders", csv_path)
+            operations = {item["name"]: item for item in memprof.stats()}
+
+            # Отчеты сохраняются в текущую папку: переходим во временную.
+            # Первый отчет загружает шрифты matplotlib, поэтому остаток считается по следующим
+            os.chdir(tmpdir)
+            analysis.generate_sales_report()
+            memprof.reset()
+            for _ in range(5):
+                analysis.generate_sales_report()
+            report = memprof.stats()[0]
+            operations["generate_sales_report"] = report
+    finally:
+        os.chdir(old_cwd)
+        if not was_enabled:
+            memprof.disable()
+
+    print(f"Заказов: {args.rows}")
+    print_table(("Операция", "Пик, КБ", "Остаток, КБ"), [
+        (name, item["max_peak"] // 1024, item["total_retained"] // 1024) for name, item in operations.items()])
+    assert operations["export_csv"]["max_peak"] < MEMORY_LIMITS["export_csv"], "экспорт держит в памяти всю таблицу"
+    assert operations["import_csv"]["max_peak"] < MEMORY_LIMITS["import_csv"], "импорт держит в памяти весь файл"
+    assert report["total_retained"] < MEMORY_LIMITS["report_retained"], "память растет с каждым отчетом"
+    assert (operations["список заказов: пачками"]["max_peak"] < operations["список заказов: fetchall"]["max_peak"]), \
+        "чтение пачками не уменьшает пик памяти"
+    print("Ограничения памяти соблюдены")
+
+
+# Бенчмарк: составляющие времени запуска программы на большой базе
+
+def _import_seconds(module):
+    """Время импорта модуля в новом процессе (модули еще не в кэше процесса)"""
+    code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def _first_chunk(query):
+    """Время до первой пачки строк списка (фоновая загрузка показывает ее сразу)"""
+    for _ in db.iter_query(*query.build()):
+        break
+
+
+def bench_startup(args):
+    """
+    Составляющие времени до появления окна с данными: импорт модулей, инициализация базы,
+    загрузка списка заказов целиком (как при прежнем запуске) и до первой пачки строк (фоновая загрузка).
+    Окно здесь не создается; время первой отрисовки печатает сама программа:
+    STORE_STARTUP_REPORT=1 python main.py
+    """
+    rows = [("import db", f"{_import_seconds('db') * 1000:.0f}"),
+            ("import gui", f"{_import_seconds('gui') * 1000:.0f}"),
+            ("import analysis (matplotlib)", f"{_import_seconds('analysis') * 1000:.0f}")]
+    with temp_db():
+        fill_db(max(args.rows // 10, 1), 1000, args.rows)
+        db.close_connections()
+        init, _ = timed(db.init_db)
+        rows.append(("init_db (база уже создана)", f"{init * 1000:.0f}"))
+        for name, query in (("клиенты", db.customers_query()), ("заказы", db.orders_query())):
+            full, _ = timed(lambda: sum(len(chunk) for chunk in db.iter_query(*query.build())))
+            first, _ = timed(_first_chunk, query)
+            rows.append((f"{name}: весь список", f"{full * 1000:.0f}"))
+            rows.append((f"{name}: первая пачка", f"{first * 1000:.0f}"))
+    print(f"Заказов: {args.rows}")
+    print_table(("Этап", "Время, мс"), rows)
+
+
+# Бенчмарк: перерисовка графиков отчетов
+
+def _new_figure_report(data):
+    """Прежний способ: каждый раз новая фигура pyplot с графиком и запись PNG"""
+    fig = analysis.plt.figure(figsize=(12, 6))
+    try:
+        analysis.plt.bar([name for name, _ in data], [count for _, count in data], color='skyblue')
+        analysis.plt.xticks(rotation=45, ha='right', fontsize=10)
+        analysis.plt.tight_layout()
+        fig.savefig(io.BytesIO(), format="png")
+    finally:
+        analysis.plt.close(fig)
+
+
+def bench_charts(args):
+    """
+    Время показа отчета: новая фигура с записью PNG (как раньше) против подстановки данных
+    в уже построенный график и перерисовки холста; отдельно - переключение между отчетами.
+    Рисование идет на холсте Agg - том же, что рисует изображение для FigureCanvasTkAgg в окне.
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    repeats = 10
+    with temp_db():
+        fill_db(max(args.rows // 10, 1), 1000, args.rows)
+        query, data = timed(analysis.top_products, analysis.TOP_LIMIT)
+        # Немного разные данные на каждом шаге, чтобы график действительно менялся
+        variants = [[(name, count + i) for name, count in data] for i in range(repeats)]
+
+        new, _ = timed(lambda: [_new_figure_report(variant) for variant in variants])
+        charts = analysis.ReportCharts()
+        canvas = FigureCanvasAgg(charts.figure)
+        canvas.draw() # Первая отрисовка: шрифты и подписи попадают в кэш
+        in_place, _ = timed(lambda: [(charts.update("top_products", variant), canvas.draw()) for variant in variants])
+        charts.update("orders_dynamics", [])
+
+        def switch():
+            for i in range(repeats):
+                charts.show(("orders_dynamics", "top_products")[i % 2])
+                canvas.draw()
+
+        switching, _ = timed(switch)
+    print(f"Заказов: {args.rows}; запрос топа товаров: {query * 1000:.0f} мс")
+    print_table(("Способ", "На один показ, мс"), [
+        ("новая фигура + PNG", f"{new / repeats * 1000:.0f}"),
+        ("обновление графика + перерисовка", f"{in_place / repeats * 1000:.0f}"),
+        ("переключение отчета", f"{switching / repeats * 1000:.0f}"),
+    ])
+
+
+# Бенчмарк: архив старых заказов
+
+def bench_archive(args):
+    """
+    Время запросов до и после переноса старых заказов в архив: заказы за последний месяц
+    (архив не читается) и запросы по всем заказам (основная база вместе с архивом)
+    """
+    # fill_db создает заказы за 2023 год; в архив уходят первые девять месяцев
+    cutoff, recent = "2023-10-01", "2023-12-01"
+    queries = {
+        "заказы за месяц": lambda: db.orders_query(date_min=recent).fetch(),
+        "первая пачка всех заказов": lambda: _first_chunk(db.orders_query()),
+        "все заказы": lambda: sum(len(chunk) for chunk in db.iter_query(*db.orders_query().build())),
+        # Порядок товаров с равным числом заказов не определен - сравниваются только числа
+        "топ товаров": lambda: [count for _, count in analysis.top_products(analysis.TOP_LIMIT)],
+        "экспорт CSV": lambda: csv_io.export_csv("orders", os.path.join(tmpdir, "orders.csv")),
+    }
+    with temp_db() as tmpdir:
+        fill_db(max(args.rows // 10, 1), 1000, args.rows)
+        # Каждый запрос выполняется дважды и измеряется второй раз: страницы базы уже в кэше
+        before = {name: (query(), timed(query))[1] for name, query in queries.items()}
+        moved_time, moved = timed(archive.archive_orders, cutoff)
+        db.close_connections() # Соединения заново подключают архив
+        after = {name: (query(), timed(query))[1] for name, query in queries.items()}
+    for name in queries:
+        if before[name][1] != after[name][1]:
+            raise AssertionError(f"{name}: результат после переноса в архив отличается")
+    print(f"Заказов: {args.rows}; перенесено в архив: {moved} за {moved_time:.1f} с")
+    print_table(("Запрос", "До архива, мс", "С архивом, мс"),
+                [(name, f"{before[name][0] * 1000:.0f}", f"{after[name][0] * 1000:.0f}") for name in queries])
+
+
+# Бенчмарк: топ товаров по счетчикам популярности
+
+def _import_orders(rows, seed):
+    """Время импорта rows заказов по одной позиции (через триггеры, как при импорте CSV)"""
+    rnd = random.Random(seed)
+    customers = db.fetch_query("SELECT MAX(id) FROM customers")[0][0]
+    data = [(rnd.randint(1, customers), rnd.randint(1, 1000), "2024-01-01") for _ in range(rows)]
+    return timed(db.import_orders, data)[0]
+
+
+def bench_topk(args):
+    """
+    Время топа товаров: точный GROUP BY по всем позициям против чтения счетчиков (topk.py);
+    цена обновления счетчиков - импорт заказов с выключенными и включенными счетчиками
+    """
+    repeats = 100
+    imported = max(args.rows // 10, 1)
+    with temp_db():
+        fill_db(max(args.rows // 10, 1), 1000, args.rows)
+        exact, data = timed(analysis.top_products, analysis.TOP_LIMIT)
+        import_plain = _import_orders(imported, 1)
+        enable, _ = timed(topk.enable, topk.CAPACITY)
+        import_counted = _import_orders(imported, 2)
+        estimate, _ = timed(lambda: [topk.top_products(analysis.TOP_LIMIT) for _ in range(repeats)])
+        rows = topk.top_products(analysis.TOP_LIMIT)
+        exact_counts = dict(analysis.top_products(1000))
+        for name, count, error in rows:
+            if not count - error <= exact_counts[name] <= count:
+                raise AssertionError(f"{name}: оценка {count} (погрешность {error}), точно {exact_counts[name]}")
+    print(f"Заказов: {args.rows}; счетчиков: {topk.CAPACITY}; завышение в топе: не больше {topk.error_bound(rows)}")
+    print_table(("Операция", "Время, мс"), [
+        ("точный топ (GROUP BY)", f"{exact * 1000:.1f}"),
+        ("топ по счетчикам", f"{estimate / repeats * 1000:.3f}"),
+        ("включение (пересчет по таблицам)", f"{enable * 1000:.0f}"),
+        (f"импорт {imported} заказов без счетчиков", f"{import_plain * 1000:.0f}"),
+        (f"импорт {imported} заказов со счетчиками", f"{import_counted * 1000:.0f}"),
+    ])
+
+
+# Бенчмарк: сводка по заказам клиентов
+
+# Прежний способ получить те же столбцы: группировка всех заказов при каждой загрузке списка
+_CUSTOMERS_AGGREGATE = """SELECT customers.id, name, phone, email, address, COUNT(orders.id),
+                                 ROUND(COALESCE(SUM(orders.total), 0), 2), MAX(orders.date)
+                          FROM customers
+                          LEFT JOIN orders ON orders.customer_id = customers.id AND orders.deleted_at IS NULL
+                          WHERE customers.deleted_at IS NULL
+                          GROUP BY customers.id"""
+
+
+def bench_customer_stats(args):
+    """
+    Список клиентов со сводкой по заказам: группировка заказов при каждой загрузке против таблицы
+    customer_stats; цена ее обновления - импорт заказов с триггерами сводки и без них
+    """
+    imported = max(args.rows // 10, 1)
+    with temp_db():
+        fill_db(max(args.rows // 10, 1), 1000, args.rows)
+        rows = []
+        for name, sql in (("весь список: группировка заказов", _CUSTOMERS_AGGREGATE),
+                          ("весь список: сводка", db.customers_query(stats=True).build()[0]),
+                          ("50 лучших: группировка заказов", _CUSTOMERS_AGGREGATE + " ORDER BY 7 DESC LIMIT 50"),
+                          ("50 лучших: сводка", db.customers_query(stats=True, order_by="revenue", descending=True)
+                           .limit(50).build()[0].replace("LIMIT ? OFFSET ?", "LIMIT 50"))):
+            seconds, _ = timed(db.fetch_query, sql)
+            rows.append((name, f"{seconds * 1000:.0f}"))
+        rows.append((f"импорт {imported} заказов со сводкой", f"{_import_orders(imported, 1) * 1000:.0f}"))
+        with db.shared_connection() as conn:
+            for (trigger,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' "
+                                           "AND name LIKE 'customer_stats_order_%'").fetchall():
+                conn.execute(f"DROP TRIGGER {trigger}")
+        rows.append((f"импорт {imported} заказов без сводки", f"{_import_orders(imported, 2) * 1000:.0f}"))
+    print(f"Заказов: {args.rows}")
+    print_table(("Операция", "Время, мс"), rows)
+
+
+# Бенчмарк: проверка строк импорта
+
+def _check_all(check, rows):
+    """Проверяет строки пачками, как импорт; возвращает число ошибочных строк"""
+    errors = 0
+    for batch in validation.batches(rows, db.IMPORT_BATCH_SIZE):
+        errors += len(batch) - check(batch)[1].count(None)
+    return errors
+
+
+def bench_validation(args):
+    """Скорость проверки строк клиентов, товаров и заказов (validation.py) без записи в базу"""
+    # Строки в том виде, в каком их читает CSV: все значения - строки
+    customers = list(datagen.customer_rows(args.rows))
+    products = list(datagen.product_rows(args.rows))
+    start = date(2023, 1, 1)
+    orders = [tuple(map(str, row)) for row in datagen.order_rows(args.rows, range(1, 1001), range(1, 101), start, 365)]
+    results = []
+    for name, check, rows in (("клиенты", validation.check_customers, customers),
+                              ("товары", validation.check_products, products),
+                              ("заказы", validation.check_orders, orders)):
+        seconds, errors = timed(_check_all, check, rows)
+        if errors:
+            raise AssertionError(f"{name}: {errors} ошибочных строк в корректных данных")
+        results.append((name, f"{seconds * 1000:.0f}", f"{len(rows) / seconds / 1e6:.2f}"))
+    print(f"Строк каждого вида: {args.rows}")
+    print_table(("Строки", "Время, мс", "Млн строк/с"), results)
+
+
+# Бенчмарк: поиск похожих клиентов
+
+def _fill_duplicates(count, every=100):
+    """
+    Заполняет базу клиентами datagen и добавляет к каждому every-му клиенту дубль: ФИО с инициалами,
+    тот же телефон в другой записи, без email. У клиента и дубля по три заказа.
+    Возвращает множество пар (id, id дубля)
+    """
+    rows = list(datagen.customer_rows(count))
+    conn = db.get_connection()
+    with conn:
+        conn.executemany("INSERT INTO customers (id, name, phone, email, address, natural_key) "
+                         "VALUES (?, ?, ?, ?, ?, ?)",
+                         ((i + 1, name, phone, email, address, db.customer_key(phone, email))
+                          for i, (name, phone, email, address) in enumerate(rows)))
+        conn.execute("INSERT INTO products (name, price) VALUES ('Товар', 100)")
+        day = db.to_day("2024-01-10")
+        injected = set()
+        for i in range(0, count, every):
+            name, phone, _, address = rows[i]
+            surname, first, *rest = name.split()
+            variant = " ".join([surname] + [word[0] + "." for word in [first] + rest])
+            digits = phone[-10:]
+            variant_phone = f"8 ({digits[:3]}) {digits[3:6]}-{digits[6:8]}-{digits[8:]}"
+            dup_id = conn.execute("INSERT INTO customers (name, phone, email, address) VALUES (?, ?, '', ?)",
+                                  (variant, variant_phone, address)).lastrowid
+            conn.executemany("INSERT INTO orders (customer_id, date) VALUES (?, ?)",
+                             [(i + 1, day), (dup_id, day)] * 3)
+            injected.add((i + 1, dup_id))
+    conn.close()
+    return injected
+
+
+def bench_dedup(args):
+    """
+    Поиск похожих клиентов: число пар-кандидатов после блокировки против попарного сравнения,
+    оценка пар в одном и в нескольких процессах, доля найденных дублей и объединение
+    """
+    workers = os.cpu_count() or 1
+    with temp_db():
+        injected = _fill_duplicates(args.rows)
+        total = db.fetch_query("SELECT COUNT(*) FROM customers")[0][0]
+        records = [dedup._record(row) for row in db.fetch_query(
+            "SELECT id, name, phone, email, address FROM customers WHERE deleted_at IS NULL")]
+        blocking, (pairs, skipped) = timed(dedup.candidate_pairs, records)
+        single, found = timed(dedup.find_pairs, workers=1)
+        parallel, found_parallel = timed(dedup.find_pairs, workers=workers)
+        if found_parallel != found:
+            raise AssertionError("Результаты в одном и в нескольких процессах различаются")
+        recall = len(injected & {(a, b) for _, a, b in found}) / len(injected)
+        suggestions = dedup.suggest_merges(found)
+        merge, moved = timed(lambda: sum(dedup.merge(keep_id, duplicate_ids)
+                                         for keep_id, duplicate_ids, _ in suggestions))
+    print(f"Клиентов: {total}; пар всего: {total * (total - 1) // 2}; кандидатов: {len(pairs)} "
+          f"(пропущено больших блоков: {skipped})")
+    print(f"Найдено пар: {len(found)}; из добавленных дублей найдено: {recall:.1%}")
+    print_table(("Операция", "Время, мс"), [
+        ("блокировка (ключи и пары)", f"{blocking * 1000:.0f}"),
+        ("поиск, 1 процесс", f"{single * 1000:.0f}"),
+        (f"поиск, процессов: {workers}", f"{parallel * 1000:.0f}"),
+        (f"объединение {len(suggestions)} групп ({moved} заказов)", f"{merge * 1000:.0f}"),
+    ])
+
+
+# Бенчмарк: даты заказов номерами дней
+
+# Запросы по диапазону дат к таблице {table}: сводка за месяц и число заказов по дням за год
+_DATE_QUERIES = (
+    ("сводка за месяц", "SELECT COUNT(*), SUM(total) FROM {table} WHERE deleted_at IS NULL AND date BETWEEN ? AND ?",
+     ("2023-06-01", "2023-06-30")),
+    ("заказы по дням за год", "SELECT date, COUNT(*) FROM {table} WHERE deleted_at IS NULL AND date >= ? "
+                              "GROUP BY date ORDER BY date", ("2023-01-01",)),
+)
+
+
+def _table_sizes(conn, names):
+    """Размер таблиц и индексов в байтах по dbstat (None, если SQLite собран без dbstat)"""
+    try:
+        sizes = dict(conn.execute("SELECT name, SUM(pgsize) FROM dbstat GROUP BY name").fetchall())
+    except sqlite3.OperationalError:
+        return [None] * len(names)
+    return [sizes.get(name) for name in names]
+
+
+def bench_dates(args):
+    """
+    Даты заказов текстом ГГГГ-ММ-ДД против номеров дней (db.to_day): размер таблицы заказов и индекса
+    по дате, время запросов по диапазону дат и группировки по дням
+    """
+    repeats = 20
+    with temp_db():
+        fill_db(max(args.rows // 10, 1), 1000, args.rows)
+        conn = db.shared_connection()
+        # Та же таблица заказов с прежним текстовым хранением дат
+        with conn:
+            conn.execute(f"CREATE TABLE orders_text AS SELECT id, customer_id, {db.day_sql('date')} AS date, "
+                         "total, deleted_at FROM orders")
+            conn.execute("CREATE INDEX idx_orders_text_date ON orders_text(date) WHERE deleted_at IS NULL")
+        conn.execute("VACUUM") # Страницы обеих таблиц заполнены одинаково плотно
+        rows = []
+        for label, table, index, convert in (("текст", "orders_text", "idx_orders_text_date", str),
+                                             ("номер дня", "orders", "idx_orders_date", db.to_day)):
+            sizes = _table_sizes(conn, (table, index))
+            row = [label] + [f"{size / 1024:.0f}" if size is not None else "-" for size in sizes]
+            for _, sql, params in _DATE_QUERIES:
+                query = sql.format(table=table)
+                values = tuple(map(convert, params))
+                seconds, _ = timed(lambda: [conn.execute(query, values).fetchall() for _ in range(repeats)])
+                row.append(f"{seconds / repeats * 1000:.1f}")
+            rows.append(row)
+        # Перевод на границе с базой: сколько стоит показать дату строкой
+        days = [day for (day,) in conn.execute("SELECT date FROM orders LIMIT 100000")]
+        convert_seconds, _ = timed(lambda: [db.day_text(day) for day in days])
+    print(f"Заказов: {args.rows}")
+    print_table(("Хранение даты", "Таблица, КБ", "Индекс, КБ") + tuple(f"{name}, мс" for name, *_ in _DATE_QUERIES),
+                rows)
+    print(f"Перевод {len(days)} номеров дней в строки ГГГГ-ММ-ДД: {convert_seconds * 1000:.0f} мс")
+
+
+# Бенчмарк: одновременная запись из нескольких процессов
+
+# Сколько "горячих" товаров правят операторы, сколько секунд длится прогон и сколько процессов запускается
+STRESS_PRODUCTS = 20
+STRESS_SECONDS = 3
+STRESS_PROCESSES = (1, 2, 4)
+
+
+def _stress_worker(db_name, seconds, cas, seed):
+    """
+    Процесс-оператор: в цикле открывает случайный товар, "редактирует" его (пауза) и сохраняет цену на 1 больше.
+    cas=False - прежнее поведение, обновление без проверки версии. Возвращает (сохранено, конфликтов, ошибок)
+    """
+    db.DB_NAME = db_name
+    rnd = random.Random(seed)
+    saved = conflicts = errors = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        product = db.get_product(rnd.randint(1, STRESS_PRODUCTS))
+        if not cas:
+            product.version = None
+        product.price += 1
+        time.sleep(rnd.uniform(0, 0.002)) # Время между чтением записи и сохранением формы
+        try:
+            if db.update_product(product) is None:
+                errors += 1
+            else:
+                saved += 1
+        except db.UpdateConflict:
+            conflicts += 1 # Оператор увидит конфликт и сохранит заново по текущим данным
+    db.close_connections()
+    return saved, conflicts, errors
+
+
+def bench_concurrency(args):
+    """
+    Несколько процессов одновременно правят одни и те же товары: сохранений в секунду, конфликтов
+    и потерянных обновлений (сохранение, которое затерло чужое) без проверки версии и с ней
+    """
+    rows = []
+    context = multiprocessing.get_context("spawn")
+    for cas in (False, True):
+        for processes in STRESS_PROCESSES:
+            with temp_db():
+                fill_db(1000, STRESS_PRODUCTS, args.rows)
+                before = db.fetch_query("SELECT SUM(price) FROM products")[0][0]
+                db.close_connections()
+                with ProcessPoolExecutor(processes, mp_context=context) as executor:
+                    results = list(executor.map(_stress_worker, [db.DB_NAME] * processes,
+                                                [STRESS_SECONDS] * processes, [cas] * processes, range(processes)))
+                saved, conflicts, errors = (sum(column) for column in zip(*results))
+                # Каждое сохранение увеличивает сумму цен на 1; разница - затертые сохранения
+                lost = saved - round(db.fetch_query("SELECT SUM(price) FROM products")[0][0] - before)
+            rows.append(("версия" if cas else "без проверки", processes, f"{saved / STRESS_SECONDS:.0f}",
+                         conflicts, errors, lost, f"{lost / saved * 100 if saved else 0:.1f}"))
+    print(f"Заказов: {args.rows}, товаров: {STRESS_PRODUCTS}, секунд на прогон: {STRESS_SECONDS}")
+    print_table(("Обновление", "Процессов", "Сохранений/с", "Конфликтов", "Ошибок", "Потеряно", "Потеряно, %"),
+                rows)
+
+
+# Бенчмарк: отзывчивость окна при типичных действиях пользователя
+
+# Допустимое опоздание пульса (p99, мс) для обработчиков, которые не должны останавливать окно:
+# списки загружаются в фоне и вставляются порциями, отчеты строятся в фоне.
+# Сортировка и импорт CSV выполняются в главном потоке - для них только печатаются измерения
+UI_BUDGETS_MS = {
+    "load_customers": 250,
+    "load_orders": 250,
+    "apply_order_filters": 250,
+    "refresh_report": 500,
+}
+
+
+def _pump(app, done, timeout=120):
+    """Обрабатывает события окна, пока done() не вернет True (как главный цикл, но с выходом)"""
+    deadline = time.perf_counter() + timeout
+    while not done():
+        if time.perf_counter() > deadline:
+            raise TimeoutError("окно не закончило операцию за отведенное время")
+        app.update()
+        time.sleep(0.002)
+
+
+def bench_ui(args):
+    """
+    Окно программы на большой базе без участия пользователя: показ списков, фильтр, сортировка,
+    импорт CSV и отчет; зависания главного цикла собираются пульсом uilag по обработчикам.
+    Опоздание больше UI_BUDGETS_MS - ошибка. Нужен дисплей; на сервере без него - через xvfb-run:
+    xvfb-run python bench.py ui --rows 100000
+    """
+    import tkinter
+    from unittest import mock
+    import gui
+    import uilag
+    with temp_db() as tmpdir:
+        fill_db(max(args.rows // 10, 1), 1000, args.rows)
+        csv_path = os.path.join(tmpdir, "orders.csv")
+        with open(csv_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["ID клиента", "ID товара", "Дата"])
+            writer.writerows((i % 100 + 1, i % 1000 + 1, "2024-06-01") for i in range(max(args.rows // 10, 1)))
+        try:
+            app = gui.App()
+        except tkinter.TclError as e:
+            print(f"Окно не создается ({e}); запустите через xvfb-run")
+            return
+        uilag.reset()
+        uilag.start(app)
+        # Диалоги выбора файла и сообщения отвечают сами, чтобы не ждать пользователя
+        with mock.patch.object(gui.filedialog, "askopenfilename", return_value=csv_path), \
+                mock.patch.multiple(gui.messagebox, askyesno=mock.DEFAULT, showinfo=mock.DEFAULT,
+                                    showerror=mock.DEFAULT) as dialogs:
+            dialogs["askyesno"].return_value = False
+            try:
+                def loads(name):
+                    return sum(stage == f"загружено: {name}" for stage, _ in app.startup.marks)
+
+                # Первая вкладка (клиенты) загружается сама после создания окна
+                seconds, _ = timed(_pump, app, lambda: loads("load_customers"))
+                rows = [("список клиентов", f"{seconds * 1000:.0f}")]
+                steps = [
+                    ("список заказов", lambda: app.notebook.select(app.order_tab), "load_orders"),
+                    ("фильтр по дате", lambda: (app.order_date_min_filter.insert(0, "2023-06-01"),
+                                                app.apply_order_filters()), "load_orders"),
+                    ("сортировка по сумме", lambda: app.sort_treeview(app.order_tree, "Сумма"), None),
+                    ("импорт CSV", app.import_order_csv, "load_orders"),
+                ]
+                for title, action, wait_for in steps:
+                    before = loads(wait_for)
+                    started = time.perf_counter()
+                    action()
+                    _pump(app, lambda: wait_for is None or loads(wait_for) > before)
+                    rows.append((title, f"{(time.perf_counter() - started) * 1000:.0f}"))
+                app.notebook.select(app.report_tab)
+                seconds, _ = timed(_pump, app, lambda: app.report_versions)
+                rows.append(("отчет", f"{seconds * 1000:.0f}"))
+            finally:
+                uilag.stop()
+                app.destroy()
+
+    print(f"Заказов: {args.rows}")
+    print_table(("Действие", "Время, мс"), rows)
+    print()
+    print(uilag.format_stats())
+    over = [(item["name"], item["p99"]) for item in uilag.stats()
+            if item["name"] in UI_BUDGETS_MS and item["p99"] > UI_BUDGETS_MS[item["name"]]]
+    assert not over, f"окно зависает дольше допустимого: {over}"
+    print("Окно отвечает в пределах UI_BUDGETS_MS")
+
+
+# Бенчмарк: цена товара на дату заказа по истории цен
+
+PRICE_CHANGES = (24, 300)  # Изменений цены каждого товара за год заказов
+
+# Выручка по ценам прайса на дату заказа за год: {price} - выражение цены позиции
+_LIST_REVENUE = """
+    SELECT ROUND(SUM(orders.quantity * {price}), 2) FROM order_lines AS orders {join}
+    WHERE orders.deleted_at IS NULL AND orders.date >= ?
+    """
+
+# Тот же запрос соединением по диапазону: периоды [valid_from, valid_to) с индексом по концу периода
+_PRICE_PERIODS = """
+    CREATE TEMP TABLE price_periods AS
+    SELECT product_id, valid_from,
+           LEAD(valid_from, 1, 2147483647) OVER (PARTITION BY product_id ORDER BY valid_from) AS valid_to, price
+    FROM price_history
+    """
+_RANGE_JOIN = ("JOIN price_periods ON price_periods.product_id = orders.product_id "
+               "AND price_periods.valid_to > orders.date AND price_periods.valid_from <= orders.date")
+
+
+def _fill_price_history(changes, seed=1):
+    """Заменяет историю цен каждого товара на changes случайных изменений за год заказов fill_db"""
+    rnd = random.Random(seed)
+    start = db.to_day("2023-01-01")
+    conn = db.get_connection()
+    with conn:
+        conn.execute("DELETE FROM price_history")
+        rows = []
+        for (product_id,) in conn.execute("SELECT id FROM products").fetchall():
+            days = [0] + sorted(rnd.sample(range(start + 1, start + 365), changes))
+            rows.extend((product_id, day, round(rnd.uniform(10, 10000), 2)) for day in days)
+        conn.executemany("INSERT INTO price_history (product_id, valid_from, price) VALUES (?, ?, ?)", rows)
+    conn.close()
+    return len(rows)
+
+
+def bench_price_history(args):
+    """
+    Выручка по ценам прайса на дату каждого заказа: поиск по ключу истории цен для каждой позиции
+    (db.PRICE_AT_ORDER_DATE) против соединения по диапазону дат с индексом по концу периода.
+    Для сравнения - тот же запрос по ценам продажи, без истории цен.
+    """
+    repeats = 3
+    rows, results = [], set()
+    with temp_db():
+        fill_db(max(args.rows // 10, 1), 1000, args.rows)
+        for changes in PRICE_CHANGES:
+            periods = _fill_price_history(changes)
+            conn = db.get_connection()
+            conn.execute(_PRICE_PERIODS)
+            conn.execute("CREATE INDEX temp.idx_price_periods ON price_periods(product_id, valid_to, price)")
+            params = (db.to_day("2023-01-01"),)
+            variants = (
+                ("цены продажи (без истории)", _LIST_REVENUE.format(price="orders.unit_price", join="")),
+                ("поиск по ключу на позицию", _LIST_REVENUE.format(
+                    price=db.PRICE_AT_ORDER_DATE.format(product="orders.product_id"), join="")),
+                ("соединение по диапазону", _LIST_REVENUE.format(price="price_periods.price", join=_RANGE_JOIN)),
+            )
+            for name, query in variants:
+                seconds = min(timed(lambda: conn.execute(query, params).fetchone())[0] for _ in range(repeats))
+                if name != variants[0][0]:
+                    results.add((changes, conn.execute(query, params).fetchone()[0]))
+                rows.append((name, periods, f"{seconds * 1000:.0f}"))
+            conn.close()
+    print(f"Позиций заказов: {args.rows}, товаров: 1000")
+    print_table(("Запрос", "Периодов цен", "Время, мс"), rows)
+    assert len(results) == len(PRICE_CHANGES), f"способы дают разную выручку: {results}"
+
+
+BENCHMARKS = {
+    "columnar": bench_columnar,
+    "fetch": bench_fetch,
+    "async": bench_async,
+    "api": bench_api,
+    "delete": bench_delete,
+    "backup": bench_backup,
+    "memory": bench_memory,
+    "startup": bench_startup,
+    "charts": bench_charts,
+    "archive": bench_archive,
+    "topk": bench_topk,
+    "customer-stats": bench_customer_stats,
+    "validation": bench_validation,
+    "dedup": bench_dedup,
+    "dates": bench_dates,
+    "concurrency": bench_concurrency,
+    "ui": bench_ui,
+    "price-history": bench_price_history,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарки менеджера интернет-магазина")
+    parser.add_argument("name", choices=sorted(BENCHMARKS), help="какой бенчмарк запустить")
+    parser.add_argument("--rows", type=int, default=100000, help="количество строк в тестовых данных")
+    args = parser.parse_args()
+    BENCHMARKS[args.name](args)
+
+
+if __name__ == "__main__":
+    main()
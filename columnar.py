@@ -0,0 +1,182 @@
+"""
+Модуль для экспорта и импорта данных в колоночном формате NumPy
+Файл .npz - это zip-архив со сжатием, внутри которого каждая колонка
+каждой пачки строк хранится отдельным массивом .npy:
+
+    meta.json              - имя таблицы, колонки, число пачек и строк
+    00000/id.npy           - колонка "id" первой пачки
+    00000/name.codes.npy   - строковая колонка "name" первой пачки: номера значений
+    00000/name.values.npy  - и словарь различных значений (values[codes] дает колонку)
+    00001/...              - вторая пачка и т.д.
+
+Такой файл пишется и читается пачками, а внешние инструменты (NumPy, pandas)
+загружают колонки целиком без построчного разбора, как у CSV.
+Строки хранятся со словарным кодированием: имена клиентов и названия товаров
+в заказах повторяются, поэтому каждое значение записывается один раз.
+"""
+import json
+import zipfile
+import numpy as np # NumPy устанавливается вместе с matplotlib
+import db
+import memprof
+
+# Количество строк в одной пачке
+CHUNK_SIZE = 50000
+
+# Уровень сжатия zip: 1 - быстрое сжатие, почти не уступающее по размеру уровню по умолчанию
+COMPRESS_LEVEL = 1
+
+# Описание экспортируемых наборов данных: запрос и колонки с типами (удаленные записи не выгружаются;
+# источники заказов {order_lines} и других подставляет db.with_archive)
+# Типы: "int" - целые числа, "float" - числа с плавающей точкой, "str" - строки
+DATASETS = {
+    "customers": (
+        "SELECT id, name, phone, email, address FROM customers WHERE deleted_at IS NULL ORDER BY id",
+        [("id", "int"), ("name", "str"), ("phone", "str"), ("email", "str"), ("address", "str")],
+    ),
+    "products": (
+        "SELECT id, name, price FROM products WHERE deleted_at IS NULL ORDER BY id",
+        [("id", "int"), ("name", "str"), ("price", "float")],
+    ),
+    # Позиции заказов вместе с клиентом и датой заказа
+    "orders": (
+        f"SELECT order_id, customer_id, product_id, {db.day_sql('date')}, quantity, unit_price "
+        "FROM {order_lines} AS orders "
+        f"WHERE {db.ACTIVE_ORDERS} ORDER BY orders.order_id, orders.id",
+        [("order_id", "int"), ("customer_id", "int"), ("product_id", "int"), ("date", "str"),
+         ("quantity", "int"), ("unit_price", "float")],
+    ),
+    # Заказы с данными клиента и списком товаров, как их возвращает db.get_all_orders()
+    "orders_view": (
+        db.ORDERS_VIEW_QUERY,
+        [("id", "int"), ("customer_name", "str"), ("customer_phone", "str"),
+         ("products", "str"), ("total", "float"), ("date", "str")],
+    ),
+}
+
+
+def _to_array(values, kind):
+    """Преобразует список значений колонки в массив NumPy нужного типа"""
+    if kind == "int":
+        return np.array(values, dtype=np.int64)
+    if kind == "float":
+        # Пустые значения (NULL) превращаются в NaN
+        return np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+    # Пустые строки (NULL) сохраняются как ""
+    return np.array(["" if v is None else str(v) for v in values], dtype=str)
+
+
+def _encode_strings(values):
+    """Словарное кодирование строковой колонки: возвращает (номера значений, массив значений)"""
+    # dict.fromkeys оставляет различные значения в порядке появления, затем каждому выдается номер
+    index = {value: code for code, value in enumerate(dict.fromkeys(values))}
+    codes = np.fromiter(map(index.__getitem__, values), dtype=np.int32, count=len(values))
+    return codes, _to_array(list(index), "str")
+
+
+def _write_array(zf, name, array):
+    """Записывает массив NumPy в архив как отдельный файл .npy"""
+    with zf.open(name, "w", force_zip64=True) as f:
+        np.lib.format.write_array(f, array, allow_pickle=False)
+
+
+def _read_array(zf, name):
+    """Читает массив NumPy из файла .npy внутри архива"""
+    with zf.open(name) as f:
+        return np.lib.format.read_array(f, allow_pickle=False)
+
+
+@memprof.profiled()
+def export_dataset(name, filepath, chunk_size=CHUNK_SIZE):
+    """
+    Экспортирует набор данных (customers, products, orders или orders_view) в файл .npz.
+    Строки читаются из БД и записываются в архив пачками по chunk_size.
+    Возвращает количество записанных строк.
+    """
+    if name not in DATASETS:
+        raise ValueError(f"Неизвестный набор данных: {name}")
+    query, columns = DATASETS[name]
+    query = db.with_archive(query) # Заказы - вместе с архивом
+
+    rows_total = 0
+    chunks = 0
+    with zipfile.ZipFile(filepath, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=COMPRESS_LEVEL) as zf:
+        for rows in db.iter_query(query, chunk_size=chunk_size):
+            # Транспонируем пачку: из списка строк получаем список колонок
+            for (column, kind), values in zip(columns, zip(*rows)):
+                prefix = f"{chunks:05d}/{column}"
+                if kind == "str":
+                    codes, uniques = _encode_strings(values)
+                    _write_array(zf, prefix + ".codes.npy", codes)
+                    _write_array(zf, prefix + ".values.npy", uniques)
+                else:
+                    _write_array(zf, prefix + ".npy", _to_array(values, kind))
+            rows_total += len(rows)
+            chunks += 1
+
+        meta = {"dataset": name, "columns": columns, "chunks": chunks, "rows": rows_total}
+        zf.writestr("meta.json", json.dumps(meta, ensure_ascii=False))
+    return rows_total
+
+
+def read_meta(filepath):
+    """Возвращает описание файла .npz: набор данных, колонки, число пачек и строк"""
+    with zipfile.ZipFile(filepath) as zf:
+        return json.loads(zf.read("meta.json"))
+
+
+def iter_chunks(filepath):
+    """Читает файл .npz по пачкам, выдавая словари {колонка: массив NumPy}"""
+    with zipfile.ZipFile(filepath) as zf:
+        meta = json.loads(zf.read("meta.json"))
+        for chunk in range(meta["chunks"]):
+            columns = {}
+            for column, kind in meta["columns"]:
+                prefix = f"{chunk:05d}/{column}"
+                if kind == "str":
+                    # Восстанавливаем колонку из словаря одной операцией индексации
+                    columns[column] = _read_array(zf, prefix + ".values.npy")[_read_array(zf, prefix + ".codes.npy")]
+                else:
+                    columns[column] = _read_array(zf, prefix + ".npy")
+            yield columns
+
+
+def read_columns(filepath):
+    """Читает весь файл .npz и возвращает словарь {колонка: массив NumPy}"""
+    meta = read_meta(filepath)
+    parts = {column: [] for column, _ in meta["columns"]}
+    for chunk in iter_chunks(filepath):
+        for column, values in chunk.items():
+            parts[column].append(values)
+    return {
+        column: np.concatenate(values) if values else _to_array([], kind)
+        for (column, kind), values in zip(meta["columns"], parts.values())
+    }
+
+
+def _iter_rows(filepath, columns):
+    """Выдает строки из выбранных колонок файла .npz в виде списков значений Python"""
+    for chunk in iter_chunks(filepath):
+        # tolist() переводит всю колонку в обычные типы Python за один вызов
+        yield from zip(*(chunk[column].tolist() for column in columns))
+
+
+@memprof.profiled()
+def import_dataset(filepath, create_missing=False):
+    """
+    Импортирует файл .npz, созданный export_dataset, через те же пакетные функции, что и импорт CSV:
+    клиенты и товары - в режиме синхронизации, заказы - с проверкой ссылок
+    (create_missing передается в db.import_orders).
+    Возвращает словарь со статистикой импорта.
+    """
+    name = read_meta(filepath)["dataset"]
+    if name == "customers":
+        return db.upsert_customers(_iter_rows(filepath, ("name", "phone", "email", "address")))
+    if name == "products":
+        return db.upsert_products(_iter_rows(filepath, ("name", "price")))
+    if name == "orders":
+        # Позиции с одним order_id собираются в один заказ, как в исходной базе
+        return db.import_orders(_iter_rows(filepath, ("order_id", "customer_id", "product_id", "date", "quantity",
+                                                      "unit_price")),
+                                create_missing=create_missing, grouped=True)
+    raise ValueError(f"Набор данных {name} нельзя импортировать")
@@ -0,0 +1,167 @@
+"""
+Модуль для импорта и экспорта данных в CSV
+Поддерживает сжатые файлы (.csv.gz, .csv.zst), продолжение прерванного импорта
+и отчет о ходе работы (строки, байты, оставшееся время) для GUI и командной строки.
+"""
+import collections
+import csv
+import gzip
+import io
+import itertools
+import os
+import time
+import db
+import memprof
+
+# Как часто (в секундах) вызывать функцию отчета о ходе работы
+PROGRESS_INTERVAL = 0.2
+
+# Через сколько строк импорта проверять, не пора ли сообщить о ходе работы
+PROGRESS_ROWS = 1000
+
+# Заголовок колонки с номером заказа: по нему позиции одного заказа собираются обратно при импорте
+# (файлы без этой колонки импортируются по-старому - строка на заказ)
+ORDER_KEY_HEADER = "ID заказа"
+
+# Заголовки CSV и запросы для экспорта каждого типа данных (удаленные записи не выгружаются;
+# источник позиций заказов {order_lines} подставляет db.with_archive)
+EXPORTS = {
+    "customers": (["ФИО", "Телефон", "Email", "Адрес"],
+                  "SELECT name, phone, email, address FROM customers WHERE deleted_at IS NULL ORDER BY id"),
+    "products": (["Название", "Цена"],
+                 "SELECT name, price FROM products WHERE deleted_at IS NULL ORDER BY id"),
+    # Каждая позиция заказа выгружается отдельной строкой, позиции одного заказа - подряд
+    "orders": ([ORDER_KEY_HEADER, "ID клиента", "ID товара", "Дата заказа", "Количество", "Цена"],
+               f"SELECT order_id, customer_id, product_id, {db.day_sql('date')}, quantity, unit_price "
+               "FROM {order_lines} AS orders "
+               f"WHERE {db.ACTIVE_ORDERS} ORDER BY orders.order_id, orders.id"),
+}
+
+
+def _wrap(raw, filepath, mode):
+    """Оборачивает двоичный файл в текстовый поток с (рас)паковкой по расширению имени файла"""
+    if filepath.endswith(".gz"):
+        stream = gzip.GzipFile(fileobj=raw, mode=mode + "b")
+    elif filepath.endswith(".zst"):
+        try:
+            import zstandard # Необязательная зависимость, нужна только для файлов .zst
+        except ImportError:
+            raise RuntimeError("Для работы с файлами .zst установите пакет zstandard: pip install zstandard")
+        if mode == "r":
+            stream = zstandard.ZstdDecompressor().stream_reader(raw, closefd=False)
+        else:
+            stream = zstandard.ZstdCompressor().stream_writer(raw, closefd=False)
+    else:
+        stream = raw
+    return io.TextIOWrapper(stream, encoding="utf-8", newline="")
+
+
+class Progress:
+    """Отслеживает ход работы и не чаще раза в PROGRESS_INTERVAL вызывает callback(строки, байты, доля, ETA)"""
+
+    def __init__(self, callback):
+        self.callback = callback
+        self.start = time.monotonic()
+        self.last = 0.0
+
+    def update(self, rows, bytes_done, fraction, force=False):
+        """Сообщает о ходе работы; fraction - выполненная доля от 0 до 1 (или None, если неизвестна)"""
+        if self.callback is None:
+            return
+        now = time.monotonic()
+        if not force and now - self.last < PROGRESS_INTERVAL:
+            return
+        self.last = now
+        eta = None
+        if fraction:
+            # Оставшееся время оцениваем по средней скорости с начала работы
+            eta = (now - self.start) * (1 - fraction) / fraction
+        self.callback(rows, bytes_done, fraction, eta)
+
+
+def format_progress(rows, bytes_done, fraction, eta):
+    """Формирует строку о ходе работы для строки состояния GUI и командной строки"""
+    text = f"Строк: {rows}, {bytes_done / 1024 / 1024:.1f} МБ"
+    if fraction is not None:
+        text += f", {fraction * 100:.0f}%"
+    if eta is not None:
+        text += f", осталось ~{eta:.0f} с"
+    return text
+
+
+def checkpoint_name(kind, filepath):
+    """Имя контрольной точки импорта: тип данных, полный путь и размер файла"""
+    return f"{kind}:{os.path.abspath(filepath)}:{os.path.getsize(filepath)}"
+
+
+@memprof.profiled()
+def import_csv(kind, filepath, resume=True, progress=None, create_missing=False):
+    """
+    Импортирует CSV-файл клиентов, товаров или заказов (kind: customers, products, orders).
+    Если для файла есть контрольная точка прерванного импорта и resume=True,
+    уже импортированные строки пропускаются. progress - функция отчета о ходе работы.
+    Возвращает словарь со статистикой импорта (с ключом resumed_from - сколько строк пропущено).
+    """
+    checkpoint = checkpoint_name(kind, filepath)
+    offset = db.get_checkpoint(checkpoint) if resume else 0
+    total_bytes = os.path.getsize(filepath)
+    tracker = Progress(progress)
+
+    with open(filepath, "rb") as raw:
+        with _wrap(raw, filepath, "r") as f:
+            reader = csv.reader(f)
+            header = next(reader, None) or []  # Пропускаем заголовок
+            # Пропускаем строки, импортированные до прерывания (deque с maxlen=0 просто исчерпывает итератор)
+            collections.deque(itertools.islice(reader, offset), maxlen=0)
+
+            rows_done = offset
+
+            def rows():
+                nonlocal rows_done
+                for rows_done, row in enumerate(reader, start=offset + 1):
+                    yield row
+                    if rows_done % PROGRESS_ROWS == 0:
+                        # raw.tell() - сколько байт файла (сжатого, если он сжат) уже прочитано
+                        tracker.update(rows_done, raw.tell(), raw.tell() / total_bytes if total_bytes else None)
+
+            if kind == "customers":
+                result = db.upsert_customers(rows(), checkpoint=checkpoint, offset=offset)
+            elif kind == "products":
+                result = db.upsert_products(rows(), checkpoint=checkpoint, offset=offset)
+            elif kind == "orders":
+                # Выгрузка с колонкой ID заказа: позиции одного заказа снова становятся одним заказом
+                grouped = bool(header) and header[0].strip() == ORDER_KEY_HEADER
+                result = db.import_orders(rows(), create_missing=create_missing,
+                                          checkpoint=checkpoint, offset=offset, grouped=grouped)
+            else:
+                raise ValueError(f"Неизвестный тип данных: {kind}")
+
+    tracker.update(rows_done, total_bytes, 1.0, force=True)
+    result["resumed_from"] = offset
+    return result
+
+
+@memprof.profiled()
+def export_csv(kind, filepath, progress=None):
+    """
+    Экспортирует клиентов, товаров или заказов в CSV-файл (сжатый, если имя оканчивается на .gz или .zst).
+    Строки читаются из БД пачками. Возвращает количество записанных строк.
+    """
+    if kind not in EXPORTS:
+        raise ValueError(f"Неизвестный тип данных: {kind}")
+    header, query = EXPORTS[kind]
+    query = db.with_archive(query) # Заказы - вместе с архивом
+    total_rows = db.fetch_query(f"SELECT COUNT(*) FROM ({query})")[0][0]
+    tracker = Progress(progress)
+
+    rows_done = 0
+    with open(filepath, "wb") as raw:
+        with _wrap(raw, filepath, "w") as f:
+            writer = csv.writer(f)
+            writer.writerow(header) # Заголовки столбцов
+            for rows in db.iter_query(query):
+                writer.writerows(rows)
+                rows_done += len(rows)
+                tracker.update(rows_done, raw.tell(), rows_done / total_rows if total_rows else None)
+    tracker.update(rows_done, os.path.getsize(filepath), 1.0, force=True)
+    return rows_done
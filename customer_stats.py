@@ -0,0 +1,82 @@
+"""
+Сводка по заказам клиентов: число заказов, сумма покупок, даты первого и последнего заказа
+
+    python main.py customer-stats --check     # сверить сводку с заказами
+    python main.py customer-stats --rebuild   # пересчитать сводку целиком
+
+Сводка хранится в таблице customer_stats и обновляется триггерами при каждой записи заказа
+(форма заказа, импорт, удаление и восстановление), поэтому вкладка "Клиенты" показывает ее
+и сортирует по ней без группировки всех заказов. Число заказов и сумма меняются сразу; дату первого
+или последнего заказа после удаления такого заказа триггер вычислить не может и помечает строку
+(stale) - refresh_stale пересчитывает помеченные строки перед показом списка. Архивные заказы
+учитываются: перенос в архив сводку не меняет, а пересчет читает архив вместе с основной базой.
+"""
+import json
+import db
+
+# Сводка по неудаленным заказам клиентов (с архивом); {where} - дополнительное условие на заказы
+_AGGREGATE = """SELECT orders.customer_id, COUNT(*), ROUND(SUM(orders.total), 2), MIN(orders.date), MAX(orders.date)
+                FROM {{orders}} AS orders
+                WHERE orders.deleted_at IS NULL {where}
+                GROUP BY orders.customer_id"""
+
+
+def _recompute(conn, customer_ids=None):
+    """Пересчитывает строки сводки клиентов customer_ids (None - всех) по заказам; возвращает их число"""
+    where, params = "", ()
+    if customer_ids is not None:
+        where, params = "AND orders.customer_id IN (SELECT value FROM json_each(?))", (json.dumps(customer_ids),)
+    # Источники выбираются до начала транзакции: архив подключается только вне ее
+    aggregate = db.with_archive(_AGGREGATE.format(where=where), conn=conn)
+    customers = "" if customer_ids is None else "WHERE customers.id IN (SELECT value FROM json_each(?))"
+    conn.execute("BEGIN IMMEDIATE")
+    with conn:
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS stats_recompute "
+                     "(customer_id INTEGER PRIMARY KEY, order_count, revenue, first_order, last_order)")
+        conn.execute("DELETE FROM stats_recompute")
+        conn.execute(f"INSERT INTO stats_recompute {aggregate}", params)
+        # Строки появляются и у клиентов без сводки (например, после сбоя), и обнуляются у клиентов без заказов
+        c = conn.execute(f"""INSERT OR REPLACE INTO customer_stats
+                                 (customer_id, order_count, revenue, first_order, last_order, stale)
+                             SELECT customers.id, COALESCE(r.order_count, 0), COALESCE(r.revenue, 0),
+                                    r.first_order, r.last_order, 0
+                             FROM customers
+                             LEFT JOIN stats_recompute AS r ON r.customer_id = customers.id
+                             {customers}""", params)
+        conn.execute("DELETE FROM stats_recompute")
+    return c.rowcount
+
+
+def refresh_stale():
+    """Пересчитывает строки сводки, помеченные триггерами (после удаления заказа с крайней датой)"""
+    conn = db.shared_connection()
+    ids = [row[0] for row in conn.execute("SELECT customer_id FROM customer_stats WHERE stale = 1")]
+    return _recompute(conn, ids) if ids else 0
+
+
+def rebuild():
+    """Пересчитывает сводку всех клиентов; возвращает число строк"""
+    return _recompute(db.shared_connection())
+
+
+def check():
+    """
+    Сверяет сводку с заказами (строки, ожидающие пересчета, сначала пересчитываются).
+    Возвращает список расхождений (id клиента, строка сводки, строка по заказам);
+    строка - (число заказов, сумма, первый заказ, последний заказ).
+    """
+    refresh_stale()
+    conn = db.shared_connection()
+    actual = {row[0]: row[1:] for row in conn.execute(db.with_archive(_AGGREGATE.format(where=""), conn=conn))}
+    mismatches = []
+    stored = conn.execute("""SELECT customers.id, customer_stats.order_count, customer_stats.revenue,
+                                    customer_stats.first_order, customer_stats.last_order
+                             FROM customers
+                             LEFT JOIN customer_stats ON customer_stats.customer_id = customers.id""")
+    for customer_id, count, revenue, first, last in stored:
+        expected = actual.get(customer_id, (0, 0, None, None))
+        # Суммы сравниваются с точностью до копейки: сводка и SUM складывают их в разном порядке
+        if (count is None or (count, first, last) != (expected[0], expected[2], expected[3])
+                or abs(revenue - expected[1]) >= 0.005):
+            mismatches.append((customer_id, (count, revenue, first, last), tuple(expected)))
+    return mismatches
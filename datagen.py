@@ -0,0 +1,212 @@
+"""
+Генератор синтетических данных магазина для проверки производительности на больших объемах
+
+    python datagen.py --customers 1000000 --products 5000 --orders 3000000
+    python datagen.py --db big.db --orders 500000 --seed 2
+
+Данные записываются теми же пакетными функциями, что и при импорте CSV (db.upsert_customers,
+db.upsert_products, db.import_orders), поэтому генерация заодно проверяет скорость импорта.
+Чтобы распределения были похожи на настоящие:
+- ФИО, города и улицы - русские, email - транслитерация фамилии;
+- популярность товаров подчиняется закону Ципфа: k-й по популярности товар заказывают в k^s реже первого;
+- покупатели тоже неравноценны: постоянные клиенты делают заметную часть заказов;
+- число заказов по дням растет к декабрю, проседает летом и выше в пятницу и субботу.
+Один и тот же seed дает одни и те же данные; с другим seed в базу добавляются новые клиенты.
+"""
+import argparse
+import itertools
+import math
+import random
+import sys
+import time
+from datetime import date, timedelta
+import db
+
+# Сколько строк генерируется за один вызов random.choices и передается в базу
+BLOCK_SIZE = 10000
+
+# Показатели неравномерности: популярность товаров (закон Ципфа) и активность покупателей
+PRODUCT_SKEW = 1.1
+CUSTOMER_SKEW = 0.6
+
+# Сезонность: насколько пик в декабре выше среднего дня, и вес дней недели (пн - вс)
+SEASON_AMPLITUDE = 0.6
+WEEKDAY_WEIGHTS = (0.9, 0.9, 0.95, 1.0, 1.2, 1.3, 1.05)
+
+# Количество товара в позиции заказа и его вероятность
+QUANTITY_WEIGHTS = {1: 70, 2: 18, 3: 7, 4: 3, 5: 2}
+
+MALE_FIRST = ("Александр", "Алексей", "Андрей", "Дмитрий", "Евгений", "Иван", "Игорь", "Кирилл",
+              "Максим", "Михаил", "Никита", "Николай", "Павел", "Роман", "Сергей", "Юрий")
+FEMALE_FIRST = ("Александра", "Анна", "Валентина", "Дарья", "Екатерина", "Елена", "Ирина", "Ксения",
+                "Мария", "Наталья", "Ольга", "Полина", "Светлана", "Татьяна", "Юлия", "Яна")
+PATRONYMIC_BASES = ("Александров", "Алексеев", "Андреев", "Дмитриев", "Иванов", "Михайлов",
+                    "Николаев", "Павлов", "Петров", "Сергеев", "Владимиров", "Викторов")
+SURNAMES = ("Иванов", "Смирнов", "Кузнецов", "Попов", "Васильев", "Петров", "Соколов", "Михайлов",
+            "Новиков", "Федоров", "Морозов", "Волков", "Алексеев", "Лебедев", "Семенов", "Егоров",
+            "Павлов", "Козлов", "Степанов", "Николаев", "Орлов", "Андреев", "Макаров", "Никитин",
+            "Захаров", "Зайцев", "Соловьев", "Борисов", "Яковлев", "Григорьев", "Романов", "Воробьев")
+CITIES = ("Москва", "Санкт-Петербург", "Новосибирск", "Екатеринбург", "Казань", "Нижний Новгород",
+          "Челябинск", "Самара", "Омск", "Ростов-на-Дону", "Уфа", "Красноярск", "Воронеж", "Пермь")
+STREETS = ("Ленина", "Мира", "Советская", "Садовая", "Центральная", "Молодежная", "Школьная",
+           "Лесная", "Гагарина", "Пушкина", "Набережная", "Заречная")
+CATEGORIES = ("Ноутбук", "Смартфон", "Наушники", "Монитор", "Клавиатура", "Мышь", "Планшет",
+              "Чайник", "Пылесос", "Кофеварка", "Телевизор", "Фотоаппарат", "Колонка", "Роутер")
+BRANDS = ("Альфа", "Вектор", "Гранит", "Зенит", "Комета", "Орион", "Полюс", "Радуга", "Сокол", "Спутник")
+
+_TRANSLIT = dict(zip("абвгдеёжзийклмнопрстуфхцчшщъыьэюя",
+                     ("a", "b", "v", "g", "d", "e", "e", "zh", "z", "i", "y", "k", "l", "m", "n", "o",
+                      "p", "r", "s", "t", "u", "f", "kh", "ts", "ch", "sh", "shch", "", "y", "", "e",
+                      "yu", "ya")))
+
+
+def translit(text):
+    """Транслитерация кириллицы латиницей (для email)"""
+    return "".join(_TRANSLIT.get(ch, ch) for ch in text.lower())
+
+
+def zipf_weights(count, skew):
+    """Накопленные веса для random.choices: k-й элемент выбирается в k^skew раз реже первого"""
+    return list(itertools.accumulate(1.0 / (k ** skew) for k in range(1, count + 1)))
+
+
+def day_weights(start, days):
+    """Накопленные веса дней периода: сезонность (пик в декабре, спад летом), дни недели и рост продаж"""
+    weights = []
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        season = 1 + SEASON_AMPLITUDE * math.cos(2 * math.pi * (day.timetuple().tm_yday - 350) / 365)
+        growth = 1 + 0.3 * offset / max(days, 1) # Магазин постепенно растет
+        weights.append(season * growth * WEEKDAY_WEIGHTS[day.weekday()])
+    return list(itertools.accumulate(weights))
+
+
+def _person(rnd):
+    """Случайные ФИО с согласованием по роду"""
+    surname = rnd.choice(SURNAMES)
+    patronymic = rnd.choice(PATRONYMIC_BASES)
+    if rnd.random() < 0.5:
+        return surname, f"{surname} {rnd.choice(MALE_FIRST)} {patronymic}ич"
+    return surname, f"{surname}а {rnd.choice(FEMALE_FIRST)} {patronymic}на"
+
+
+def customer_rows(count, seed=1):
+    """Строки клиентов (ФИО, Телефон, Email, Адрес) в формате CSV-импорта"""
+    rnd = random.Random(seed)
+    for i in range(count):
+        surname, name = _person(rnd)
+        address = f"г. {rnd.choice(CITIES)}, ул. {rnd.choice(STREETS)}, д. {rnd.randint(1, 150)}"
+        if rnd.random() < 0.4:
+            address += f", кв. {rnd.randint(1, 300)}"
+        email = f"{translit(surname)}.{seed}.{i}@example.ru" # seed в адресе: другой seed - новые клиенты
+        yield name, f"+79{rnd.randrange(10 ** 9):09d}", email, address
+
+
+def product_rows(count, seed=1):
+    """Строки товаров (Название, Цена): цены распределены логнормально, от сотен рублей до сотен тысяч"""
+    rnd = random.Random(seed)
+    for i in range(count):
+        name = f"{rnd.choice(CATEGORIES)} {rnd.choice(BRANDS)} {seed}-{i:05d}"
+        price = round(min(max(rnd.lognormvariate(8.5, 1.1), 99.0), 500000.0), 2)
+        yield name, str(price)
+
+
+def order_rows(count, customer_ids, product_ids, start, days, seed=1):
+    """
+    Строки заказов (ID клиента, ID товара, дата, количество) для db.import_orders.
+    Порядок товаров и клиентов перемешивается, чтобы самыми популярными были случайные записи, а не первые.
+    """
+    rnd = random.Random(seed)
+    product_ids = list(product_ids)
+    customer_ids = list(customer_ids)
+    rnd.shuffle(product_ids)
+    rnd.shuffle(customer_ids)
+    product_weights = zipf_weights(len(product_ids), PRODUCT_SKEW)
+    customer_weights = zipf_weights(len(customer_ids), CUSTOMER_SKEW)
+    dates = [(start + timedelta(days=offset)).isoformat() for offset in range(days)]
+    date_weights = day_weights(start, days)
+    quantities, quantity_weights = list(QUANTITY_WEIGHTS), list(itertools.accumulate(QUANTITY_WEIGHTS.values()))
+
+    # Выборка блоками: один вызов random.choices на BLOCK_SIZE строк намного быстрее построчного
+    for block_start in range(0, count, BLOCK_SIZE):
+        size = min(BLOCK_SIZE, count - block_start)
+        yield from zip(rnd.choices(customer_ids, cum_weights=customer_weights, k=size),
+                       rnd.choices(product_ids, cum_weights=product_weights, k=size),
+                       rnd.choices(dates, cum_weights=date_weights, k=size),
+                       rnd.choices(quantities, cum_weights=quantity_weights, k=size))
+
+
+def _counted(rows, total, stage, progress):
+    """Пропускает строки, вызывая progress(этап, строк готово, всего) каждые BLOCK_SIZE строк"""
+    for done, row in enumerate(rows, start=1):
+        yield row
+        if progress and (done % BLOCK_SIZE == 0 or done == total):
+            progress(stage, done, total)
+
+
+def _active_ids(table):
+    """Все id неудаленных записей таблицы (на миллион клиентов - несколько десятков МБ)"""
+    query = f"SELECT id FROM {table} WHERE deleted_at IS NULL ORDER BY id"
+    return [record_id for rows in db.iter_query(query, chunk_size=100000) for (record_id,) in rows]
+
+
+def generate(customers=10000, products=1000, orders=100000, seed=1, start=None, days=365, progress=None):
+    """
+    Добавляет в текущую базу синтетических клиентов, товары и заказы.
+    Заказы ссылаются на всех клиентов и товары базы, в том числе существовавшие раньше.
+    Заказы создаются за days дней начиная со start (None - за последние days дней до сегодняшнего,
+    чтобы отчеты за последние дни были не пустыми).
+    progress(этап, готово, всего) - ход генерации. Возвращает словарь {этап: секунды} и итоговые числа строк.
+    """
+    timings = {}
+    began = time.perf_counter()
+    db.upsert_customers(_counted(customer_rows(customers, seed), customers, "customers", progress))
+    timings["customers"] = time.perf_counter() - began
+
+    began = time.perf_counter()
+    db.upsert_products(_counted(product_rows(products, seed), products, "products", progress))
+    timings["products"] = time.perf_counter() - began
+
+    if start is None:
+        start = date.today() - timedelta(days=days - 1)
+    began = time.perf_counter()
+    customer_ids, product_ids = _active_ids("customers"), _active_ids("products")
+    if orders and (not customer_ids or not product_ids):
+        raise ValueError("Для заказов нужны клиенты и товары")
+    result = db.import_orders(_counted(order_rows(orders, customer_ids, product_ids, start, days, seed),
+                                       orders, "orders", progress),
+                              batch_size=BLOCK_SIZE)
+    timings["orders"] = time.perf_counter() - began
+    return {"seconds": timings, "customers": len(customer_ids), "products": len(product_ids),
+            "orders": result["imported"]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Генератор синтетических данных магазина")
+    parser.add_argument("--db", help="файл базы данных (по умолчанию store.db)")
+    parser.add_argument("--customers", type=int, default=10000)
+    parser.add_argument("--products", type=int, default=1000)
+    parser.add_argument("--orders", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=1, help="другой seed - другие данные")
+    parser.add_argument("--start", type=date.fromisoformat,
+                        help="первый день заказов (ГГГГ-ММ-ДД), по умолчанию - days дней назад")
+    parser.add_argument("--days", type=int, default=365, help="за сколько дней создавать заказы")
+    args = parser.parse_args()
+    if args.db:
+        db.DB_NAME = args.db
+    db.init_db()
+
+    def show(stage, done, total):
+        sys.stderr.write(f"\r{stage}: {done} из {total}".ljust(50))
+        sys.stderr.flush()
+
+    result = generate(args.customers, args.products, args.orders, args.seed, args.start, args.days, show)
+    sys.stderr.write("\n")
+    for stage, seconds in result["seconds"].items():
+        print(f"{stage}: {seconds:.1f} с")
+    print(f"В базе клиентов: {result['customers']}, товаров: {result['products']}; "
+          f"добавлено заказов: {result['orders']}")
+
+
+if __name__ == "__main__":
+    main()
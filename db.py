@@ -4,14 +4,147 @@
 """
 import sqlite3
 import os
+import json
+import re
+import itertools
+import functools
+import random
+import threading
+import time
+from array import array
+from datetime import date
+from models import Customer, Product, Order, OrderItem
+import validation
+from validation import normalize_phone # Телефон в ключе клиента - одни цифры
 
 DB_NAME = "store.db"
 
+# Размер пачки строк, которые вставляются одной транзакцией при импорте
+IMPORT_BATCH_SIZE = 1000
+
+# Сколько подготовленных запросов хранит каждое соединение (ключ кэша - текст SQL,
+# при переполнении вытесняется давно не использованный запрос)
+STATEMENT_CACHE_SIZE = 256
+
+# Одновременная работа нескольких копий программы с одним файлом базы.
+# Пока другое соединение пишет, SQLite ждет освобождения базы до BUSY_TIMEOUT секунд; если база все еще
+# занята, транзакция записи повторяется до WRITE_RETRIES раз с паузой от RETRY_DELAY секунд, которая
+# каждый раз растет вдвое (со случайным разбросом, чтобы процессы не повторяли попытки одновременно)
+BUSY_TIMEOUT = 5.0
+WRITE_RETRIES = 5
+RETRY_DELAY = 0.05
+
+# Долгоживущие соединения: у каждого потока свои, по одному на файл базы
+_local = threading.local()
+
+
+def _lower(value):
+    """Нижний регистр с поддержкой кириллицы (встроенные LOWER и LIKE в SQLite понимают только ASCII)"""
+    return value.lower() if isinstance(value, str) else value
+
+
+# Даты заказов
+# В базе дата заказа хранится целым числом - номером дня от 1970-01-01 (столько же занимает и в индексе):
+# диапазоны дат и группировка по дням сравнивают целые числа, а не строки. Этот же номер дня - число
+# даты matplotlib (эпоха по умолчанию 1970-01-01), поэтому графики строятся без разбора строк.
+# Программа и пользователь видят дату строкой ГГГГ-ММ-ДД; перевод выполняется на границе с базой.
+
+# Юлианская дата полуночи 1970-01-01: в SQL номер дня - julianday(дата) - _EPOCH_JULIAN
+_EPOCH_JULIAN = 2440587.5
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+@functools.lru_cache(maxsize=4096)
+def to_day(text):
+    """Номер дня для даты 'ГГГГ-ММ-ДД' ('1970-01-02' -> 1); некорректная дата вызывает ValueError"""
+    try:
+        return date.fromisoformat(validation.parse_date(text)).toordinal() - _EPOCH_ORDINAL
+    except (ValueError, AttributeError): # AttributeError - не строка
+        raise ValueError(f"Некорректная дата {text!r}, нужен формат ГГГГ-ММ-ДД") from None
+
+
+@functools.lru_cache(maxsize=4096)
+def day_text(day):
+    """Дата 'ГГГГ-ММ-ДД' по номеру дня (None остается None)"""
+    return None if day is None else date.fromordinal(day + _EPOCH_ORDINAL).isoformat()
+
+
+def day_sql(column):
+    """SQL-выражение: дата 'ГГГГ-ММ-ДД' по столбцу с номером дня"""
+    return f"date({column} + {_EPOCH_JULIAN})"
+
+
+# SQL-выражение: номер сегодняшнего дня (по UTC, как date('now'))
+_TODAY_SQL = f"CAST(julianday('now') - {_EPOCH_JULIAN} AS INTEGER)"
+
+
+def get_connection(check_same_thread=True):
+    """
+    Открывает соединение с БД и включает проверку внешних ключей.
+    check_same_thread=False разрешает передавать соединение между потоками (пул соединений в adb.py).
+    """
+    conn = sqlite3.connect(DB_NAME, timeout=BUSY_TIMEOUT, cached_statements=STATEMENT_CACHE_SIZE,
+                           check_same_thread=check_same_thread)
+    # В SQLite внешние ключи по умолчанию выключены и включаются для каждого соединения отдельно
+    conn.execute("PRAGMA foreign_keys = ON")
+    conn.create_function("LOWER_UNICODE", 1, _lower, deterministic=True)
+    attach_archive(conn) # Архив старых заказов, если он уже создан
+    return conn
+
+
+def shared_connection():
+    """
+    Возвращает долгоживущее соединение текущего потока с базой DB_NAME.
+    Соединение не закрывается после запроса, поэтому его кэш подготовленных запросов
+    переживает вызовы, и повторный запрос с тем же текстом SQL не разбирается заново.
+    """
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(DB_NAME)
+    if conn is None:
+        conn = connections[DB_NAME] = get_connection()
+    return conn
+
+
+def close_connections():
+    """Закрывает долгоживущие соединения текущего потока (например, перед удалением или заменой файла базы)"""
+    for conn in getattr(_local, "connections", {}).values():
+        conn.close()
+    _local.connections = {}
+
+
+class DataVersion:
+    """
+    Номер версии данных: увеличивается, когда кто-либо подтверждает транзакцию в базе.
+    PRAGMA data_version меняется при записи через любое другое соединение, поэтому для него
+    держится отдельное соединение, которое само ничего не пишет. Используется кэшем ответов API
+    и окном отчетов (в отличие от номера журнала, учитывает и таблицы без журнала, например price_history).
+    """
+
+    def __init__(self):
+        self.conn = get_connection(check_same_thread=False)
+        self.lock = threading.Lock()
+        self.last = None
+        self.generation = 0
+
+    def current(self):
+        with self.lock:
+            version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+            if version != self.last:
+                self.last = version
+                self.generation += 1
+            return self.generation
+
+    def close(self):
+        self.conn.close()
+
 
 def init_db():
     """Создает базу данных и таблицы, если они не существуют"""
+    close_connections() # Файл базы мог быть создан заново, старые соединения указывают на прежний
     if not os.path.exists(DB_NAME): # существует ли файл базы данных с именем DB_NAME
-        conn = sqlite3.connect(DB_NAME)  # Если база данных не существует, подключаемся к новой пустой базе
+        conn = get_connection()  # Если база данных не существует, подключаемся к новой пустой базе
         c = conn.cursor() # Получаем объект cursor, используемый для выполнения SQL-запросов
 
 
@@ -60,129 +193,1682 @@ def init_db():
         conn.close() # Закрываем соединение с базой данных
         print("База данных создана успешно!")
 
+    # Доводим схему (новой или существующей базы) до актуальной версии
+    conn = get_connection()
+    try:
+        migrate(conn)
+        # Журнал WAL: читатели не блокируют запись и друг друга (режим сохраняется в файле базы)
+        conn.execute("PRAGMA journal_mode = WAL")
+    finally:
+        conn.close()
+
+
+# Миграции схемы
+# Номер последней примененной миграции хранится в PRAGMA user_version.
+# Каждая миграция - функция, принимающая соединение; новые миграции добавляются в конец списка MIGRATIONS.
+
+def _migration_natural_keys(conn):
+    """Добавляет естественные ключи клиентов и товаров с уникальными индексами для импорта без дублей"""
+    conn.execute("ALTER TABLE customers ADD COLUMN natural_key TEXT")
+    conn.execute("ALTER TABLE products ADD COLUMN natural_key TEXT")
+
+    # Заполняем ключи для уже существующих записей.
+    # Если в базе уже есть дубли, ключ получает только самая ранняя запись, остальные остаются без ключа.
+    for table, key_func in (("customers", lambda row: customer_key(row[1], row[2])),
+                            ("products", lambda row: product_key(row[1]))):
+        columns = "id, phone, email" if table == "customers" else "id, name"
+        seen = set()
+        updates = []
+        for row in conn.execute(f"SELECT {columns} FROM {table} ORDER BY id"):
+            key = key_func(row)
+            if key is not None and key not in seen:
+                seen.add(key)
+                updates.append((key, row[0]))
+        conn.executemany(f"UPDATE {table} SET natural_key=? WHERE id=?", updates)
+
+    conn.execute("CREATE UNIQUE INDEX idx_customers_natural_key ON customers(natural_key)")
+    conn.execute("CREATE UNIQUE INDEX idx_products_natural_key ON products(natural_key)")
+
+
+def _migration_import_checkpoints(conn):
+    """Создает таблицу контрольных точек для продолжения прерванного импорта"""
+    # Столбцы:
+    #   source     - источник импорта (тип данных, путь и размер файла)
+    #   rows       - сколько строк файла (без заголовка) уже импортировано
+    #   updated_at - время последней подтвержденной пачки
+    conn.execute('''CREATE TABLE import_checkpoints (
+                    source TEXT PRIMARY KEY,
+                    rows INTEGER NOT NULL,
+                    updated_at TEXT)''')
+
+
+def _migration_order_items(conn):
+    """
+    Переводит заказы на схему "заказ + позиции заказа":
+    в orders остаются клиент, дата и сумма заказа, а товары с количеством и ценой
+    на момент продажи хранятся в order_items. Каждый старый заказ становится заказом из одной позиции.
+    """
+    # Внешние ключи раньше не проверялись, поэтому в старой базе могут быть заказы удаленных
+    # клиентов или товаров. Заказы сохраняем: как при импорте с create_missing, создаем для них
+    # клиентов и товары-заглушки с теми же id (товар - с ценой 0)
+    created_customers = conn.execute("""
+        INSERT INTO customers (id, name, phone, email, address)
+        SELECT DISTINCT customer_id, 'Клиент #' || customer_id || ' (создан при обновлении базы)', '', '', ''
+        FROM orders WHERE customer_id NOT IN (SELECT id FROM customers)""").rowcount
+    created_products = conn.execute("""
+        INSERT INTO products (id, name, price)
+        SELECT DISTINCT product_id, 'Товар #' || product_id || ' (создан при обновлении базы)', 0
+        FROM orders WHERE product_id NOT IN (SELECT id FROM products)""").rowcount
+    if created_customers or created_products:
+        print(f"Заказы ссылались на отсутствующие записи: созданы клиенты ({created_customers}) "
+              f"и товары ({created_products}) с пометкой \"создан при обновлении базы\"")
+
+    # Новая таблица "orders" (заказы)
+    # Столбцы:
+    #   id          - уникальный идентификатор заказа
+    #   customer_id - внешний ключ, ссылающийся на таблицу customers.id
+    #   date        - дата оформления заказа (текстовая строка формата ГГГГ-ММ-ДД)
+    #   total       - сумма заказа, поддерживается триггерами по позициям заказа
+    conn.execute('''CREATE TABLE orders_new (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    customer_id INTEGER NOT NULL,
+                    date TEXT NOT NULL,
+                    total REAL NOT NULL DEFAULT 0,
+                    FOREIGN KEY(customer_id) REFERENCES customers(id) ON DELETE CASCADE)''')
+    conn.execute("INSERT INTO orders_new (id, customer_id, date) SELECT id, customer_id, date FROM orders")
+    conn.execute("ALTER TABLE orders RENAME TO orders_old")
+    conn.execute("ALTER TABLE orders_new RENAME TO orders")
+
+    # Таблица "order_items" (позиции заказа)
+    # Столбцы:
+    #   id          - уникальный идентификатор позиции
+    #   order_id    - внешний ключ, ссылающийся на таблицу orders.id
+    #   product_id  - внешний ключ, ссылающийся на таблицу products.id
+    #   quantity    - количество товара (целое положительное число)
+    #   unit_price  - цена за единицу на момент продажи
+    conn.execute('''CREATE TABLE order_items (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    order_id INTEGER NOT NULL,
+                    product_id INTEGER NOT NULL,
+                    quantity INTEGER NOT NULL DEFAULT 1 CHECK (quantity > 0),
+                    unit_price REAL NOT NULL,
+                    FOREIGN KEY(order_id) REFERENCES orders(id) ON DELETE CASCADE,
+                    FOREIGN KEY(product_id) REFERENCES products(id) ON DELETE CASCADE)''')
+    # Индексы для поиска позиций заказа и для отчетов по товарам
+    conn.execute("CREATE INDEX idx_order_items_order ON order_items(order_id)")
+    conn.execute("CREATE INDEX idx_order_items_product ON order_items(product_id)")
+    # Индексы для фильтров и отчетов по клиенту и дате заказа
+    conn.execute("CREATE INDEX idx_orders_customer ON orders(customer_id)")
+    conn.execute("CREATE INDEX idx_orders_date ON orders(date)")
+
+    # Сумма заказа пересчитывается при любом изменении его позиций
+    conn.execute('''CREATE TRIGGER order_items_after_insert AFTER INSERT ON order_items BEGIN
+                        UPDATE orders SET total = ROUND(total + NEW.quantity * NEW.unit_price, 2)
+                        WHERE id = NEW.order_id;
+                    END''')
+    conn.execute('''CREATE TRIGGER order_items_after_delete AFTER DELETE ON order_items BEGIN
+                        UPDATE orders SET total = ROUND(total - OLD.quantity * OLD.unit_price, 2)
+                        WHERE id = OLD.order_id;
+                    END''')
+    conn.execute('''CREATE TRIGGER order_items_after_update
+                    AFTER UPDATE OF order_id, quantity, unit_price ON order_items BEGIN
+                        UPDATE orders SET total = ROUND(total - OLD.quantity * OLD.unit_price, 2)
+                        WHERE id = OLD.order_id;
+                        UPDATE orders SET total = ROUND(total + NEW.quantity * NEW.unit_price, 2)
+                        WHERE id = NEW.order_id;
+                    END''')
+
+    # Переносим товары старых заказов в позиции; цена продажи не хранилась, берем текущую цену товара
+    conn.execute("""INSERT INTO order_items (order_id, product_id, quantity, unit_price)
+                    SELECT orders_old.id, orders_old.product_id, 1, COALESCE(products.price, 0)
+                    FROM orders_old
+                    JOIN products ON products.id = orders_old.product_id
+                    ORDER BY orders_old.id""")
+    conn.execute("DROP TABLE orders_old")
+
+
+def _migration_soft_deletes(conn):
+    """
+    Добавляет мягкое удаление: столбец deleted_at (NULL - запись не удалена, иначе время удаления).
+    Частичные индексы содержат только нужные строки: уникальность естественного ключа и индекс
+    по дате заказа - только для неудаленных записей, а индексы deleted_at - только для удаленных.
+    """
+    for table in ("customers", "products", "orders"):
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN deleted_at TEXT")
+        conn.execute(f"CREATE INDEX idx_{table}_deleted ON {table}(deleted_at) WHERE deleted_at IS NOT NULL")
+
+    # Удаленный клиент или товар не мешает завести новый с тем же email или названием
+    for table in ("customers", "products"):
+        conn.execute(f"DROP INDEX idx_{table}_natural_key")
+        conn.execute(f"CREATE UNIQUE INDEX idx_{table}_natural_key ON {table}(natural_key) WHERE deleted_at IS NULL")
+
+    conn.execute("DROP INDEX idx_orders_date")
+    conn.execute("CREATE INDEX idx_orders_date ON orders(date) WHERE deleted_at IS NULL")
+
+
+def _migration_change_journal(conn):
+    """
+    Добавляет журнал изменений: каждая вставка, изменение и удаление клиента, товара или заказа
+    записывается триггером в таблицу changes с возрастающим номером seq.
+    Изменение позиций заказа пересчитывает orders.total, поэтому тоже попадает в журнал как изменение заказа.
+    """
+    # Таблица "changes" (журнал изменений, только добавление записей)
+    # Столбцы:
+    #   seq        - номер изменения, только растет (AUTOINCREMENT не переиспользует номера)
+    #   table_name - таблица: customers, products или orders
+    #   row_id     - id измененной записи
+    #   op         - insert, update или delete
+    #   changed_at - время изменения
+    conn.execute('''CREATE TABLE changes (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    table_name TEXT NOT NULL,
+                    row_id INTEGER NOT NULL,
+                    op TEXT NOT NULL CHECK (op IN ('insert', 'update', 'delete')),
+                    changed_at TEXT NOT NULL DEFAULT (datetime('now')))''')
+    for table in ("customers", "products", "orders"):
+        for op, row in (("insert", "NEW"), ("update", "NEW"), ("delete", "OLD")):
+            conn.execute(f'''CREATE TRIGGER {table}_journal_{op} AFTER {op.upper()} ON {table} BEGIN
+                                INSERT INTO changes (table_name, row_id, op) VALUES ('{table}', {row}.id, '{op}');
+                            END''')
+        # Уже существующие записи попадают в журнал как вставки, чтобы синхронизация с нуля получила все данные
+        conn.execute(f"INSERT INTO changes (table_name, row_id, op) SELECT '{table}', id, 'insert' FROM {table} ORDER BY id")
+
+
+def _migration_order_archive(conn):
+    """
+    Добавляет состояние архива заказов (archive.py): границу архива и признак идущего переноса.
+    Удаление заказа при переносе в архив не записывается в журнал изменений: заказ не изменился, а переехал.
+    """
+    # Таблица "archive_state" (одна строка)
+    # Столбцы:
+    #   cutoff    - заказы с датой раньше cutoff могут быть в архиве (NULL - архива нет)
+    #   archiving - 1 только внутри транзакции, удаляющей перенесенные заказы из основной базы
+    conn.execute('''CREATE TABLE archive_state (
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    cutoff TEXT,
+                    archiving INTEGER NOT NULL DEFAULT 0)''')
+    conn.execute("INSERT INTO archive_state (id) VALUES (1)")
+    # Позиции вместе с полями заказа: отчеты и выгрузки по позициям читают одно представление,
+    # а с архивом - такое же представление all_order_lines по обоим файлам
+    conn.execute('''CREATE VIEW order_lines AS
+                    SELECT order_items.id, order_items.order_id, orders.customer_id, orders.date, orders.total,
+                           orders.deleted_at, order_items.product_id, order_items.quantity, order_items.unit_price
+                    FROM order_items
+                    JOIN orders ON orders.id = order_items.order_id''')
+    conn.execute("DROP TRIGGER orders_journal_delete")
+    conn.execute('''CREATE TRIGGER orders_journal_delete AFTER DELETE ON orders
+                    WHEN (SELECT archiving FROM archive_state) = 0 BEGIN
+                        INSERT INTO changes (table_name, row_id, op) VALUES ('orders', OLD.id, 'delete');
+                    END''')
+
+
+def _migration_top_products_sketch(conn):
+    """
+    Добавляет счетчики популярных товаров (topk.py) для мгновенного топа товаров без GROUP BY по всем позициям.
+    Счетчики обновляются триггерами по алгоритму Space-Saving: при любой вставке позиций (форма заказа,
+    импорт CSV и .npz, другие процессы) и при удалении заказов. Изменения, которые алгоритм учесть не может
+    (восстановление заказа, удаление и восстановление клиента, замена товара в позиции), помечают
+    счетчики устаревшими; тогда topk пересчитывает их по таблицам перед следующим отчетом.
+    """
+    # Таблица "topk_state" (одна строка)
+    # Столбцы:
+    #   capacity - сколько товаров отслеживается (0 - счетчики выключены и не обновляются)
+    #   stale    - 1, если счетчики нужно пересчитать по таблицам
+    conn.execute('''CREATE TABLE topk_state (
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    capacity INTEGER NOT NULL DEFAULT 0,
+                    stale INTEGER NOT NULL DEFAULT 0)''')
+    conn.execute("INSERT INTO topk_state (id) VALUES (1)")
+    # Таблица "topk_counters" (не больше capacity строк)
+    # Столбцы:
+    #   product_id - отслеживаемый товар
+    #   count      - оценка числа позиций товара в неудаленных заказах (не меньше точного значения)
+    #   error      - на сколько count может превышать точное значение
+    conn.execute('''CREATE TABLE topk_counters (
+                    product_id INTEGER PRIMARY KEY,
+                    count INTEGER NOT NULL,
+                    error INTEGER NOT NULL DEFAULT 0)''')
+    conn.execute("CREATE INDEX idx_topk_counters_count ON topk_counters(count)")
+
+    maintained = "(SELECT capacity FROM topk_state WHERE NOT stale) > 0"
+    active_item = f"EXISTS (SELECT 1 FROM orders WHERE orders.id = NEW.order_id AND {ACTIVE_ORDERS})"
+    # Space-Saving: отслеживаемому товару - +1; новому - свободный счетчик, а если свободных нет,
+    # он занимает счетчик с наименьшим значением m: count = m + 1, error = m
+    conn.execute(f'''CREATE TRIGGER topk_item_insert AFTER INSERT ON order_items
+                     WHEN {maintained} AND {active_item} BEGIN
+                         UPDATE topk_counters SET count = count + 1 WHERE product_id = NEW.product_id;
+                         INSERT INTO topk_counters (product_id, count)
+                         SELECT NEW.product_id, 1
+                         WHERE NOT EXISTS (SELECT 1 FROM topk_counters WHERE product_id = NEW.product_id)
+                           AND (SELECT COUNT(*) FROM topk_counters) < (SELECT capacity FROM topk_state);
+                         UPDATE topk_counters SET product_id = NEW.product_id, error = count, count = count + 1
+                         WHERE product_id = (SELECT product_id FROM topk_counters ORDER BY count LIMIT 1)
+                           AND NOT EXISTS (SELECT 1 FROM topk_counters WHERE product_id = NEW.product_id);
+                     END''')
+    # Удаление позиции неудаленного заказа (замена позиций, окончательное удаление товара)
+    conn.execute(f'''CREATE TRIGGER topk_item_delete AFTER DELETE ON order_items
+                     WHEN {maintained} AND {active_item.replace("NEW.", "OLD.")} BEGIN
+                         UPDATE topk_counters SET count = count - 1 WHERE product_id = OLD.product_id;
+                     END''')
+    conn.execute(f'''CREATE TRIGGER topk_item_update AFTER UPDATE OF order_id, product_id ON order_items
+                     WHEN {maintained} BEGIN
+                         UPDATE topk_state SET stale = 1;
+                     END''')
+    # Заказ перестает учитываться (мягкое или окончательное удаление, но не перенос в архив):
+    # из счетчиков вычитаются его позиции; позиции еще на месте, поэтому триггер до удаления
+    order_lines = '''UPDATE topk_counters
+                     SET count = count - (SELECT COUNT(*) FROM order_items
+                                          WHERE order_id = OLD.id AND product_id = topk_counters.product_id)
+                     WHERE product_id IN (SELECT product_id FROM order_items WHERE order_id = OLD.id)'''
+    active_old = ACTIVE_ORDERS.replace("orders.", "OLD.")
+    conn.execute(f'''CREATE TRIGGER topk_order_delete BEFORE DELETE ON orders
+                     WHEN {maintained} AND (SELECT archiving FROM archive_state) = 0 AND {active_old} BEGIN
+                         {order_lines};
+                     END''')
+    conn.execute(f'''CREATE TRIGGER topk_order_soft_delete AFTER UPDATE OF deleted_at ON orders
+                     WHEN {maintained} AND NEW.deleted_at IS NOT NULL AND {active_old} BEGIN
+                         {order_lines};
+                     END''')
+    conn.execute(f'''CREATE TRIGGER topk_order_restore AFTER UPDATE OF deleted_at ON orders
+                     WHEN {maintained} AND OLD.deleted_at IS NOT NULL AND NEW.deleted_at IS NULL BEGIN
+                         UPDATE topk_state SET stale = 1;
+                     END''')
+    conn.execute(f'''CREATE TRIGGER topk_order_customer AFTER UPDATE OF customer_id ON orders
+                     WHEN {maintained} AND OLD.customer_id != NEW.customer_id
+                       AND EXISTS (SELECT 1 FROM customers WHERE id IN (OLD.customer_id, NEW.customer_id)
+                                                             AND deleted_at IS NOT NULL) BEGIN
+                         UPDATE topk_state SET stale = 1;
+                     END''')
+    # Удаление или восстановление клиента меняет учет всех его заказов
+    conn.execute(f'''CREATE TRIGGER topk_customer_update AFTER UPDATE OF deleted_at ON customers
+                     WHEN {maintained} AND (OLD.deleted_at IS NULL) != (NEW.deleted_at IS NULL) BEGIN
+                         UPDATE topk_state SET stale = 1;
+                     END''')
+    conn.execute(f'''CREATE TRIGGER topk_customer_delete BEFORE DELETE ON customers
+                     WHEN {maintained} BEGIN
+                         UPDATE topk_state SET stale = 1;
+                     END''')
+
+
+def _migration_customer_stats(conn):
+    """
+    Добавляет сводку по заказам каждого клиента (customer_stats.py): число заказов, сумму покупок,
+    даты первого и последнего заказа. Сводка обновляется триггерами при каждой записи заказа, поэтому
+    список клиентов показывает ее без группировки всех заказов. Даты после удаления заказа с крайней
+    датой пересчитываются отдельно (столбец stale), а перенос заказов в архив сводку не меняет.
+    """
+    # Таблица "customer_stats" (строка на каждого клиента)
+    # Столбцы:
+    #   customer_id - клиент (строка удаляется вместе с ним)
+    #   order_count - число неудаленных заказов, в том числе архивных
+    #   revenue     - сумма этих заказов
+    #   first_order, last_order - даты первого и последнего из них (NULL - заказов нет)
+    #   stale       - 1, если даты нужно пересчитать по заказам
+    conn.execute('''CREATE TABLE customer_stats (
+                    customer_id INTEGER PRIMARY KEY,
+                    order_count INTEGER NOT NULL DEFAULT 0,
+                    revenue REAL NOT NULL DEFAULT 0,
+                    first_order TEXT,
+                    last_order TEXT,
+                    stale INTEGER NOT NULL DEFAULT 0,
+                    FOREIGN KEY(customer_id) REFERENCES customers(id) ON DELETE CASCADE)''')
+    # Индексы для сортировки и фильтров списка клиентов по сводке
+    conn.execute("CREATE INDEX idx_customer_stats_count ON customer_stats(order_count)")
+    conn.execute("CREATE INDEX idx_customer_stats_revenue ON customer_stats(revenue)")
+    conn.execute("CREATE INDEX idx_customer_stats_last ON customer_stats(last_order)")
+    conn.execute("CREATE INDEX idx_customer_stats_stale ON customer_stats(customer_id) WHERE stale = 1")
+
+    # Заказ учитывается, пока он не удален. Каждый столбец обновляется отдельной командой и только
+    # если значение меняется: иначе любая вставка заказа перезаписывала бы все три индекса сводки
+    # (новый заказ вставляется с нулевой суммой, а сумма приходит с позициями)
+    # {0} - дополнительное условие
+    add = ";\n".join(f"UPDATE customer_stats SET {assignment} WHERE customer_id = NEW.customer_id{condition}{{0}}"
+                      for assignment, condition in (
+                          # first_order не индексирован, его можно записывать всегда
+                          ("order_count = order_count + 1, first_order = MIN(COALESCE(first_order, NEW.date), NEW.date)",
+                           ""),
+                          ("revenue = ROUND(revenue + NEW.total, 2)", " AND NEW.total != 0"),
+                          ("last_order = NEW.date", " AND (last_order IS NULL OR last_order < NEW.date)")))
+    remove = '''UPDATE customer_stats
+                SET order_count = order_count - 1, revenue = ROUND(revenue - OLD.total, 2),
+                    stale = stale OR OLD.date IN (first_order, last_order)
+                WHERE customer_id = OLD.customer_id'''
+    same_order = "OLD.customer_id = NEW.customer_id AND OLD.date = NEW.date AND OLD.deleted_at IS NEW.deleted_at"
+    conn.execute('''CREATE TRIGGER customer_stats_customer_insert AFTER INSERT ON customers BEGIN
+                        INSERT OR IGNORE INTO customer_stats (customer_id) VALUES (NEW.id);
+                    END''')
+    conn.execute(f'''CREATE TRIGGER customer_stats_order_insert AFTER INSERT ON orders
+                     WHEN NEW.deleted_at IS NULL BEGIN
+                         {add.format("")};
+                     END''')
+    # Изменение позиций меняет только сумму заказа - самый частый случай, одна строка сводки
+    conn.execute(f'''CREATE TRIGGER customer_stats_order_total AFTER UPDATE OF total ON orders
+                     WHEN OLD.total != NEW.total AND NEW.deleted_at IS NULL AND {same_order} BEGIN
+                         UPDATE customer_stats SET revenue = ROUND(revenue + NEW.total - OLD.total, 2)
+                         WHERE customer_id = NEW.customer_id;
+                     END''')
+    # Смена клиента, даты, удаление и восстановление: прежний заказ вычитается, новый добавляется
+    conn.execute(f'''CREATE TRIGGER customer_stats_order_update
+                     AFTER UPDATE OF customer_id, date, total, deleted_at ON orders
+                     WHEN NOT ({same_order}) BEGIN
+                         {remove} AND OLD.deleted_at IS NULL;
+                         {add.format(" AND NEW.deleted_at IS NULL")};
+                     END''')
+    conn.execute(f'''CREATE TRIGGER customer_stats_order_delete AFTER DELETE ON orders
+                     WHEN OLD.deleted_at IS NULL AND (SELECT archiving FROM archive_state) = 0 BEGIN
+                         {remove};
+                     END''')
+
+    conn.execute('''INSERT INTO customer_stats (customer_id, order_count, revenue, first_order, last_order)
+                    SELECT customers.id, COUNT(orders.id), ROUND(COALESCE(SUM(orders.total), 0), 2),
+                           MIN(orders.date), MAX(orders.date)
+                    FROM customers
+                    LEFT JOIN orders ON orders.customer_id = customers.id AND orders.deleted_at IS NULL
+                    GROUP BY customers.id''')
+    # Архив при миграции не подключен: если он есть, сводка пересчитывается вместе с ним при первом чтении
+    conn.execute("UPDATE customer_stats SET stale = 1 WHERE (SELECT cutoff FROM archive_state) IS NOT NULL")
+
+
+def _rebuild_table(conn, table, columns, select, schema="main"):
+    """
+    Пересоздает таблицу schema.table с новым описанием столбцов columns и заполняет ее запросом select
+    (он читает прежнюю таблицу schema.table). Индексы и триггеры таблицы и представления схемы создаются заново, счетчик AUTOINCREMENT сохраняется.
+    Внешние ключи при этом должны быть выключены (см. migrate): иначе удаление старой таблицы каскадно
+    удалило бы ссылающиеся на нее строки.
+    """
+    objects = conn.execute(f"SELECT type, name, sql FROM {schema}.sqlite_master "
+                           "WHERE tbl_name = ? AND type IN ('index', 'trigger') AND sql IS NOT NULL",
+                           (table,)).fetchall()
+    views = conn.execute(f"SELECT name, sql FROM {schema}.sqlite_master WHERE type = 'view'").fetchall()
+    sequence = conn.execute(f"SELECT seq FROM {schema}.sqlite_sequence WHERE name = ?", (table,)).fetchone() \
+        if conn.execute(f"SELECT 1 FROM {schema}.sqlite_master WHERE name = 'sqlite_sequence'").fetchone() else None
+    for name, _ in views:
+        conn.execute(f"DROP VIEW {schema}.{name}")
+    conn.execute(f"CREATE TABLE {schema}.{table}_new ({columns})")
+    conn.execute(f"INSERT INTO {schema}.{table}_new {select}")
+    conn.execute(f"DROP TABLE {schema}.{table}")
+    # Без legacy_alter_table переименование проверяло бы триггеры других таблиц, которые ссылаются
+    # на еще не существующую таблицу с прежним именем
+    conn.execute("PRAGMA legacy_alter_table = ON")
+    try:
+        conn.execute(f"ALTER TABLE {schema}.{table}_new RENAME TO {table}")
+    finally:
+        conn.execute("PRAGMA legacy_alter_table = OFF")
+    for kind, name, sql in objects:
+        conn.execute(sql if schema == "main" else sql.replace(f"CREATE {kind.upper()} {name}",
+                                                              f"CREATE {kind.upper()} {schema}.{name}", 1))
+    for name, sql in views:
+        conn.execute(sql)
+    if sequence is not None: # Номера удаленных последними записей не должны достаться новым
+        conn.execute(f"DELETE FROM {schema}.sqlite_sequence WHERE name = ?", (table,))
+        conn.execute(f"INSERT INTO {schema}.sqlite_sequence (name, seq) VALUES (?, ?)", (table, sequence[0]))
+
+
+def _migration_integer_dates(conn):
+    """
+    Переводит даты заказов (и даты первого/последнего заказа в сводке клиентов) с текста ГГГГ-ММ-ДД
+    на номер дня от 1970-01-01 (см. to_day): запись и индекс по дате меньше, диапазоны дат и группировка
+    по дням сравнивают целые числа. Архив, если он подключен, переводится так же.
+    """
+    day = f"CAST(julianday({{0}}) - {_EPOCH_JULIAN} AS INTEGER)"
+    # Старые версии импорта дату не проверяли: нераспознанная дата становится 1970-01-01,
+    # такие заказы легко найти фильтром по дате
+    broken = conn.execute("SELECT COUNT(*) FROM orders WHERE julianday(date) IS NULL").fetchone()[0]
+    if broken:
+        print(f"Заказов с нераспознанной датой: {broken} (дата заменена на 1970-01-01)")
+
+    # Таблица "orders" (заказы): столбцы прежние, date - номер дня (CHECK не пропустит строку с датой)
+    _rebuild_table(conn, "orders", """
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        customer_id INTEGER NOT NULL,
+        date INTEGER NOT NULL CHECK (typeof(date) = 'integer'),
+        total REAL NOT NULL DEFAULT 0,
+        deleted_at TEXT,
+        FOREIGN KEY(customer_id) REFERENCES customers(id) ON DELETE CASCADE""",
+        f"SELECT id, customer_id, COALESCE({day.format('date')}, 0), total, deleted_at FROM orders")
+    _rebuild_table(conn, "customer_stats", """
+        customer_id INTEGER PRIMARY KEY,
+        order_count INTEGER NOT NULL DEFAULT 0,
+        revenue REAL NOT NULL DEFAULT 0,
+        first_order INTEGER,
+        last_order INTEGER,
+        stale INTEGER NOT NULL DEFAULT 0,
+        FOREIGN KEY(customer_id) REFERENCES customers(id) ON DELETE CASCADE""",
+        f"SELECT customer_id, order_count, revenue, {day.format('first_order')}, {day.format('last_order')}, stale "
+        "FROM customer_stats")
+    if any(row[1] == ARCHIVE_SCHEMA for row in conn.execute("PRAGMA database_list")):
+        _rebuild_table(conn, "orders", """
+            id INTEGER PRIMARY KEY,
+            customer_id INTEGER NOT NULL,
+            date INTEGER NOT NULL,
+            total REAL NOT NULL DEFAULT 0,
+            deleted_at TEXT""",
+            f"SELECT id, customer_id, COALESCE({day.format('date')}, 0), total, deleted_at FROM archive.orders",
+            schema=ARCHIVE_SCHEMA)
+
+
+def _migration_row_versions(conn):
+    """
+    Добавляет версию записи клиентов, товаров и заказов для одновременной работы нескольких копий программы.
+    Каждое изменение записи увеличивает версию на 1; форма сохраняет запись, только если версия
+    не изменилась с момента чтения (см. update_customer), иначе сообщает о конфликте, а не затирает
+    чужие изменения.
+    """
+    for table in ("customers", "products", "orders"):
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN version INTEGER NOT NULL DEFAULT 1")
+
+
+def _migration_price_history(conn):
+    """
+    Добавляет историю цен товаров: с какого дня действовала каждая цена. Цена в позиции заказа без
+    указанной цены берется на дату заказа (а не текущая), отчет о выручке сравнивает цены продажи
+    с ценами прайса на дату заказа. История пополняется триггерами при любом изменении цены товара.
+    """
+    # Таблица "price_history" (строка на каждое изменение цены)
+    # Столбцы:
+    #   product_id - товар (история удаляется вместе с ним)
+    #   valid_from - день (номер дня, как orders.date), с которого действует цена - до следующей строки
+    #                товара; у первой цены - 0: до первого изменения известна только она
+    #   price      - цена
+    # Таблица без rowid хранится в порядке ключа (product_id, valid_from), и цена лежит прямо в нем:
+    # цена на дату - один поиск по ключу (PRICE_AT_ORDER_DATE), без чтения других строк
+    conn.execute('''CREATE TABLE price_history (
+                    product_id INTEGER NOT NULL REFERENCES products(id) ON DELETE CASCADE,
+                    valid_from INTEGER NOT NULL,
+                    price REAL NOT NULL,
+                    PRIMARY KEY (product_id, valid_from)
+                 ) WITHOUT ROWID''')
+    conn.execute('''CREATE TRIGGER price_history_product_insert AFTER INSERT ON products BEGIN
+                        INSERT INTO price_history (product_id, valid_from, price)
+                        VALUES (NEW.id, 0, COALESCE(NEW.price, 0));
+                    END''')
+    # Новая цена действует с сегодняшнего дня; повторное изменение в тот же день заменяет цену дня.
+    # Цену, уже записанную в историю последней (set_product_price), триггер не дублирует
+    conn.execute(f'''CREATE TRIGGER price_history_product_price AFTER UPDATE OF price ON products
+                     WHEN NEW.price IS NOT (SELECT price FROM price_history WHERE product_id = NEW.id
+                                            ORDER BY valid_from DESC LIMIT 1)
+                     BEGIN
+                         INSERT INTO price_history (product_id, valid_from, price)
+                         VALUES (NEW.id, {_TODAY_SQL}, COALESCE(NEW.price, 0))
+                         ON CONFLICT (product_id, valid_from) DO UPDATE SET price = excluded.price;
+                     END''')
+    conn.execute("INSERT INTO price_history (product_id, valid_from, price) SELECT id, 0, COALESCE(price, 0) "
+                 "FROM products")
+
+
+MIGRATIONS = [
+    _migration_natural_keys,
+    _migration_import_checkpoints,
+    _migration_order_items,
+    _migration_soft_deletes,
+    _migration_change_journal,
+    _migration_order_archive,
+    _migration_top_products_sketch,
+    _migration_customer_stats,
+    _migration_integer_dates,
+    _migration_row_versions,
+    _migration_price_history,
+]
+
+
+def migrate(conn):
+    """Применяет к базе все миграции, которые еще не были применены"""
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    # Миграции, пересоздающие таблицы (_rebuild_table), выполняются с выключенными внешними ключами;
+    # включить или выключить их можно только вне транзакции
+    conn.execute("PRAGMA foreign_keys = OFF")
+    try:
+        for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+            conn.execute("BEGIN") # Миграция и смена версии выполняются одной транзакцией
+            with conn:
+                migration(conn)
+                conn.execute(f"PRAGMA user_version = {number}")
+    finally:
+        conn.execute("PRAGMA foreign_keys = ON")
+
 
 # Общие функции для работы с БД
 
+def _is_busy(error):
+    """Ошибка из-за того, что базу держит другое соединение"""
+    message = str(error)
+    return isinstance(error, sqlite3.OperationalError) and ("locked" in message or "busy" in message)
+
+
+def write_transaction(func, *args, conn=None):
+    """
+    Выполняет func(conn, *args) одной транзакцией записи и возвращает ее результат.
+    Транзакция начинается с BEGIN IMMEDIATE: блокировка записи берется сразу, а не при первой записи
+    после чтения (тогда SQLite вернул бы ошибку, не дожидаясь другого писателя). Если база занята
+    дольше BUSY_TIMEOUT, транзакция повторяется (см. WRITE_RETRIES); остальные ошибки передаются дальше.
+    """
+    conn = conn or shared_connection()
+    for attempt in range(WRITE_RETRIES + 1):
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            with conn: # При ошибке в func транзакция откатывается
+                return func(conn, *args)
+        except sqlite3.OperationalError as e:
+            if attempt == WRITE_RETRIES or not _is_busy(e):
+                raise
+        time.sleep(RETRY_DELAY * 2 ** attempt * random.uniform(0.5, 1.5))
+
+
 # Функция для выполнения любых SQL-запросов, которые изменяют базу данных (INSERT/UPDATE/DELETE)
 def execute_query(query, params=()):
     """Выполняет SQL запрос с параметрами"""
-    conn = sqlite3.connect(DB_NAME) # Открываем соединение с базой данных
-    c = conn.cursor() # Получаем курсор для выполнения SQL-команд
     try: # код, в котором может возникнуть исключение
-        c.execute(query, params) # Выполняем SQL-запрос с предоставленными параметрами
-        conn.commit() # Сохраняем изменения в базе данных
-        last_id = c.lastrowid  # Получаем идентификатор последней вставленной записи
-        return last_id
+        # Транзакция на долгоживущем соединении потока: при ошибке изменения откатываются
+        return write_transaction(lambda conn: conn.execute(query, params).lastrowid) # id вставленной записи
     except sqlite3.Error as e: # код для обработки исключений
         print(f"Ошибка базы данных: {e}") # Если произошла ошибка, печатаем её и возвращаем None
         return None
-    finally: # выполняется всегда, независимо от того, возникло исключение или нет
-        conn.close() # Обязательно закрываем соединение с базой данных
 
 
 # Функция для выполнения SELECT-запросов и возврата всех полученных данных
 def fetch_query(query, params=()):
     """Выполняет SELECT запрос и возвращает все результаты"""
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
     try:
-        c.execute(query, params)
-        return c.fetchall()     # Возвращаем все полученные строки
+        return shared_connection().execute(query, params).fetchall() # Возвращаем все полученные строки
     except sqlite3.Error as e:
         print(f"Ошибка базы данных: {e}")
         return [] # возвращаем пустой список, если ошибка
+
+
+# Функция для чтения больших выборок по частям, не загружая все строки в память
+def iter_query(query, params=(), chunk_size=IMPORT_BATCH_SIZE):
+    """Выполняет SELECT запрос и выдает результаты списками по chunk_size строк"""
+    c = shared_connection().execute(query, params)
+    try:
+        while True:
+            rows = c.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
     finally:
-        conn.close()
+        c.close() # Освобождаем запрос, даже если чтение прервали на середине
+
+
+# Построитель запросов
+# Фильтры GUI и отчетов собираются из условий; значения всегда передаются параметрами,
+# поэтому текст SQL зависит только от набора условий, а не от введенных пользователем значений.
+# Одинаковые по форме запросы дают одинаковый текст и берутся из кэша подготовленных запросов.
+
+# Имя столбца, возможно с именем таблицы: name, orders.date
+_COLUMN_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z_][A-Za-z0-9_]*)?")
+
+
+def _check_column(column):
+    if not _COLUMN_RE.fullmatch(column):
+        raise ValueError(f"Недопустимое имя столбца: {column!r}")
+    return column
+
+
+class Query:
+    """
+    SELECT-запрос, к которому по цепочке добавляются условия WHERE, сортировка и LIMIT:
+
+        Query("SELECT id, name FROM products").where("price >= ?", 100).order_by("name").limit(50).fetch()
+    """
+
+    def __init__(self, base, params=()):
+        self.base = base # Запрос без WHERE/ORDER BY/LIMIT
+        self.params = list(params)
+        self.conditions = []
+        self.order = []
+        self.limit_clause = None
+        self.limit_params = []
+
+    def where(self, condition, *params):
+        """Добавляет условие (через AND); в условии должно быть столько '?', сколько передано значений"""
+        if condition.count("?") != len(params):
+            raise ValueError(f"В условии {condition!r} ожидается {condition.count('?')} параметров, передано {len(params)}")
+        self.conditions.append(f"({condition})")
+        self.params.extend(params)
+        return self
+
+    def contains(self, text, *columns):
+        """Условие 'text входит в один из столбцов' без учета регистра (в том числе для кириллицы)"""
+        text = text.lower()
+        if not columns:
+            raise ValueError("Не указаны столбцы для поиска")
+        condition = " OR ".join(f"INSTR(LOWER_UNICODE({_check_column(column)}), ?) > 0" for column in columns)
+        return self.where(condition, *[text] * len(columns))
+
+    def order_by(self, column, descending=False):
+        """Добавляет столбец сортировки"""
+        self.order.append(_check_column(column) + (" DESC" if descending else ""))
+        return self
+
+    def limit(self, count, offset=0):
+        """Ограничивает число строк результата"""
+        self.limit_clause = "LIMIT ? OFFSET ?"
+        self.limit_params = [int(count), int(offset)]
+        return self
+
+    def build(self):
+        """Возвращает (текст SQL, параметры)"""
+        parts = [self.base.strip()]
+        if self.conditions:
+            parts.append("WHERE " + " AND ".join(self.conditions))
+        if self.order:
+            parts.append("ORDER BY " + ", ".join(self.order))
+        if self.limit_clause:
+            parts.append(self.limit_clause)
+        return " ".join(parts), tuple(self.params + self.limit_params)
+
+    def fetch(self):
+        """Выполняет запрос и возвращает все строки"""
+        return fetch_query(*self.build())
+
+
+# Архив заказов
+# Старые заказы переносятся (archive.py) в отдельный файл рядом с основной базой (store-archive.db),
+# который подключается к каждому соединению командой ATTACH под именем archive. Временные представления
+# all_orders, all_order_items и all_order_lines соединяют основные и архивные строки; заказ, который есть
+# в основной базе, берется только оттуда, поэтому копия в архиве, оставшаяся после прерванного переноса,
+# не дает дубля. Запросы заказов пишутся с подстановками источников (см. order_sources и with_archive):
+# архив читается, только если диапазон дат запроса начинается раньше границы архива.
+
+ARCHIVE_SCHEMA = "archive"
+
+_ARCHIVE_TABLES = (
+    # Те же столбцы, что и в основной базе; внешние ключи на клиентов и товары между файлами невозможны
+    '''CREATE TABLE IF NOT EXISTS archive.orders (
+       id INTEGER PRIMARY KEY,
+       customer_id INTEGER NOT NULL,
+       date INTEGER NOT NULL,
+       total REAL NOT NULL DEFAULT 0,
+       deleted_at TEXT)''',
+    '''CREATE TABLE IF NOT EXISTS archive.order_items (
+       id INTEGER PRIMARY KEY,
+       order_id INTEGER NOT NULL,
+       product_id INTEGER NOT NULL,
+       quantity INTEGER NOT NULL,
+       unit_price REAL NOT NULL,
+       FOREIGN KEY(order_id) REFERENCES orders(id) ON DELETE CASCADE)''',
+    "CREATE INDEX IF NOT EXISTS archive.idx_orders_date ON orders(date)",
+    "CREATE INDEX IF NOT EXISTS archive.idx_orders_customer ON orders(customer_id)",
+    "CREATE INDEX IF NOT EXISTS archive.idx_order_items_order ON order_items(order_id)",
+    "CREATE INDEX IF NOT EXISTS archive.idx_order_items_product ON order_items(product_id)",
+)
+
+# Заказ из архива, если его нет в основной базе
+_NOT_IN_HOT = "NOT EXISTS (SELECT 1 FROM main.orders AS hot WHERE hot.id = {})"
+
+_ARCHIVE_VIEWS = (
+    f'''CREATE TEMP VIEW IF NOT EXISTS all_orders AS
+        SELECT id, customer_id, date, total, deleted_at, 0 AS archived, version FROM main.orders
+        UNION ALL
+        SELECT id, customer_id, date, total, deleted_at, 1 AS archived, NULL FROM archive.orders
+        WHERE {_NOT_IN_HOT.format("archive.orders.id")}''',
+    f'''CREATE TEMP VIEW IF NOT EXISTS all_order_items AS
+        SELECT id, order_id, product_id, quantity, unit_price FROM main.order_items
+        UNION ALL
+        SELECT id, order_id, product_id, quantity, unit_price FROM archive.order_items
+        WHERE {_NOT_IN_HOT.format("archive.order_items.order_id")}''',
+    # Соединение позиций с заказами выполняется в каждом файле отдельно, по его индексам
+    f'''CREATE TEMP VIEW IF NOT EXISTS all_order_lines AS
+        SELECT * FROM main.order_lines
+        UNION ALL
+        SELECT archive.order_items.id, order_id, customer_id, date, total, deleted_at,
+               product_id, quantity, unit_price
+        FROM archive.order_items JOIN archive.orders ON archive.orders.id = archive.order_items.order_id
+        WHERE {_NOT_IN_HOT.format("archive.orders.id")}''',
+)
+
+# Товары заказа одной строкой ("Ноутбук ×2, Мышь") по позициям из таблицы {items}.
+# Позиции заказа находятся по индексу idx_order_items_order (без сортировки всех позиций)
+_ORDER_PRODUCTS = """(SELECT GROUP_CONCAT(products.name || CASE WHEN order_items.quantity > 1
+                                                 THEN ' ×' || order_items.quantity ELSE '' END, ', ')
+       FROM {items} AS order_items
+       JOIN products ON products.id = order_items.product_id
+       WHERE order_items.order_id = orders.id)"""
+
+
+def archive_path():
+    """Файл архива заказов текущей базы: store.db -> store-archive.db"""
+    base, ext = os.path.splitext(DB_NAME)
+    return f"{base}-archive{ext or '.db'}"
+
+
+def attach_archive(conn, create=False):
+    """
+    Подключает архив к соединению и создает представления с архивными строками.
+    Без create отсутствующий архив не создается. Возвращает True, если архив подключен.
+    """
+    if any(row[1] == ARCHIVE_SCHEMA for row in conn.execute("PRAGMA database_list")):
+        return True
+    if (not create and not os.path.exists(archive_path())) or conn.in_transaction:
+        return False # ATTACH внутри транзакции невозможен
+    conn.execute(f"ATTACH DATABASE ? AS {ARCHIVE_SCHEMA}", (archive_path(),))
+    if create:
+        conn.execute(f"PRAGMA {ARCHIVE_SCHEMA}.journal_mode = WAL")
+        for statement in _ARCHIVE_TABLES:
+            conn.execute(statement)
+    for statement in _ARCHIVE_VIEWS:
+        conn.execute(statement)
+    return True
+
+
+def archive_cutoff(conn=None):
+    """Граница архива: заказы с датой раньше нее могут быть в архиве (None - архива нет)"""
+    try:
+        return (conn or shared_connection()).execute("SELECT cutoff FROM archive_state").fetchone()[0]
+    except sqlite3.OperationalError: # Схема базы еще не создана (init_db не вызывался)
+        return None
+
+
+def order_sources(date_min="", conn=None):
+    """
+    Источники заказов для диапазона дат с date_min ('' - за все время) - подстановки для with_archive:
+    orders, order_items - заказы и позиции; order_lines - позиции вместе с полями заказа
+    (id позиции, order_id, customer_id, date, total, deleted_at, product_id, quantity, unit_price);
+    order_products - товары заказа одной строкой (для запроса с псевдонимом orders).
+    Если диапазон заходит в архив, вместо таблиц подставляются представления с архивными строками.
+    """
+    conn = conn or shared_connection()
+    cutoff = archive_cutoff(conn)
+    if cutoff is None or (date_min and date_min >= cutoff) or not attach_archive(conn):
+        sources = {"orders": "orders", "order_items": "order_items", "order_lines": "order_lines"}
+    else:
+        sources = {"orders": "all_orders", "order_items": "all_order_items", "order_lines": "all_order_lines"}
+    sources["order_products"] = order_items_expression(sources, _ORDER_PRODUCTS)[0]
+    return sources
+
+
+def order_items_expression(sources, expression):
+    """
+    Выражение по позициям заказа orders: в expression таблица позиций обозначена {items}.
+    С архивом позиции ищутся по индексу в том файле, где лежит заказ (поиск по представлению с UNION ALL
+    для каждого заказа заново строил бы временный индекс по всем позициям).
+    Возвращает (текст, во сколько раз повторены параметры выражения).
+    """
+    if sources["orders"] == "orders":
+        return expression.format(items="order_items"), 1
+    return (f"CASE WHEN orders.archived THEN {expression.format(items='archive.order_items')} "
+            f"ELSE {expression.format(items='main.order_items')} END"), 2
+
+
+def with_archive(query, date_min="", conn=None):
+    """
+    Подставляет в текст запроса источники заказов (order_sources): {orders}, {order_items}, {order_lines},
+    {order_products}. Источники пишутся с псевдонимом ("FROM {orders} AS orders"), поэтому условия
+    вида orders.date одинаковы для основной таблицы и для представления с архивом.
+    """
+    return query.format(**order_sources(date_min, conn))
+
+
+# Мягкое удаление
+# Удаленная запись только помечается (deleted_at), ее можно восстановить; заказы удаленного клиента
+# скрываются вместе с ним без изменения каждого заказа. Окончательно записи удаляет purge_deleted,
+# при этом внешние ключи каскадно удаляют заказы и позиции (по индексам idx_orders_customer,
+# idx_order_items_order и idx_order_items_product).
+
+# Удалять ли записи мягко, если в функцию удаления не передан параметр soft
+SOFT_DELETE = True
+
+# Условие для заказов, которые видны пользователю: заказ не удален и клиент не удален.
+# Подзапрос читает только удаленных клиентов по частичному индексу idx_customers_deleted
+ACTIVE_ORDERS = ("orders.deleted_at IS NULL "
+                 "AND orders.customer_id NOT IN (SELECT id FROM customers WHERE deleted_at IS NOT NULL)")
+
+
+# Условие "id входит в список": список передается одним параметром-массивом JSON, поэтому
+# команда для любого числа записей одна и та же (и берется из кэша подготовленных запросов)
+_ID_IN_LIST = "id IN (SELECT value FROM json_each(?))"
+
+
+def _ids_param(ids):
+    return json.dumps([int(record_id) for record_id in ids])
+
+
+def _delete_query(table, soft):
+    if SOFT_DELETE if soft is None else soft:
+        return (f"UPDATE {table} SET deleted_at = datetime('now'), version = version + 1 "
+                f"WHERE {_ID_IN_LIST} AND deleted_at IS NULL")
+    return f"DELETE FROM {table} WHERE {_ID_IN_LIST}"
+
+
+def _delete(table, ids, soft):
+    """Удаляет записи ids одной командой, мягко (помечает) или окончательно; возвращает их число или None"""
+    try:
+        return write_transaction(lambda conn: conn.execute(_delete_query(table, soft), (_ids_param(ids),)).rowcount)
+    except sqlite3.Error as e:
+        print(f"Ошибка базы данных: {e}")
+        return None
+
+
+def _restore(table, record_id):
+    """Снимает пометку об удалении; возвращает True, если запись восстановлена, или None при ошибке"""
+    try:
+        return write_transaction(lambda conn: conn.execute(
+            f"UPDATE {table} SET deleted_at = NULL, version = version + 1 WHERE id=? AND deleted_at IS NOT NULL",
+            (record_id,)).rowcount > 0)
+    except sqlite3.Error as e:
+        # Например, за время удаления появился другой клиент с тем же email
+        print(f"Ошибка базы данных: {e}")
+        return None
+
+
+def purge_deleted(older_than_days=0):
+    """
+    Окончательно удаляет записи, помеченные удаленными не меньше older_than_days дней назад.
+    Возвращает словарь {таблица: сколько записей удалено}.
+    """
+    result = {}
+    conn = shared_connection()
+    with conn: # Одна транзакция: каскады внешних ключей удаляют заказы и позиции удаляемых записей
+        for table in ("orders", "customers", "products"):
+            c = conn.execute(f"DELETE FROM {table} WHERE deleted_at IS NOT NULL "
+                             f"AND deleted_at <= datetime('now', ?)", (f"-{int(older_than_days)} days",))
+            result[table] = c.rowcount
+    if attach_archive(conn):
+        # Внешние ключи не действуют между файлами, поэтому архив чистится отдельно:
+        # удаленные заказы, заказы удаленных клиентов и позиции удаленных товаров
+        with conn:
+            c = conn.execute("DELETE FROM archive.orders WHERE (deleted_at IS NOT NULL "
+                             "AND deleted_at <= datetime('now', ?)) "
+                             "OR customer_id NOT IN (SELECT id FROM main.customers)",
+                             (f"-{int(older_than_days)} days",))
+            conn.execute("DELETE FROM archive.order_items WHERE product_id NOT IN (SELECT id FROM main.products)")
+        result["archive"] = c.rowcount
+    return result
+
+
+# Естественные ключи
+# По ним повторный импорт находит уже существующие записи вместо создания дублей
+
+def customer_key(phone, email):
+    """Естественный ключ клиента: email, а если его нет - нормализованный телефон"""
+    email = (email or "").strip().lower()
+    if email:
+        return "email:" + email
+    phone = normalize_phone(phone)
+    if phone:
+        return "phone:" + phone
+    return None # Клиента без email и телефона сопоставить не по чему
+
+
+def product_key(name):
+    """Естественный ключ товара: название без учета регистра и лишних пробелов"""
+    name = " ".join((name or "").split()).casefold()
+    return name or None
+
+
+# Версии записей
+# Форма редактирования помнит версию прочитанной записи, а обновление проверяет ее в условии UPDATE
+# ("сравнить и заменить"): если за это время запись изменила другая копия программы, обновление
+# не затрагивает ни одной строки, и вызывающий получает UpdateConflict вместо молчаливой перезаписи.
+# Версию увеличивает каждое изменение записи: формы, импорт, изменение цен, удаление и восстановление.
+
+class UpdateConflict(Exception):
+    """
+    Запись изменили или удалили после того, как ее прочитали.
+    current - запись в текущем виде (Customer, Product или Order) или None, если ее больше нет
+    """
+
+    def __init__(self, table, record_id, current):
+        state = "удалена" if current is None else "изменена"
+        super().__init__(f"Запись {record_id} таблицы {table} {state} другим пользователем")
+        self.table = table
+        self.record_id = record_id
+        self.current = current
+
+
+# Условие обновления записи: id, запись не удалена и (если версия известна) версия не изменилась.
+# Без версии (None) запись обновляется без проверки, как раньше
+_CURRENT_VERSION = "id=? AND deleted_at IS NULL AND version = COALESCE(?, version)"
 
 
 # Функции для работы с клиентами
 
+# Читаем клиента по идентификатору
+def read_customer(conn, customer_id):
+    """Возвращает клиента (объект Customer с версией) по ID или None, если его нет или он удален"""
+    row = conn.execute("SELECT id, name, phone, email, address, version FROM customers "
+                       "WHERE id=? AND deleted_at IS NULL", (customer_id,)).fetchone()
+    return Customer(*row) if row else None
+
+# Получаем клиента по идентификатору
+def get_customer(customer_id):
+    """Возвращает клиента по ID или None"""
+    return read_customer(shared_connection(), customer_id)
+
 # Общая функция для получения всех клиентов из базы данных
 def get_all_customers():
     """Возвращает всех клиентов"""
-    return fetch_query("SELECT * FROM customers") # Используем fetch_query для получения всех клиентов
+    return fetch_query("SELECT id, name, phone, email, address FROM customers WHERE deleted_at IS NULL")
+
+# Столбцы сводки по заказам клиента (customer_stats), по которым сортируется список клиентов
+CUSTOMER_STATS_COLUMNS = ("order_count", "revenue", "first_order", "last_order")
+
+# Запрос клиентов по подстрокам ФИО, телефона и email (пустая строка - без фильтра)
+def customers_query(name="", phone="", email="", stats=False, min_orders=0, order_by="id", descending=False):
+    """
+    Возвращает Query для выборки клиентов с фильтрами (к нему можно добавить limit).
+    stats=True добавляет столбцы сводки: число заказов, сумму покупок и дату последнего заказа;
+    тогда можно отобрать клиентов с не меньше чем min_orders заказами и сортировать по столбцу
+    сводки order_by (см. CUSTOMER_STATS_COLUMNS) по его индексу.
+    """
+    if stats:
+        query = Query(f"""SELECT id, name, phone, email, address,
+                                 customer_stats.order_count, customer_stats.revenue,
+                                 {day_sql("customer_stats.last_order")}
+                         FROM customers
+                         JOIN customer_stats ON customer_stats.customer_id = customers.id""")
+        if min_orders:
+            query.where("customer_stats.order_count >= ?", int(min_orders))
+        if order_by in CUSTOMER_STATS_COLUMNS:
+            order_by = f"customer_stats.{order_by}"
+    else:
+        query = Query("SELECT id, name, phone, email, address FROM customers")
+    query.where("deleted_at IS NULL")
+    if name:
+        query.contains(name, "name")
+    if phone:
+        query.contains(phone, "phone")
+    if email:
+        query.contains(email, "email")
+    query.order_by(order_by, descending)
+    return query.order_by("id") if order_by != "id" else query
+
+# Ищем клиентов с фильтрами
+def find_customers(name="", phone="", email=""):
+    """Возвращает клиентов, подходящих под фильтры, фильтрация выполняется в SQLite"""
+    return customers_query(name, phone, email).fetch()
 
 # Добавляем нового клиента в базу данных
 def add_customer(customer):
     """Добавляет нового клиента"""
-    query = "INSERT INTO customers (name, phone, email, address) VALUES (?, ?, ?, ?)"
+    query = "INSERT INTO customers (name, phone, email, address, natural_key) VALUES (?, ?, ?, ?, ?)"
     # Передаем значения объекта customer в качестве параметров
-    return execute_query(query, (customer.name, customer.phone, customer.email, customer.address))
+    return execute_query(query, (customer.name, customer.phone, customer.email, customer.address,
+                                 customer_key(customer.phone, customer.email)))
 
 # Обновляем информацию о клиенте в базе данных
 def update_customer(customer):
-    """Обновляет данные клиента"""
-    query = "UPDATE customers SET name=?, phone=?, email=?, address=? WHERE id=?"
-    # Передаем новые свойства клиента и его идентификатор
-    execute_query(query, (customer.name, customer.phone, customer.email, customer.address, customer.id))
+    """
+    Обновляет данные клиента, если его версия совпадает с customer.version (см. "Версии записей"),
+    и записывает в customer новую версию. Возвращает ID клиента или None при ошибке базы
+    (например, такой email уже есть); если клиента изменили или удалили, вызывает UpdateConflict
+    """
+    query = (f"UPDATE customers SET name=?, phone=?, email=?, address=?, natural_key=?, version=version+1 "
+             f"WHERE {_CURRENT_VERSION} RETURNING version")
+    # Передаем новые свойства клиента, его идентификатор и прочитанную версию
+    params = (customer.name, customer.phone, customer.email, customer.address,
+              customer_key(customer.phone, customer.email), customer.id, customer.version)
+    return _update_record(customer, "customers", query, params, read_customer)
+
+# Общая часть обновления клиента, товара и заказа
+def _update_record(record, table, query, params, read, then=None):
+    """
+    Выполняет обновление записи с проверкой версии (query ... RETURNING version) и повторами при занятой базе.
+    read(conn, id) читает текущую запись для UpdateConflict; then(conn) - дальнейшие изменения в той же транзакции
+    """
+    def write(conn):
+        row = conn.execute(query, params).fetchone()
+        if row is None: # Версия не совпала или записи нет
+            raise UpdateConflict(table, record.id, read(conn, record.id))
+        if then is not None:
+            then(conn)
+        return row[0]
+    try:
+        record.version = write_transaction(write)
+        return record.id
+    except sqlite3.Error as e:
+        print(f"Ошибка базы данных: {e}")
+        return None
 
 # Удаляем клиента из базы данных по его идентификатору
-def delete_customer(customer_id):
-    """Удаляет клиента по ID"""
-    execute_query("DELETE FROM customers WHERE id=?", (customer_id,))
+def delete_customer(customer_id, soft=None):
+    """Удаляет клиента по ID (soft=None - как задано в SOFT_DELETE); заказы клиента скрываются или удаляются вместе с ним"""
+    _delete("customers", [customer_id], soft)
+
+# Удаляем сразу несколько клиентов
+def delete_customers(customer_ids, soft=None):
+    """
+    Удаляет клиентов одной командой в одной транзакции.
+    Возвращает ID видимых заказов, которые пропали вместе с клиентами (для обновления списка заказов), или None
+    """
+    ids = _ids_param(customer_ids)
+
+    def delete(conn): # Список заказов и удаление - в одной транзакции записи
+        order_ids = [row[0] for row in conn.execute(with_archive(
+            "SELECT id FROM {orders} AS orders WHERE customer_id IN (SELECT value FROM json_each(?)) "
+            "AND deleted_at IS NULL", conn=conn), (ids,))]
+        conn.execute(_delete_query("customers", soft), (ids,))
+        return order_ids
+    try:
+        conn = shared_connection()
+        attach_archive(conn) # ATTACH внутри транзакции невозможен - подключаем архив заранее
+        return write_transaction(delete, conn=conn)
+    except sqlite3.Error as e:
+        print(f"Ошибка базы данных: {e}")
+        return None
+
+# Восстанавливаем мягко удаленного клиента вместе с его заказами
+def restore_customer(customer_id):
+    """Восстанавливает удаленного клиента"""
+    return _restore("customers", customer_id)
 
 
 # Функции для работы с товарами
 
+# Читаем товар по идентификатору
+def read_product(conn, product_id):
+    """Возвращает товар (объект Product с версией) по ID или None, если его нет или он удален"""
+    row = conn.execute("SELECT id, name, price, version FROM products WHERE id=? AND deleted_at IS NULL",
+                       (product_id,)).fetchone()
+    return Product(*row) if row else None
+
+# Получаем товар по идентификатору
+def get_product(product_id):
+    """Возвращает товар по ID или None"""
+    return read_product(shared_connection(), product_id)
+
 # Получаем все товары из базы данных
 def get_all_products():
     """Возвращает все товары"""
-    return fetch_query("SELECT * FROM products")
+    return fetch_query("SELECT id, name, price FROM products WHERE deleted_at IS NULL")
+
+# Запрос товаров по подстроке названия и диапазону цены (None - граница не задана)
+def products_query(name="", price_min=None, price_max=None):
+    """Возвращает Query для выборки товаров с фильтрами"""
+    query = Query("SELECT id, name, price FROM products").where("deleted_at IS NULL")
+    if name:
+        query.contains(name, "name")
+    if price_min is not None:
+        query.where("price >= ?", price_min)
+    if price_max is not None:
+        query.where("price <= ?", price_max)
+    return query.order_by("id")
+
+# Ищем товары с фильтрами
+def find_products(name="", price_min=None, price_max=None):
+    """Возвращает товары, подходящие под фильтры"""
+    return products_query(name, price_min, price_max).fetch()
 
 # Добавляем новый товар в базу данных
 def add_product(product):
     """Добавляет новый товар"""
-    query = "INSERT INTO products (name, price) VALUES (?, ?)"
-    return execute_query(query, (product.name, product.price))
+    query = "INSERT INTO products (name, price, natural_key) VALUES (?, ?, ?)"
+    return execute_query(query, (product.name, product.price, product_key(product.name)))
 
 # Обновляем информацию о товаре в базе данных
 def update_product(product):
-    """Обновляет данные товара"""
-    query = "UPDATE products SET name=?, price=? WHERE id=?"
-    execute_query(query, (product.name, product.price, product.id))
+    """Обновляет данные товара с проверкой версии, как update_customer"""
+    query = (f"UPDATE products SET name=?, price=?, natural_key=?, version=version+1 "
+             f"WHERE {_CURRENT_VERSION} RETURNING version")
+    params = (product.name, product.price, product_key(product.name), product.id, product.version)
+    return _update_record(product, "products", query, params, read_product)
 
 # Удаляем товар из базы данных по его идентификатору
-def delete_product(product_id):
-    """Удаляет товар по ID"""
-    execute_query("DELETE FROM products WHERE id=?", (product_id,))
+def delete_product(product_id, soft=None):
+    """
+    Удаляет товар по ID. Мягко удаленный товар пропадает из списка товаров, но остается в уже
+    оформленных заказах; при окончательном удалении его позиции удаляются из заказов
+    """
+    _delete("products", [product_id], soft)
+
+# Удаляем сразу несколько товаров
+def delete_products(product_ids, soft=None):
+    """Удаляет товары одной командой, возвращает их число или None"""
+    return _delete("products", product_ids, soft)
+
+# Меняем цену нескольких товаров на процент
+def reprice_products(product_ids, percent):
+    """
+    Изменяет цены товаров на percent процентов (отрицательный - скидка) одной командой.
+    Цены в уже оформленных заказах не меняются. Возвращает новые строки (id, название, цена) или None
+    """
+    try:
+        return write_transaction(lambda conn: conn.execute(
+            f"UPDATE products SET price = ROUND(price * (100 + ?) / 100, 2), version = version + 1 "
+            f"WHERE {_ID_IN_LIST} AND deleted_at IS NULL RETURNING id, name, price",
+            (percent, _ids_param(product_ids))).fetchall())
+    except sqlite3.Error as e:
+        print(f"Ошибка базы данных: {e}")
+        return None
+
+# Восстанавливаем мягко удаленный товар
+def restore_product(product_id):
+    """Восстанавливает удаленный товар"""
+    return _restore("products", product_id)
+
+
+# История цен
+# Каждое изменение цены товара записывается в price_history с днем, с которого цена действует
+# (см. _migration_price_history). Цена на дату - последняя строка товара не позже этой даты.
+
+# SQL-выражение: цена товара {product} на дату заказа (заказ - под псевдонимом orders, как в ACTIVE_ORDERS).
+# Для каждой позиции это один поиск по ключу таблицы с конца диапазона (product_id, valid_from <= дата):
+# соединение по диапазону [valid_from, следующая valid_from) SQLite не может остановить на первом
+# подходящем периоде и читает все более поздние (см. python bench.py price-history)
+PRICE_AT_ORDER_DATE = ("(SELECT price FROM price_history WHERE price_history.product_id = {product} "
+                       "AND price_history.valid_from <= orders.date ORDER BY price_history.valid_from DESC LIMIT 1)")
+
+
+def price_at(product_id, date):
+    """Цена товара, действовавшая в день date (ГГГГ-ММ-ДД), или None, если товара нет"""
+    row = shared_connection().execute(
+        "SELECT price FROM price_history WHERE product_id = ? AND valid_from <= ? ORDER BY valid_from DESC LIMIT 1",
+        (product_id, to_day(date))).fetchone()
+    return row[0] if row else None
+
+
+def get_price_history(product_id):
+    """История цен товара: список (действует с, действует до или None для текущей цены, цена), по датам"""
+    rows = shared_connection().execute(
+        "SELECT valid_from, price FROM price_history WHERE product_id = ? ORDER BY valid_from", (product_id,)).fetchall()
+    return [(day_text(valid_from), day_text(following[0]) if following else None, price)
+            for (valid_from, price), following in zip(rows, rows[1:] + [None])]
+
+
+def set_product_price(product_id, price, date):
+    """
+    Записывает в историю цену товара, действующую с даты date (ГГГГ-ММ-ДД, не позже сегодняшней), -
+    например, чтобы восстановить прошлые изменения цен. Прежняя цена действует до date, более поздние
+    изменения сохраняются; если их нет, price становится и текущей ценой товара.
+    Возвращает True или None при ошибке базы (например, товара нет).
+    """
+    day = to_day(date) # Некорректная дата - ValueError до обращения к базе
+
+    def write(conn):
+        if day > conn.execute(f"SELECT {_TODAY_SQL}").fetchone()[0]:
+            raise ValueError(f"Дата {date} еще не наступила")
+        conn.execute("INSERT INTO price_history (product_id, valid_from, price) VALUES (?, ?, ?) "
+                     "ON CONFLICT (product_id, valid_from) DO UPDATE SET price = excluded.price",
+                     (product_id, day, price))
+        # Это последняя цена - она же текущая; триггер ее повторно не записывает
+        conn.execute("UPDATE products SET price = ?, version = version + 1 WHERE id = ? AND NOT EXISTS "
+                     "(SELECT 1 FROM price_history WHERE product_id = ? AND valid_from > ?)",
+                     (price, product_id, product_id, day))
+        return True
+
+    try:
+        return write_transaction(write)
+    except sqlite3.Error as e:
+        print(f"Ошибка базы данных: {e}")
+        return None
 
 
 # Функции для работы с заказами
 
-# Получаем все заказы из базы данных с присоединенными данными о клиенте и товаре
-def get_all_orders():
-    """Возвращает все заказы с дополнительной информацией о клиенте и товаре"""
-    # Формируем сложный SQL-запрос с использованием JOIN для объединения нескольких таблиц
-    query = """
+# Сложный SQL-запрос с использованием JOIN для объединения нескольких таблиц:
+# заказы с присоединенными данными о клиенте, списком товаров ("Ноутбук ×2, Мышь") и суммой заказа.
+# Сумма берется из поддерживаемого триггерами столбца orders.total.
+# Источники заказов и список товаров подставляет with_archive
+_ORDERS_VIEW_SELECT = """
     SELECT orders.id, 
            customers.name, 
            customers.phone, 
-           products.name, 
-           products.price, 
-           orders.date 
-    FROM orders
+           {order_products}, 
+           orders.total, 
+           {order_date} 
+    FROM {orders} AS orders
     JOIN customers ON customers.id = orders.customer_id
-    JOIN products ON products.id = orders.product_id
+    """.replace("{order_date}", day_sql("orders.date")) # Дата заказа показывается строкой ГГГГ-ММ-ДД
+
+# Условия видимости заказа: удаленные заказы и заказы удаленных клиентов не показываются
+_ORDERS_VIEW_ACTIVE = ("orders.deleted_at IS NULL", "customers.deleted_at IS NULL")
+
+ORDERS_VIEW_QUERY = _ORDERS_VIEW_SELECT + "WHERE " + " AND ".join(_ORDERS_VIEW_ACTIVE)
+
+# Запрос для вставки позиции заказа: если цена не передана, берется цена товара на дату заказа
+# (из истории цен; для нового заказа это текущая цена)
+_INSERT_ORDER_ITEM = """
+    INSERT INTO order_items (order_id, product_id, quantity, unit_price)
+    SELECT orders.id, products.id, ?, COALESCE(?, """ + PRICE_AT_ORDER_DATE.format(product="products.id") + """,
+                                             products.price, 0)
+    FROM orders JOIN products ON products.id = ?
+    WHERE orders.id = ?
     """
-    return fetch_query(query)
+
+# Получаем все заказы из базы данных с присоединенными данными о клиенте и товаре
+def get_all_orders():
+    """Возвращает все заказы с дополнительной информацией о клиенте и товарах"""
+    return fetch_query(with_archive(ORDERS_VIEW_QUERY))
+
+# Запрос заказов по клиенту (ФИО или телефон), товару и диапазону дат
+def orders_query(customer="", product="", date_min="", date_max="", conn=None):
+    """
+    Возвращает Query для выборки заказов в том же виде, что и get_all_orders.
+    conn - соединение, которым будет выполнен запрос (по умолчанию - соединение текущего потока):
+    выбор источников читает границу архива и при необходимости подключает архив к этому соединению
+    """
+    # Архив читается, только если нет нижней границы дат или она раньше границы архива
+    sources = order_sources(date_min, conn)
+    query = Query(_ORDERS_VIEW_SELECT.format(**sources))
+    for condition in _ORDERS_VIEW_ACTIVE:
+        query.where(condition)
+    if customer:
+        query.contains(customer, "customers.name", "customers.phone")
+    if product:
+        # Заказ подходит, если хотя бы один товар в нем содержит подстроку
+        condition, repeats = order_items_expression(sources, """EXISTS (SELECT 1 FROM {items} AS order_items
+                               JOIN products ON products.id = order_items.product_id
+                               WHERE order_items.order_id = orders.id
+                                 AND INSTR(LOWER_UNICODE(products.name), ?) > 0)""")
+        query.where(condition, *[product.lower()] * repeats)
+    if date_min:
+        query.where("orders.date >= ?", to_day(date_min)) # Даты хранятся номерами дней (см. to_day)
+    if date_max:
+        query.where("orders.date <= ?", to_day(date_max))
+    return query.order_by("orders.id")
+
+# Ищем заказы с фильтрами
+def find_orders(customer="", product="", date_min="", date_max=""):
+    """Возвращает заказы с учетом фильтров"""
+    return orders_query(customer, product, date_min, date_max).fetch()
+
+# Читаем заказ вместе с его позициями через переданное соединение
+def read_order(conn, order_id):
+    """Возвращает заказ (объект Order с позициями) по ID или None; ошибки SQLite не перехватывает"""
+    sources = order_sources(conn=conn) # Заказ может быть в архиве
+    archived = "0" if sources["orders"] == "orders" else "archived"
+    row = conn.execute(f"SELECT id, customer_id, date, version, {archived} FROM {sources['orders']} WHERE id=?",
+                       (order_id,)).fetchone()
+    if row is None:
+        return None
+    items = [OrderItem(id=item[0], order_id=order_id, product_id=item[1], quantity=item[2], unit_price=item[3])
+             for item in conn.execute(f"SELECT id, product_id, quantity, unit_price FROM {sources['order_items']} "
+                                      "WHERE order_id=? ORDER BY id", (order_id,))]
+    order = Order(id=row[0], customer_id=row[1], date=day_text(row[2]), items=items, version=row[3],
+                  archived=bool(row[4]))
+    order.product_id = items[0].product_id if items else None
+    return order
+
+# Получаем заказ вместе с его позициями
+def get_order(order_id):
+    """Возвращает заказ (объект Order с позициями) по ID или None"""
+    try:
+        return read_order(shared_connection(), order_id)
+    except sqlite3.Error as e:
+        print(f"Ошибка базы данных: {e}")
+        return None
+
+# Записываем позиции заказа (внутри транзакции вызывающей функции)
+def _insert_order_items(conn, order):
+    conn.executemany(_INSERT_ORDER_ITEM, [(item.quantity, item.unit_price, item.product_id, order.id)
+                                          for item in order.items])
 
 # Добавляем новый заказ в базу данных
 def add_order(order):
-    """Добавляет новый заказ"""
-    query = "INSERT INTO orders (customer_id, product_id, date) VALUES (?, ?, ?)"
-    return execute_query(query, (order.customer_id, order.product_id, order.date))
+    """Добавляет новый заказ вместе с позициями, возвращает его ID"""
+    day = to_day(order.date) # Некорректная дата - ValueError до обращения к базе
+
+    def write(conn): # Заказ и его позиции записываются одной транзакцией
+        order.id = conn.execute("INSERT INTO orders (customer_id, date) VALUES (?, ?)",
+                                (order.customer_id, day)).lastrowid
+        _insert_order_items(conn, order)
+        order.version = 1
+        return order.id
+    try:
+        return write_transaction(write)
+    except sqlite3.Error as e:
+        print(f"Ошибка базы данных: {e}")
+        return None
+
+# Читаем заказ, который еще можно изменить
+def _read_current_order(conn, order_id):
+    """Заказ из основной базы, если он не удален (заказы в архиве не изменяются), иначе None"""
+    if conn.execute("SELECT 1 FROM main.orders WHERE id=? AND deleted_at IS NULL", (order_id,)).fetchone() is None:
+        return None
+    return read_order(conn, order_id)
+
+# Получаем заказ для редактирования
+def get_current_order(order_id):
+    """Возвращает заказ основной базы, который можно изменить, или None (нет, удален или в архиве)"""
+    try:
+        return _read_current_order(shared_connection(), order_id)
+    except sqlite3.Error as e:
+        print(f"Ошибка базы данных: {e}")
+        return None
 
 # Обновляем информацию о заказе в базе данных
 def update_order(order):
-    """Обновляет данные заказа"""
-    query = "UPDATE orders SET customer_id=?, product_id=?, date=? WHERE id=?"
-    execute_query(query, (order.customer_id, order.product_id, order.date, order.id))
+    """
+    Обновляет данные заказа и заменяет его позиции с проверкой версии, как update_customer.
+    Заказ, перенесенный в архив, изменить нельзя - для него тоже вызывается UpdateConflict
+    """
+    day = to_day(order.date)
+    query = f"UPDATE orders SET customer_id=?, date=?, version=version+1 WHERE {_CURRENT_VERSION} RETURNING version"
+
+    def replace_items(conn):
+        # Позиции проще записать заново; сумму заказа пересчитают триггеры
+        conn.execute("DELETE FROM order_items WHERE order_id=?", (order.id,))
+        _insert_order_items(conn, order)
+
+    return _update_record(order, "orders", query, (order.customer_id, day, order.id, order.version),
+                          _read_current_order, replace_items)
 
 # Удаляем заказ из базы данных по его идентификатору
-def delete_order(order_id):
+def delete_order(order_id, soft=None):
     """Удаляет заказ по ID"""
-    execute_query("DELETE FROM orders WHERE id=?", (order_id,))
+    _delete("orders", [order_id], soft)
+
+# Удаляем сразу несколько заказов
+def delete_orders(order_ids, soft=None):
+    """Удаляет заказы одной командой, возвращает их число или None"""
+    return _delete("orders", order_ids, soft)
+
+# Восстанавливаем мягко удаленный заказ
+def restore_order(order_id):
+    """Восстанавливает удаленный заказ"""
+    return _restore("orders", order_id)
+
+
+# Контрольные точки импорта
+# После каждой пачки в той же транзакции сохраняется число обработанных строк файла,
+# поэтому прерванный импорт можно продолжить с места последней подтвержденной пачки.
+
+def get_checkpoint(source):
+    """Возвращает число уже импортированных строк источника source (0, если точки нет)"""
+    rows = fetch_query("SELECT rows FROM import_checkpoints WHERE source=?", (source,))
+    return rows[0][0] if rows else 0
+
+
+def clear_checkpoint(source):
+    """Удаляет контрольную точку источника source"""
+    execute_query("DELETE FROM import_checkpoints WHERE source=?", (source,))
+
+
+def _save_checkpoint(conn, source, rows):
+    """Сохраняет контрольную точку внутри текущей транзакции пачки"""
+    if source is not None:
+        conn.execute("INSERT INTO import_checkpoints (source, rows, updated_at) "
+                     "VALUES (?, ?, datetime('now')) "
+                     "ON CONFLICT(source) DO UPDATE SET rows=excluded.rows, updated_at=excluded.updated_at",
+                     (source, rows))
+
+
+# Импорт клиентов и товаров в режиме синхронизации (upsert)
+
+# Максимум параметров в одном запросе "WHERE ... IN (...)" (ограничение старых версий SQLite - 999)
+_SQL_IN_CHUNK = 900
+
+
+def _upsert(table, columns, keyed_rows, result, batch_size, checkpoint):
+    """
+    Вставляет новые и обновляет изменившиеся записи по естественному ключу.
+    keyed_rows - итератор кортежей (обработано строк файла, ключ, кортеж значений columns).
+    Строки собираются в пачки по batch_size различных ключей: повторы ключа внутри пачки
+    схлопываются словарем, существующие записи пачки читаются одним запросом,
+    а неизменившиеся строки в базу не пишутся вовсе.
+    """
+    column_list = ", ".join(columns)
+    placeholders = ", ".join("?" for _ in columns)
+    updates = ", ".join(f"{col}=excluded.{col}" for col in columns) + ", version=version+1"
+    query = (f"INSERT INTO {table} ({column_list}, natural_key) VALUES ({placeholders}, ?) "
+             f"ON CONFLICT(natural_key) WHERE deleted_at IS NULL DO UPDATE SET {updates}")
+
+    conn = get_connection()
+    try:
+        batch = {}
+        consumed = 0
+        for consumed, key, values in keyed_rows:
+            if key in batch:
+                result["duplicates"] += 1
+            batch[key] = values # Побеждает последняя строка с тем же ключом
+            if len(batch) >= batch_size:
+                _upsert_batch(conn, table, column_list, query, batch, result, checkpoint, consumed)
+                batch = {}
+        if batch:
+            _upsert_batch(conn, table, column_list, query, batch, result, checkpoint, consumed)
+    finally:
+        conn.close()
+    if checkpoint is not None:
+        clear_checkpoint(checkpoint) # Импорт завершен, продолжать больше нечего
+    return result
+
+
+def _upsert_batch(conn, table, column_list, query, batch, result, checkpoint, consumed):
+    """Сравнивает пачку с текущими записями и записывает только новые и изменившиеся"""
+    keys = list(batch)
+    # Загружаем текущие значения записей пачки, чтобы понять, что изменилось
+    existing = {}
+    for chunk_start in range(0, len(keys), _SQL_IN_CHUNK):
+        chunk = keys[chunk_start:chunk_start + _SQL_IN_CHUNK]
+        marks = ", ".join("?" for _ in chunk)
+        for row in conn.execute(f"SELECT natural_key, {column_list} FROM {table} "
+                                f"WHERE natural_key IN ({marks}) AND deleted_at IS NULL", chunk):
+            existing[row[0]] = tuple(row[1:])
+
+    changed = []
+    for key, values in batch.items():
+        old = existing.get(key)
+        if old is None:
+            result["inserted"] += 1
+        elif old != values:
+            result["updated"] += 1
+        else:
+            result["unchanged"] += 1
+            continue
+        changed.append(values + (key,))
+
+    with conn: # Одна транзакция на пачку вместе с контрольной точкой
+        conn.executemany(query, changed)
+        _save_checkpoint(conn, checkpoint, consumed)
+
+
+def _checked_rows(rows, check, batch_size, offset, result):
+    """
+    Проверяет строки импорта пачками функцией check из validation и выдает пары
+    (номер строки файла, нормализованные значения) для корректных строк.
+    Ошибочные строки учитываются в result (skipped и errors).
+    Нумерация строк с 2: первая строка файла - заголовок.
+    """
+    start = offset + 2
+    for batch in validation.batches(rows, batch_size):
+        values, errors = check(batch)
+        for line_no, row, error in zip(itertools.count(start), values, errors):
+            if error is None:
+                yield line_no, row
+            else:
+                result["skipped"] += 1
+                result["errors"].append((line_no, error))
+        start += len(batch)
+
+
+def upsert_customers(rows, batch_size=IMPORT_BATCH_SIZE, checkpoint=None, offset=0):
+    """
+    Импортирует клиентов из строк (ФИО, Телефон, Email, Адрес) без создания дублей.
+    Клиент сопоставляется по email или телефону: новые добавляются, изменившиеся обновляются.
+    Строки проверяются validation.check_customers, телефон сохраняется в едином виде (+79161234567).
+    Повторы одного клиента внутри пачки схлопываются (побеждает последняя строка).
+    checkpoint - имя источника для контрольных точек, offset - сколько строк файла уже
+    было импортировано раньше (вызывающий код пропускает их сам).
+    Возвращает словарь со счетчиками inserted/updated/unchanged/duplicates/skipped и списком ошибок.
+    """
+    result = {"inserted": 0, "updated": 0, "unchanged": 0, "duplicates": 0, "skipped": 0, "errors": []}
+
+    def keyed_rows():
+        for line_no, values in _checked_rows(rows, validation.check_customers, batch_size, offset, result):
+            yield line_no - 1, customer_key(values[1], values[2]), values
+
+    return _upsert("customers", ("name", "phone", "email", "address"), keyed_rows(), result, batch_size, checkpoint)
+
+
+def upsert_products(rows, batch_size=IMPORT_BATCH_SIZE, checkpoint=None, offset=0):
+    """
+    Импортирует товары из строк (Название, Цена) без создания дублей.
+    Товар сопоставляется по названию: новые добавляются, у существующих обновляется цена.
+    Строки с некорректной ценой пропускаются с ошибкой.
+    Параметры и результат - как у upsert_customers.
+    """
+    result = {"inserted": 0, "updated": 0, "unchanged": 0, "duplicates": 0, "skipped": 0, "errors": []}
+
+    def keyed_rows():
+        for line_no, values in _checked_rows(rows, validation.check_products, batch_size, offset, result):
+            yield line_no - 1, product_key(values[0]), values
+
+    return _upsert("products", ("name", "price"), keyed_rows(), result, batch_size, checkpoint)
+
+
+# Импорт заказов с проверкой ссылок на клиентов и товары
+
+class IdSet:
+    """
+    Компактное множество идентификаторов в виде битовой карты.
+    Каждому id соответствует один бит, поэтому миллион клиентов занимает ~125 КБ,
+    а проверка принадлежности выполняется без запросов к БД.
+    """
+    def __init__(self, ids=()):
+        self.bits = bytearray()
+        for id_ in ids:
+            self.add(id_)
+
+    def add(self, id_):
+        """Добавляет идентификатор в множество"""
+        byte = id_ >> 3
+        if byte >= len(self.bits):
+            # Расширяем карту с запасом, чтобы не копировать её на каждый новый id
+            self.bits.extend(bytes(max(byte + 1 - len(self.bits), len(self.bits))))
+        self.bits[byte] |= 1 << (id_ & 7)
+
+    def __contains__(self, id_):
+        byte = id_ >> 3
+        return 0 <= byte < len(self.bits) and bool(self.bits[byte] & (1 << (id_ & 7)))
+
+    def missing(self, ids):
+        """Возвращает отсортированный массив id из пачки, которых нет в множестве"""
+        return array('q', sorted({id_ for id_ in ids if id_ not in self}))
+
+
+def load_id_set(table):
+    """
+    Загружает все id таблицы (customers или products) в IdSet одним запросом.
+    Мягко удаленные записи тоже существуют: заказ на них импортируется и скрыт, пока запись не восстановят
+    """
+    if table not in ("customers", "products"):
+        raise ValueError(f"Неизвестная таблица: {table}")
+    conn = get_connection()
+    try:
+        return IdSet(row[0] for row in conn.execute(f"SELECT id FROM {table}"))
+    finally:
+        conn.close()
+
+
+def import_orders(rows, create_missing=False, batch_size=IMPORT_BATCH_SIZE, checkpoint=None, offset=0,
+                  grouped=False):
+    """
+    Импортирует заказы из строк вида (ID клиента, ID товара, дата[, количество[, цена за единицу]]).
+    Каждая строка становится заказом из одной позиции; если цена не указана, берется цена товара на дату
+    заказа (db.price_at).
+    grouped=True - перед этими колонками идет ключ заказа (ID заказа в выгрузке): идущие подряд строки
+    с одинаковыми ключом, клиентом и датой становятся позициями одного заказа, строка с пустым ключом -
+    отдельным заказом. Сам ключ не сохраняется, заказы получают новые id.
+    Строки проверяются validation.check_orders (в том числе формат даты ГГГГ-ММ-ДД).
+    Существующие id клиентов и товаров загружаются в память заранее, и каждая пачка
+    проверяется целиком. Строки со ссылками на несуществующие записи пропускаются,
+    либо (create_missing=True) для них создаются клиенты/товары-заглушки.
+    checkpoint и offset - как у upsert_customers.
+    Возвращает словарь со статистикой (imported - заказов, items - позиций) и списком ошибок
+    (номер строки, причина).
+    """
+    result = {"imported": 0, "items": 0, "skipped": 0, "created_customers": 0, "created_products": 0,
+              "errors": []}
+    customer_ids = load_id_set("customers")
+    product_ids = load_id_set("products")
+    check = _check_keyed_orders if grouped else validation.check_orders
+
+    conn = get_connection()
+    try:
+        batch = []
+        line_no = offset + 1
+        group, previous = 0, None # Номер текущего заказа в импорте и его ключ
+        for line_no, values in _checked_rows(rows, check, batch_size, offset, result):
+            key = (values[5], values[0], values[2]) if grouped and values[5] else None
+            if key is None or key != previous:
+                group += 1
+            previous = key
+            batch.append((line_no,) + values[:5] + (group,))
+            if len(batch) >= batch_size:
+                # Заказ с ключом может продолжиться следующей строкой: его позиции переносятся
+                # в следующую пачку, чтобы заказ не разделился между транзакциями
+                split = len(batch)
+                if key is not None:
+                    split = next(i for i, row in enumerate(batch) if row[-1] == group)
+                if split == len(batch):
+                    _import_order_batch(conn, batch, customer_ids, product_ids, create_missing, result,
+                                        checkpoint, line_no - 1)
+                    batch = []
+                elif split:
+                    _import_order_batch(conn, batch[:split], customer_ids, product_ids, create_missing, result,
+                                        checkpoint, batch[split][0] - 2)
+                    batch = batch[split:]
+        if batch:
+            _import_order_batch(conn, batch, customer_ids, product_ids, create_missing, result,
+                                checkpoint, line_no - 1)
+    finally:
+        conn.close()
+    if checkpoint is not None:
+        clear_checkpoint(checkpoint) # Импорт завершен, продолжать больше нечего
+    return result
+
+
+def _check_keyed_orders(rows):
+    """validation.check_orders для строк с ключом заказа в первой колонке (ключ добавляется в конец значения)"""
+    values, errors = validation.check_orders([row[1:] for row in rows])
+    return [value and value + (str(row[0]).strip(),) for value, row in zip(values, rows)], errors
+
+
+def _next_id(conn, table):
+    """Следующий свободный id таблицы с AUTOINCREMENT (id удаленных записей повторно не выдаются)"""
+    row = conn.execute(f"SELECT MAX(COALESCE((SELECT seq FROM sqlite_sequence WHERE name='{table}'), 0), "
+                       f"COALESCE((SELECT MAX(id) FROM {table}), 0))").fetchone()
+    return row[0] + 1
+
+
+def _import_order_batch(conn, batch, customer_ids, product_ids, create_missing, result, checkpoint, consumed):
+    """Проверяет пачку заказов по множествам id и вставляет её одной транзакцией"""
+    missing_customers = customer_ids.missing(row[1] for row in batch)
+    missing_products = product_ids.missing(row[2] for row in batch)
+
+    conn.execute("BEGIN IMMEDIATE") # Сразу захватываем блокировку записи (нужно для _next_id)
+    with conn: # Транзакция: при ошибке пачка откатывается целиком
+        if create_missing:
+            # Создаем заглушки с теми же id, чтобы заказы ссылались на реальные записи
+            conn.executemany("INSERT INTO customers (id, name, phone, email, address) VALUES (?, ?, '', '', '')",
+                             [(id_, f"Клиент #{id_} (создан при импорте)") for id_ in missing_customers])
+            conn.executemany("INSERT INTO products (id, name, price) VALUES (?, ?, 0)",
+                             [(id_, f"Товар #{id_} (создан при импорте)") for id_ in missing_products])
+            for id_ in missing_customers:
+                customer_ids.add(id_)
+            for id_ in missing_products:
+                product_ids.add(id_)
+            result["created_customers"] += len(missing_customers)
+            result["created_products"] += len(missing_products)
+            valid = batch
+        elif not missing_customers and not missing_products:
+            valid = batch # Вся пачка корректна - построчная проверка не нужна
+        else:
+            valid = []
+            for row in batch:
+                line_no, customer_id, product_id = row[:3]
+                if customer_id not in customer_ids:
+                    result["errors"].append((line_no, f"клиент с ID {customer_id} не найден"))
+                elif product_id not in product_ids:
+                    result["errors"].append((line_no, f"товар с ID {product_id} не найден"))
+                else:
+                    valid.append(row)
+            result["skipped"] += len(batch) - len(valid)
 
+        # executemany не возвращает id вставленных строк, поэтому id заказов назначаем сами:
+        # пачка пишется под блокировкой записи, и следующие id никто другой занять не может.
+        # Последний элемент строки - номер заказа в импорте: строки с одним номером идут подряд
+        first_id = _next_id(conn, "orders")
+        orders, order_ids, group = [], [], None
+        for row in valid:
+            if row[-1] != group:
+                group = row[-1]
+                orders.append((first_id + len(orders), row[1], to_day(row[3])))
+            order_ids.append(orders[-1][0])
+        conn.executemany("INSERT INTO orders (id, customer_id, date) VALUES (?, ?, ?)", orders)
+        conn.executemany(_INSERT_ORDER_ITEM,
+                         [(row[4], row[5], row[2], order_id) for row, order_id in zip(valid, order_ids)])
+        _save_checkpoint(conn, checkpoint, consumed)
+    result["imported"] += len(orders)
+    result["items"] += len(valid)
 
-# Инициализация БД при запуске модуля
-init_db()
\ No newline at end of file
@@ -0,0 +1,269 @@
+"""
+Поиск похожих клиентов (возможных дублей) и их объединение
+
+    python main.py dedup                          # предложения объединить клиентов
+    python main.py dedup --min-score 0.9 --workers 4
+    python main.py dedup --merge 12 15 40         # оставить клиента 12, клиентов 15 и 40 присоединить к нему
+
+Повторные импорты и ручной ввод создают почти одинаковых клиентов: "Иванов И." и "Иван Иванов",
+один телефон в разной записи. Сравнивать всех клиентов попарно - квадратичная работа, поэтому
+сравниваются только кандидаты: клиенты с общим ключом блокировки (телефон, email, имя почтового
+ящика, начало слова из ФИО вместе с инициалом другого слова). Слишком большие блоки (частые
+фамилии) пропускаются: пара из такого блока без совпадения контактов все равно не набрала бы
+нужной оценки. Оценки пар считаются параллельно в нескольких процессах; у пар, которым и одинаковое
+ФИО не дало бы нужной оценки (нет общих контактов), ФИО не сравниваются.
+
+Оценка пары - среднее из сходства ФИО и совпадения контактов (телефон, email, адрес), от 0 до 1;
+одинаковое ФИО без общих контактов дает 0.5 и в предложения не попадает (это могут быть тезки).
+Объединение переносит заказы дублей (и в архиве) к оставляемому клиенту одной командой, заполняет его
+пустые телефон, email и адрес данными дублей и удаляет дубли.
+"""
+import os
+import re
+import json
+import sqlite3
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import db
+
+# Пары с оценкой не ниже этой предлагаются к объединению
+MIN_SCORE = 0.75
+# Блоки больше этого размера не сравниваются (число пар в блоке растет квадратично)
+MAX_BLOCK = 100
+# Сколько первых букв слова ФИО входит в ключ блокировки (опечатки и окончания дальше не мешают)
+NAME_PREFIX = 4
+# Меньше этого числа пар оценки считаются в текущем процессе: запуск процессов дороже самой работы
+PARALLEL_MIN_PAIRS = 20000
+# Пар в одном задании для процесса
+CHUNK_PAIRS = 5000
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def name_tokens(name):
+    """Слова ФИО в нижнем регистре без знаков препинания: 'Иванов И.' -> ('иванов', 'и')"""
+    return tuple(_WORD_RE.findall((name or "").casefold().replace("ё", "е")))
+
+
+def _record(row):
+    """Запись для сравнения: (id, слова ФИО, телефон (10 последних цифр), email, адрес)"""
+    customer_id, name, phone, email, address = row
+    phone = db.normalize_phone(phone)
+    return (customer_id, name_tokens(name), phone[-10:] if len(phone) >= 10 else "",
+            (email or "").strip().casefold(), " ".join(_WORD_RE.findall((address or "").casefold())))
+
+
+def blocking_keys(record):
+    """Ключи блокировки записи: клиенты без общего ключа не сравниваются"""
+    _, tokens, phone, email, _ = record
+    keys = set()
+    if phone:
+        keys.add("phone:" + phone)
+    if "@" in email:
+        local = email.rsplit("@", 1)[0]
+        keys.add("email:" + email)
+        if len(local) >= 3:
+            keys.add("local:" + local) # тот же ящик у другого почтового сервиса
+    # Начало каждого слова вместе с инициалом другого слова: 'Иванов И.' и 'Иван Иванов' дают 'иван|и'
+    for word, other in itertools.permutations(tokens, 2):
+        if len(word) >= 2:
+            keys.add(f"name:{word[:NAME_PREFIX]}|{other[0]}")
+    return keys
+
+
+def candidate_pairs(records, max_block=MAX_BLOCK):
+    """
+    Пары индексов записей (i < j) с общим ключом блокировки.
+    Возвращает (множество пар, число пропущенных слишком больших блоков).
+    """
+    blocks = {}
+    for index, record in enumerate(records):
+        for key in blocking_keys(record):
+            blocks.setdefault(key, []).append(index)
+    pairs = set()
+    skipped = 0
+    for members in blocks.values():
+        if len(members) > max_block:
+            skipped += 1
+            continue
+        pairs.update(itertools.combinations(members, 2))
+    return pairs, skipped
+
+
+def _trigrams(word):
+    return {word[i:i + 3] for i in range(len(word) - 2)} or {word}
+
+
+def _word_similarity(a, b):
+    """Сходство слов: 1 - совпадают или одно - инициал другого, иначе доля общих триграмм (опечатки)"""
+    if a == b or (len(a) == 1 and b.startswith(a)) or (len(b) == 1 and a.startswith(b)):
+        return 1.0
+    if len(a) == 1 or len(b) == 1:
+        return 0.0
+    ta, tb = _trigrams(a), _trigrams(b)
+    similarity = len(ta & tb) / len(ta | tb)
+    return similarity if similarity >= 0.5 else 0.0
+
+
+def name_similarity(a, b):
+    """
+    Сходство ФИО (кортежей слов) от 0 до 1: каждое слово более короткого ФИО сопоставляется с самым
+    похожим свободным словом другого; порядок слов не важен, отчество может отсутствовать.
+    ФИО из одного слова дает не больше 0.5.
+    """
+    if not a or not b:
+        return 0.0
+    short, rest = (a, list(b)) if len(a) <= len(b) else (b, list(a))
+    total = 0.0
+    for word in short:
+        best, best_index = 0.0, None
+        for index, other in enumerate(rest):
+            similarity = _word_similarity(word, other)
+            if similarity > best:
+                best, best_index = similarity, index
+        if best_index is not None:
+            total += best
+            del rest[best_index]
+    return total / max(len(short), 2)
+
+
+def contact_similarity(a, b):
+    """Совпадение контактов записей: 1 - тот же телефон или email, 0.5 - тот же почтовый ящик или адрес"""
+    if (a[2] and a[2] == b[2]) or (a[3] and a[3] == b[3]):
+        return 1.0
+    if a[3] and b[3] and a[3].split("@")[0] == b[3].split("@")[0] and len(a[3].split("@")[0]) >= 3:
+        return 0.5 # тот же почтовый ящик у другого сервиса
+    if a[4] and a[4] == b[4]:
+        return 0.5
+    return 0.0
+
+
+def score(a, b):
+    """Оценка пары записей от 0 до 1: среднее из сходства ФИО и совпадения контактов"""
+    return (name_similarity(a[1], b[1]) + contact_similarity(a, b)) / 2
+
+
+def _score_pairs(pairs, min_score):
+    """Оценивает пары записей [(a, b), ...]; возвращает [(оценка, id a, id b)] с оценкой не ниже min_score"""
+    found = []
+    for a, b in pairs:
+        contact = contact_similarity(a, b)
+        if (1 + contact) / 2 < min_score:
+            continue # Даже одинаковое ФИО не доведет оценку до порога - сравнивать ФИО незачем
+        value = (name_similarity(a[1], b[1]) + contact) / 2
+        if value >= min_score:
+            found.append((round(value, 3), a[0], b[0]))
+    return found
+
+
+def find_pairs(min_score=MIN_SCORE, workers=None, max_block=MAX_BLOCK):
+    """
+    Находит пары похожих неудаленных клиентов.
+    workers - число процессов для оценки пар (None - по числу ядер).
+    Возвращает список (оценка, id клиента, id клиента) по убыванию оценки.
+    """
+    records = [_record(row) for rows in db.iter_query(
+        "SELECT id, name, phone, email, address FROM customers WHERE deleted_at IS NULL ORDER BY id")
+               for row in rows]
+    pairs, _ = candidate_pairs(records, max_block)
+    work = [(records[i], records[j]) for i, j in pairs]
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(work) < PARALLEL_MIN_PAIRS:
+        found = _score_pairs(work, min_score)
+    else:
+        chunks = [work[start:start + CHUNK_PAIRS] for start in range(0, len(work), CHUNK_PAIRS)]
+        # spawn: процессы не наследуют потоки и открытые соединения (поиск запускается и из окна программы)
+        with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+            found = [item for part in executor.map(_score_pairs, chunks, itertools.repeat(min_score))
+                     for item in part]
+    return sorted(found, key=lambda item: (-item[0], item[1], item[2]))
+
+
+def suggest_merges(pairs):
+    """
+    Группирует пары find_pairs в предложения объединения: связанные парами клиенты - одна группа.
+    Оставляется клиент с наибольшим числом заказов (при равенстве - более ранний).
+    Возвращает список (id оставляемого клиента, список id дублей, наименьшая оценка пары в группе).
+    """
+    parent = {}
+
+    def root(x):
+        while parent.setdefault(x, x) != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for _, a, b in pairs:
+        parent[root(a)] = root(b)
+    groups, scores = {}, {}
+    for value, a, b in pairs:
+        scores[root(a)] = min(scores.get(root(a), 1.0), value)
+    for customer_id in parent:
+        groups.setdefault(root(customer_id), []).append(customer_id)
+
+    orders = dict(db.fetch_query("SELECT customer_id, order_count FROM customer_stats "
+                                 "WHERE customer_id IN (SELECT value FROM json_each(?))", (json.dumps(list(parent)),)))
+    suggestions = []
+    for group_root, members in groups.items():
+        members.sort(key=lambda customer_id: (-orders.get(customer_id, 0), customer_id))
+        suggestions.append((members[0], members[1:], scores[group_root]))
+    return sorted(suggestions, key=lambda item: (-item[2], item[0]))
+
+
+def merge(keep_id, duplicate_ids):
+    """
+    Объединяет клиентов: заказы дублей (и архивные) переходят к клиенту keep_id, его пустые телефон,
+    email и адрес заполняются данными дублей, дубли удаляются (мягко - их можно восстановить, но уже без заказов).
+    Всё выполняется в одной транзакции. Возвращает число перенесенных заказов.
+    """
+    duplicate_ids = [int(customer_id) for customer_id in duplicate_ids if int(customer_id) != int(keep_id)]
+    if not duplicate_ids:
+        return 0
+    ids = json.dumps(duplicate_ids)
+    conn = db.shared_connection()
+    archived = db.attach_archive(conn) # Подключение возможно только вне транзакции
+    conn.execute("BEGIN IMMEDIATE")
+    with conn:
+        keep = conn.execute("SELECT name, phone, email, address FROM customers WHERE id = ? AND deleted_at IS NULL",
+                            (keep_id,)).fetchone()
+        if keep is None:
+            raise ValueError(f"Клиент с ID {keep_id} не найден")
+        duplicates = conn.execute("SELECT phone, email, address FROM customers WHERE id IN "
+                                  "(SELECT value FROM json_each(?)) AND deleted_at IS NULL ORDER BY id",
+                                  (ids,)).fetchall()
+        if len(duplicates) != len(set(duplicate_ids)):
+            raise ValueError("Не все объединяемые клиенты найдены")
+
+        # Заказы переносятся одной командой; сводку по клиентам и счетчики обновляют триггеры
+        moved = conn.execute("UPDATE orders SET customer_id = ?, version = version + 1 WHERE customer_id IN "
+                             "(SELECT value FROM json_each(?))", (keep_id, ids)).rowcount
+        if archived:
+            # В архиве триггеров нет: сводка оставляемого клиента пересчитается по таблицам
+            c = conn.execute("UPDATE archive.orders SET customer_id = ? WHERE customer_id IN "
+                             "(SELECT value FROM json_each(?))", (keep_id, ids))
+            if c.rowcount:
+                moved += c.rowcount
+                conn.execute("UPDATE customer_stats SET stale = 1 WHERE customer_id = ?", (keep_id,))
+
+        # Дубли удаляются до изменения контактов: освобождается их естественный ключ (email или телефон)
+        conn.execute("UPDATE customers SET deleted_at = datetime('now'), version = version + 1 WHERE id IN "
+                     "(SELECT value FROM json_each(?))", (ids,))
+        name, phone, email, address = keep
+        for dup_phone, dup_email, dup_address in duplicates:
+            phone, email, address = phone or dup_phone, email or dup_email, address or dup_address
+        if (phone, email, address) != tuple(keep[1:]):
+            try:
+                conn.execute("UPDATE customers SET phone = ?, email = ?, address = ?, natural_key = ?, "
+                             "version = version + 1 WHERE id = ?",
+                             (phone, email, address, db.customer_key(phone, email), keep_id))
+            except sqlite3.IntegrityError:
+                raise ValueError(f"Email или телефон клиента {keep_id} после объединения "
+                                 f"совпадет с другим клиентом") from None
+    return moved
+
+
+def customer_names(customer_ids):
+    """ФИО клиентов по id: словарь {id: ФИО}"""
+    return dict(db.fetch_query("SELECT id, name FROM customers WHERE id IN (SELECT value FROM json_each(?))",
+                               (json.dumps(list(customer_ids)),)))
@@ -3,21 +3,69 @@
 Использует Tkinter для создания оконного приложения
 """
 import tkinter as tk # Базовый модуль для GUI
-from tkinter import ttk, messagebox, filedialog # Виджеты, диалоговые окна
+from tkinter import ttk, messagebox, filedialog, simpledialog # Виджеты, диалоговые окна
+import threading # Фоновые операции с базой, чтобы окно не замирало
+import queue # Передача пачек строк из фонового потока загрузки в главный
+import os
+import sys
+import time
 import db
-import csv # Работа с CSV-файлами
+import csv_io # Импорт/экспорт CSV, в том числе сжатых (.gz, .zst)
+import backup # Резервные копии базы во время работы
+import memprof # Измерение памяти операций (по умолчанию выключено)
+import uilag # Зависания окна по обработчикам (по умолчанию выключено)
+import customer_stats # Сводка по заказам клиентов для списка клиентов
+import validation # Общие правила проверки данных форм и импорта
 from datetime import datetime # Работа с датами
-from analysis import generate_sales_report, generate_orders_dynamics
-from models import Customer, Product, Order  # Импорт классов моделей
-import re  # для работы с регулярными выражениями
+from models import Customer, Product, Order, OrderItem  # Импорт классов моделей
+
+
+# Как часто (в миллисекундах) проверять, закончилась ли фоновая операция
+BACKGROUND_POLL_MS = 50
+
+# Загрузка списков: сколько пачек строк может ждать вставки в таблицу и сколько миллисекунд
+# главный поток вставляет строки за один раз, прежде чем снова обработать события окна
+LOAD_QUEUE_CHUNKS = 4
+LOAD_SLICE_MS = 30
+
+# Заголовки столбцов сводки по заказам на вкладке "Клиенты" и соответствующие столбцы customer_stats
+CUSTOMER_STATS_HEADINGS = {"Заказов": "order_count", "Сумма": "revenue", "Последний заказ": "last_order"}
+
+# Сколько последних резервных копий хранить в выбранной папке
+BACKUP_KEEP = 10
+
+# Сколько дней предлагать по умолчанию при переносе старых заказов в архив
+ARCHIVE_DAYS = 365
+
+# Форматы файлов для импорта/экспорта: CSV (в том числе сжатый) и колоночный формат NumPy
+FILE_TYPES = [("CSV Files", "*.csv"), ("CSV gzip", "*.csv.gz"), ("CSV zstd", "*.csv.zst"),
+              ("NumPy Files", "*.npz")]
+
+
+def resolve_conflict(dialog, conflict, what):
+    """
+    Сообщает, что запись из формы dialog изменили или удалили в другой копии программы (db.UpdateConflict).
+    what - запись в винительном падеже ("Клиента"). Возвращает "overwrite" - сохранить данные формы
+    поверх чужих изменений, "reload" - показать в форме текущие данные, "deleted" - записи больше нет,
+    или None - вернуться к форме.
+    """
+    if conflict.current is None:
+        archived = " или перенес в архив" if conflict.table == "orders" else ""
+        messagebox.showerror("Конфликт изменений", f"{what} удалил другой пользователь{archived}.\n"
+                                                   "Изменения не сохранены.", parent=dialog)
+        return "deleted"
+    answer = messagebox.askyesnocancel(
+        "Конфликт изменений",
+        f"{what} изменил другой пользователь, пока форма была открыта.\n\n"
+        "Да - сохранить ваши данные поверх его изменений\n"
+        "Нет - загрузить в форму текущие данные\n"
+        "Отмена - вернуться к форме",
+        parent=dialog)
+    if answer is None:
+        return None
+    return "overwrite" if answer else "reload"
 
 
-def is_valid_email(email): # Проверяет корректность email с помощью регулярного выражения
-    if not email:
-        return True  # Пустой email считается валидным
-    pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-    return re.match(pattern, email) is not None # пытается применить шаблон (pattern) к строке (email), is not None' преобразует результат в булево значение
-
 class EditCustomerDialog(tk.Toplevel): # Диалоговое окно для добавления/редактирования клиента
 
     def __init__(self, parent, customer=None): # Конструктор класса для инициализации нового экземпляра
@@ -51,12 +99,7 @@ class EditCustomerDialog(tk.Toplevel): # Диалоговое окно для д
 
         # Заполняем поля, если редактируем существующего клиента
         if customer:
-            # Заполнение поля данными из объекта клиента
-            # insert(0, value) - вставка текста в начало поля (позиция 0)
-            self.name_entry.insert(0, customer.name)
-            self.phone_entry.insert(0, customer.phone)
-            self.email_entry.insert(0, customer.email)
-            self.address_entry.insert(0, customer.address)
+            self.fill(customer)
 
         # Кнопки сохранения/отмены
         btn_frame = tk.Frame(self) # Создаем фрейм для группировки кнопок
@@ -65,6 +108,13 @@ class EditCustomerDialog(tk.Toplevel): # Диалоговое окно для д
         tk.Button(btn_frame, text="Сохранить", command=self.save).pack(side=tk.LEFT, padx=10) # Создаем кнопку "Сохранить" внутри фрейма кнопок, command=self.save - привязка к методу save() текущего класса
         tk.Button(btn_frame, text="Отмена", command=self.destroy).pack(side=tk.LEFT, padx=10) # Создаем кнопку "Отмена" внутри фрейма кнопок
 
+    def fill(self, customer):
+        """Заполняет поля данными из объекта клиента"""
+        for entry, value in ((self.name_entry, customer.name), (self.phone_entry, customer.phone),
+                             (self.email_entry, customer.email), (self.address_entry, customer.address)):
+            entry.delete(0, tk.END)
+            entry.insert(0, value) # insert(0, value) - вставка текста в начало поля (позиция 0)
+
     def save(self):
         # Собирает данные из формы и сохраняет клиента
         #   - get(): получение текущего текста из поля ввода
@@ -84,7 +134,7 @@ class EditCustomerDialog(tk.Toplevel): # Диалоговое окно для д
             is_valid = False
 
         # Проверка корректности email (только если поле не пустое)
-        if email and not is_valid_email(email):
+        if not validation.is_valid_email(email):
             messagebox.showerror(
                 "Ошибка",
                 "Некорректный формат email.\n"
@@ -94,6 +144,15 @@ class EditCustomerDialog(tk.Toplevel): # Диалоговое окно для д
             self.email_entry.focus_set()  # Устанавливаем фокус на поле
             is_valid = False
 
+        # Телефон сохраняется в едином виде, как и при импорте
+        if is_valid:
+            try:
+                phone = validation.canonical_phone(phone)
+            except ValueError:
+                messagebox.showerror("Ошибка", "Некорректный телефон.\nПример: +7 (916) 123-45-67")
+                self.phone_entry.focus_set()
+                is_valid = False
+
         # Если есть ошибки - не закрываем окно
         if not is_valid:
             return
@@ -104,11 +163,30 @@ class EditCustomerDialog(tk.Toplevel): # Диалоговое окно для д
             self.customer.phone = phone
             self.customer.email = email
             self.customer.address = address
-            db.update_customer(self.customer)
+            try:
+                saved = db.update_customer(self.customer)
+            except db.UpdateConflict as conflict: # Клиента изменили в другой копии программы
+                action = resolve_conflict(self, conflict, "Клиента")
+                if action == "overwrite":
+                    self.customer.version = conflict.current.version
+                    self.save()
+                elif action == "reload":
+                    self.customer = conflict.current
+                    self.fill(conflict.current)
+                elif action == "deleted":
+                    self.parent.load_customers()
+                    self.destroy()
+                return
         else: # Создаем
             # Используем класс Customer из models.ry
             customer = Customer(name=name, phone=phone, email=email, address=address)
-            db.add_customer(customer)
+            saved = db.add_customer(customer)
+
+        # Email и телефон уникальны, поэтому сохранение может не пройти
+        if saved is None:
+            messagebox.showerror("Ошибка", "Не удалось сохранить клиента.\n"
+                                           "Возможно, клиент с таким email или телефоном уже существует")
+            return
 
         self.parent.load_customers()
         self.destroy()
@@ -138,9 +216,7 @@ class EditProductDialog(tk.Toplevel): # Диалоговое окно для д
 
         # Заполняем поля, если редактируем существующий товар
         if product:
-            # Заполнение поля данными из объекта клиента
-            self.name_entry.insert(0, product.name)
-            self.price_entry.insert(0, str(product.price))
+            self.fill(product)
 
         # Кнопки сохранения/отмены
         btn_frame = tk.Frame(self)
@@ -149,6 +225,13 @@ class EditProductDialog(tk.Toplevel): # Диалоговое окно для д
         tk.Button(btn_frame, text="Сохранить", command=self.save).pack(side=tk.LEFT, padx=10)
         tk.Button(btn_frame, text="Отмена", command=self.destroy).pack(side=tk.LEFT, padx=10)
 
+    def fill(self, product):
+        """Заполняет поля данными из объекта товара"""
+        self.name_entry.delete(0, tk.END)
+        self.name_entry.insert(0, product.name)
+        self.price_entry.delete(0, tk.END)
+        self.price_entry.insert(0, str(product.price))
+
     def save(self):
         """Собирает данные из формы и сохраняет товар"""
         name = self.name_entry.get().strip()
@@ -159,9 +242,7 @@ class EditProductDialog(tk.Toplevel): # Диалоговое окно для д
             return
 
         try:
-            price = float(price_str)
-            if price <= 0:
-                raise ValueError("Цена должна быть положительным числом")
+            price = validation.parse_price(price_str)
         except ValueError:
             messagebox.showerror("Ошибка", "Некорректная цена. Введите число (например: 199.99)")
             return
@@ -170,10 +251,29 @@ class EditProductDialog(tk.Toplevel): # Диалоговое окно для д
         if self.product:
             self.product.name = name
             self.product.price = price
-            db.update_product(self.product)
+            try:
+                saved = db.update_product(self.product)
+            except db.UpdateConflict as conflict: # Товар изменили в другой копии программы
+                action = resolve_conflict(self, conflict, "Товар")
+                if action == "overwrite":
+                    self.product.version = conflict.current.version
+                    self.save()
+                elif action == "reload":
+                    self.product = conflict.current
+                    self.fill(conflict.current)
+                elif action == "deleted":
+                    self.parent.load_products()
+                    self.destroy()
+                return
         else:
             product = Product(name=name, price=price)
-            db.add_product(product)
+            saved = db.add_product(product)
+
+        # Название товара уникально, поэтому сохранение может не пройти
+        if saved is None:
+            messagebox.showerror("Ошибка", "Не удалось сохранить товар.\n"
+                                           "Возможно, товар с таким названием уже существует")
+            return
 
         self.parent.load_products()
         self.destroy()
@@ -189,7 +289,7 @@ class EditOrderDialog(tk.Toplevel):
         self.order = order # Храним ссылку на редактируемый заказ (если таковой есть)
 
         self.title("Редактирование заказа" if order else "Добавление заказа") # Название окна меняется в зависимости от наличия заказа
-        self.geometry("500x300") # Размер окна
+        self.geometry("600x500") # Размер окна
         self.resizable(False, False)    # Запрещаем менять размер окна
 
         # Получаем данные для выпадающих списков
@@ -198,12 +298,13 @@ class EditOrderDialog(tk.Toplevel):
 
         # Создаем элементы формы
         tk.Label(self, text="Клиент:").grid(row=0, column=0, padx=10, pady=10, sticky="e")
-        tk.Label(self, text="Товар:").grid(row=1, column=0, padx=10, pady=10, sticky="e")
-        tk.Label(self, text="Дата заказа:").grid(row=2, column=0, padx=10, pady=10, sticky="e")
+        tk.Label(self, text="Дата заказа:").grid(row=1, column=0, padx=10, pady=10, sticky="e")
+        tk.Label(self, text="Товар:").grid(row=2, column=0, padx=10, pady=10, sticky="e")
+        tk.Label(self, text="Количество:").grid(row=3, column=0, padx=10, pady=10, sticky="e")
 
         # Выпадающий список для клиентов
         self.customer_var = tk.StringVar(self) # Переменная для хранения выбранного клиента
-        self.customer_combobox = ttk.Combobox(self, textvariable=self.customer_var, width=40) # Виджет ComboBox для выбора клиента
+        self.customer_combobox = ttk.Combobox(self, textvariable=self.customer_var, width=50) # Виджет ComboBox для выбора клиента
 
         # Формируем список для отображения и словарь для сопоставления
         self.customer_display = [] # Список для отображения в Combobox
@@ -214,108 +315,418 @@ class EditOrderDialog(tk.Toplevel):
             self.customer_id_map[display_text] = c[0] # Связываем отображаемое значение с ID клиента
 
         self.customer_combobox['values'] = self.customer_display # Устанавливаем список отображения в Combobox
-        self.customer_combobox.grid(row=0, column=1, padx=10, pady=10, sticky="w")  # Располагаем Combobox на форме
+        self.customer_combobox.grid(row=0, column=1, columnspan=2, padx=10, pady=10, sticky="w")  # Располагаем Combobox на форме
+
+        # Поле для даты заказа
+        self.date_entry = tk.Entry(self, width=30) # Виджет Entry для ввода даты
+        self.date_entry.grid(row=1, column=1, columnspan=2, padx=10, pady=10, sticky="w") # Расположение на форме
+        self.date_entry.insert(0, datetime.now().strftime("%Y-%m-%d"))  # Текущая дата
+        # Цены новых позиций зависят от даты заказа: пересчитываем их при изменении поля
+        for event in ("<KeyRelease>", "<FocusOut>"):
+            self.date_entry.bind(event, lambda event: self.refresh_items())
 
         # Выпадающий список для товаров
         self.product_var = tk.StringVar(self)  # Переменная для хранения выбранного товара
-        self.product_combobox = ttk.Combobox(self, textvariable=self.product_var, width=40) # Виджет ComboBox для выбора товара
+        self.product_combobox = ttk.Combobox(self, textvariable=self.product_var, width=50) # Виджет ComboBox для выбора товара
 
         self.product_display = []  # Список для отображения в Combobox
         self.product_id_map = {}  # Словарь для сопоставления отображаемого текста с ID товара
+        self.product_by_id = {}  # Словарь ID товара -> (название, текущая цена)
         for p in self.products:
             display_text = f"{p[1]} (ID: {p[0]}, цена: {p[2]} руб.)" # Форматируем текст для отображения
             self.product_display.append(display_text) # Добавляем в список отображения
             self.product_id_map[display_text] = p[0] # Связываем отображаемое значение с ID товара
+            self.product_by_id[p[0]] = (p[1], p[2])
 
         self.product_combobox['values'] = self.product_display # Устанавливаем список отображения в Combobox
-        self.product_combobox.grid(row=1, column=1, padx=10, pady=10, sticky="w") # Располагаем Combobox на форме
+        self.product_combobox.grid(row=2, column=1, columnspan=2, padx=10, pady=10, sticky="w") # Располагаем Combobox на форме
+
+        # Количество товара и кнопки для работы с позициями заказа
+        self.quantity_spinbox = tk.Spinbox(self, from_=1, to=100000, width=8)
+        self.quantity_spinbox.grid(row=3, column=1, padx=10, pady=10, sticky="w")
+        items_btn_frame = tk.Frame(self)
+        items_btn_frame.grid(row=3, column=2, padx=10, pady=10, sticky="e")
+        tk.Button(items_btn_frame, text="Добавить позицию", command=self.add_item).pack(side=tk.LEFT, padx=5)
+        tk.Button(items_btn_frame, text="Удалить позицию", command=self.remove_item).pack(side=tk.LEFT, padx=5)
+
+        # Таблица позиций заказа
+        columns = ("Товар", "Количество", "Цена", "Сумма")
+        self.items_tree = ttk.Treeview(self, columns=columns, show="headings", height=8)
+        for col in columns:
+            self.items_tree.heading(col, text=col)
+            self.items_tree.column(col, width=240 if col == "Товар" else 100)
+        self.items_tree.grid(row=4, column=0, columnspan=3, padx=10, pady=5)
 
-        # Поле для даты заказа
-        self.date_entry = tk.Entry(self, width=30) # Виджет Entry для ввода даты
-        self.date_entry.grid(row=2, column=1, padx=10, pady=10, sticky="w") # Расположение на форме
-        self.date_entry.insert(0, datetime.now().strftime("%Y-%m-%d"))  # Текущая дата
+        # Итоговая сумма заказа
+        self.total_label = tk.Label(self, text="Итого: 0.00 руб.", font=("Arial", 10, "bold"))
+        self.total_label.grid(row=5, column=0, columnspan=3, padx=10, sticky="e")
+
+        # Позиции заказа: OrderItem для каждой строки таблицы (в том же порядке)
+        self.items = []
 
         # Заполняем поля, если редактируем существующий заказ
         if order:
-            # Находим клиента и товар по ID
-            customer_display = next(
-                (d for d, cid in self.customer_id_map.items() if cid == order.customer_id),
-                None
-            )
-
-            product_display = next(
-                (d for d, pid in self.product_id_map.items() if pid == order.product_id),
-                None
-            )
-
-            if customer_display:
-                self.customer_var.set(customer_display)
-            if product_display:
-                self.product_var.set(product_display)
-            self.date_entry.delete(0, tk.END) # Очищаем поле даты
-            self.date_entry.insert(0, order.date) # Ставим дату заказа
+            self.fill(order)
 
         # Кнопки сохранения/отмены
         btn_frame = tk.Frame(self) # Рамка для кнопок
-        btn_frame.grid(row=3, column=0, columnspan=2, pady=20) # Расположение рамки на форме
+        btn_frame.grid(row=6, column=0, columnspan=3, pady=15) # Расположение рамки на форме
 
         tk.Button(btn_frame, text="Сохранить", command=self.save).pack(side=tk.LEFT, padx=10) # Кнопка "Сохранить"
         tk.Button(btn_frame, text="Отмена", command=self.destroy).pack(side=tk.LEFT, padx=10) # Кнопка "Отмена"
 
+    def fill(self, order):
+        """Заполняет форму данными заказа: клиент, дата и позиции"""
+        # Находим клиента по ID
+        customer_display = next(
+            (d for d, cid in self.customer_id_map.items() if cid == order.customer_id),
+            None
+        )
+
+        if customer_display:
+            self.customer_var.set(customer_display)
+        self.date_entry.delete(0, tk.END) # Очищаем поле даты
+        self.date_entry.insert(0, order.date) # Ставим дату заказа
+        # Цена позиции сохраняется такой, какой она была на момент продажи
+        self.items = [OrderItem(product_id=item.product_id, quantity=item.quantity, unit_price=item.unit_price)
+                      for item in order.items]
+        self.refresh_items()
+
+    def add_item(self):
+        """Добавляет выбранный товар с указанным количеством в позиции заказа"""
+        product_id = self.product_id_map.get(self.product_var.get().strip())
+        if product_id is None:
+            messagebox.showerror("Ошибка", "Выберите товар", parent=self)
+            return
+        try:
+            quantity = validation.parse_quantity(self.quantity_spinbox.get())
+        except ValueError:
+            messagebox.showerror("Ошибка", "Количество должно быть целым положительным числом", parent=self)
+            return
+
+        # Если товар уже есть в заказе, увеличиваем его количество
+        for item in self.items:
+            if item.product_id == product_id:
+                item.quantity += quantity
+                break
+        else:
+            # Цена не указывается: при сохранении берется цена товара на дату заказа (db.price_at)
+            self.items.append(OrderItem(product_id=product_id, quantity=quantity))
+        self.refresh_items()
+
+    def item_price(self, item):
+        """Цена позиции для показа: сохраненная цена продажи или цена товара на дату из поля формы"""
+        if item.unit_price is not None:
+            return item.unit_price
+        try:
+            price = db.price_at(item.product_id, validation.parse_date(self.date_entry.get()))
+        except ValueError: # Дата еще не введена полностью
+            price = None
+        # Как и при сохранении: до первой цены в истории действует текущая цена товара
+        return price if price is not None else self.product_by_id.get(item.product_id, ("", 0))[1]
+
+    def remove_item(self):
+        """Удаляет выбранные позиции из заказа"""
+        indexes = sorted((self.items_tree.index(row) for row in self.items_tree.selection()), reverse=True)
+        for index in indexes:
+            del self.items[index]
+        self.refresh_items()
+
+    def refresh_items(self):
+        """Перерисовывает таблицу позиций и итоговую сумму"""
+        self.items_tree.delete(*self.items_tree.get_children())
+        total = 0
+        for item in self.items:
+            name = self.product_by_id.get(item.product_id, (f"ID {item.product_id}", 0))[0]
+            price = self.item_price(item)
+            total += item.quantity * price
+            self.items_tree.insert("", tk.END, values=(name, item.quantity, f"{price:.2f}",
+                                                       f"{item.quantity * price:.2f}"))
+        self.total_label.config(text=f"Итого: {total:.2f} руб.")
+
     def save(self):
         """Собирает данные из формы и сохраняет заказ"""
         customer_display = self.customer_var.get().strip() # Получаем выбранного клиента
-        product_display = self.product_var.get().strip() # Получаем выбранный товар
         date = self.date_entry.get().strip() # Получаем введённую дату
 
-        if not customer_display or not product_display:
-            messagebox.showerror("Ошибка", "Выберите клиента и товар") # Если не выбраны клиент и товар, выдаём ошибку
-            return
+        # Товар, выбранный в списке, но не добавленный кнопкой, добавляем автоматически
+        if not self.items and self.product_var.get().strip():
+            self.add_item()
 
-        # Получаем ID клиента и товара из словарей
-        try:
-            customer_id = self.customer_id_map.get(customer_display) # Получаем ID клиента
-            product_id = self.product_id_map.get(product_display) # Получаем ID товара
+        if not customer_display or not self.items:
+            messagebox.showerror("Ошибка", "Выберите клиента и добавьте хотя бы один товар", parent=self) # Если не выбраны клиент и товар, выдаём ошибку
+            return
 
-            if customer_id is None:
-                raise ValueError("Не удалось определить ID клиента") # Если ID клиента не найден, выдаём ошибку
-            if product_id is None:
-                raise ValueError("Не удалось определить ID товара")  # Если ID товара не найден, выдаём ошибку
-        except Exception as e:
-            messagebox.showerror("Ошибка", f"Ошибка при обработке данных: {str(e)}") # Обрабатываем общую ошибку
+        # Получаем ID клиента из словаря
+        customer_id = self.customer_id_map.get(customer_display) # Получаем ID клиента
+        if customer_id is None:
+            messagebox.showerror("Ошибка", "Не удалось определить ID клиента", parent=self) # Если ID клиента не найден, выдаём ошибку
             return
 
         # Проверяем корректность даты
         try:
-            datetime.strptime(date, "%Y-%m-%d")
+            date = validation.parse_date(date)
         except ValueError:
-            messagebox.showerror("Ошибка", "Некорректный формат даты. Используйте ГГГГ-ММ-ДД")
+            messagebox.showerror("Ошибка", "Некорректный формат даты. Используйте ГГГГ-ММ-ДД", parent=self)
             return
 
         # Обновляем или создаем новый заказ
         if self.order:
             # Редактируем существующий заказ
             self.order.customer_id = customer_id
-            self.order.product_id = product_id
             self.order.date = date
-            db.update_order(self.order) # Обновляем заказ в базе данных
+            self.order.items = self.items
+            try:
+                db.update_order(self.order) # Обновляем заказ в базе данных
+            except db.UpdateConflict as conflict: # Заказ изменили в другой копии программы
+                action = resolve_conflict(self, conflict, "Заказ")
+                if action == "overwrite":
+                    self.order.version = conflict.current.version
+                    self.save()
+                elif action == "reload":
+                    self.order = conflict.current
+                    self.fill(conflict.current)
+                elif action == "deleted":
+                    self.parent.load_orders()
+                    self.destroy()
+                return
         else:
             # Создаем новый заказ
-            order = Order(customer_id=customer_id, product_id=product_id, date=date)
+            order = Order(customer_id=customer_id, date=date, items=self.items)
             db.add_order(order) # Добавляем новый заказ в базу данных
 
         self.parent.load_orders() # Обновляем список заказов в основном окне
         self.destroy() # Закрываем окно
 
+
+class StartupTimer:
+    """
+    Замеры времени запуска: от старта процесса до создания окна, первой отрисовки и загрузки первого списка.
+    С переменной окружения STORE_STARTUP_REPORT=1 отчет печатается, когда загружен первый список.
+    """
+
+    def __init__(self, started=None):
+        self.started = time.perf_counter() if started is None else started
+        self.marks = []
+        self.reported = False
+
+    def mark(self, stage):
+        """Запоминает, сколько секунд прошло от старта до этапа stage"""
+        self.marks.append((stage, time.perf_counter() - self.started))
+        if stage.startswith("загружено") and not self.reported:
+            self.reported = True
+            if os.environ.get("STORE_STARTUP_REPORT") == "1":
+                sys.stderr.write(self.report() + "\n")
+
+    def report(self):
+        """Текстовый отчет: этап, время от старта и от предыдущего этапа (в мс)"""
+        lines, previous = ["Запуск программы, мс (от старта / этап):"], 0.0
+        for stage, seconds in self.marks:
+            lines.append(f"  {stage:<28} {seconds * 1000:8.0f} {(seconds - previous) * 1000:8.0f}")
+            previous = seconds
+        return "\n".join(lines)
+
+
+class MemoryDialog(tk.Toplevel): # Окно диагностики памяти: пик и остаток памяти операций (memprof)
+
+    COLUMNS = ("name", "calls", "peak", "max_peak", "retained", "total_retained")
+    HEADINGS = ("Операция", "Вызовов", "Пик, КБ", "Макс. пик, КБ", "Остаток, КБ", "Остаток всего, КБ")
+
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.title("Диагностика памяти")
+        self.geometry("760x460")
+
+        btn_frame = tk.Frame(self)
+        btn_frame.pack(fill=tk.X, padx=10, pady=5)
+        self.toggle_button = tk.Button(btn_frame, command=self.toggle)
+        self.toggle_button.pack(side=tk.LEFT, padx=5)
+        tk.Button(btn_frame, text="Обновить", command=self.refresh).pack(side=tk.LEFT, padx=5)
+        tk.Button(btn_frame, text="Сбросить", command=self.reset).pack(side=tk.LEFT, padx=5)
+
+        # Таблица операций: пик - временная память во время операции, остаток - прирост после нее
+        self.tree = ttk.Treeview(self, columns=self.COLUMNS, show="headings", height=8)
+        for column, heading in zip(self.COLUMNS, self.HEADINGS):
+            self.tree.heading(column, text=heading)
+            self.tree.column(column, width=150 if column == "name" else 100)
+        self.tree.pack(fill=tk.X, padx=10, pady=5)
+
+        # Места в коде, где сейчас выделено больше всего памяти
+        tk.Label(self, text="Больше всего памяти выделено в строках:").pack(anchor="w", padx=10)
+        self.top_text = tk.Text(self, height=10, state=tk.DISABLED)
+        self.top_text.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+        self.refresh()
+
+    def toggle(self):
+        """Включает или выключает измерение памяти"""
+        if memprof.enabled():
+            memprof.disable()
+        else:
+            memprof.enable()
+        self.refresh()
+
+    def reset(self):
+        memprof.reset()
+        self.refresh()
+
+    def refresh(self):
+        """Показывает текущую статистику"""
+        self.toggle_button.config(text="Выключить измерение" if memprof.enabled() else "Включить измерение")
+        self.tree.delete(*self.tree.get_children())
+        for item in memprof.stats():
+            self.tree.insert("", tk.END, values=(item["name"], item["calls"]) + tuple(
+                item[key] // 1024 for key in self.COLUMNS[2:]))
+        lines = [f"{size // 1024:>8} КБ  {count:>7} блоков  {place}"
+                 for place, size, count in memprof.top_allocations()]
+        self.top_text.config(state=tk.NORMAL)
+        self.top_text.delete(1.0, tk.END)
+        self.top_text.insert(tk.END, "\n".join(lines) if lines else "Измерение выключено")
+        self.top_text.config(state=tk.DISABLED)
+
+
+class ResponsivenessDialog(tk.Toplevel): # Окно отзывчивости: зависания главного цикла по обработчикам (uilag)
+
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.parent = parent
+        self.title("Отзывчивость окна")
+        self.geometry("760x360")
+
+        btn_frame = tk.Frame(self)
+        btn_frame.pack(fill=tk.X, padx=10, pady=5)
+        self.toggle_button = tk.Button(btn_frame, command=self.toggle)
+        self.toggle_button.pack(side=tk.LEFT, padx=5)
+        tk.Button(btn_frame, text="Обновить", command=self.refresh).pack(side=tk.LEFT, padx=5)
+        tk.Button(btn_frame, text="Сбросить", command=self.reset).pack(side=tk.LEFT, padx=5)
+        tk.Button(btn_frame, text="Сохранить в файл", command=self.export).pack(side=tk.RIGHT, padx=5)
+
+        # Таблица зависаний: сколько раз и насколько окно переставало отвечать во время обработчика
+        self.tree = ttk.Treeview(self, columns=uilag.FIELDS, show="headings", height=10)
+        for column, heading in zip(uilag.FIELDS, uilag.HEADINGS):
+            self.tree.heading(column, text=heading)
+            self.tree.column(column, width=200 if column == "name" else 80)
+        self.tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+        self.overall_var = tk.StringVar(self)
+        tk.Label(self, textvariable=self.overall_var, anchor="w").pack(fill=tk.X, padx=10, pady=5)
+        self.refresh()
+
+    def toggle(self):
+        """Запускает или останавливает пульс"""
+        if uilag.running():
+            uilag.stop()
+        else:
+            uilag.start(self.parent)
+        self.refresh()
+
+    def reset(self):
+        uilag.reset()
+        self.refresh()
+
+    def export(self):
+        """Сохраняет статистику в CSV или JSON"""
+        filepath = filedialog.asksaveasfilename(defaultextension=".csv",
+                                                filetypes=[("CSV файлы", "*.csv"), ("JSON", "*.json")])
+        if not filepath:
+            return
+        try:
+            uilag.export(filepath)
+        except OSError as e:
+            messagebox.showerror("Ошибка", f"Ошибка сохранения: {str(e)}", parent=self)
+
+    def refresh(self):
+        """Показывает текущую статистику"""
+        self.toggle_button.config(text="Выключить измерение" if uilag.running() else "Включить измерение")
+        self.tree.delete(*self.tree.get_children())
+        for item in uilag.stats():
+            self.tree.insert("", tk.END, values=(item["name"], item["stalls"]) + tuple(
+                f"{item[key]:.0f}" for key in uilag.FIELDS[2:]))
+        total = uilag.overall()
+        self.overall_var.set(f"Пульсов: {total['beats']}, опоздание пульса p50 {total['p50']:.0f} мс, "
+                             f"p99 {total['p99']:.0f} мс, max {total['max']:.0f} мс "
+                             f"(зависание - от {uilag.STALL_MS} мс)")
+
+
+class DuplicatesDialog(tk.Toplevel): # Окно предложений объединить похожих клиентов (dedup)
+
+    COLUMNS = ("score", "keep", "duplicates")
+    HEADINGS = ("Сходство", "Оставить", "Объединить с")
+
+    def __init__(self, parent, suggestions):
+        super().__init__(parent)
+        self.parent = parent
+        self.title("Похожие клиенты")
+        self.geometry("760x400")
+        import dedup
+        names = dedup.customer_names(customer_id for keep_id, duplicate_ids, _ in suggestions
+                                     for customer_id in [keep_id] + duplicate_ids)
+
+        # Строка таблицы - группа похожих клиентов; первый (с наибольшим числом заказов) остается
+        self.tree = ttk.Treeview(self, columns=self.COLUMNS, show="headings")
+        for column, heading in zip(self.COLUMNS, self.HEADINGS):
+            self.tree.heading(column, text=heading)
+            self.tree.column(column, width=80 if column == "score" else 320)
+        self.groups = {}
+        for keep_id, duplicate_ids, score in suggestions:
+            item = self.tree.insert("", tk.END, values=(
+                f"{score:.2f}", f"{keep_id}: {names.get(keep_id, '')}",
+                "; ".join(f"{customer_id}: {names.get(customer_id, '')}" for customer_id in duplicate_ids)))
+            self.groups[item] = (keep_id, duplicate_ids)
+        self.tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+
+        btn_frame = tk.Frame(self)
+        btn_frame.pack(fill=tk.X, padx=10, pady=5)
+        tk.Button(btn_frame, text="Объединить выбранные", command=self.merge_selected).pack(side=tk.LEFT, padx=5)
+        tk.Button(btn_frame, text="Закрыть", command=self.destroy).pack(side=tk.RIGHT, padx=5)
+
+    def merge_selected(self):
+        """Объединяет выбранные группы: заказы дублей переходят к оставляемому клиенту"""
+        selected = self.tree.selection()
+        if not selected:
+            messagebox.showwarning("Предупреждение", "Выберите группы клиентов для объединения", parent=self)
+            return
+        if not messagebox.askyesno("Подтверждение", f"Объединить выбранные группы ({len(selected)})?", parent=self):
+            return
+        import dedup
+        moved = 0
+        for item in selected:
+            try:
+                moved += dedup.merge(*self.groups.pop(item))
+            except ValueError as e: # например, клиент уже удален или объединен
+                messagebox.showerror("Ошибка", f"Не удалось объединить: {e}", parent=self)
+            self.tree.delete(item)
+        self.parent.load_customers()
+        self.parent.load_orders()
+        messagebox.showinfo("Успех", f"Перенесено заказов: {moved}", parent=self)
+
+
 # Класс наследуется от класса Tk, предоставляя базовую структуру окна приложения.
 class App(tk.Tk):
     """Основной класс приложения"""
     # инициализируется окно приложения, задаётся название (title) и размер окна (geometry)
-    def __init__(self):
+    def __init__(self, startup=None):
         super().__init__()
+        # Замеры времени запуска (StartupTimer); база к этому моменту уже инициализирована (db.init_db)
+        self.startup = startup or StartupTimer()
         self.title("Менеджер интернет-магазина")  # заголовок окна
         self.geometry("1000x700")   # Размер окна приложения
 
+        # Строка состояния внизу окна: ход импорта/экспорта и другие сообщения
+        self.status_var = tk.StringVar(self)
+        tk.Label(self, textvariable=self.status_var, anchor="w").pack(side=tk.BOTTOM, fill=tk.X, padx=10)
+
+        # Меню "База данных": резервные копии делаются в фоне, не останавливая работу с программой
+        menu = tk.Menu(self)
+        db_menu = tk.Menu(menu, tearoff=0)
+        db_menu.add_command(label="Резервная копия", command=lambda: self.make_backup(vacuum=False))
+        db_menu.add_command(label="Компактная копия (VACUUM INTO)", command=lambda: self.make_backup(vacuum=True))
+        db_menu.add_command(label="Архивировать старые заказы...", command=self.archive_orders)
+        db_menu.add_command(label="Найти похожих клиентов...", command=self.find_duplicates)
+        db_menu.add_separator()
+        db_menu.add_command(label="Диагностика памяти", command=lambda: MemoryDialog(self))
+        db_menu.add_command(label="Отзывчивость окна", command=lambda: ResponsivenessDialog(self))
+        menu.add_cascade(label="База данных", menu=db_menu)
+        self.config(menu=menu)
+
         # Создаем вкладки
         # Позволит пользователям переключаться между разными секциями программы
         self.notebook = ttk.Notebook(self)
@@ -340,6 +751,20 @@ class App(tk.Tk):
         self.init_order_tab()
         self.init_report_tab()
 
+        # Списки загружаются не при создании окна, а при первом показе вкладки и в фоне:
+        # окно появляется сразу, даже если в базе миллионы заказов
+        self.tab_loaders = {str(self.customer_tab): self.load_customers,
+                            str(self.product_tab): self.load_products,
+                            str(self.order_tab): self.load_orders}
+        self.loading = {}  # таблица -> номер текущей загрузки (более новая загрузка отменяет прежнюю)
+        self.loaded = set() # таблицы, которые уже загружались
+        self.notebook.bind("<<NotebookTabChanged>>", self.on_tab_changed)
+        if os.environ.get("STORE_UILAG") == "1": # Зависания окна печатаются при выходе (main.py)
+            uilag.start(self)
+        self.startup.mark("окно создано")
+        self.bind("<Map>", self.on_first_map)
+        self.after_idle(self.on_tab_changed) # Первая вкладка показана без события смены вкладки
+
     def init_customer_tab(self):
         """
         Инициализирует вкладку "Клиенты".
@@ -348,13 +773,20 @@ class App(tk.Tk):
         для добавления, изменения и удаления клиентов, а также систему фильтрации и сортировки.
         """
         # Столбцы таблицы (колонки, которые будут видны пользователю)
-        columns = ("ID", "ФИО", "Телефон", "Email", "Адрес")
+        # Последние три - сводка по заказам клиента (таблица customer_stats, обновляется при записи заказов)
+        columns = ("ID", "ФИО", "Телефон", "Email", "Адрес") + tuple(CUSTOMER_STATS_HEADINGS)
         self.customer_tree = ttk.Treeview(self.customer_tab, columns=columns, show="headings")
+        self.customer_sort = "id" # Столбец сводки, по которому база сортирует список (по убыванию)
 
         # Установка заголовков колонок и определение размеров
         for col in columns:
-            self.customer_tree.heading(col, text=col, command=lambda c=col: self.sort_treeview(self.customer_tree, c))
-            self.customer_tree.column(col, width=150)
+            if col in CUSTOMER_STATS_HEADINGS:
+                # Список может быть большим: по сводке сортирует база, по индексу столбца
+                command = lambda c=col: self.sort_customers(CUSTOMER_STATS_HEADINGS[c])
+            else:
+                command = lambda c=col: self.sort_treeview(self.customer_tree, c)
+            self.customer_tree.heading(col, text=col, command=command)
+            self.customer_tree.column(col, width=100 if col in CUSTOMER_STATS_HEADINGS else 150)
 
         # Прокручиваемая область справа от таблицы (вертикальная полоса прокрутки)
         scrollbar = ttk.Scrollbar(self.customer_tab, orient=tk.VERTICAL, command=self.customer_tree.yview)
@@ -393,16 +825,18 @@ class App(tk.Tk):
         self.customer_email_filter = tk.Entry(filter_frame, width=20)
         self.customer_email_filter.grid(row=0, column=5, padx=5)
 
+        tk.Label(filter_frame, text="Заказов от:").grid(row=0, column=6, padx=5)
+        self.customer_orders_filter = tk.Entry(filter_frame, width=6)
+        self.customer_orders_filter.grid(row=0, column=7, padx=5)
+
         # Кнопка применения фильтра
-        tk.Button(filter_frame, text="Применить фильтр", command=self.apply_customer_filters).grid(row=0, column=6,
+        tk.Button(filter_frame, text="Применить фильтр", command=self.apply_customer_filters).grid(row=0, column=8,
                                                                                                    padx=10)
         # Кнопка сброса фильтра
-        tk.Button(filter_frame, text="Сбросить", command=self.reset_customer_filters).grid(row=0, column=7, padx=5)
+        tk.Button(filter_frame, text="Сбросить", command=self.reset_customer_filters).grid(row=0, column=9, padx=5)
 
 
-
-        # Подгружаем список клиентов из базы данных
-        self.load_customers()
+        # Список клиентов загружается при первом показе вкладки (on_tab_changed)
 
     def init_product_tab(self):
         """
@@ -434,6 +868,7 @@ class App(tk.Tk):
         tk.Button(btn_frame, text="Добавить", command=self.add_product).pack(side=tk.LEFT, padx=5)
         tk.Button(btn_frame, text="Редактировать", command=self.edit_product).pack(side=tk.LEFT, padx=5)
         tk.Button(btn_frame, text="Удалить", command=self.delete_product).pack(side=tk.LEFT, padx=5)
+        tk.Button(btn_frame, text="Изменить цену, %", command=self.reprice_products).pack(side=tk.LEFT, padx=5)
 
         # Работа с файлами (.csv): импорт и экспорт
         tk.Button(btn_frame, text="Импорт CSV", command=self.import_product_csv).pack(side=tk.RIGHT, padx=5)
@@ -463,8 +898,7 @@ class App(tk.Tk):
         # Кнопка сброса фильтра
         tk.Button(filter_frame, text="Сбросить", command=self.reset_product_filters).grid(row=0, column=7, padx=5)
 
-        # Загрузка данных
-        self.load_products()
+        # Данные загружаются при первом показе вкладки (on_tab_changed)
 
     def init_order_tab(self):
         """
@@ -473,7 +907,7 @@ class App(tk.Tk):
 
         """
         # Таблица для отображения заказов
-        columns = ("ID", "ФИО клиента", "Телефон", "Товар", "Цена", "Дата заказа")
+        columns = ("ID", "ФИО клиента", "Телефон", "Товары", "Сумма", "Дата заказа")
         self.order_tree = ttk.Treeview(self.order_tab, columns=columns, show="headings")
 
         # Настраиваем заголовки и ширину колонок
@@ -528,40 +962,50 @@ class App(tk.Tk):
         # Кнопка сброса фильтра
         tk.Button(filter_frame, text="Сбросить", command=self.reset_order_filters).grid(row=0, column=9, padx=5)
 
-        # Подгрузка заказов из базы данных
-        self.load_orders()
+        # Заказы загружаются при первом показе вкладки (on_tab_changed)
 
     def init_report_tab(self):
         """
         Инициализирует вкладку "Отчеты".
-        Позволяет генерировать отчёты и выводить уведомления о результатах.
+        Графики показываются прямо на вкладке; холст с графиками создается при первом показе вкладки.
         """
-        # Панель инструментов с кнопками генерации отчётов
+        # Панель инструментов: выбор отчета, обновление и сохранение в файл
         btn_frame = tk.Frame(self.report_tab)
-        btn_frame.pack(fill=tk.X, padx=10, pady=20)
+        btn_frame.pack(fill=tk.X, padx=10, pady=10)
 
-        # Кнопки генерации отчетов
+        # Кнопки переключения отчетов
         tk.Button(btn_frame, text="Топ товаров",
-                  command=lambda: self.generate_report("top_products")).pack(side=tk.LEFT, padx=10, pady=5)
+                  command=lambda: self.show_report("top_products")).pack(side=tk.LEFT, padx=10, pady=5)
 
         tk.Button(btn_frame, text="Динамика заказов",
-                  command=lambda: self.generate_report("orders_dynamics")).pack(side=tk.LEFT, padx=10, pady=5)
+                  command=lambda: self.show_report("orders_dynamics")).pack(side=tk.LEFT, padx=10, pady=5)
+
+        tk.Button(btn_frame, text="Выручка",
+                  command=lambda: self.show_report("revenue")).pack(side=tk.LEFT, padx=10, pady=5)
 
-        # Область для вывода информации о сгенерированных отчетах
-        self.report_info = tk.Text(self.report_tab, height=10, state=tk.DISABLED)
-        self.report_info.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        tk.Button(btn_frame, text="Обновить",
+                  command=lambda: self.refresh_report(force=True)).pack(side=tk.LEFT, padx=10, pady=5)
 
-        # Информация о расположении отчётов
-        tk.Label(self.report_tab, text="Отчеты сохраняются в файлы в текущей директории",
-                 font=("Arial", 10)).pack(side=tk.BOTTOM, pady=10)
+        # Файл записывается только по кнопке, а не при каждом построении отчета
+        tk.Button(btn_frame, text="Сохранить в файл", command=self.save_report).pack(side=tk.RIGHT, padx=10, pady=5)
+
+        # Область для графика
+        self.report_frame = tk.Frame(self.report_tab)
+        self.report_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        self.report_charts = None # analysis.ReportCharts, создается при первом показе вкладки
+        self.report_canvas = None
+        self.report_versions = {} # отчет -> версия данных базы, по которой он построен
+        self.data_version = None # db.DataVersion, создается при первом построении отчета
 
 
     # Функционал работы с клиентами
 
+    @uilag.tracked()
     def add_customer(self):
         """Открывает форму для добавления нового клиента"""
         EditCustomerDialog(self) # Дополнительный модуль EditCustomerDialog
 
+    @uilag.tracked()
     def edit_customer(self):
         """Открывает форму для редактирования существующего клиента.    """
         selected = self.customer_tree.selection() # Выбираем выделенного клиента
@@ -571,129 +1015,122 @@ class App(tk.Tk):
         # Извлекаем ID клиента
         item = self.customer_tree.item(selected[0])
         customer_id = item['values'][0]
-        # Используем дополнительный модуль для подкачки данных по найденному ID
-        customer_data = db.fetch_query("SELECT * FROM customers WHERE id=?", (customer_id,))[0]
-        # Запоминаем поля для редактирования
-        customer = Customer(
-            id=customer_data[0],
-            name=customer_data[1],
-            phone=customer_data[2],
-            email=customer_data[3],
-            address=customer_data[4]
-        )
+        # Читаем клиента вместе с версией записи: при сохранении она покажет, не изменил ли его кто-то еще
+        customer = db.get_customer(customer_id)
+        if customer is None: # Клиента удалили в другой копии программы
+            messagebox.showwarning("Предупреждение", "Клиент уже удален")
+            self.load_customers()
+            return
 
         EditCustomerDialog(self, customer)
 
+    @uilag.tracked()
     def delete_customer(self):
-        """Удаляет выбранного клиента"""
+        """Удаляет выбранных клиентов (можно выделить несколько строк с Ctrl или Shift)"""
         selected = self.customer_tree.selection()
         if not selected:
             messagebox.showwarning("Предупреждение", "Выберите клиента для удаления")
             return
         # Подтверждаем удаление
-        if messagebox.askyesno("Подтверждение", "Удалить выбранного клиента?"):
-            item = self.customer_tree.item(selected[0]) # выбран элемент дерева customer_tree (клиент),
-            customer_id = item['values'][0] # Определение ID удаляемого клиента
-            db.delete_customer(customer_id) # Удаление клиента из базы данных
-            self.load_customers() # Перезагружаем список клиентов
-
+        if messagebox.askyesno("Подтверждение", f"Удалить выбранных клиентов ({len(selected)})?"):
+            customer_ids = [int(iid) for iid in selected] # iid строки дерева - это ID клиента
+
+            def done(order_ids):
+                if order_ids is None:
+                    messagebox.showerror("Ошибка", "Не удалось удалить клиентов")
+                    return
+                # Вместо перезагрузки списков убираем удаленных клиентов и пропавшие вместе с ними заказы
+                self.remove_rows(self.customer_tree, customer_ids)
+                self.remove_rows(self.order_tree, order_ids)
+
+            # Удаление клиентов одной командой в фоновом потоке (вместе с ними скрываются их заказы)
+            self.run_in_background(f"Удаление клиентов: {len(customer_ids)}...",
+                                   lambda: db.delete_customers(customer_ids), done)
+
+    @uilag.tracked()
     def import_customer_csv(self):
         """Импортирует клиентов из CSV файла"""
-        filepath = filedialog.askopenfilename(filetypes=[("CSV Files", "*.csv")]) # Выбор пути к файлу
+        filepath = filedialog.askopenfilename(filetypes=FILE_TYPES) # Выбор пути к файлу
         if not filepath:
             return # Выходим если файл не выбран
         # Чтение данных из файла
         try:
-            with open(filepath, newline='', encoding='utf-8') as f:
-                reader = csv.reader(f) # Создается объект чтения CSV-файлов
-                next(reader)  # Пропускаем заголовок
-                for row in reader:
-                    if len(row) >= 4: # минимум 4 колонки
-                        customer = Customer(
-                            name=row[0].strip(), # Имя клиента (очищает лишние пробелы перед и после значения)
-                            phone=row[1].strip(), # Телефон клиента
-                            email=row[2].strip(), # Email клиента
-                            address=row[3].strip() # Адрес клиента
-                        )
-                        db.add_customer(customer) # новый клиент добавляется в базу данных
+            # Клиенты сопоставляются по email/телефону: повторный импорт не создает дублей
+            result = self.run_import("customers", filepath)
 
             self.load_customers() # обновляет список клиентов
-            messagebox.showinfo("Успех", "Данные успешно импортированы")
+            messagebox.showinfo("Успех", self.format_upsert_result(result))
         except Exception as e: # Если возникает ошибка
             messagebox.showerror("Ошибка", f"Ошибка импорта: {str(e)}")
 
+    @uilag.tracked()
     def export_customer_csv(self):
         """Экспортирует клиентов в CSV файл"""
         filepath = filedialog.asksaveasfilename( # Запрашиваем путь к файлу для сохранения
             defaultextension=".csv",
-            filetypes=[("CSV Files", "*.csv")]
+            filetypes=FILE_TYPES
         )
         if not filepath:
             return # Выходим если файла нет
 
         try:
-            with open(filepath, 'w', newline='', encoding='utf-8') as f: # Файл открывается в режиме записи ('w'),
-                writer = csv.writer(f) # Создаем объект записи CSV
-                writer.writerow(["ФИО", "Телефон", "Email", "Адрес"]) # Заголовки столбцов
-
-                customers = db.get_all_customers() # Получение всех клиентов из базы
-                for customer in customers:
-                    writer.writerow(customer[1:])  # Пропускаем ID путем среза customer[1:]
+            self.run_export("customers", filepath)
 
             messagebox.showinfo("Успех", "Данные успешно экспортированы")
         except Exception as e:
             messagebox.showerror("Ошибка", f"Ошибка экспорта: {str(e)}")
 
+    @uilag.tracked()
     def apply_customer_filters(self):
         """Применяет фильтры для клиентов"""
         self.load_customers()
 
+    @uilag.tracked()
     def reset_customer_filters(self):
         """Сбрасывает фильтры клиентов"""
         self.customer_name_filter.delete(0, tk.END) # очистка всего текста, внутри поля
         self.customer_phone_filter.delete(0, tk.END)
         self.customer_email_filter.delete(0, tk.END)
+        self.customer_orders_filter.delete(0, tk.END)
+        self.customer_sort = "id"
         self.load_customers() # Обновление списка клиентов
 
+    @uilag.tracked()
     def load_customers(self):
         """Загружает клиентов с учетом фильтров"""
-        # Удаляем все существующие элементы из дерева клиентов
-        # Это необходимо для обновления после изменений фильтров
-        for item in self.customer_tree.get_children():
-            self.customer_tree.delete(item)
-
-        # Получаем значения фильтров из соответствующих полей ввода,
-        # преобразуя их в нижний регистр и обрезая лишнее пространство
-        name_filter = self.customer_name_filter.get().strip().lower()
-        phone_filter = self.customer_phone_filter.get().strip().lower()
-        email_filter = self.customer_email_filter.get().strip().lower()
-
-        # Выполняем запрос ко всей базе данных клиентов
-        customers = db.get_all_customers()
-        # Проходим по каждому клиенту и применяем фильтры
-        for customer in customers:
-            matches = True # Изначально считаем, что клиент соответствует условиям фильтрации
-            #   если фильтр пустой (существование самого фильтра) and присутствует ли содержимое фильтра в соответствующем поле
-            if name_filter and name_filter not in customer[1].lower(): # customer[1] — это имя клиента
-                matches = False
-
-            if phone_filter and phone_filter not in customer[2].lower(): # customer[2] — номер телефона
-                matches = False
-
-            if email_filter and email_filter not in customer[3].lower(): # customer[3] — email
-                matches = False
+        # Получаем значения фильтров из соответствующих полей ввода, обрезая лишнее пространство
+        name_filter = self.customer_name_filter.get().strip()
+        phone_filter = self.customer_phone_filter.get().strip()
+        email_filter = self.customer_email_filter.get().strip()
+        orders_filter = self.customer_orders_filter.get().strip()
+        if orders_filter and not orders_filter.isdigit():
+            messagebox.showwarning("Предупреждение", "Число заказов должно быть целым неотрицательным числом")
+            return
 
-            # Если клиент прошел проверку по всем фильтрам, добавляем его в дерево клиентов
-            if matches:
-                self.customer_tree.insert("", tk.END, values=customer)
+        # Фильтрация выполняется запросом к базе, в дерево попадают только подходящие клиенты
+        # Строки читаются пачками в фоне; iid строки таблицы - ID клиента
+        query = db.customers_query(name_filter, phone_filter, email_filter, stats=True,
+                                   min_orders=int(orders_filter or 0), order_by=self.customer_sort,
+                                   descending=self.customer_sort != "id")
+        # Даты в сводке клиентов, у которых удалили первый или последний заказ, уточняются перед показом -
+        # в том же фоновом потоке: пересчет пишет в базу и может ждать другого писателя
+        self.load_tree(self.customer_tree, query, "load_customers", prepare=customer_stats.refresh_stale)
+
+    @uilag.tracked()
+    def sort_customers(self, column):
+        """Перезагружает клиентов, отсортированных базой по столбцу сводки column (по убыванию)"""
+        self.customer_sort = column
+        self.load_customers()
 
 
     # Аналогичные методы для товаров и заказов (load_orders, add_order, load_products, add_product,  edit_product и т.д.)
 
+    @uilag.tracked()
     def apply_product_filters(self):
         """Применяет фильтры для товаров"""
         self.load_products()
 
+    @uilag.tracked()
     def reset_product_filters(self):
         """Сбрасывает фильтры товаров"""
         self.product_name_filter.delete(0, tk.END)
@@ -701,49 +1138,35 @@ class App(tk.Tk):
         self.product_price_max_filter.delete(0, tk.END)
         self.load_products()
 
+    @uilag.tracked()
     def load_products(self):
         """Загружает товары с учетом фильтров"""
-        for item in self.product_tree.get_children():
-            self.product_tree.delete(item)
-
         # Получаем значения фильтров
-        name_filter = self.product_name_filter.get().strip().lower()
+        name_filter = self.product_name_filter.get().strip()
         price_min = self.product_price_min_filter.get().strip()
         price_max = self.product_price_max_filter.get().strip()
 
-        # Преобразуем цены в числа, если возможно
+        # Преобразуем цены в числа, если возможно (иначе граница не задана)
         try:
-            price_min = float(price_min) if price_min else 0
+            price_min = float(price_min) if price_min else None
         except ValueError:
-            price_min = 0
+            price_min = None
 
         try:
-            price_max = float(price_max) if price_max else float('inf')
+            price_max = float(price_max) if price_max else None
         except ValueError:
-            price_max = float('inf')
-
-        # Загрузка данных с фильтрацией
-        products = db.get_all_products()
-        for product in products:
-            matches = True
+            price_max = None
 
-            # Фильтр по названию
-            if name_filter and name_filter not in product[1].lower():
-                matches = False
-
-            # Фильтр по цене
-            product_price = float(product[2])
-            if product_price < price_min or product_price > price_max:
-                matches = False
-
-            if matches:
-                self.product_tree.insert("", tk.END, values=product)
+        # Загрузка данных с фильтрацией на стороне базы
+        self.load_tree(self.product_tree, db.products_query(name_filter, price_min, price_max), "load_products")
 
 
+    @uilag.tracked()
     def add_product(self):
         """Открывает диалог добавления нового товара"""
         EditProductDialog(self)
 
+    @uilag.tracked()
     def edit_product(self):
         """Открывает диалог редактирования выбранного товара"""
         selected = self.product_tree.selection()
@@ -753,84 +1176,103 @@ class App(tk.Tk):
 
         item = self.product_tree.item(selected[0])
         product_id = item['values'][0]
-        product_data = db.fetch_query("SELECT * FROM products WHERE id=?", (product_id,))[0]
-
-        product = Product(
-            id=product_data[0],
-            name=product_data[1],
-            price=product_data[2]
-        )
+        product = db.get_product(product_id) # Товар вместе с версией записи
+        if product is None:
+            messagebox.showwarning("Предупреждение", "Товар уже удален")
+            self.load_products()
+            return
 
         EditProductDialog(self, product)
 
+    @uilag.tracked()
     def delete_product(self):
-        """Удаляет выбранный товар"""
+        """Удаляет выбранные товары"""
         selected = self.product_tree.selection()
         if not selected:
             messagebox.showwarning("Предупреждение", "Выберите товар для удаления")
             return
 
-        if messagebox.askyesno("Подтверждение", "Удалить выбранный товар?"):
-            item = self.product_tree.item(selected[0])
-            product_id = item['values'][0]
-            db.delete_product(product_id)
-            self.load_products()
+        if messagebox.askyesno("Подтверждение", f"Удалить выбранные товары ({len(selected)})?"):
+            product_ids = [int(iid) for iid in selected]
+
+            def done(count):
+                if count is None:
+                    messagebox.showerror("Ошибка", "Не удалось удалить товары")
+                    return
+                self.remove_rows(self.product_tree, product_ids)
 
+            self.run_in_background(f"Удаление товаров: {len(product_ids)}...",
+                                   lambda: db.delete_products(product_ids), done)
+
+    @uilag.tracked()
+    def reprice_products(self):
+        """Изменяет цены выбранных товаров на заданный процент"""
+        selected = self.product_tree.selection()
+        if not selected:
+            messagebox.showwarning("Предупреждение", "Выберите товары для изменения цены")
+            return
+
+        percent = simpledialog.askfloat(
+            "Изменение цены",
+            f"На сколько процентов изменить цену выбранных товаров ({len(selected)})?\n"
+            "Например, 10 - повысить на 10%, -5 - снизить на 5%",
+            parent=self, minvalue=-99.99)
+        if percent is None:
+            return
+        product_ids = [int(iid) for iid in selected]
+
+        def done(rows):
+            if rows is None:
+                messagebox.showerror("Ошибка", "Не удалось изменить цены")
+                return
+            # Обновляем в таблице только измененные строки
+            for row in rows:
+                if self.product_tree.exists(row[0]):
+                    self.product_tree.item(row[0], values=row)
+
+        self.run_in_background(f"Изменение цен: {len(product_ids)}...",
+                               lambda: db.reprice_products(product_ids, percent), done)
+
+    @uilag.tracked()
     def import_product_csv(self):
         """Импортирует товары из CSV файла"""
-        filepath = filedialog.askopenfilename(filetypes=[("CSV Files", "*.csv")])
+        filepath = filedialog.askopenfilename(filetypes=FILE_TYPES)
         if not filepath:
             return
 
         try:
-            with open(filepath, newline='', encoding='utf-8') as f:
-                reader = csv.reader(f)
-                next(reader)  # Пропускаем заголовок
-                for row in reader:
-                    if len(row) >= 2: # минимум 2 колонки
-                        try:
-                            price = float(row[1]) # цена товара
-                        except ValueError:
-                            price = 0.0 # если ошибка (не float) = 0
-
-                        product = Product(
-                            name=row[0].strip(), # название товара
-                            price=price # цена
-                        )
-                        db.add_product(product) # добавляем в базу
+            # Товары сопоставляются по названию: у существующих обновляется цена
+            result = self.run_import("products", filepath)
 
             self.load_products() # обновляет список товаров
-            messagebox.showinfo("Успех", "Данные успешно импортированы")
+            messagebox.showinfo("Успех", self.format_upsert_result(result))
         except Exception as e:
             messagebox.showerror("Ошибка", f"Ошибка импорта: {str(e)}")
 
+    @uilag.tracked()
     def export_product_csv(self):
         """Экспортирует товары в CSV файл"""
         filepath = filedialog.asksaveasfilename(
             defaultextension=".csv",
-            filetypes=[("CSV Files", "*.csv")]
+            filetypes=FILE_TYPES
         ) # Запрашиваем путь к файлу для сохранения
         if not filepath:
             return # Выходим если файла нет
 
         try:
-            with open(filepath, 'w', newline='', encoding='utf-8') as f: # Файл для записи ('w')
-                writer = csv.writer(f) # Создаем объект записи CSV
-                writer.writerow(["Название", "Цена"]) # Заголовки столбцов
-
-                products = db.get_all_products() # Получение всех товаров из базы
-                for product in products:
-                    writer.writerow([product[1], product[2]])  # Название и цена
+            self.run_export("products", filepath)
 
             messagebox.showinfo("Успех", "Данные успешно экспортированы")
         except Exception as e:
             messagebox.showerror("Ошибка", f"Ошибка экспорта: {str(e)}")
 
 
+    @uilag.tracked()
     def apply_order_filters(self):
         """Применяет фильтры для заказов"""
         self.load_orders()
 
+    @uilag.tracked()
     def reset_order_filters(self):
         """Сбрасывает фильтры заказов"""
         self.order_customer_filter.delete(0, tk.END) # очистка всего текста, внутри поля
@@ -839,47 +1281,29 @@ class App(tk.Tk):
         self.order_date_max_filter.delete(0, tk.END)
         self.load_orders() # Обновление списка клиентов
 
+    @uilag.tracked()
     def load_orders(self):
         """Загружает заказы с учетом фильтров"""
-        for item in self.order_tree.get_children():
-            self.order_tree.delete(item) # Удаляем все существующие элементы из дерева
-
-        # Получаем значения фильтров, преобразуя их в нижний регистр и обрезая лишнее пространство
-        customer_filter = self.order_customer_filter.get().strip().lower()
-        product_filter = self.order_product_filter.get().strip().lower()
+        # Получаем значения фильтров, обрезая лишнее пространство
+        customer_filter = self.order_customer_filter.get().strip()
+        product_filter = self.order_product_filter.get().strip()
         date_min = self.order_date_min_filter.get().strip()
         date_max = self.order_date_max_filter.get().strip()
 
-        # Загрузка данных с фильтрацией
-        orders = db.get_all_orders()
-        for order in orders:
-            matches = True # Изначально считаем, что все подходят фильтру
-
-            # Фильтр по клиенту (ФИО или телефон)
-            if customer_filter:
-                customer_match = (customer_filter in order[1].lower() or
-                                  customer_filter in order[2].lower())
-                if not customer_match:
-                    matches = False
-
-            # Фильтр по товару
-            if product_filter and product_filter not in order[3].lower():
-                matches = False
-
-            # Фильтр по дате
-            if date_min and order[5] < date_min:
-                matches = False
-
-            if date_max and order[5] > date_max:
-                matches = False
-
-            if matches: # Если прошел проверку по всем фильтрам, добавляем его в дерево
-                self.order_tree.insert("", tk.END, values=order)
+        # Загрузка данных с фильтрацией по клиенту (ФИО или телефон), товару и дате
+        try:
+            query = db.orders_query(customer_filter, product_filter, date_min, date_max)
+        except ValueError as e: # Дата фильтра не в формате ГГГГ-ММ-ДД
+            messagebox.showerror("Ошибка", str(e))
+            return
+        self.load_tree(self.order_tree, query, "load_orders")
 
+    @uilag.tracked()
     def add_order(self):
         """Открывает диалог добавления нового заказа"""
         EditOrderDialog(self)
 
+    @uilag.tracked()
     def edit_order(self):
         """Открывает диалог редактирования выбранного заказа"""
         selected = self.order_tree.selection() # Выбираем выделенный заказ
@@ -889,79 +1313,342 @@ class App(tk.Tk):
         # Извлекаем ID
         item = self.order_tree.item(selected[0])
         order_id = item['values'][0]
-        # Получаем данные по найденному ID
-        order_data = db.fetch_query("SELECT * FROM orders WHERE id=?", (order_id,))[0]
-        # Запоминаем поля для редактирования, текущими значениями
-        order = Order(
-            id=order_data[0],
-            customer_id=order_data[1],
-            product_id=order_data[2],
-            date=order_data[3]
-        )
+        # Получаем заказ вместе с позициями и версией записи; заказы архива и удаленные не изменяются
+        order = db.get_current_order(order_id)
+        if order is None:
+            found = db.get_order(order_id)
+            if found is not None and found.archived:
+                messagebox.showinfo("Архив", "Заказ перенесен в архив, его можно только просматривать")
+                return
+            messagebox.showwarning("Предупреждение", "Заказ уже удален") # Удалили в другой копии программы
+            self.load_orders()
+            return
 
         EditOrderDialog(self, order)
 
+    @uilag.tracked()
     def delete_order(self):
-        """Удаляет выбранный заказ"""
+        """Удаляет выбранные заказы"""
         selected = self.order_tree.selection()
         if not selected:
             messagebox.showwarning("Предупреждение", "Выберите заказ для удаления")
             return
 
-        if messagebox.askyesno("Подтверждение", "Удалить выбранный заказ?"):
-            item = self.order_tree.item(selected[0])
-            order_id = item['values'][0] # Определение ID
-            db.delete_order(order_id) # Удаление из базы по ID
-            self.load_orders() # Перезагружаем список
+        if messagebox.askyesno("Подтверждение", f"Удалить выбранные заказы ({len(selected)})?"):
+            order_ids = [int(iid) for iid in selected] # Определение ID
+
+            def done(count):
+                if count is None:
+                    messagebox.showerror("Ошибка", "Не удалось удалить заказы")
+                    return
+                self.remove_rows(self.order_tree, order_ids)
+
+            self.run_in_background(f"Удаление заказов: {len(order_ids)}...",
+                                   lambda: db.delete_orders(order_ids), done)
 
+    @uilag.tracked()
     def import_order_csv(self):
         """Импортирует заказы из CSV файла"""
-        filepath = filedialog.askopenfilename(filetypes=[("CSV Files", "*.csv")])
+        filepath = filedialog.askopenfilename(filetypes=FILE_TYPES)
         if not filepath:
             return # Выходим если файл не выбран
+        # Спрашиваем, создавать ли клиентов и товары, на которые ссылаются заказы, но которых нет в базе
+        create_missing = messagebox.askyesno(
+            "Импорт заказов",
+            "Создавать отсутствующих клиентов и товары автоматически?\n"
+            "Если нет - заказы с несуществующими ID будут пропущены."
+        )
         # Чтение данных из файла
         try:
-            with open(filepath, newline='', encoding='utf-8') as f:
-                reader = csv.reader(f) # Создается объект чтения CSV-файлов
-                next(reader)  # Пропускаем заголовок
-                for row in reader:
-                    if len(row) >= 3: # минимум 3 колонки
-                        order = Order(
-                            customer_id=int(row[0]), # ID клиента
-                            product_id=int(row[1]), # ID товара
-                            date=row[2].strip() # дата заказа
-                        )
-                        db.add_order(order) # новый заказ добавляется в базу данных
+            # Проверка ссылок и вставка выполняются пачками внутри db.import_orders
+            result = self.run_import("orders", filepath, create_missing=create_missing)
 
             self.load_orders() # обновляет список
-            messagebox.showinfo("Успех", "Данные успешно импортированы")
+            if create_missing:
+                self.load_customers()
+                self.load_products()
+            message = f"Импортировано заказов: {result['imported']}"
+            if result["items"] != result["imported"]:
+                message += f" (позиций: {result['items']})"
+            if result.get("resumed_from"):
+                message += f"\nИмпорт продолжен после строки {result['resumed_from']}"
+            if result["created_customers"] or result["created_products"]:
+                message += (f"\nСоздано клиентов: {result['created_customers']}, "
+                            f"товаров: {result['created_products']}")
+            if result["skipped"]:
+                message += f"\nПропущено строк: {result['skipped']}"
+                # Показываем только первые ошибки, чтобы окно не было огромным
+                for line_no, reason in result["errors"][:10]:
+                    message += f"\n  строка {line_no}: {reason}"
+            messagebox.showinfo("Успех", message)
         except Exception as e:
             messagebox.showerror("Ошибка", f"Ошибка импорта: {str(e)}")
 
+    @uilag.tracked()
     def export_order_csv(self):
         """Экспортирует заказы в CSV файл"""
         filepath = filedialog.asksaveasfilename(
             defaultextension=".csv",
-            filetypes=[("CSV Files", "*.csv")]
+            filetypes=FILE_TYPES
         ) # Запрашиваем путь к файлу для сохранения
         if not filepath:
             return # Выходим если файла нет
 
         try:
-            with open(filepath, 'w', newline='', encoding='utf-8') as f:
-                writer = csv.writer(f)
-                writer.writerow(["ID клиента", "ID товара", "Дата заказа"]) # Заголовки столбцов
-                # Получение всех заказов из базы
-                orders = db.fetch_query("SELECT customer_id, product_id, date FROM orders")
-                for order in orders:
-                    writer.writerow(order)
+            self.run_export("orders", filepath)
 
             messagebox.showinfo("Успех", "Данные успешно экспортированы")
         except Exception as e:
             messagebox.showerror("Ошибка", f"Ошибка экспорта: {str(e)}")
 
 
+    # Резервные копии
+
+    @uilag.tracked()
+    def make_backup(self, vacuum=False):
+        """Создает сжатую резервную копию базы в фоновом потоке, показывая ход копирования"""
+        directory = filedialog.askdirectory(title="Папка для резервных копий", initialdir=".")
+        if not directory:
+            return
+        progress = {} # Заполняется потоком копирования, читается главным потоком
+
+        def status():
+            if "total" in progress:
+                return f"Резервное копирование: {progress['done'] * 100 // max(progress['total'], 1)}%"
+            return None
+
+        def task():
+            return backup.backup(directory, compress=True, keep=BACKUP_KEEP, vacuum=vacuum,
+                                 progress=lambda done, total: progress.update(done=done, total=total))
+
+        self.run_in_background("Резервное копирование...", task,
+                               lambda path: messagebox.showinfo("Успех", f"Резервная копия сохранена:\n{path}"),
+                               poll_status=status)
+
+    @uilag.tracked()
+    def archive_orders(self):
+        """Переносит в архив заказы старше указанного числа дней (в фоне), затем перезагружает список заказов"""
+        days = simpledialog.askinteger("Архив заказов", "Перенести в архив заказы старше (дней):",
+                                       initialvalue=ARCHIVE_DAYS, minvalue=1, parent=self)
+        if days is None:
+            return
+        import archive
+        progress = {}
+
+        def status():
+            if progress.get("total"):
+                return f"Перенос в архив: {progress['done']} из {progress['total']}"
+            return None
+
+        def task():
+            try:
+                return archive.archive_older_than(
+                    days, progress=lambda done, total: progress.update(done=done, total=total))
+            finally:
+                db.close_connections()
+
+        def done(moved):
+            self.load_orders()
+            messagebox.showinfo("Успех", f"Перенесено в архив заказов: {moved}")
+
+        self.run_in_background("Перенос заказов в архив...", task, done, poll_status=status)
+
+
+    @uilag.tracked()
+    def find_duplicates(self):
+        """Ищет похожих клиентов в фоне и показывает предложения объединить их"""
+        import dedup # Процессы для оценки пар нужны только здесь, а не при запуске программы
+
+        def task():
+            try:
+                return dedup.suggest_merges(dedup.find_pairs())
+            finally:
+                db.close_connections()
+
+        def done(suggestions):
+            if not suggestions:
+                messagebox.showinfo("Похожие клиенты", "Похожих клиентов не найдено")
+                return
+            DuplicatesDialog(self, suggestions)
+
+        self.run_in_background("Поиск похожих клиентов...", task, done)
+
+
     # Общие методы
+    def on_first_map(self, event):
+        """Окно впервые показано: отмечаем время первой отрисовки"""
+        if event.widget is not self:
+            return
+        self.unbind("<Map>")
+        # Отрисовка виджетов выполняется в обработчиках простоя, запланированных раньше этого
+        self.after_idle(lambda: self.startup.mark("первая отрисовка"))
+
+    def on_tab_changed(self, event=None):
+        """При первом показе вкладки со списком загружает его; отчеты обновляет, если база изменилась"""
+        selected = self.notebook.select()
+        loader = self.tab_loaders.get(selected)
+        if loader is not None and loader.__name__ not in self.loaded:
+            loader()
+        elif selected == str(self.report_tab):
+            self.refresh_report()
+
+    def load_tree(self, tree, query, name, prepare=None):
+        """
+        Заполняет таблицу строками запроса query, не останавливая окно.
+        Фоновый поток читает строки пачками (db.iter_query) и передает их через очередь ограниченного
+        размера, главный поток вставляет их в таблицу порциями по LOAD_SLICE_MS миллисекунд.
+        Первые строки видны сразу, а в памяти одновременно находится лишь несколько пачек.
+        Новая загрузка той же таблицы (например, с другим фильтром) отменяет прежнюю.
+        prepare - функция, которую фоновый поток вызывает перед чтением строк (например, пересчет сводки).
+        """
+        self.loaded.add(name)
+        generation = self.loading.get(tree, 0) + 1
+        self.loading[tree] = generation
+        tree.delete(*tree.get_children())
+        chunks = queue.Queue(maxsize=LOAD_QUEUE_CHUNKS)
+        sql, params = query.build()
+
+        def cancelled():
+            return self.loading.get(tree) != generation
+
+        def put(item):
+            # Ждем места в очереди, пока загрузку не отменили (иначе поток ждал бы вечно)
+            while not cancelled():
+                try:
+                    chunks.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def produce():
+            try:
+                with memprof.measure(name):
+                    if prepare is not None:
+                        prepare()
+                    for rows in db.iter_query(sql, params):
+                        if not put(rows):
+                            return
+            finally:
+                db.close_connections() # Соединение потока больше не понадобится
+                put(None) # Конец данных
+
+        @uilag.tracked(name) # Вставка строк - часть загрузки списка
+        def consume():
+            if cancelled():
+                return
+            deadline = time.perf_counter() + LOAD_SLICE_MS / 1000
+            while time.perf_counter() < deadline:
+                try:
+                    rows = chunks.get_nowait()
+                except queue.Empty:
+                    self.after(BACKGROUND_POLL_MS // 5, consume)
+                    return
+                if rows is None:
+                    self.status_var.set("")
+                    self.startup.mark(f"загружено: {name}")
+                    return
+                for row in rows:
+                    tree.insert("", tk.END, iid=row[0], values=row)
+            self.after(1, consume) # Даем окну обработать события и продолжаем
+
+        self.status_var.set("Загрузка...")
+        threading.Thread(target=produce, daemon=True).start()
+        self.after(BACKGROUND_POLL_MS // 5, consume)
+
+    def run_in_background(self, status, task, on_done, poll_status=None):
+        """
+        Выполняет task() в фоновом потоке, показывая status в строке состояния,
+        затем вызывает on_done(результат) в главном потоке.
+        Tkinter нельзя вызывать из других потоков, поэтому главный поток сам периодически проверяет,
+        закончилась ли операция. poll_status() - текст о ходе работы, который главный поток
+        при каждой проверке показывает в строке состояния (None - оставить прежний).
+        """
+        self.status_var.set(status)
+        outcome = {}
+
+        def worker():
+            try:
+                outcome["result"] = task()
+            except Exception as e:
+                outcome["error"] = e
+
+        thread = threading.Thread(target=worker, daemon=True)
+        thread.start()
+
+        def check():
+            if thread.is_alive():
+                text = poll_status() if poll_status else None
+                if text:
+                    self.status_var.set(text)
+                self.after(BACKGROUND_POLL_MS, check)
+                return
+            self.status_var.set("")
+            if "error" in outcome:
+                messagebox.showerror("Ошибка", str(outcome["error"]))
+            else:
+                # Зависание при показе результата приписываем обработчику, начавшему операцию:
+                # App.refresh_report.<locals>.done -> refresh_report
+                with uilag.handler(on_done.__qualname__.split(".<locals>")[0].split(".")[-1]):
+                    on_done(outcome["result"])
+
+        self.after(BACKGROUND_POLL_MS, check)
+
+    def remove_rows(self, tree, ids):
+        """Убирает из таблицы строки с указанными ID (если они в ней есть)"""
+        rows = [record_id for record_id in ids if tree.exists(record_id)]
+        if rows:
+            tree.delete(*rows)
+
+    def run_import(self, kind, filepath, create_missing=False):
+        """Импортирует файл (CSV, сжатый CSV или .npz) с отображением хода работы в строке состояния"""
+        if filepath.endswith(".npz"): # Колоночный формат
+            import columnar # NumPy загружается только при работе с .npz, а не при запуске программы
+            return columnar.import_dataset(filepath, create_missing=create_missing)
+
+        # Если импорт этого файла уже прерывался, предлагаем продолжить с места остановки
+        done = db.get_checkpoint(csv_io.checkpoint_name(kind, filepath))
+        resume = done > 0 and messagebox.askyesno(
+            "Продолжить импорт",
+            f"Импорт этого файла был прерван после строки {done}.\n"
+            "Продолжить с места остановки? (Нет - импортировать файл заново)"
+        )
+        try:
+            return csv_io.import_csv(kind, filepath, resume=resume, progress=self.show_progress,
+                                     create_missing=create_missing)
+        finally:
+            self.status_var.set("")
+
+    def run_export(self, kind, filepath):
+        """Экспортирует данные в файл (CSV, сжатый CSV или .npz) с отображением хода работы"""
+        if filepath.endswith(".npz"): # Колоночный формат
+            import columnar
+            columnar.export_dataset(kind, filepath)
+            return
+        try:
+            csv_io.export_csv(kind, filepath, progress=self.show_progress)
+        finally:
+            self.status_var.set("")
+
+    def show_progress(self, rows, bytes_done, fraction, eta):
+        """Показывает ход импорта/экспорта в строке состояния"""
+        self.status_var.set(csv_io.format_progress(rows, bytes_done, fraction, eta))
+        self.update_idletasks() # Перерисовываем окно, не дожидаясь окончания операции
+
+    def format_upsert_result(self, result):
+        """Формирует текст сообщения по итогам импорта в режиме синхронизации"""
+        message = (f"Добавлено: {result['inserted']}\n"
+                   f"Обновлено: {result['updated']}\n"
+                   f"Без изменений: {result['unchanged']}")
+        if result["duplicates"]:
+            message += f"\nПовторов в файле: {result['duplicates']}"
+        if result["skipped"]:
+            message += f"\nПропущено строк: {result['skipped']}"
+            for line_no, reason in result["errors"][:10]:
+                message += f"\n  строка {line_no}: {reason}"
+        return message
+
+    @uilag.tracked()
     def sort_treeview(self, treeview, col): # Treeview, в котором нужно произвести сортировку. col: Имя колонки, по которой будет выполнена сортировка.
         """
         Сортирует данные в Treeview по выбранному столбцу
@@ -976,27 +1663,75 @@ class App(tk.Tk):
         for index, (_, child) in enumerate(data):
             treeview.move(child, '', index) # Метод move() перемещает элемент (child) на новую позицию в дереве.
 
-    def generate_report(self, report_type):
-        """Генерирует отчеты и выводит информацию о результате"""
-        try:
-            if report_type == "top_products": # Генерация отчета "Топ товаров"
-                filename = generate_sales_report() # Генерируем отчёт продаж
-                message = "Отчет 'Топ товаров' сохранен в файл: " + filename # Формируем сообщение
-            elif report_type == "orders_dynamics": # Генерация отчета "Динамика заказов"
-                filename = generate_orders_dynamics() # Генерируем динамику заказов
-                message = "Отчет 'Динамика заказов' сохранен в файл: " + filename # Формируем сообщение
-            else:
-                messagebox.showerror("Ошибка", "Неизвестный тип отчета") # Сообщаем об ошибке
-                return
-
-            # Выводим информацию о создании отчета в специальное текстовое поле
-            self.report_info.config(state=tk.NORMAL)  # Включаем возможность редактирования поля
-            self.report_info.delete(1.0, tk.END) # Очищаем предыдущее содержание
-            self.report_info.insert(tk.END, message + "\n\n") # Вставляем новое сообщение
-            self.report_info.insert(tk.END, "Чтобы открыть файл, перейдите в папку с программой.") # Дополнительная подсказка
-            self.report_info.config(state=tk.DISABLED) # Возвращаем режим "только для чтения"
-            # Дополнительно показываем окошко с информацией о сохранении отчета
-            messagebox.showinfo("Успех", message)
-        except Exception as e: # Ловим любые непредвиденные ошибки
-            messagebox.showerror("Ошибка", f"Ошибка генерации отчета: {str(e)}")
+    # Отчеты
+
+    def create_report_canvas(self):
+        """Создает фигуру с графиками отчетов и встраивает ее во вкладку"""
+        # matplotlib загружается около полсекунды, поэтому импортируется при первом показе отчетов
+        import analysis
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
+        self.report_charts = analysis.ReportCharts()
+        self.report_canvas = FigureCanvasTkAgg(self.report_charts.figure, master=self.report_frame)
+        # Панель масштабирования и перемещения графика
+        NavigationToolbar2Tk(self.report_canvas, self.report_frame).pack(side=tk.BOTTOM, fill=tk.X)
+        self.report_canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+
+    @uilag.tracked()
+    def show_report(self, kind):
+        """Переключает видимый отчет: график уже построен, поэтому нужна только перерисовка"""
+        if self.report_charts is None:
+            self.create_report_canvas()
+        self.report_charts.show(kind)
+        self.report_canvas.draw_idle()
+        self.refresh_report()
+
+    @uilag.tracked()
+    def refresh_report(self, force=False):
+        """
+        Обновляет данные видимого отчета, если база изменилась с прошлого построения (force - в любом случае).
+        Запрос выполняется в фоне; новые данные подставляются в уже построенный график.
+        """
+        import analysis
+        if self.report_charts is None:
+            self.create_report_canvas()
+        kind = self.report_charts.current
+        # Версия данных меняется при любой подтвержденной записи в базу из другого соединения, в том числе
+        # в таблицы без журнала изменений (например, цена с прошлой даты пишется только в price_history)
+        if self.data_version is None:
+            self.data_version = db.DataVersion()
+        version = self.data_version.current()
+        if not force and self.report_versions.get(kind) == version:
+            return
 
+        def task():
+            try:
+                with memprof.measure(f"report_{kind}"):
+                    return analysis.report_data(kind)
+            finally:
+                db.close_connections() # Соединение потока больше не понадобится
+
+        def done(data):
+            self.report_versions[kind] = version
+            if self.report_charts.update(kind, data) and self.report_charts.current == kind:
+                self.report_canvas.draw_idle()
+
+        self.run_in_background("Построение отчета...", task, done)
+
+    @uilag.tracked()
+    def save_report(self):
+        """Сохраняет видимый отчет в файл (PNG, SVG или PDF)"""
+        import analysis
+        if self.report_charts is None:
+            return
+        filepath = filedialog.asksaveasfilename(
+            defaultextension=".png",
+            initialfile=analysis.report_filename(self.report_charts.current),
+            filetypes=[("PNG", "*.png"), ("SVG", "*.svg"), ("PDF", "*.pdf")]
+        )
+        if not filepath:
+            return
+        try:
+            self.report_charts.save(filepath)
+            messagebox.showinfo("Успех", f"Отчет сохранен в файл: {filepath}")
+        except Exception as e:
+            messagebox.showerror("Ошибка", f"Ошибка сохранения отчета: {str(e)}")
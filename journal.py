@@ -0,0 +1,136 @@
+"""
+Журнал изменений и инкрементальная выгрузка
+
+Триггеры записывают каждое изменение клиентов, товаров и заказов в таблицу changes с номером seq.
+Внешняя система запоминает номер последнего полученного изменения и в следующий раз запрашивает
+только то, что изменилось после него, - без чтения всех таблиц:
+
+    python main.py changes --since 0 full.jsonl.gz      # первая выгрузка: все данные
+    python main.py changes --since 12345 delta.jsonl    # дальше - только изменения
+
+Каждая строка выгрузки - JSON: {"seq", "table", "id", "op", "row"}. Для записи, которая менялась
+несколько раз, выгружается одна строка с последним номером изменения и текущим состоянием записи
+(для удаленной - "row": null). Мягко удаленные записи выгружаются со значением deleted_at.
+"""
+import itertools
+import json
+import csv_io
+import db
+
+# Сколько записей журнала обрабатывается за один проход (одним запросом на таблицу)
+CHUNK_SIZE = 1000
+
+# Какие столбцы выгружаются для каждой таблицы
+FIELDS = {
+    "customers": ("id", "name", "phone", "email", "address", "deleted_at"),
+    "products": ("id", "name", "price", "deleted_at"),
+    "orders": ("id", "customer_id", "date", "total", "deleted_at"),
+}
+
+
+class JournalPruned(ValueError):
+    """Запрошенные изменения уже удалены из журнала (prune): получателю нужна полная выгрузка данных"""
+
+
+def current_seq():
+    """Номер последнего изменения в базе (0, если изменений не было)"""
+    rows = db.fetch_query("SELECT seq FROM sqlite_sequence WHERE name = 'changes'")
+    return rows[0][0] if rows else 0
+
+
+def _pruned_seq(conn):
+    """
+    Номер, до которого журнал очищен: изменения с меньшими номерами уже не выдать.
+    Номера идут без пропусков, кроме удаленных функцией prune, поэтому это номер перед самой старой записью
+    (а в пустом журнале - последний выданный номер).
+    """
+    oldest = conn.execute("SELECT MIN(seq) FROM changes").fetchone()[0]
+    if oldest is not None:
+        return oldest - 1
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'changes'").fetchone()
+    return row[0] if row else 0
+
+
+def _load_rows(conn, table, ids):
+    """Читает текущие строки таблицы по списку id; заказы - вместе с позициями (в том числе из архива)"""
+    fields = FIELDS[table]
+    ids_param = json.dumps(ids)
+    sources = db.order_sources(conn=conn)
+    source = sources["orders"] if table == "orders" else table
+    rows = {row[0]: dict(zip(fields, row)) for row in conn.execute(
+        f"SELECT {', '.join(fields)} FROM {source} WHERE id IN (SELECT value FROM json_each(?))", (ids_param,))}
+    if table == "orders":
+        for row in rows.values():
+            row["date"] = db.day_text(row["date"]) # В выгрузке дата - строка ГГГГ-ММ-ДД
+            row["items"] = []
+        for order_id, product_id, quantity, unit_price in conn.execute(
+                f"SELECT order_id, product_id, quantity, unit_price FROM {sources['order_items']} "
+                "WHERE order_id IN (SELECT value FROM json_each(?)) ORDER BY id", (ids_param,)):
+            rows[order_id]["items"].append({"product_id": product_id, "quantity": quantity,
+                                            "unit_price": unit_price})
+    return rows
+
+
+def iter_changes(since=0, limit=None):
+    """
+    Выдает изменения с номером больше since в порядке номеров: словари {"seq", "table", "id", "op", "row"}.
+    Каждая запись выдается один раз - с последним изменением и текущим состоянием.
+    limit - сколько записей выдать не больше (продолжение - с since равным seq последней полученной).
+    Весь проход читает один снимок базы, поэтому записи и журнал согласованы между собой.
+    """
+    conn = db.get_connection()
+    try:
+        conn.execute("BEGIN") # Снимок базы на время всей выгрузки
+        if since < _pruned_seq(conn):
+            raise JournalPruned(f"Изменения после {since} уже удалены из журнала, нужна полная выгрузка")
+
+        # Последнее изменение каждой записи: в SQLite значение op берется из строки с MAX(seq)
+        cursor = conn.execute("""SELECT MAX(seq), table_name, row_id, op FROM changes
+                                 WHERE seq > ?
+                                 GROUP BY table_name, row_id
+                                 ORDER BY MAX(seq)
+                                 LIMIT ?""", (since, -1 if limit is None else limit))
+        while True:
+            chunk = cursor.fetchmany(CHUNK_SIZE)
+            if not chunk:
+                break
+            # Текущие строки пачки читаются одним запросом на таблицу
+            rows = {}
+            for table in FIELDS:
+                ids = [row_id for _, name, row_id, op in chunk if name == table and op != "delete"]
+                if ids:
+                    rows[table] = _load_rows(conn, table, ids)
+            for seq, table, row_id, op in chunk:
+                yield {"seq": seq, "table": table, "id": row_id, "op": op,
+                       "row": None if op == "delete" else rows[table].get(row_id)}
+    finally:
+        conn.close()
+
+
+def export_changes(filepath, since=0, limit=None):
+    """
+    Записывает изменения после since в файл JSON Lines (сжатый, если имя оканчивается на .gz или .zst).
+    Возвращает (число записей, номер последнего выгруженного изменения - since для следующего раза).
+    """
+    changes = iter_changes(since, limit)
+    first = next(changes, None) # JournalPruned - до создания файла
+    count, last_seq = 0, since
+    with open(filepath, "wb") as raw:
+        with csv_io._wrap(raw, filepath, "w") as f:
+            for change in itertools.chain([first] if first else [], changes):
+                f.write(json.dumps(change, ensure_ascii=False) + "\n")
+                count += 1
+                last_seq = change["seq"]
+    return count, last_seq
+
+
+def prune(up_to_seq):
+    """
+    Удаляет из журнала изменения с номером не больше up_to_seq (когда все получатели их уже забрали).
+    Возвращает число удаленных записей журнала.
+    """
+    if up_to_seq > current_seq():
+        raise ValueError("Нельзя очистить журнал дальше последнего изменения")
+    conn = db.shared_connection()
+    with conn:
+        return conn.execute("DELETE FROM changes WHERE seq <= ?", (up_to_seq,)).rowcount
@@ -0,0 +1,172 @@
+"""
+Имитация нагрузки на базу: одновременные чтения, записи и построение отчетов
+
+    python datagen.py --customers 100000 --orders 1000000
+    python loadsim.py --seconds 30 --readers 4 --writers 2 --reporters 1
+
+Каждый поток работает со своим соединением (как окна программы, API и фоновые задачи) и выполняет
+операции своей роли в случайном порядке:
+- читатели - страницы заказов за день, поиск клиента по имени, карточка заказа;
+- писатели - новый заказ, новый клиент, изменение цены товара;
+- отчеты - топ товаров и заказы по дням.
+В конце печатается для каждой операции число выполнений в секунду, задержки p50/p90/p99 и число ошибок.
+"""
+import argparse
+import collections
+import random
+import threading
+import time
+from datetime import date, timedelta
+import db
+import analysis
+import datagen
+from loadtest import percentile
+from models import Customer, Order
+
+
+def _page_of_orders(rnd, ctx):
+    day = (ctx["start"] + timedelta(days=rnd.randrange(ctx["days"]))).isoformat()
+    db.orders_query(date_min=day, date_max=day).limit(50).fetch()
+
+
+def _search_customer(rnd, ctx):
+    db.customers_query().contains(rnd.choice(datagen.SURNAMES).lower(), "name").limit(20).fetch()
+
+
+def _read_order(rnd, ctx):
+    db.read_order(db.shared_connection(), rnd.randint(1, ctx["max_order"]))
+
+
+def _add_order(rnd, ctx):
+    day = (ctx["start"] + timedelta(days=rnd.randrange(ctx["days"]))).isoformat()
+    if db.add_order(Order(customer_id=rnd.randint(1, ctx["max_customer"]),
+                          product_id=rnd.randint(1, ctx["max_product"]), date=day,
+                          quantity=rnd.randint(1, 3))) is None:
+        raise RuntimeError("заказ не добавлен")
+
+
+def _add_customer(rnd, ctx):
+    name, phone, email, address = next(datagen.customer_rows(1, seed=rnd.randrange(10 ** 9)))
+    if db.add_customer(Customer(name=name, phone=phone, email=email, address=address)) is None:
+        raise RuntimeError("клиент не добавлен")
+
+
+def _reprice(rnd, ctx):
+    db.reprice_products([rnd.randint(1, ctx["max_product"])], rnd.choice((-5, 5)))
+
+
+def _top_products(rnd, ctx):
+    analysis.top_products(10)
+
+
+def _orders_by_day(rnd, ctx):
+    analysis.orders_by_day(365)
+
+
+# Операции каждой роли и их относительная частота
+ROLES = {
+    "reader": {"страница заказов": (_page_of_orders, 5), "поиск клиента": (_search_customer, 2),
+               "карточка заказа": (_read_order, 5)},
+    "writer": {"новый заказ": (_add_order, 6), "новый клиент": (_add_customer, 2),
+               "изменение цены": (_reprice, 1)},
+    "reporter": {"топ товаров": (_top_products, 1), "заказы по дням": (_orders_by_day, 1)},
+}
+
+
+def _worker(role, seconds, seed, ctx, results, lock):
+    rnd = random.Random(seed)
+    names = list(ROLES[role])
+    weights = [ROLES[role][name][1] for name in names]
+    latencies = collections.defaultdict(list)
+    errors = collections.Counter()
+    deadline = time.perf_counter() + seconds
+    try:
+        while time.perf_counter() < deadline:
+            name = rnd.choices(names, weights)[0]
+            start = time.perf_counter()
+            try:
+                ROLES[role][name][0](rnd, ctx)
+            except Exception:
+                errors[name] += 1
+            latencies[name].append(time.perf_counter() - start)
+    finally:
+        db.close_connections() # Соединение потока больше не нужно
+    with lock:
+        for name, values in latencies.items():
+            results["latencies"][name].extend(values)
+        results["errors"].update(errors)
+
+
+def run(seconds=10, readers=4, writers=1, reporters=1, seed=1):
+    """
+    Запускает потоки ролей на seconds секунд на текущей базе (в ней должны быть клиенты, товары и заказы).
+    Возвращает словарь {операция: {"count", "rate", "p50", "p90", "p99", "max", "errors"}} (задержки в мс).
+    """
+    conn = db.shared_connection()
+    ctx = {
+        "max_customer": conn.execute("SELECT MAX(id) FROM customers").fetchone()[0],
+        "max_product": conn.execute("SELECT MAX(id) FROM products").fetchone()[0],
+        "max_order": conn.execute("SELECT MAX(id) FROM orders").fetchone()[0],
+    }
+    if None in ctx.values():
+        raise ValueError("База пуста: сначала создайте данные, например python datagen.py")
+    first, last = conn.execute("SELECT MIN(date), MAX(date) FROM orders").fetchone()
+    ctx["start"] = date.fromisoformat(db.day_text(first)) # В базе даты - номера дней
+    ctx["days"] = last - first + 1
+
+    results = {"latencies": collections.defaultdict(list), "errors": collections.Counter()}
+    lock = threading.Lock()
+    roles = ["reader"] * readers + ["writer"] * writers + ["reporter"] * reporters
+    threads = [threading.Thread(target=_worker, args=(role, seconds, seed * 1000 + i, ctx, results, lock))
+               for i, role in enumerate(roles)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    summary = {}
+    for role in ROLES:
+        for name in ROLES[role]:
+            values = sorted(results["latencies"].get(name, []))
+            if not values:
+                continue
+            summary[name] = {
+                "count": len(values),
+                "rate": len(values) / elapsed,
+                "p50": percentile(values, 0.50) * 1000,
+                "p90": percentile(values, 0.90) * 1000,
+                "p99": percentile(values, 0.99) * 1000,
+                "max": values[-1] * 1000,
+                "errors": results["errors"][name],
+            }
+    return summary
+
+
+def format_summary(summary):
+    """Формирует текстовую таблицу по результатам run"""
+    header = ("Операция", "Выполнено", "В секунду", "p50, мс", "p90, мс", "p99, мс", "max, мс", "Ошибок")
+    rows = [(name, s["count"], f"{s['rate']:.1f}", f"{s['p50']:.1f}", f"{s['p90']:.1f}",
+             f"{s['p99']:.1f}", f"{s['max']:.1f}", s["errors"]) for name, s in summary.items()]
+    widths = [max(len(str(x)) for x in column) for column in zip(header, *rows)]
+    return "\n".join("  ".join(str(x).ljust(width) for x, width in zip(row, widths)) for row in [header] + rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Имитация одновременной работы с базой магазина")
+    parser.add_argument("--db", help="файл базы данных (по умолчанию store.db)")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--readers", type=int, default=4, help="потоков чтения")
+    parser.add_argument("--writers", type=int, default=1, help="потоков записи")
+    parser.add_argument("--reporters", type=int, default=1, help="потоков построения отчетов")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    if args.db:
+        db.DB_NAME = args.db
+    db.init_db()
+    print(format_summary(run(args.seconds, args.readers, args.writers, args.reporters, args.seed)))
+
+
+if __name__ == "__main__":
+    main()
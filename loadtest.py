@@ -0,0 +1,119 @@
+"""
+Нагрузочный тест HTTP API (api.py)
+Несколько клиентов параллельно выполняют запросы по keep-alive соединениям;
+в конце печатаются число запросов в секунду и задержки p50/p90/p99.
+
+    python main.py serve --port 8080
+    python loadtest.py --url http://127.0.0.1:8080 --requests 2000 --concurrency 8
+    python loadtest.py --path "/orders?limit=50" --path /reports/top-products --etag
+
+Число клиентов лучше не делать больше числа потоков сервера: keep-alive соединение занимает поток.
+"""
+import argparse
+import collections
+import http.client
+import itertools
+import threading
+import time
+from urllib.parse import urlsplit
+
+# Запросы по умолчанию: страницы списков, поиск и отчеты
+DEFAULT_PATHS = [
+    "/customers?limit=50",
+    "/products?limit=50",
+    "/orders?limit=50",
+    "/orders?limit=50&offset=1000",
+    "/orders?date_min=2023-06-01&date_max=2023-06-30&limit=100",
+    "/search?q=100",
+    "/reports/top-products",
+    "/reports/orders-by-day?days=365",
+]
+
+
+def percentile(sorted_values, fraction):
+    """Процентиль по отсортированному списку (ближайший ранг)"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def run(url, paths=None, requests=1000, concurrency=8, etag=False):
+    """
+    Выполняет requests запросов (адреса paths по кругу) в concurrency потоков.
+    etag=True - клиенты запоминают ETag и присылают If-None-Match (как браузер с кэшем).
+    Возвращает словарь: requests, seconds, rps, p50, p90, p99, max (задержки в мс), statuses.
+    """
+    paths = paths or DEFAULT_PATHS
+    address = urlsplit(url)
+    counter = itertools.count()
+    latencies = []
+    statuses = collections.Counter()
+    lock = threading.Lock()
+
+    def client():
+        conn = http.client.HTTPConnection(address.hostname, address.port or 80, timeout=30)
+        etags = {}
+        local_latencies, local_statuses = [], collections.Counter()
+        while True:
+            number = next(counter) # itertools.count потокобезопасен благодаря GIL
+            if number >= requests:
+                break
+            path = paths[number % len(paths)]
+            headers = {"If-None-Match": etags[path]} if etag and path in etags else {}
+            start = time.perf_counter()
+            conn.request("GET", path, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            local_latencies.append(time.perf_counter() - start)
+            local_statuses[response.status] += 1
+            if response.getheader("ETag"):
+                etags[path] = response.getheader("ETag")
+        conn.close()
+        with lock:
+            latencies.extend(local_latencies)
+            statuses.update(local_statuses)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "seconds": seconds,
+        "rps": len(latencies) / seconds if seconds else 0.0,
+        "p50": percentile(latencies, 0.50) * 1000,
+        "p90": percentile(latencies, 0.90) * 1000,
+        "p99": percentile(latencies, 0.99) * 1000,
+        "max": (latencies[-1] if latencies else 0.0) * 1000,
+        "statuses": dict(statuses),
+    }
+
+
+def format_result(result):
+    """Формирует текстовый отчет о нагрузочном тесте"""
+    statuses = ", ".join(f"{status}: {count}" for status, count in sorted(result["statuses"].items()))
+    return (f"Запросов: {result['requests']} за {result['seconds']:.2f} с ({result['rps']:.0f}/с)\n"
+            f"Задержка, мс: p50 {result['p50']:.1f}, p90 {result['p90']:.1f}, "
+            f"p99 {result['p99']:.1f}, max {result['max']:.1f}\n"
+            f"Коды ответов: {statuses}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест HTTP API магазина")
+    parser.add_argument("--url", default="http://127.0.0.1:8080", help="адрес запущенного сервера")
+    parser.add_argument("--requests", type=int, default=1000, help="сколько запросов выполнить")
+    parser.add_argument("--concurrency", type=int, default=8, help="сколько клиентов работает параллельно")
+    parser.add_argument("--path", action="append", help="адрес запроса (можно указать несколько раз)")
+    parser.add_argument("--etag", action="store_true", help="присылать If-None-Match с полученным ETag")
+    args = parser.parse_args()
+    print(format_result(run(args.url, args.path, args.requests, args.concurrency, args.etag)))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,232 @@
 """
 Главный модуль для запуска приложения
+Без аргументов запускает графический интерфейс, с аргументами - команды командной строки:
+
+    python main.py import orders orders.csv.gz
+    python main.py export customers customers.csv.zst
+    python main.py serve --port 8080
+    python main.py restore customer 42
+    python main.py purge --older-than-days 30
+    python main.py changes --since 0 changes.jsonl.gz
+    python main.py backup --compress --keep 7
+    python main.py archive --older-than-days 365
+    python main.py topk --enable
+    python main.py customer-stats --check
+    python main.py dedup --merge 12 15
 """
-from gui import App
+import time
+STARTED = time.perf_counter() # Начало отсчета для отчета о времени запуска (до импорта остальных модулей)
+
+import argparse
+import os
+import sys
+import csv_io
+import db
+
+
+def show_progress(rows, bytes_done, fraction, eta):
+    """Печатает ход импорта/экспорта в одну обновляемую строку"""
+    sys.stderr.write("\r" + csv_io.format_progress(rows, bytes_done, fraction, eta).ljust(70))
+    sys.stderr.flush()
+
+
+def run_cli(argv):
+    """Выполняет команду командной строки"""
+    parser = argparse.ArgumentParser(description="Менеджер интернет-магазина")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = commands.add_parser("import", help="импорт CSV (.csv, .csv.gz, .csv.zst)")
+    import_parser.add_argument("kind", choices=["customers", "products", "orders"])
+    import_parser.add_argument("filepath")
+    import_parser.add_argument("--restart", action="store_true",
+                               help="импортировать файл заново, не продолжая прерванный импорт")
+    import_parser.add_argument("--create-missing", action="store_true",
+                               help="создавать отсутствующих клиентов и товары при импорте заказов")
+
+    export_parser = commands.add_parser("export", help="экспорт CSV (.csv, .csv.gz, .csv.zst)")
+    export_parser.add_argument("kind", choices=["customers", "products", "orders"])
+    export_parser.add_argument("filepath")
+
+    serve_parser = commands.add_parser("serve", help="HTTP API только для чтения (JSON)")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8080)
+    serve_parser.add_argument("--workers", type=int, default=8, help="число потоков обработки запросов")
+
+    restore_parser = commands.add_parser("restore", help="восстановить удаленную запись")
+    restore_parser.add_argument("kind", choices=["customer", "product", "order"])
+    restore_parser.add_argument("id", type=int)
+
+    purge_parser = commands.add_parser("purge", help="окончательно удалить записи, помеченные удаленными")
+    purge_parser.add_argument("--older-than-days", type=int, default=0,
+                              help="удалять только записи, удаленные не меньше указанного числа дней назад")
+
+    changes_parser = commands.add_parser("changes", help="выгрузить изменения после номера since (JSON Lines)")
+    changes_parser.add_argument("filepath")
+    changes_parser.add_argument("--since", type=int, default=0,
+                                help="номер последнего полученного изменения (0 - выгрузить все данные)")
+    changes_parser.add_argument("--limit", type=int, help="выгрузить не больше указанного числа записей")
+    changes_parser.add_argument("--prune", action="store_true",
+                                help="после выгрузки удалить из журнала изменения до since")
+
+    backup_parser = commands.add_parser("backup", help="резервная копия базы (можно во время работы приложения)")
+    backup_parser.add_argument("--dir", default="backups", help="папка для копий")
+    backup_parser.add_argument("--compress", action="store_true", help="сжать копию (gzip)")
+    backup_parser.add_argument("--keep", type=int, help="сколько последних копий хранить")
+    backup_parser.add_argument("--vacuum", action="store_true",
+                               help="компактная копия (VACUUM INTO) вместо постраничного копирования")
+
+    archive_parser = commands.add_parser("archive", help="перенести старые заказы в архивную базу")
+    archive_group = archive_parser.add_mutually_exclusive_group(required=True)
+    archive_group.add_argument("--older-than-days", type=int, help="перенести заказы старше указанного числа дней")
+    archive_group.add_argument("--before", help="перенести заказы с датой раньше указанной (ГГГГ-ММ-ДД)")
+    archive_group.add_argument("--stats", action="store_true", help="показать число заказов в базе и в архиве")
+
+    topk_parser = commands.add_parser("topk", help="счетчики популярности товаров для мгновенного топа")
+    topk_group = topk_parser.add_mutually_exclusive_group()
+    topk_group.add_argument("--enable", action="store_true", help="включить счетчики и заполнить их по таблицам")
+    topk_group.add_argument("--disable", action="store_true", help="выключить счетчики")
+    topk_group.add_argument("--rebuild", action="store_true", help="пересчитать счетчики по таблицам")
+    topk_parser.add_argument("--capacity", type=int, default=None, help="сколько товаров отслеживать")
+    topk_parser.add_argument("--limit", type=int, default=10, help="сколько товаров показать")
+
+    stats_parser = commands.add_parser("customer-stats", help="сводка по заказам клиентов")
+    stats_group = stats_parser.add_mutually_exclusive_group(required=True)
+    stats_group.add_argument("--check", action="store_true", help="сверить сводку с заказами")
+    stats_group.add_argument("--rebuild", action="store_true", help="пересчитать сводку всех клиентов")
+
+    dedup_parser = commands.add_parser("dedup", help="найти похожих клиентов (возможные дубли) и объединить их")
+    dedup_parser.add_argument("--min-score", type=float, default=None, help="наименьшая оценка сходства (0-1)")
+    dedup_parser.add_argument("--workers", type=int, default=None, help="число процессов для оценки пар")
+    dedup_parser.add_argument("--merge", type=int, nargs="+", metavar="ID",
+                              help="объединить клиентов: первый ID остается, заказы остальных переносятся к нему")
+
+    args = parser.parse_args(argv)
+    db.init_db() # Создает базу или доводит ее схему до текущей версии
+    if args.command == "restore":
+        restore = {"customer": db.restore_customer, "product": db.restore_product, "order": db.restore_order}
+        restored = restore[args.kind](args.id)
+        print("Запись восстановлена" if restored else "Запись не восстановлена (не найдена среди удаленных или конфликт)")
+    elif args.command == "purge":
+        for table, count in db.purge_deleted(args.older_than_days).items():
+            print(f"{table}: {count}")
+    elif args.command == "changes":
+        import journal
+        try:
+            count, last_seq = journal.export_changes(args.filepath, args.since, args.limit)
+        except journal.JournalPruned as e:
+            sys.exit(str(e))
+        print(f"Выгружено записей: {count}")
+        print(f"Следующая выгрузка: --since {last_seq}")
+        if args.prune:
+            print(f"Удалено из журнала: {journal.prune(args.since)}")
+    elif args.command == "backup":
+        import backup
+
+        def progress(done, total):
+            sys.stderr.write(f"\rСкопировано страниц: {done} из {total}")
+            sys.stderr.flush()
+
+        path = backup.backup(args.dir, compress=args.compress, keep=args.keep, vacuum=args.vacuum,
+                             progress=progress)
+        sys.stderr.write("\n")
+        print(f"Резервная копия: {path}")
+    elif args.command == "archive":
+        import archive
+
+        def progress(done, total):
+            sys.stderr.write(f"\rПеренесено заказов: {done} из {total}")
+            sys.stderr.flush()
+
+        if not args.stats:
+            try:
+                if args.before:
+                    moved = archive.archive_orders(args.before, progress=progress)
+                else:
+                    moved = archive.archive_older_than(args.older_than_days, progress=progress)
+            except ValueError as e:
+                sys.exit(f"Неверная дата: {e}")
+            sys.stderr.write("\n")
+            print(f"Перенесено в архив: {moved}")
+        result = archive.stats()
+        print(f"Граница архива: {result['cutoff'] or 'нет'}")
+        print(f"Заказов в базе: {result['hot']}, в архиве: {result['archived']}")
+    elif args.command == "topk":
+        import topk
+        if args.enable:
+            topk.enable(args.capacity or topk.CAPACITY)
+        elif args.disable:
+            topk.disable()
+        elif args.rebuild:
+            topk.rebuild()
+        rows = topk.top_products(args.limit)
+        if rows is None:
+            print(f"Счетчики выключены или отслеживают меньше {args.limit} товаров "
+                  f"(отслеживается: {topk.capacity()})")
+        else:
+            for name, count, error in rows:
+                print(f"{name}: {count}" + (f" (точное значение не меньше {count - error})" if error else ""))
+            print(f"Возможное завышение: не больше {topk.error_bound(rows)}")
+    elif args.command == "customer-stats":
+        import customer_stats
+        if args.rebuild:
+            print(f"Пересчитано клиентов: {customer_stats.rebuild()}")
+        else:
+            mismatches = customer_stats.check()
+            for customer_id, stored, actual in mismatches[:20]:
+                print(f"  клиент {customer_id}: в сводке {stored}, по заказам {actual}")
+            print(f"Расхождений: {len(mismatches)}" + (" (исправьте: --rebuild)" if mismatches else ""))
+            if mismatches:
+                sys.exit(1)
+    elif args.command == "dedup":
+        import dedup
+        if args.merge:
+            try:
+                moved = dedup.merge(args.merge[0], args.merge[1:])
+            except ValueError as e:
+                sys.exit(str(e))
+            print(f"Перенесено заказов: {moved}")
+        else:
+            pairs = dedup.find_pairs(dedup.MIN_SCORE if args.min_score is None else args.min_score,
+                                     args.workers)
+            suggestions = dedup.suggest_merges(pairs)
+            for keep_id, duplicate_ids, score in suggestions:
+                print(f"{score:.2f}  python main.py dedup --merge {keep_id} {' '.join(map(str, duplicate_ids))}")
+            print(f"Похожих пар: {len(pairs)}, предложений объединить: {len(suggestions)}")
+    elif args.command == "serve":
+        import api
+        api.serve(args.host, args.port, args.workers)
+    elif args.command == "import":
+        result = csv_io.import_csv(args.kind, args.filepath, resume=not args.restart,
+                                   progress=show_progress, create_missing=args.create_missing)
+        sys.stderr.write("\n")
+        if result["resumed_from"]:
+            print(f"Импорт продолжен после строки {result['resumed_from']}")
+        for key, value in result.items():
+            if key not in ("errors", "resumed_from"):
+                print(f"{key}: {value}")
+        for line_no, reason in result["errors"][:10]:
+            print(f"  строка {line_no}: {reason}")
+    else:
+        rows = csv_io.export_csv(args.kind, args.filepath, progress=show_progress)
+        sys.stderr.write("\n")
+        print(f"Экспортировано строк: {rows}")
+
 
 if __name__ == "__main__":
-    # Создаем и запускаем приложение
-    app = App()
-    app.mainloop()
\ No newline at end of file
+    if len(sys.argv) > 1:
+        run_cli(sys.argv[1:])
+        import memprof
+        if memprof.enabled(): # STORE_MEMPROF=1: память команды импорта, экспорта и т.п.
+            sys.stderr.write(memprof.format_stats() + "\n")
+    else:
+        from gui import App, StartupTimer
+        startup = StartupTimer(STARTED)
+        startup.mark("импорт модулей")
+        db.init_db()
+        startup.mark("инициализация базы")
+        # Создаем и запускаем приложение
+        app = App(startup)
+        app.mainloop()
+        if os.environ.get("STORE_UILAG") == "1": # Зависания окна за время работы
+            import uilag
+            sys.stderr.write(uilag.format_stats() + "\n")
@@ -0,0 +1,157 @@
+"""
+Измерение памяти загрузки списков, импорта, экспорта и отчетов (tracemalloc)
+
+Выключено по умолчанию: tracemalloc замедляет выделение памяти в несколько раз. Включается переменной
+окружения STORE_MEMPROF=1, вызовом enable() или в окне "База данных" - "Диагностика памяти".
+
+Для каждой операции запоминается:
+- пик - насколько во время операции память превышала уровень на ее начало (временные списки, буферы);
+- остаток - насколько память выросла после операции (кэши, строки таблиц в окне или утечка:
+  остаток, который растет с каждым вызовом, - признак утечки).
+
+    with memprof.measure("export_orders"):
+        ...
+
+    @memprof.profiled("load_orders")
+    def load_orders(self): ...
+"""
+import functools
+import gc
+import os
+import threading
+import tracemalloc
+
+# Сколько кадров стека хранить для каждого выделения (больше - точнее источник, но медленнее)
+TRACE_FRAMES = 1
+
+_lock = threading.Lock()
+_stats = {}  # операция -> словарь счетчиков
+_local = threading.local()  # стек измеряемых операций текущего потока
+
+
+def enabled():
+    """Включено ли измерение"""
+    return tracemalloc.is_tracing()
+
+
+def enable(frames=TRACE_FRAMES):
+    """Включает измерение (память, выделенная раньше, не учитывается)"""
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+
+
+def disable():
+    """Выключает измерение; собранная статистика сохраняется"""
+    tracemalloc.stop()
+
+
+def reset():
+    """Очищает собранную статистику"""
+    with _lock:
+        _stats.clear()
+
+
+def _record(name, peak, retained):
+    with _lock:
+        item = _stats.setdefault(name, {"calls": 0, "peak": 0, "max_peak": 0, "retained": 0, "total_retained": 0})
+        item["calls"] += 1
+        item["peak"] = peak
+        item["max_peak"] = max(item["max_peak"], peak)
+        item["retained"] = retained
+        item["total_retained"] += retained
+
+
+class _Frame:
+    __slots__ = ("start", "peak")
+
+    def __init__(self, start):
+        self.start = start
+        self.peak = start
+
+
+class measure:
+    """
+    Контекстный менеджер: измеряет пик и остаток памяти блока под именем name (если измерение включено).
+    Вложенные измерения допустимы: пик вложенной операции учитывается и во внешней.
+    Пик общий для процесса, поэтому при параллельных операциях в других потоках он завышается.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.frame = None
+
+    def __enter__(self):
+        if not tracemalloc.is_tracing():
+            return self
+        stack = _local.__dict__.setdefault("stack", [])
+        current, peak = tracemalloc.get_traced_memory()
+        # Сбрасываем пик, сохранив его для уже открытых внешних операций
+        for frame in stack:
+            frame.peak = max(frame.peak, peak)
+        tracemalloc.reset_peak()
+        self.frame = _Frame(current)
+        stack.append(self.frame)
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.frame is None:
+            return False
+        stack = _local.stack
+        stack.remove(self.frame)
+        if tracemalloc.is_tracing(): # Могли выключить во время операции
+            # Пик - до сборки мусора; остаток - после: объекты в циклических ссылках (например, фигуры
+            # matplotlib) освобождаются только сборщиком и иначе выглядели бы утечкой
+            peak = tracemalloc.get_traced_memory()[1]
+            gc.collect()
+            current = tracemalloc.get_traced_memory()[0]
+            for frame in stack:
+                frame.peak = max(frame.peak, peak)
+            self.frame.peak = max(self.frame.peak, peak)
+            _record(self.name, self.frame.peak - self.frame.start, current - self.frame.start)
+        self.frame = None
+        return False
+
+
+def profiled(name=None):
+    """Декоратор: измеряет каждый вызов функции (имя по умолчанию - имя функции)"""
+    def decorator(func):
+        label = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not tracemalloc.is_tracing(): # Выключено - без накладных расходов
+                return func(*args, **kwargs)
+            with measure(label):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def stats():
+    """Статистика по операциям: список словарей (name, calls, peak, max_peak, retained, total_retained), в байтах"""
+    with _lock:
+        return [dict(item, name=name) for name, item in sorted(_stats.items())]
+
+
+def top_allocations(limit=10):
+    """Строки кода, где сейчас выделено больше всего памяти: список (место, байт, блоков)"""
+    if not tracemalloc.is_tracing():
+        return []
+    snapshot = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ))
+    return [(str(stat.traceback), stat.size, stat.count) for stat in snapshot.statistics("lineno")[:limit]]
+
+
+def format_stats():
+    """Текстовая таблица статистики (размеры в КБ)"""
+    header = ("Операция", "Вызовов", "Пик, КБ", "Макс. пик, КБ", "Остаток, КБ", "Остаток всего, КБ")
+    rows = [(s["name"], s["calls"], s["peak"] // 1024, s["max_peak"] // 1024, s["retained"] // 1024,
+             s["total_retained"] // 1024) for s in stats()]
+    widths = [max(len(str(x)) for x in column) for column in zip(header, *rows)]
+    return "\n".join("  ".join(str(x).ljust(width) for x, width in zip(row, widths)) for row in [header] + rows)
+
+
+if os.environ.get("STORE_MEMPROF") == "1":
+    enable()
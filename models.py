@@ -3,16 +3,18 @@
 - Customer (Клиент)
 - Product (Товар)
 - Order (Заказ)
+- OrderItem (Позиция заказа)
 """
 
 class Customer:
     """Класс для представления клиента"""
-    def __init__(self, id=None, name="", phone="", email="", address=""): # Конструктор класса, принимающий параметры для инициализации объекта.
+    def __init__(self, id=None, name="", phone="", email="", address="", version=None): # Конструктор класса, принимающий параметры для инициализации объекта.
         self.id = id          # Уникальный идентификатор
         self.name = name      # ФИО клиента
         self.phone = phone    # Номер телефона
         self.email = email    # Email адрес
         self.address = address  # Адрес доставки
+        self.version = version  # Версия записи при чтении из базы (None - обновлять без проверки)
 
     # Специальный метод, определяющий строку, которую вернет объект при выводе
     # Используется для удобного вывода информации о клиенте
@@ -21,21 +23,47 @@ class Customer:
 
 class Product:
     """Класс для представления товара"""
-    def __init__(self, id=None, name="", price=0.0):
+    def __init__(self, id=None, name="", price=0.0, version=None):
         self.id = id        # Уникальный идентификатор
         self.name = name    # Название товара
         self.price = price  # Цена товара
+        self.version = version  # Версия записи при чтении из базы (None - обновлять без проверки)
 
     def __repr__(self):
         return f"Product(id={self.id}, name={self.name}, price={self.price})"
 
+class OrderItem:
+    """Класс для представления позиции заказа"""
+    def __init__(self, id=None, order_id=None, product_id=None, quantity=1, unit_price=None):
+        self.id = id                  # Уникальный идентификатор
+        self.order_id = order_id      # ID заказа
+        self.product_id = product_id  # ID товара
+        self.quantity = quantity      # Количество
+        self.unit_price = unit_price  # Цена за единицу на момент продажи (None - взять цену товара на дату заказа)
+
+    def __repr__(self):
+        return (f"OrderItem(id={self.id}, product_id={self.product_id}, "
+                f"quantity={self.quantity}, unit_price={self.unit_price})")
+
 class Order:
     """Класс для представления заказа"""
-    def __init__(self, id=None, customer_id=None, product_id=None, date=""):
+    def __init__(self, id=None, customer_id=None, product_id=None, date="", quantity=1, items=None, version=None,
+                 archived=False):
         self.id = id              # Уникальный идентификатор
         self.customer_id = customer_id  # ID клиента
-        self.product_id = product_id    # ID товара
+        self.product_id = product_id    # ID товара (для заказа из одной позиции)
         self.date = date          # Дата заказа в формате ГГГГ-ММ-ДД
+        # Позиции заказа. Если передан только product_id, заказ состоит из одной позиции
+        if items is None:
+            items = [OrderItem(product_id=product_id, quantity=quantity)] if product_id is not None else []
+        self.items = items
+        self.version = version    # Версия записи при чтении из базы (None - обновлять без проверки)
+        self.archived = archived  # Заказ прочитан из архива (только для просмотра)
+
+    @property
+    def total(self):
+        """Сумма заказа по позициям с известной ценой"""
+        return sum(item.quantity * item.unit_price for item in self.items if item.unit_price is not None)
 
     def __repr__(self):
         return f"Order(id={self.id}, customer_id={self.customer_id}, product_id={self.product_id}, date={self.date})"
\ No newline at end of file
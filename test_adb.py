@@ -0,0 +1,61 @@
+import unittest
+import asyncio
+import threading
+from unittest import mock
+import db
+import testutil
+import adb
+from models import Customer, Product, Order
+
+
+class TestAsyncDb(testutil.TempDbMixin, unittest.IsolatedAsyncioTestCase):
+    """Тесты для асинхронного доступа к базе данных"""
+
+    def setUp(self):
+        super().setUp()
+        self.customer_id = db.add_customer(Customer(name="Иван Иванов", phone="+79161234567"))
+        product_id = db.add_product(Product(name="Ноутбук", price=49999.99))
+        for day in range(1, 6):
+            db.add_order(Order(customer_id=self.customer_id, product_id=product_id, date=f"2023-10-0{day}"))
+
+    async def test_concurrent_reads(self):
+        """Тест параллельных запросов с фильтрами и постраничной выборкой"""
+        async with adb.AsyncDB(pool_size=2) as store:
+            pages = await asyncio.gather(*(store.get_orders(customer="иван", limit=2, offset=offset)
+                                           for offset in (0, 2, 4)))
+            self.assertEqual([len(page) for page in pages], [2, 2, 1])
+            order = await store.get_order(pages[0][0][0])
+            self.assertEqual(order.customer_id, self.customer_id)
+
+            chunks = [rows async for rows in store.iter_query("SELECT id FROM orders", chunk_size=2)]
+            self.assertEqual([len(rows) for rows in chunks], [2, 2, 1])
+
+    async def test_orders_query_built_in_pool(self):
+        """Тест: выбор источников заказов (граница архива) выполняется в потоке пула, а не в цикле событий"""
+        threads = []
+        order_sources = db.order_sources
+
+        def recording(*args, **kwargs):
+            threads.append(threading.get_ident())
+            return order_sources(*args, **kwargs)
+
+        async with adb.AsyncDB(pool_size=1) as store:
+            with mock.patch.object(db, "order_sources", recording):
+                rows = await store.get_orders(date_min="2023-10-02", limit=2)
+        self.assertEqual(len(rows), 2)
+        self.assertTrue(threads)
+        self.assertNotIn(threading.get_ident(), threads)
+
+    async def test_timeout_interrupts_query(self):
+        """Тест прерывания долгого запроса по таймауту; соединение после этого снова доступно"""
+        endless = ("WITH RECURSIVE n(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM n) "
+                   "SELECT COUNT(*) FROM n")
+        async with adb.AsyncDB(pool_size=1) as store:
+            with self.assertRaises(asyncio.TimeoutError):
+                await store.fetch(endless, timeout=0.1)
+            self.assertEqual(await store.fetch("SELECT COUNT(*) FROM orders"), [(5,)])
+
+
+if __name__ == "__main__":
+    # Запускаем все тесты
+    unittest.main()
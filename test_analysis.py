@@ -1,7 +1,12 @@
 import unittest
 import os
 import sqlite3
+from datetime import date
+import db
+import testutil
+import analysis
 from analysis import generate_sales_report, generate_orders_dynamics
+from models import Customer, Product, Order
 
 
 class TestAnalysis(unittest.TestCase):
@@ -45,6 +50,52 @@ class TestAnalysis(unittest.TestCase):
         self.assertGreater(os.path.getsize(filename), 1000)
 
 
+class TestReportCharts(testutil.DbTestCase):
+    """Тесты для графиков отчетов, обновляемых на месте"""
+
+    def setUp(self):
+        super().setUp()
+        self.customer_id = db.add_customer(Customer(name="Иван Иванов", phone="+79161234567"))
+        self.product_id = db.add_product(Product(name="Ноутбук", price=49999.99))
+
+    def add_order(self):
+        db.add_order(Order(customer_id=self.customer_id, product_id=self.product_id,
+                           date=date.today().isoformat()))
+
+    def test_update_in_place(self):
+        """Тест подстановки новых данных в уже построенные столбцы и линию"""
+        charts = analysis.ReportCharts()
+        bars, line = list(charts.bars), charts.line
+        self.assertTrue(charts.update("top_products", analysis.report_data("top_products")))
+        self.assertTrue(charts.empty["top_products"].get_visible())
+
+        self.add_order()
+        self.add_order()
+        self.assertTrue(charts.update("top_products", analysis.report_data("top_products")))
+        self.assertFalse(charts.update("top_products", analysis.report_data("top_products")))
+        self.assertEqual(list(charts.bars), bars)
+        self.assertEqual((bars[0].get_height(), bars[0].get_visible(), bars[1].get_visible()), (2, True, False))
+        self.assertFalse(charts.empty["top_products"].get_visible())
+
+        self.assertTrue(charts.update("orders_dynamics", analysis.report_data("orders_dynamics")))
+        self.assertIs(charts.line, line)
+        self.assertEqual(list(line.get_ydata()), [2])
+
+    def test_show_and_save(self):
+        """Тест переключения отчетов и записи видимого отчета в файл только по запросу"""
+        self.add_order()
+        charts = analysis.ReportCharts()
+        charts.update("top_products", analysis.report_data("top_products"))
+        charts.show("orders_dynamics")
+        self.assertEqual([ax.get_visible() for ax in charts.axes.values()], [False, True, False])
+        self.assertFalse([name for name in os.listdir(self.tmpdir) if name.endswith(".png")])
+
+        filename = charts.save(os.path.join(self.tmpdir, "report.png"))
+        self.assertGreater(os.path.getsize(filename), 1000)
+        with self.assertRaises(ValueError):
+            charts.show("unknown")
+
+
 if __name__ == "__main__":
     # Запускаем все тесты
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,97 @@
+import unittest
+import json
+import threading
+import urllib.request
+import urllib.error
+from urllib.parse import quote
+import db
+import testutil
+import api
+from models import Customer, Product, Order
+
+
+class TestApi(testutil.DbTestCase):
+    """Тесты для HTTP API"""
+
+    def setUp(self):
+        super().setUp()
+        self.customer_id = db.add_customer(Customer(name="Иван Иванов", phone="+79161234567"))
+        self.product_id = db.add_product(Product(name="Ноутбук", price=49999.99))
+        self.order_id = db.add_order(Order(customer_id=self.customer_id, product_id=self.product_id,
+                                           date="2023-10-15"))
+
+        # Сервер на свободном порту в отдельном потоке
+        self.server = api.ApiServer(("127.0.0.1", 0), workers=2)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.thread.join()
+        self.server.server_close()
+
+    def get(self, path, headers=None):
+        """Выполняет GET-запрос, возвращает (код ответа, заголовки, тело)"""
+        request = urllib.request.Request(self.url + path, headers=headers or {})
+        try:
+            with urllib.request.urlopen(request) as response:
+                return response.status, response.headers, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.headers, e.read()
+
+    def test_lists_and_order(self):
+        """Тест постраничных списков, фильтров и заказа с позициями"""
+        status, _, body = self.get("/orders?customer=" + quote("иван") + "&limit=10")
+        self.assertEqual(status, 200)
+        data = json.loads(body)
+        self.assertEqual((data["count"], data["items"][0]["products"]), (1, "Ноутбук"))
+
+        status, _, body = self.get("/products?price_min=50000")
+        self.assertEqual(json.loads(body)["items"], [])
+
+        status, _, body = self.get(f"/orders/{self.order_id}")
+        self.assertEqual(json.loads(body)["total"], 49999.99)
+
+    def test_etag_revalidation(self):
+        """Тест ответа 304 для неизменившихся данных и нового ETag после записи в базу"""
+        _, headers, _ = self.get("/customers")
+        etag = headers["ETag"]
+        status, _, _ = self.get("/customers", {"If-None-Match": etag})
+        self.assertEqual(status, 304)
+
+        db.add_customer(Customer(name="Петр Петров", phone="+79260000000"))
+        status, headers, body = self.get("/customers", {"If-None-Match": etag})
+        self.assertEqual(status, 200)
+        self.assertNotEqual(headers["ETag"], etag)
+        self.assertEqual(json.loads(body)["count"], 2)
+
+    def test_changes(self):
+        """Тест постраничного получения изменений по номеру последнего полученного"""
+        data = json.loads(self.get("/changes?limit=2")[2])
+        self.assertEqual([item["table"] for item in data["items"]], ["customers", "products"])
+        data = json.loads(self.get(f"/changes?since={data['last_seq']}")[2])
+        self.assertEqual((data["count"], data["items"][0]["id"]), (1, self.order_id))
+
+    def test_errors(self):
+        """Тест ответов на неверные параметры и неизвестные адреса"""
+        self.assertEqual(self.get("/orders?limit=abc")[0], 400)
+        self.assertEqual(self.get("/unknown")[0], 404)
+        self.assertEqual(self.get("/orders/999")[0], 404)
+        self.assertEqual(self.get("/changes?since=-1")[0], 400)
+
+    def test_deleted_order_not_found(self):
+        """Тест: удаленный заказ и заказ удаленного клиента не отдаются, как и в списке заказов"""
+        db.delete_order(self.order_id)
+        self.assertEqual(self.get(f"/orders/{self.order_id}")[0], 404)
+
+        order_id = db.add_order(Order(customer_id=self.customer_id, product_id=self.product_id, date="2023-10-16"))
+        self.assertEqual(self.get(f"/orders/{order_id}")[0], 200)
+        db.delete_customer(self.customer_id)
+        self.assertEqual(self.get(f"/orders/{order_id}")[0], 404)
+        self.assertEqual(json.loads(self.get("/orders")[2])["count"], 0)
+
+
+if __name__ == "__main__":
+    # Запускаем все тесты
+    unittest.main()
@@ -0,0 +1,115 @@
+import unittest
+import os
+from unittest import mock
+import db
+import testutil
+import gui
+import analysis
+import archive
+import journal
+from models import Customer, Product, Order
+
+
+class TestArchive(testutil.DbTestCase):
+    """Тесты для переноса старых заказов в архивную базу"""
+
+    def setUp(self):
+        super().setUp()
+        customers = [db.add_customer(Customer(name=f"Клиент {i}", phone=f"+7916{i:07d}")) for i in range(3)]
+        self.laptop = db.add_product(Product(name="Ноутбук", price=1000))
+        self.mouse = db.add_product(Product(name="Мышь", price=10))
+        # 20 заказов по одному в месяц 2023 и 2024 годов, половина - с ноутбуком
+        self.orders = []
+        for i in range(20):
+            product = self.laptop if i % 2 else self.mouse
+            order = Order(customer_id=customers[i % 3], product_id=product,
+                          date=f"{2023 + i // 12}-{i % 12 + 1:02d}-15", quantity=1 + i % 2)
+            self.orders.append(db.add_order(order))
+
+    def snapshot(self):
+        return (sorted(db.get_all_orders()), sorted(db.find_orders(product="ноут")),
+                sorted(analysis.top_products()), sorted(db.find_orders(date_min="2024-03-01")))
+
+    def test_archive_keeps_query_results(self):
+        """Тест переноса пачками: списки, фильтры и отчеты те же, а недавние заказы читаются без архива"""
+        before = self.snapshot()
+        seq = journal.current_seq()
+        steps = []
+        moved = archive.archive_orders("2024-01-01", batch_size=5, progress=lambda done, total: steps.append(done))
+        self.assertEqual(moved, 12)
+        self.assertEqual(steps, [5, 10, 12])
+        self.assertTrue(os.path.exists(db.archive_path()))
+        self.assertEqual(archive.stats(), {"cutoff": "2024-01-01", "hot": 8, "archived": 12})
+        self.assertEqual(self.snapshot(), before)
+        self.assertEqual(journal.current_seq(), seq) # перенос не записывается в журнал как удаление
+
+        self.assertEqual(db.order_sources("2024-03-01")["orders"], "orders")
+        self.assertEqual(db.order_sources("2023-06-01")["orders"], "all_orders")
+        order = db.get_order(self.orders[1])
+        self.assertEqual((order.date, order.items[0].product_id, order.items[0].quantity),
+                         ("2023-02-15", self.laptop, 2))
+
+    def test_interrupted_copy_is_not_duplicated(self):
+        """Тест копии в архиве, оставшейся после прерванного переноса: заказ берется из основной базы"""
+        before = self.snapshot()
+        conn = db.get_connection()
+        try:
+            db.attach_archive(conn, create=True)
+            with conn:
+                conn.execute("UPDATE archive_state SET cutoff = '2024-01-01'")
+            archive._copy_batch(conn, f"[{self.orders[0]}, {self.orders[1]}]")
+        finally:
+            conn.close()
+        db.close_connections()
+        self.assertEqual(self.snapshot(), before)
+        self.assertEqual(archive.stats()["archived"], 0)
+        # Следующий запуск переносит заказы заново, заменяя оставшиеся копии
+        self.assertEqual(archive.archive_orders("2024-01-01"), 12)
+        self.assertEqual(self.snapshot(), before)
+
+    def test_purge_archived_orders(self):
+        """Тест окончательного удаления архивных заказов, удаленных до переноса"""
+        db.delete_order(self.orders[0])
+        archive.archive_orders("2024-01-01")
+        result = db.purge_deleted()
+        self.assertEqual(result["archive"], 1)
+        self.assertEqual(archive.stats()["archived"], 11)
+        self.assertIsNone(db.get_order(self.orders[0]))
+
+    def test_gui_archive_dialog(self):
+        """Тест пункта меню архивации: запрос числа дней и отказ от переноса (окно не создается)"""
+        app = mock.Mock()
+        with mock.patch.object(gui.simpledialog, "askinteger", return_value=None) as ask:
+            gui.App.archive_orders(app)
+        self.assertEqual(ask.call_args.kwargs["initialvalue"], gui.ARCHIVE_DAYS)
+        app.run_in_background.assert_not_called()
+        self.assertEqual(archive.stats()["archived"], 0)
+
+    def test_gui_edit_archived_or_deleted_order(self):
+        """Тест редактирования заказа: архивный только просматривается, удаленный не открывается как новый"""
+        archive.archive_orders("2024-01-01")
+        db.delete_order(self.orders[-1])
+        self.assertTrue(db.get_order(self.orders[0]).archived)
+        self.assertIsNone(db.get_current_order(self.orders[0]))
+
+        def edit(order_id):
+            app = mock.Mock()
+            app.order_tree.selection.return_value = [str(order_id)]
+            app.order_tree.item.return_value = {"values": [order_id]}
+            with mock.patch.object(gui, "EditOrderDialog") as dialog, mock.patch.object(gui, "messagebox") as box:
+                gui.App.edit_order(app)
+            return app, dialog, box
+
+        app, dialog, box = edit(self.orders[0])
+        dialog.assert_not_called()
+        box.showinfo.assert_called_once()
+        app, dialog, box = edit(self.orders[-1])
+        dialog.assert_not_called()
+        box.showwarning.assert_called_once()
+        app.load_orders.assert_called_once()
+        app, dialog, box = edit(self.orders[-2]) # заказ основной базы открывается для изменения
+        self.assertEqual(dialog.call_args.args[1].id, self.orders[-2])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+import unittest
+import gzip
+import os
+import shutil
+import sqlite3
+import threading
+import db
+import testutil
+import backup
+from models import Customer
+
+
+class TestBackup(testutil.DbTestCase):
+    """Тесты для резервного копирования базы"""
+
+    def setUp(self):
+        super().setUp()
+        for i in range(200):
+            db.add_customer(Customer(name=f"Клиент {i}", phone=f"+7916{i:07d}"))
+        self.target = os.path.join(self.tmpdir, "backups")
+
+    def count_customers(self, path):
+        conn = sqlite3.connect(path)
+        try:
+            return conn.execute("SELECT COUNT(*) FROM customers").fetchone()[0]
+        finally:
+            conn.close()
+
+    def test_online_backup_during_writes(self):
+        """Тест постраничной копии из одного снимка, пока другой поток пишет в базу"""
+        old_pages = backup.PAGES_PER_STEP
+        backup.PAGES_PER_STEP = 1 # Много шагов, чтобы запись шла между ними
+        steps = []
+        writer = threading.Thread(target=lambda: [db.add_customer(Customer(name="Новый", phone=f"+7800{i:07d}"))
+                                                  for i in range(50)])
+        try:
+            writer.start()
+            path = backup.backup(self.target, progress=lambda done, total: steps.append(done))
+        finally:
+            writer.join()
+            backup.PAGES_PER_STEP = old_pages
+        self.assertGreater(len(steps), 1)
+        self.assertGreaterEqual(self.count_customers(path), 200)
+        self.assertEqual(sorted(os.listdir(self.target)), [os.path.basename(path)]) # без -wal и временных файлов
+
+    def test_compress_vacuum_and_rotation(self):
+        """Тест сжатой и компактной копий и удаления старых копий"""
+        compressed = backup.backup(self.target, compress=True)
+        plain = os.path.join(self.tmpdir, "restored.db")
+        with gzip.open(compressed, "rb") as src, open(plain, "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        self.assertEqual(self.count_customers(plain), 200)
+
+        backup.backup(self.target)
+        latest = backup.backup(self.target, vacuum=True, keep=2)
+        self.assertEqual(self.count_customers(latest), 200)
+        self.assertEqual(len(backup.list_backups(self.target)), 2)
+        self.assertNotIn(compressed, backup.list_backups(self.target))
+
+
+if __name__ == "__main__":
+    # Запускаем все тесты
+    unittest.main()
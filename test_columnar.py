@@ -0,0 +1,61 @@
+import unittest
+import os
+import db
+import testutil
+import columnar
+from models import Customer, Product, Order, OrderItem
+
+
+class TestColumnar(testutil.DbTestCase):
+    """Тесты для экспорта/импорта в колоночном формате"""
+
+    def setUp(self):
+        super().setUp()
+        self.customer_id = db.add_customer(Customer(name="Иван Иванов", phone="+79161234567"))
+        self.laptop_id = db.add_product(Product(name="Ноутбук", price=49999.99))
+        self.mouse_id = db.add_product(Product(name="Мышь", price=999.0))
+        db.add_order(Order(customer_id=self.customer_id, product_id=self.laptop_id, date="2023-10-15"))
+        db.add_order(Order(customer_id=self.customer_id, product_id=self.mouse_id, date="2023-10-16"))
+
+    def test_export_orders_view(self):
+        """Тест экспорта заказов с данными клиента и товара несколькими пачками"""
+        path = os.path.join(self.tmpdir, "orders.npz")
+        self.assertEqual(columnar.export_dataset("orders_view", path, chunk_size=1), 2)
+
+        self.assertEqual(columnar.read_meta(path)["chunks"], 2)
+        columns = columnar.read_columns(path)
+        self.assertEqual(columns["customer_name"].tolist(), ["Иван Иванов", "Иван Иванов"])
+        self.assertEqual(columns["products"].tolist(), ["Ноутбук", "Мышь"])
+        self.assertEqual(columns["total"].tolist(), [49999.99, 999.0])
+
+    def test_roundtrip_import(self):
+        """Тест повторного импорта экспортированных товаров и заказов"""
+        products_path = os.path.join(self.tmpdir, "products.npz")
+        orders_path = os.path.join(self.tmpdir, "orders.npz")
+        columnar.export_dataset("products", products_path)
+        columnar.export_dataset("orders", orders_path)
+
+        # Товары сопоставляются по названию, поэтому повторный импорт ничего не меняет
+        result = columnar.import_dataset(products_path)
+        self.assertEqual((result["inserted"], result["unchanged"]), (0, 2))
+
+        result = columnar.import_dataset(orders_path)
+        self.assertEqual(result["imported"], 2)
+        self.assertEqual(len(db.get_all_orders()), 4)
+
+    def test_roundtrip_multi_item_order(self):
+        """Тест повторного импорта заказа из нескольких позиций: позиции собираются по order_id"""
+        db.add_order(Order(customer_id=self.customer_id, date="2023-10-17",
+                           items=[OrderItem(product_id=self.laptop_id), OrderItem(product_id=self.mouse_id)]))
+        path = os.path.join(self.tmpdir, "orders.npz")
+        self.assertEqual(columnar.export_dataset("orders", path, chunk_size=2), 4)
+
+        result = columnar.import_dataset(path)
+        self.assertEqual((result["imported"], result["items"]), (3, 4))
+        products = [order[3] for order in db.get_all_orders()]
+        self.assertEqual(products.count("Ноутбук, Мышь"), 2)
+
+
+if __name__ == "__main__":
+    # Запускаем все тесты
+    unittest.main()
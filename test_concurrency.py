@@ -0,0 +1,118 @@
+import unittest
+import sqlite3
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from unittest import mock
+import db
+import testutil
+import archive
+from models import Customer, Product, Order
+
+
+def _increment(db_name, product_id, count):
+    """Процесс-оператор: count раз увеличивает цену товара на 1, перечитывая товар при конфликте"""
+    db.DB_NAME = db_name
+    conflicts = 0
+    for _ in range(count):
+        while True:
+            product = db.get_product(product_id)
+            product.price += 1
+            try:
+                db.update_product(product)
+                break
+            except db.UpdateConflict:
+                conflicts += 1
+    db.close_connections()
+    return conflicts
+
+
+class TestConcurrency(testutil.DbTestCase):
+    """Тесты для одновременной работы нескольких копий программы с одной базой"""
+
+    def setUp(self):
+        super().setUp()
+        self.customer_id = db.add_customer(Customer(name="Иван Иванов", phone="+79161234567"))
+        self.product_id = db.add_product(Product(name="Ноутбук", price=100))
+
+    def test_compare_and_swap(self):
+        """Тест обновления с проверкой версии: устаревшая форма получает конфликт с текущей записью"""
+        first, second = db.get_customer(self.customer_id), db.get_customer(self.customer_id)
+        self.assertEqual(first.version, 1)
+        first.address = "Москва"
+        self.assertEqual(db.update_customer(first), self.customer_id)
+        self.assertEqual(first.version, 2)
+        second.name = "Иванов Иван"
+        with self.assertRaises(db.UpdateConflict) as caught:
+            db.update_customer(second)
+        self.assertEqual((caught.exception.current.address, caught.exception.current.version), ("Москва", 2))
+        self.assertEqual(db.get_customer(self.customer_id).name, "Иван Иванов") # изменение не записано
+
+        # Без версии запись обновляется как раньше; импорт, цены и удаление тоже меняют версию
+        db.update_product(Product(id=self.product_id, name="Ноутбук", price=120))
+        db.upsert_products([["Ноутбук", "130"]])
+        db.reprice_products([self.product_id], 10)
+        product = db.get_product(self.product_id)
+        self.assertEqual((product.price, product.version), (143.0, 4))
+        db.delete_product(self.product_id)
+        with self.assertRaises(db.UpdateConflict) as caught:
+            db.update_product(product)
+        self.assertIsNone(caught.exception.current)
+
+    def test_order_conflicts(self):
+        """Тест конфликтов заказа: позиции не заменяются, заказ из архива не изменяется"""
+        order_id = db.add_order(Order(customer_id=self.customer_id, product_id=self.product_id, date="2024-01-10"))
+        stale, order = db.get_order(order_id), db.get_order(order_id)
+        order.items[0].quantity = 2
+        db.update_order(order)
+        stale.items[0].quantity = 5
+        with self.assertRaises(db.UpdateConflict) as caught:
+            db.update_order(stale)
+        self.assertEqual(caught.exception.current.items[0].quantity, 2)
+        self.assertEqual(db.fetch_query("SELECT total FROM orders"), [(200.0,)])
+
+        archive.archive_orders("2025-01-01")
+        order = db.get_order(order_id)
+        self.assertIsNone(order.version)
+        with self.assertRaises(db.UpdateConflict) as caught:
+            db.update_order(order)
+        self.assertIsNone(caught.exception.current)
+
+    def test_busy_retry(self):
+        """Тест записи в занятую базу: повтор после освобождения, ошибка - если база занята дольше всех попыток"""
+        db.close_connections()
+        blocker = sqlite3.connect(db.DB_NAME, isolation_level=None, check_same_thread=False) # другая копия программы
+        blocker.execute("BEGIN IMMEDIATE")
+        with mock.patch.multiple(db, BUSY_TIMEOUT=0.05, RETRY_DELAY=0.05, WRITE_RETRIES=3):
+            threading.Timer(0.2, blocker.rollback).start()
+            self.assertIsNotNone(db.add_product(Product(name="Мышь", price=10)))
+
+            blocker.execute("BEGIN IMMEDIATE")
+            with self.assertRaises(sqlite3.OperationalError):
+                db.write_transaction(lambda conn: conn.execute("DELETE FROM products"))
+            blocker.rollback()
+        blocker.close()
+        self.assertEqual(len(db.get_all_products()), 2)
+
+    def test_delete_customers_waits_for_writer(self):
+        """Тест удаления клиентов, пока другая копия программы держит блокировку записи: удаление дожидается ее"""
+        order_id = db.add_order(Order(customer_id=self.customer_id, product_id=self.product_id, date="2024-01-01"))
+        db.close_connections()
+        blocker = sqlite3.connect(db.DB_NAME, isolation_level=None, check_same_thread=False)
+        blocker.execute("BEGIN IMMEDIATE")
+        with mock.patch.multiple(db, BUSY_TIMEOUT=0.05, RETRY_DELAY=0.05, WRITE_RETRIES=3):
+            threading.Timer(0.3, blocker.commit).start()
+            self.assertEqual(db.delete_customers([self.customer_id]), [order_id])
+        blocker.close()
+        self.assertEqual(db.get_all_customers(), [])
+
+    def test_processes_lose_no_updates(self):
+        """Тест одновременной правки одного товара из нескольких процессов: ни одно увеличение цены не потеряно"""
+        db.close_connections()
+        with ProcessPoolExecutor(2, mp_context=multiprocessing.get_context("spawn")) as executor:
+            list(executor.map(_increment, [db.DB_NAME] * 2, [self.product_id] * 2, [100] * 2))
+        self.assertEqual(db.get_product(self.product_id).price, 300.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
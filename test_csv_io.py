@@ -0,0 +1,100 @@
+import unittest
+import os
+import db
+import testutil
+import csv_io
+import columnar
+from models import Customer, Product, Order, OrderItem
+
+
+class TestCsvIo(testutil.DbTestCase):
+    """Тесты для импорта/экспорта CSV"""
+
+    def setUp(self):
+        super().setUp()
+        self.customer_id = db.add_customer(Customer(name="Иван Иванов", phone="+79161234567"))
+        self.product_id = db.add_product(Product(name="Ноутбук", price=49999.99))
+
+    def test_gzip_roundtrip(self):
+        """Тест экспорта и повторного импорта сжатого CSV с отчетом о ходе работы"""
+        path = os.path.join(self.tmpdir, "customers.csv.gz")
+        calls = []
+        self.assertEqual(csv_io.export_csv("customers", path, progress=lambda *args: calls.append(args)), 1)
+        self.assertEqual(calls[-1][2], 1.0) # последний вызов - 100%
+
+        result = csv_io.import_csv("customers", path)
+        self.assertEqual(result["unchanged"], 1)
+
+    def test_resume_after_failure(self):
+        """Тест продолжения импорта заказов после сбоя"""
+        path = os.path.join(self.tmpdir, "orders.csv")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("ID клиента,ID товара,Дата заказа\n")
+            for day in range(1, 6):
+                f.write(f"{self.customer_id},{self.product_id},2023-10-0{day}\n")
+
+        # Имитируем сбой после первой пачки из двух строк
+        def failing_rows():
+            yield [str(self.customer_id), str(self.product_id), "2023-10-01"]
+            yield [str(self.customer_id), str(self.product_id), "2023-10-02"]
+            yield [str(self.customer_id), str(self.product_id), "2023-10-03"]
+            raise OSError("обрыв чтения")
+
+        checkpoint = csv_io.checkpoint_name("orders", path)
+        with self.assertRaises(OSError):
+            db.import_orders(failing_rows(), batch_size=2, checkpoint=checkpoint)
+        self.assertEqual(db.get_checkpoint(checkpoint), 2)
+
+        # Повторный запуск пропускает две уже импортированные строки
+        result = csv_io.import_csv("orders", path)
+        self.assertEqual((result["resumed_from"], result["imported"]), (2, 3))
+        self.assertEqual(len(db.get_all_orders()), 5)
+        self.assertEqual(db.get_checkpoint(checkpoint), 0) # после успешного импорта точка удаляется
+
+    def test_orders_roundtrip_keeps_items_together(self):
+        """Тест экспорта и импорта заказа из нескольких позиций: позиции не разделяются на заказы"""
+        mouse_id = db.add_product(Product(name="Мышь", price=999.0))
+        db.add_order(Order(customer_id=self.customer_id, date="2023-10-15",
+                           items=[OrderItem(product_id=self.product_id), OrderItem(product_id=mouse_id, quantity=2)]))
+        db.add_order(Order(customer_id=self.customer_id, product_id=mouse_id, date="2023-10-16"))
+        path = os.path.join(self.tmpdir, "orders.csv")
+        self.assertEqual(csv_io.export_csv("orders", path), 3) # строка на позицию
+
+        result = csv_io.import_csv("orders", path)
+        self.assertEqual((result["imported"], result["items"]), (2, 3))
+        orders = db.get_all_orders()
+        self.assertEqual(len(orders), 4)
+        self.assertEqual(sorted(order[3] for order in orders), ["Мышь", "Мышь", "Ноутбук, Мышь ×2", "Ноутбук, Мышь ×2"])
+
+    def test_import_orders_grouped(self):
+        """Тест сборки заказов по ключу, в том числе заказа, не поместившегося в одну пачку"""
+        rows = [["", self.customer_id, self.product_id, "2023-10-15", "1"],
+                ["", self.customer_id, self.product_id, "2023-10-15", "1"], # пустой ключ - заказ на строку
+                ["a", self.customer_id, self.product_id, "2023-10-15", "1"],
+                ["a", self.customer_id, self.product_id, "2023-10-15", "2"],
+                ["a", self.customer_id, self.product_id, "2023-10-15", "3"], # заказ длиннее пачки
+                ["a", self.customer_id, self.product_id, "2023-10-16", "1"]] # другая дата - другой заказ
+        result = db.import_orders(rows, batch_size=2, grouped=True)
+        self.assertEqual((result["imported"], result["items"], result["skipped"]), (4, 6, 0))
+        totals = sorted(row[4] for row in db.get_all_orders())
+        self.assertEqual(totals, [49999.99, 49999.99, 49999.99, 6 * 49999.99])
+
+    def test_roundtrip_with_stub_product(self):
+        """Тест повторного импорта заказа и товара-заглушки с нулевой ценой, созданных при импорте"""
+        result = db.import_orders([[str(self.customer_id), "99", "2023-10-15"]], create_missing=True)
+        self.assertEqual(result["created_products"], 1)
+        paths = {name: os.path.join(self.tmpdir, name) for name in ("orders.csv", "products.csv", "orders.npz")}
+        csv_io.export_csv("orders", paths["orders.csv"])
+        csv_io.export_csv("products", paths["products.csv"])
+        columnar.export_dataset("orders", paths["orders.npz"])
+
+        for result in (csv_io.import_csv("orders", paths["orders.csv"]),
+                       csv_io.import_csv("products", paths["products.csv"]),
+                       columnar.import_dataset(paths["orders.npz"])):
+            self.assertEqual((result["skipped"], result["errors"]), (0, []))
+        self.assertEqual(len(db.get_all_orders()), 3)
+
+
+if __name__ == "__main__":
+    # Запускаем все тесты
+    unittest.main()
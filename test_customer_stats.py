@@ -0,0 +1,98 @@
+import unittest
+import time
+from unittest import mock
+import db
+import testutil
+import archive
+import customer_stats
+import gui
+from models import Customer, Product, Order, OrderItem
+
+
+class TestCustomerStats(testutil.DbTestCase):
+    """Тесты для сводки по заказам клиентов"""
+
+    def setUp(self):
+        super().setUp()
+        self.ivan = db.add_customer(Customer(name="Иванов Иван", phone="+79160000001"))
+        self.petr = db.add_customer(Customer(name="Петров Петр", phone="+79160000002"))
+        self.product = db.add_product(Product(name="Ноутбук", price=100))
+        self.orders = [db.add_order(Order(customer_id=self.ivan, product_id=self.product, date=day, quantity=quantity))
+                       for day, quantity in (("2024-01-10", 1), ("2024-02-10", 2), ("2024-03-10", 3))]
+
+    def stats(self, customer_id):
+        # Даты в сводке - номера дней, для сравнения переводим их в строки
+        return db.fetch_query(f"SELECT order_count, revenue, {db.day_sql('first_order')}, "
+                              f"{db.day_sql('last_order')} FROM customer_stats WHERE customer_id = ?",
+                              (customer_id,))[0]
+
+    def test_incremental_updates(self):
+        """Тест обновления сводки при добавлении, изменении, удалении и восстановлении заказов"""
+        self.assertEqual(self.stats(self.ivan), (3, 600.0, "2024-01-10", "2024-03-10"))
+        self.assertEqual(self.stats(self.petr), (0, 0.0, None, None))
+
+        order = db.get_order(self.orders[1])
+        order.items = [OrderItem(product_id=self.product, quantity=5, unit_price=10)]
+        db.update_order(order)
+        self.assertEqual(self.stats(self.ivan), (3, 450.0, "2024-01-10", "2024-03-10"))
+
+        # Заказ с крайней датой: число и сумма меняются сразу, даты уточняются пересчетом
+        db.delete_order(self.orders[2])
+        self.assertEqual(self.stats(self.ivan)[:2], (2, 150.0))
+        self.assertEqual(customer_stats.refresh_stale(), 1)
+        self.assertEqual(self.stats(self.ivan), (2, 150.0, "2024-01-10", "2024-02-10"))
+        db.restore_order(self.orders[2])
+        self.assertEqual(self.stats(self.ivan), (3, 450.0, "2024-01-10", "2024-03-10"))
+
+        # Перенос заказа другому клиенту и импорт
+        order = db.get_order(self.orders[0])
+        order.customer_id = self.petr
+        db.update_order(order)
+        db.import_orders([(self.petr, self.product, "2024-04-01", 2, 50)])
+        customer_stats.refresh_stale()
+        self.assertEqual(self.stats(self.petr), (2, 200.0, "2024-01-10", "2024-04-01"))
+        self.assertEqual(self.stats(self.ivan), (2, 350.0, "2024-02-10", "2024-03-10"))
+        self.assertEqual(customer_stats.check(), [])
+
+    def test_gui_refreshes_stale_in_background(self):
+        """Тест списка клиентов: пересчет сводки выполняется в фоновом потоке загрузки, а не в потоке окна"""
+        db.delete_order(self.orders[2])
+        app = mock.Mock(customer_sort="id", loading={}, loaded=set())
+        for entry in (app.customer_name_filter, app.customer_phone_filter, app.customer_email_filter,
+                      app.customer_orders_filter):
+            entry.get.return_value = ""
+        gui.App.load_customers(app)
+        self.assertEqual(self.stats(self.ivan)[3], "2024-03-10") # окно не пересчитывало сводку само
+        (tree, query, name), kwargs = app.load_tree.call_args
+        self.assertIs(kwargs["prepare"], customer_stats.refresh_stale)
+
+        tree.get_children.return_value = ()
+        gui.App.load_tree(app, tree, query, name, **kwargs)
+        deadline = time.monotonic() + 5
+        while self.stats(self.ivan)[3] != "2024-02-10" and time.monotonic() < deadline:
+            time.sleep(0.01)
+        app.loading[tree] = 0 # Отменяем загрузку: строки в таблицу никто не вставляет
+        self.assertEqual(self.stats(self.ivan), (2, 300.0, "2024-01-10", "2024-02-10"))
+
+    def test_query_sort_and_filter(self):
+        """Тест столбцов сводки в списке клиентов, фильтра по числу заказов и сортировки"""
+        rows = db.customers_query(stats=True, order_by="revenue", descending=True).fetch()
+        self.assertEqual([(row[0], row[5], row[6]) for row in rows], [(self.ivan, 3, 600.0), (self.petr, 0, 0.0)])
+        self.assertEqual([row[0] for row in db.customers_query(stats=True, min_orders=1).fetch()], [self.ivan])
+        self.assertEqual(len(db.customers_query().fetch()[0]), 5) # без stats - прежние столбцы
+
+    def test_check_rebuild_and_archive(self):
+        """Тест проверки и пересчета сводки, в том числе с архивными заказами"""
+        archive.archive_orders("2024-03-01")
+        self.assertEqual(self.stats(self.ivan), (3, 600.0, "2024-01-10", "2024-03-10"))
+        with db.shared_connection() as conn:
+            conn.execute("UPDATE customer_stats SET order_count = 7 WHERE customer_id = ?", (self.ivan,))
+            conn.execute("DELETE FROM customer_stats WHERE customer_id = ?", (self.petr,))
+        self.assertEqual(sorted(row[0] for row in customer_stats.check()), sorted([self.ivan, self.petr]))
+        self.assertEqual(customer_stats.rebuild(), 2)
+        self.assertEqual(customer_stats.check(), [])
+        self.assertEqual(self.stats(self.ivan), (3, 600.0, "2024-01-10", "2024-03-10"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,39 @@
+import unittest
+import collections
+from datetime import date
+import db
+import testutil
+import datagen
+import loadsim
+
+
+class TestDataGen(testutil.DbTestCase):
+    """Тесты для генератора синтетических данных и имитации нагрузки"""
+
+    def test_distributions(self):
+        """Тест неравномерной популярности товаров, сезонности и русских ФИО"""
+        rows = list(datagen.order_rows(20000, range(1, 101), range(1, 51), date(2023, 1, 1), 365))
+        products = collections.Counter(row[1] for row in rows).most_common()
+        self.assertGreater(products[0][1], 10 * products[-1][1]) # закон Ципфа
+        months = collections.Counter(row[2][5:7] for row in rows)
+        self.assertGreater(months["12"], 1.5 * months["07"]) # пик в декабре, спад летом
+
+        name, phone, email, _ = next(datagen.customer_rows(1))
+        self.assertRegex(name, r"^[А-ЯЁ][а-яё]+ [А-ЯЁ][а-яё]+ [А-ЯЁ][а-яё]+(ич|на)$")
+        self.assertRegex(email, r"^[a-z]+\.1\.0@example\.ru$")
+        self.assertEqual(list(datagen.customer_rows(3)), list(datagen.customer_rows(3))) # воспроизводимость
+
+    def test_generate_and_simulate(self):
+        """Тест заполнения базы через пакетный импорт и короткой имитации нагрузки"""
+        result = datagen.generate(customers=200, products=30, orders=2000, seed=3)
+        self.assertEqual((result["customers"], result["products"], result["orders"]), (200, 30, 2000))
+        self.assertEqual(len(db.find_orders()), 2000)
+
+        summary = loadsim.run(seconds=0.3, readers=1, writers=1, reporters=1)
+        self.assertIn("новый заказ", summary)
+        self.assertEqual(sum(s["errors"] for s in summary.values()), 0)
+
+
+if __name__ == "__main__":
+    # Запускаем все тесты
+    unittest.main()
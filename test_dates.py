@@ -0,0 +1,105 @@
+import unittest
+import sqlite3
+from datetime import date
+from unittest import mock
+import db
+import testutil
+import analysis
+import archive
+import customer_stats
+from models import Customer, Product, Order
+
+
+class TestDates(testutil.DbTestCase):
+    """Тесты для хранения дат заказов номерами дней"""
+
+    init_db = False # База создается в каждом тесте (в том числе из файла старой схемы)
+
+    def test_conversion(self):
+        """Тест перевода дат в номера дней и обратно"""
+        self.assertEqual(db.to_day("1970-01-01"), 0)
+        self.assertEqual(db.to_day(" 2024-03-01 ") - db.to_day("2024-02-28"), 2) # високосный год
+        self.assertEqual(db.day_text(db.to_day("2024-02-29")), "2024-02-29")
+        self.assertIsNone(db.day_text(None))
+        for text in ("2024-02-30", "2024-3-1", "", None):
+            with self.assertRaises(ValueError):
+                db.to_day(text)
+        conn = sqlite3.connect(":memory:")
+        self.assertEqual(conn.execute(f"SELECT {db.day_sql('?')}", (db.to_day("2024-02-29"),)).fetchone(),
+                         ("2024-02-29",))
+        # Номер дня - это и число даты matplotlib
+        self.assertEqual(db.to_day("2024-02-29") + analysis.DAY_OFFSET,
+                         analysis.mdates.datestr2num("2024-02-29"))
+
+    def test_migration_from_text_dates(self):
+        """Тест миграции базы с текстовыми датами: значения, индексы, триггеры и архив сохраняются"""
+        text_dates = db.MIGRATIONS[:db.MIGRATIONS.index(db._migration_integer_dates)]
+        with mock.patch.object(db, "MIGRATIONS", text_dates):
+            db.init_db()
+            db.add_customer(Customer(name="Иван Иванов", phone="+79161234567"))
+            db.add_product(Product(name="Ноутбук", price=100))
+            with db.shared_connection() as conn:
+                for day in ("2023-05-01", "2024-01-10", "2024-02-10", "не дата"):
+                    order_id = conn.execute("INSERT INTO orders (customer_id, date) VALUES (1, ?)", (day,)).lastrowid
+                    conn.execute("INSERT INTO order_items (order_id, product_id, unit_price) VALUES (?, 1, 100)",
+                                 (order_id,))
+                conn.execute("DELETE FROM orders WHERE id = 4") # номер 4 не должен достаться новому заказу
+            conn.execute("UPDATE archive_state SET cutoff = '2024-01-01'")
+            conn.commit()
+            db.attach_archive(conn, create=True)
+            with conn:
+                conn.execute("INSERT INTO archive.orders SELECT id, customer_id, date, total, deleted_at "
+                             "FROM main.orders WHERE id = 1")
+                conn.execute("INSERT INTO archive.order_items SELECT * FROM main.order_items WHERE order_id = 1")
+                conn.execute("UPDATE archive_state SET archiving = 1")
+                conn.execute("DELETE FROM main.orders WHERE id = 1")
+                conn.execute("UPDATE archive_state SET archiving = 0")
+        db.init_db()
+
+        self.assertEqual(db.fetch_query("SELECT id, date, typeof(date) FROM main.orders ORDER BY id"),
+                         [(2, db.to_day("2024-01-10"), "integer"), (3, db.to_day("2024-02-10"), "integer")])
+        self.assertEqual(db.fetch_query("SELECT date FROM archive.orders"), [(db.to_day("2023-05-01"),)])
+        self.assertEqual(db.get_order(1).date, "2023-05-01")
+        customer_stats.refresh_stale() # Заказ с последней датой удален до миграции
+        self.assertEqual(db.fetch_query("SELECT first_order, last_order FROM customer_stats"),
+                         [(db.to_day("2023-05-01"), db.to_day("2024-02-10"))])
+        # Индексы, триггеры и представление пересозданы, позиции заказов не удалены каскадом
+        self.assertEqual(db.fetch_query("SELECT COUNT(*) FROM order_items"), [(2,)])
+        plan = db.fetch_query("EXPLAIN QUERY PLAN SELECT id FROM orders WHERE deleted_at IS NULL AND date >= 0")
+        self.assertIn("idx_orders_date", " ".join(row[-1] for row in plan))
+        order_id = db.add_order(Order(customer_id=1, product_id=1, date="2024-03-10"))
+        self.assertEqual(order_id, 5)
+        self.assertEqual(db.fetch_query("SELECT total FROM orders WHERE id = ?", (order_id,)), [(100.0,)])
+        self.assertEqual(db.fetch_query("SELECT COUNT(*) FROM order_lines"), [(3,)])
+        self.assertEqual(db.fetch_query("SELECT order_count, last_order FROM customer_stats"),
+                         [(4, db.to_day("2024-03-10"))]) # с архивным заказом
+        self.assertEqual(db.fetch_query("PRAGMA foreign_keys"), [(1,)])
+        self.assertEqual(db.fetch_query("PRAGMA foreign_key_check"), [])
+
+    def test_range_queries(self):
+        """Тест фильтров и отчетов по датам: граница входит в диапазон, текст в столбец даты не пишется"""
+        db.init_db()
+        customer_id = db.add_customer(Customer(name="Иван Иванов", phone="+79161234567"))
+        product_id = db.add_product(Product(name="Ноутбук", price=100))
+        for day in ("2023-12-31", "2024-01-01", "2024-01-31", "2024-02-01"):
+            db.add_order(Order(customer_id=customer_id, product_id=product_id, date=day))
+        self.assertEqual([row[5] for row in db.find_orders(date_min="2024-01-01", date_max="2024-01-31")],
+                         ["2024-01-01", "2024-01-31"])
+        with self.assertRaises(ValueError):
+            db.find_orders(date_min="2024-01")
+        with self.assertRaises(ValueError):
+            db.add_order(Order(customer_id=customer_id, product_id=product_id, date="31.01.2024"))
+        self.assertIsNone(db.execute_query("UPDATE orders SET date = '2024-01-01' WHERE id = 1"))
+
+        archive.archive_orders("2024-01-01")
+        self.assertEqual(db.fetch_query("SELECT COUNT(*) FROM main.orders"), [(3,)])
+        self.assertEqual(sorted(row[5] for row in db.get_all_orders()),
+                         ["2023-12-31", "2024-01-01", "2024-01-31", "2024-02-01"])
+
+        # Отчет по дням возвращает номера дней (старые заказы в период не входят)
+        today = date.today().isoformat()
+        db.add_order(Order(customer_id=customer_id, product_id=product_id, date=today))
+        self.assertEqual(analysis.orders_by_day(30), [(db.to_day(today), 1)])
+
+if __name__ == "__main__":
+    unittest.main()
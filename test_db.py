@@ -0,0 +1,222 @@
+import unittest
+import os
+import tempfile
+import sqlite3
+import subprocess
+import sys
+import db
+import testutil
+from models import Customer, Product, Order, OrderItem
+
+
+class TestDb(testutil.DbTestCase):
+    """Тесты для операций с базой данных"""
+
+    def test_id_set(self):
+        """Тест битового множества идентификаторов"""
+        ids = db.IdSet([1, 5, 1000])
+        self.assertIn(5, ids)
+        self.assertNotIn(6, ids)
+        self.assertNotIn(100000, ids)
+        self.assertEqual(list(ids.missing([1, 2, 1000, 2])), [2])
+
+    def test_import_orders_skips_missing_references(self):
+        """Тест импорта заказов: строки с несуществующими id пропускаются"""
+        customer_id = db.add_customer(Customer(name="Иван Иванов"))
+        product_id = db.add_product(Product(name="Ноутбук", price=49999.99))
+
+        rows = [
+            [str(customer_id), str(product_id), "2023-10-15"],
+            [str(customer_id), "999", "2023-10-16"],  # товара нет
+            ["abc", str(product_id), "2023-10-17"],   # некорректный id
+        ]
+        result = db.import_orders(rows, batch_size=2)
+
+        self.assertEqual(result["imported"], 1)
+        self.assertEqual(result["skipped"], 2)
+        self.assertEqual([line for line, _ in result["errors"]], [3, 4])
+        self.assertEqual(len(db.get_all_orders()), 1)
+
+    def test_import_orders_creates_missing_references(self):
+        """Тест импорта заказов с автоматическим созданием клиентов и товаров"""
+        result = db.import_orders([["7", "3", "2023-10-15"], ["7", "4", "2023-10-16"]],
+                                  create_missing=True)
+
+        self.assertEqual(result["imported"], 2)
+        self.assertEqual(result["created_customers"], 1)
+        self.assertEqual(result["created_products"], 2)
+        self.assertEqual(len(db.get_all_orders()), 2)
+
+    def test_foreign_keys_enforced(self):
+        """Тест того, что внешние ключи включены для каждого соединения"""
+        self.assertEqual(db.fetch_query("PRAGMA foreign_keys"), [(1,)])
+        # Заказ на несуществующего клиента не должен попасть в базу
+        self.assertIsNone(db.execute_query(
+            "INSERT INTO orders (customer_id, date) VALUES (1, 19645)"))
+
+    def test_upsert_customers_is_idempotent(self):
+        """Тест повторного импорта клиентов: дубли не создаются, изменения обновляются"""
+        rows = [
+            ["Иван Иванов", "+7 (916) 123-45-67", "", "Москва"],
+            ["Петр Петров", "", "Petr@example.com", "Казань"],
+            ["Иван Иванов", "89161234567", "", "Москва"],  # тот же телефон в другом формате
+        ]
+        result = db.upsert_customers(rows)
+        self.assertEqual((result["inserted"], result["duplicates"]), (2, 1))
+
+        rows[1] = ["Петр Петров", "", "petr@example.com", "Самара"]
+        result = db.upsert_customers(rows)
+        self.assertEqual((result["inserted"], result["updated"], result["unchanged"]), (0, 1, 1))
+        self.assertEqual(len(db.get_all_customers()), 2)
+
+    def test_upsert_products(self):
+        """Тест синхронизации товаров по названию"""
+        db.upsert_products([["Ноутбук", "100"], ["Мышь", "5"]])
+        result = db.upsert_products([["ноутбук ", "120"], ["Мышь", "5"], ["Клавиатура", "10"]])
+
+        self.assertEqual((result["inserted"], result["updated"], result["unchanged"]), (1, 1, 1))
+        prices = {name: price for _, name, price in db.get_all_products()}
+        self.assertEqual(prices["ноутбук"], 120.0) # название берется из последнего импорта
+
+    def test_migration_keeps_existing_duplicates(self):
+        """Тест миграции старой базы, в которой уже есть дубли"""
+        # Создаем базу в исходной схеме (без миграций) с двумя одинаковыми товарами
+        os.remove(db.DB_NAME)
+        conn = sqlite3.connect(db.DB_NAME)
+        conn.execute("CREATE TABLE customers (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, "
+                     "phone TEXT, email TEXT, address TEXT)")
+        conn.execute("CREATE TABLE products (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, price REAL)")
+        conn.execute("CREATE TABLE orders (id INTEGER PRIMARY KEY AUTOINCREMENT, customer_id INTEGER NOT NULL, "
+                     "product_id INTEGER NOT NULL, date TEXT NOT NULL, "
+                     "FOREIGN KEY(customer_id) REFERENCES customers(id) ON DELETE CASCADE, "
+                     "FOREIGN KEY(product_id) REFERENCES products(id) ON DELETE CASCADE)")
+        conn.executemany("INSERT INTO products (name, price) VALUES (?, ?)", [("Мышь", 5), ("Мышь", 6)])
+        conn.execute("INSERT INTO customers (name) VALUES ('Иван Иванов')")
+        conn.executemany("INSERT INTO orders (customer_id, product_id, date) VALUES (?, ?, ?)",
+                         [(1, 2, "2023-10-15"), (5, 1, "2023-10-16"),  # второй заказ - удаленного клиента,
+                          (1, 7, "2023-10-17")])                         # третий - удаленного товара
+        conn.commit()
+        conn.close()
+
+        db.init_db()
+        keys = db.fetch_query("SELECT natural_key FROM products ORDER BY id")
+        self.assertEqual(keys, [("мышь",), (None,), (None,)]) # у заглушки, как при импорте, ключа нет
+
+        # Старый заказ стал заказом из одной позиции по текущей цене товара
+        self.assertEqual(db.fetch_query("SELECT id, total FROM orders ORDER BY id"), [(1, 6.0), (2, 5.0), (3, 0.0)])
+        order = db.get_order(1)
+        self.assertEqual([(item.product_id, item.quantity, item.unit_price) for item in order.items], [(2, 1, 6.0)])
+        # Заказ удаленного клиента сохранен: для него создан клиент-заглушка с тем же id
+        self.assertEqual(db.get_customer(5).name, "Клиент #5 (создан при обновлении базы)")
+        self.assertEqual(db.get_product(7).price, 0.0)
+        self.assertEqual(len(db.get_all_orders()), 3)
+    def test_order_items_and_total(self):
+        """Тест заказа из нескольких позиций: цена фиксируется при продаже, сумма поддерживается"""
+        customer_id = db.add_customer(Customer(name="Иван Иванов"))
+        laptop = Product(name="Ноутбук", price=1000.0)
+        laptop.id = db.add_product(laptop)
+        mouse_id = db.add_product(Product(name="Мышь", price=10.0))
+
+        order_id = db.add_order(Order(customer_id=customer_id, date="2023-10-15",
+                                      items=[OrderItem(product_id=laptop.id, quantity=2),
+                                             OrderItem(product_id=mouse_id, quantity=3, unit_price=9.5)]))
+        self.assertEqual(db.get_all_orders(), [(order_id, "Иван Иванов", "", "Ноутбук ×2, Мышь ×3", 2028.5, "2023-10-15")])
+
+        # Изменение цены товара не меняет уже проданные позиции
+        laptop.price = 2000.0
+        db.update_product(laptop)
+        order = db.get_order(order_id)
+        self.assertEqual(order.total, 2028.5)
+
+        # При изменении позиций сумма пересчитывается
+        order.items = order.items[:1]
+        db.update_order(order)
+        self.assertEqual(db.fetch_query("SELECT total FROM orders WHERE id=?", (order_id,)), [(2000.0,)])
+
+
+    def test_query_builder(self):
+        """Тест построителя запросов: значения передаются параметрами, имена столбцов проверяются"""
+        sql, params = (db.Query("SELECT id FROM products").where("price >= ?", 10)
+                       .contains("мышь", "name").order_by("price", descending=True).limit(5, 10).build())
+        self.assertEqual(sql, "SELECT id FROM products WHERE (price >= ?) AND (INSTR(LOWER_UNICODE(name), ?) > 0) "
+                              "ORDER BY price DESC LIMIT ? OFFSET ?")
+        self.assertEqual(params, (10, "мышь", 5, 10))
+        with self.assertRaises(ValueError):
+            db.Query("SELECT id FROM products").order_by("price; DROP TABLE products")
+        with self.assertRaises(ValueError):
+            db.Query("SELECT id FROM products").where("price > ?")
+
+    def test_find_with_filters(self):
+        """Тест фильтрации в SQLite, в том числе без учета регистра для кириллицы"""
+        ivan = db.add_customer(Customer(name="Иван Иванов", phone="+79161234567"))
+        db.add_customer(Customer(name="Петр Петров", phone="+79260000000"))
+        laptop = db.add_product(Product(name="Ноутбук", price=49999.99))
+        mouse = db.add_product(Product(name="Мышь", price=999.0))
+        db.add_order(Order(customer_id=ivan, product_id=laptop, date="2023-10-15"))
+        db.add_order(Order(customer_id=ivan, product_id=mouse, date="2023-11-01"))
+
+        self.assertEqual([row[0] for row in db.find_customers(name="иВАН")], [ivan])
+        self.assertEqual(len(db.find_customers(phone="7926")), 1)
+        self.assertEqual([row[1] for row in db.find_products(price_min=1000)], ["Ноутбук"])
+        self.assertEqual(len(db.find_orders(customer="1234567")), 2)
+        orders = db.find_orders(product="мыш", date_min="2023-10-20")
+        self.assertEqual([row[3] for row in orders], ["Мышь"])
+
+    def test_shared_connection(self):
+        """Тест повторного использования соединения потока и переключения на другой файл базы"""
+        conn = db.shared_connection()
+        self.assertIs(db.shared_connection(), conn)
+        db.close_connections()
+        self.assertIsNot(db.shared_connection(), conn)
+
+
+    def test_soft_delete_and_restore(self):
+        """Тест мягкого удаления клиента: заказы скрываются, восстанавливаются и удаляются окончательно"""
+        customer_id = db.add_customer(Customer(name="Иван Иванов", email="ivan@example.com"))
+        product_id = db.add_product(Product(name="Ноутбук", price=49999.99))
+        db.add_order(Order(customer_id=customer_id, product_id=product_id, date="2023-10-15"))
+
+        db.delete_customer(customer_id, soft=True)
+        self.assertEqual((db.get_all_customers(), db.get_all_orders()), ([], []))
+        # Удаленный клиент не мешает завести нового с тем же email
+        new_id = db.add_customer(Customer(name="Иван Новый", email="ivan@example.com"))
+        self.assertIsNotNone(new_id)
+        self.assertIsNone(db.restore_customer(customer_id)) # восстановить нельзя: email уже занят
+
+        db.delete_customer(new_id, soft=False)
+        self.assertTrue(db.restore_customer(customer_id))
+        self.assertEqual(len(db.get_all_orders()), 1)
+
+        db.delete_customer(customer_id, soft=True)
+        self.assertEqual(db.purge_deleted(), {"orders": 0, "customers": 1, "products": 0})
+        self.assertEqual(db.fetch_query("SELECT COUNT(*) FROM orders"), [(0,)]) # каскад внешнего ключа
+
+
+    def test_batch_operations(self):
+        """Тест пакетного удаления клиентов и изменения цен одной командой"""
+        ivan = db.add_customer(Customer(name="Иван Иванов", email="ivan@example.com"))
+        petr = db.add_customer(Customer(name="Петр Петров", email="petr@example.com"))
+        laptop = db.add_product(Product(name="Ноутбук", price=1000.0))
+        mouse = db.add_product(Product(name="Мышь", price=100.0))
+        order_id = db.add_order(Order(customer_id=ivan, product_id=laptop, date="2023-10-15"))
+        db.add_order(Order(customer_id=petr, product_id=mouse, date="2023-10-16"))
+
+        self.assertEqual(db.delete_customers([ivan]), [order_id]) # ID заказов, пропавших вместе с клиентом
+        self.assertEqual(len(db.get_all_orders()), 1)
+
+        rows = db.reprice_products([laptop, mouse], -10)
+        self.assertEqual(sorted(rows), [(laptop, "Ноутбук", 900.0), (mouse, "Мышь", 90.0)])
+        self.assertEqual(db.get_order(order_id).total, 1000.0) # цена в заказе не меняется
+        self.assertEqual(db.delete_products([laptop, mouse]), 2)
+
+    def test_import_has_no_side_effects(self):
+        """Тест: импорт модуля db не создает файл базы (базу создает init_db при запуске программы)"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            subprocess.run([sys.executable, "-c", "import db"], cwd=tmpdir, check=True,
+                           env=dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(db.__file__))))
+            self.assertEqual(os.listdir(tmpdir), [])
+
+
+if __name__ == "__main__":
+    # Запускаем все тесты
+    unittest.main()
@@ -0,0 +1,79 @@
+import unittest
+import db
+import testutil
+import dedup
+import archive
+import customer_stats
+from models import Customer, Product, Order
+
+
+class TestDedup(testutil.DbTestCase):
+    """Тесты для поиска и объединения похожих клиентов"""
+
+    def setUp(self):
+        super().setUp()
+        self.ivan = db.add_customer(Customer(name="Иван Иванов", phone="89161234567", address="Москва"))
+        self.short = db.add_customer(Customer(name="Иванов И.", phone="+7 (916) 123-45-67",
+                                              email="ivanov@example.ru"))
+        self.namesake = db.add_customer(Customer(name="Иванов Иван", phone="+79990000000"))
+        self.other = db.add_customer(Customer(name="Петров Петр", email="petrov@example.ru"))
+        self.product = db.add_product(Product(name="Ноутбук", price=100))
+
+    def test_scores_and_blocking(self):
+        """Тест оценки пар и ключей блокировки"""
+        self.assertEqual(dedup.name_tokens("Иванов  И."), ("иванов", "и"))
+        self.assertEqual(dedup.name_similarity(("иванов", "и"), ("иван", "иванов")), 1.0)
+        self.assertEqual(dedup.name_similarity(("петров", "петр"), ("иван", "иванов")), 0.0)
+        self.assertGreater(dedup.name_similarity(("иваноф", "иван"), ("иван", "иванов")), 0.75) # опечатка
+
+        a = dedup._record((1, "Иванов И.", "+7 (916) 123-45-67", "", ""))
+        b = dedup._record((2, "Иван Иванов", "89161234567", "", ""))
+        c = dedup._record((3, "Иван Иванов", "+79990000000", "", ""))
+        self.assertIn("phone:9161234567", dedup.blocking_keys(a) & dedup.blocking_keys(b))
+        self.assertEqual(dedup.score(a, b), 1.0)
+        self.assertLess(dedup.score(b, c), dedup.MIN_SCORE) # тезки без общих контактов
+
+        # Блок больше max_block пропускается
+        pairs, skipped = dedup.candidate_pairs([a, b, c], max_block=2)
+        self.assertEqual((pairs, skipped), ({(0, 1)}, 1))
+
+    def test_find_pairs_and_suggestions(self):
+        """Тест поиска пар (в одном и в нескольких процессах) и выбора оставляемого клиента"""
+        pairs = dedup.find_pairs(workers=1)
+        self.assertEqual([(a, b) for _, a, b in pairs], [(self.ivan, self.short)])
+        old_min_pairs = dedup.PARALLEL_MIN_PAIRS
+        dedup.PARALLEL_MIN_PAIRS = 0
+        try:
+            self.assertEqual(dedup.find_pairs(workers=2), pairs)
+        finally:
+            dedup.PARALLEL_MIN_PAIRS = old_min_pairs
+
+        # Оставляется клиент с большим числом заказов
+        db.add_order(Order(customer_id=self.short, product_id=self.product, date="2024-01-10"))
+        self.assertEqual(dedup.suggest_merges(pairs), [(self.short, [self.ivan], 1.0)])
+
+    def test_merge(self):
+        """Тест объединения: заказы (и архивные) переносятся, пустые контакты заполняются, дубль удаляется"""
+        db.add_order(Order(customer_id=self.short, product_id=self.product, date="2023-01-10"))
+        db.add_order(Order(customer_id=self.short, product_id=self.product, date="2024-01-10", quantity=2))
+        db.add_order(Order(customer_id=self.ivan, product_id=self.product, date="2024-02-10"))
+        archive.archive_orders("2024-01-01")
+
+        self.assertEqual(dedup.merge(self.ivan, [self.short]), 2)
+        orders = db.fetch_query(db.with_archive("SELECT customer_id FROM {orders} AS orders"))
+        self.assertEqual(orders, [(self.ivan,)] * 3)
+        self.assertEqual(sorted(row[0] for row in db.get_all_customers()), [self.ivan, self.namesake, self.other])
+        self.assertEqual(db.find_customers(email="ivanov")[0][0], self.ivan) # email дубля перешел к клиенту
+        customer_stats.refresh_stale()
+        self.assertEqual(customer_stats.check(), [])
+        self.assertEqual(db.fetch_query("SELECT order_count, revenue FROM customer_stats WHERE customer_id = ?",
+                                        (self.ivan,)), [(3, 400.0)])
+
+        # Оставляемый клиент должен существовать, заказы при ошибке не переносятся
+        with self.assertRaises(ValueError):
+            dedup.merge(self.short, [self.other])
+        self.assertEqual(dedup.merge(self.ivan, [self.ivan]), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+import unittest
+import gzip
+import json
+import os
+import db
+import testutil
+import journal
+from models import Customer, Product, Order
+
+
+class TestJournal(testutil.DbTestCase):
+    """Тесты для журнала изменений и инкрементальной выгрузки"""
+
+    def setUp(self):
+        super().setUp()
+        self.customer_id = db.add_customer(Customer(name="Иван Иванов", phone="+79161234567"))
+        self.product_id = db.add_product(Product(name="Ноутбук", price=49999.99))
+        self.order_id = db.add_order(Order(customer_id=self.customer_id, product_id=self.product_id,
+                                           date="2023-10-15"))
+
+    def test_incremental_changes(self):
+        """Тест выгрузки всех данных с нуля и затем только последних изменений"""
+        changes = list(journal.iter_changes(0))
+        self.assertEqual([(c["table"], c["id"]) for c in changes],
+                         [("customers", self.customer_id), ("products", self.product_id),
+                          ("orders", self.order_id)])
+        self.assertEqual(changes[2]["row"]["items"],
+                         [{"product_id": self.product_id, "quantity": 1, "unit_price": 49999.99}])
+        since = changes[-1]["seq"]
+        self.assertEqual(since, journal.current_seq())
+
+        # Несколько изменений одной записи выдаются одной строкой с ее текущим состоянием
+        db.update_product(Product(id=self.product_id, name="Ноутбук", price=45000))
+        db.update_product(Product(id=self.product_id, name="Ноутбук Pro", price=45000))
+        db.delete_order(self.order_id, soft=False)
+        changes = list(journal.iter_changes(since))
+        self.assertEqual([(c["table"], c["op"]) for c in changes], [("products", "update"), ("orders", "delete")])
+        self.assertEqual(changes[0]["row"]["name"], "Ноутбук Pro")
+        self.assertIsNone(changes[1]["row"])
+        self.assertEqual(list(journal.iter_changes(since, limit=1)), changes[:1])
+
+    def test_export_and_prune(self):
+        """Тест выгрузки в сжатый файл и очистки уже полученной части журнала"""
+        filepath = os.path.join(self.tmpdir, "changes.jsonl.gz")
+        count, last_seq = journal.export_changes(filepath)
+        with gzip.open(filepath, "rt", encoding="utf-8") as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEqual((count, lines[0]["row"]["name"]), (3, "Иван Иванов"))
+
+        self.assertEqual(journal.prune(last_seq), journal.current_seq())
+        db.delete_customer(self.customer_id)
+        self.assertEqual([c["op"] for c in journal.iter_changes(last_seq)], ["update"])
+        with self.assertRaises(journal.JournalPruned):
+            list(journal.iter_changes(0))
+
+
+if __name__ == "__main__":
+    # Запускаем все тесты
+    unittest.main()
@@ -0,0 +1,61 @@
+import unittest
+from unittest import mock
+import matplotlib.pyplot as plt
+import db
+import testutil
+import analysis
+import memprof
+from models import Customer, Product, Order
+
+
+class TestMemprof(unittest.TestCase):
+    """Тесты для измерения памяти операций"""
+
+    def setUp(self):
+        self.was_enabled = memprof.enabled()
+        memprof.enable()
+        memprof.reset()
+
+    def tearDown(self):
+        memprof.reset()
+        if not self.was_enabled:
+            memprof.disable()
+
+    def test_peak_and_retained(self):
+        """Тест пика временной памяти, остатка и вложенных измерений"""
+        kept = []
+
+        @memprof.profiled()
+        def inner():
+            temporary = bytearray(2 * 1024 * 1024)
+            kept.append(bytearray(512 * 1024))
+            return len(temporary)
+
+        with memprof.measure("outer"):
+            inner()
+        stats = {item["name"]: item for item in memprof.stats()}
+        for name in ("inner", "outer"):
+            self.assertGreater(stats[name]["peak"], 2 * 1024 * 1024) # пик вложенной операции виден и во внешней
+            self.assertGreater(stats[name]["retained"], 500 * 1024)
+            self.assertLess(stats[name]["retained"], 1024 * 1024)
+
+        memprof.disable()
+        inner() # выключено - не измеряется
+        self.assertEqual({item["name"]: item["calls"] for item in memprof.stats()}, {"inner": 1, "outer": 1})
+
+    def test_report_closes_figure_on_error(self):
+        """Тест: фигура отчета закрывается, даже если сохранение файла завершилось ошибкой"""
+        with testutil.temp_db():
+            customer_id = db.add_customer(Customer(name="Иван Иванов", phone="+79161234567"))
+            product_id = db.add_product(Product(name="Ноутбук", price=49999.99))
+            db.add_order(Order(customer_id=customer_id, product_id=product_id, date="2023-10-15"))
+            with mock.patch.object(analysis.plt, "savefig", side_effect=OSError("Диск заполнен")):
+                with self.assertRaises(OSError):
+                    analysis.generate_sales_report()
+            self.assertEqual(plt.get_fignums(), [])
+            self.assertEqual(memprof.stats()[0]["name"], "generate_sales_report")
+
+
+if __name__ == "__main__":
+    # Запускаем все тесты
+    unittest.main()
@@ -0,0 +1,135 @@
+import unittest
+from unittest import mock
+import db
+import testutil
+import analysis
+import archive
+import gui
+from models import Customer, Product, Order
+
+
+class TestPriceHistory(testutil.DbTestCase):
+    """Тесты для истории цен товаров и выручки по ценам на дату заказа"""
+
+    init_db = False # База создается в каждом тесте (в том числе из файла старой схемы)
+
+    def init(self):
+        db.init_db()
+        self.customer_id = db.add_customer(Customer(name="Иван Иванов", phone="+79161234567"))
+        self.product_id = db.add_product(Product(name="Ноутбук", price=100))
+        today = db.fetch_query(f"SELECT {db._TODAY_SQL}")[0][0] # "сегодня" базы - по UTC
+        self.today, self.month_ago = db.day_text(today), db.day_text(today - 31)
+
+    def test_history_on_price_changes(self):
+        """Тест записи истории при изменении цены: форма, изменение на процент, импорт; миграция"""
+        before_history = db.MIGRATIONS[:db.MIGRATIONS.index(db._migration_price_history)]
+        with mock.patch.object(db, "MIGRATIONS", before_history):
+            self.init()
+        db.close_connections()
+        db.init_db() # Миграция: текущая цена становится первой ценой в истории
+        self.assertEqual(db.get_price_history(self.product_id), [("1970-01-01", None, 100.0)])
+
+        product = db.get_product(self.product_id)
+        product.name = "Ноутбук 15" # Цена не менялась - истории не прибавляется
+        db.update_product(product)
+        product.price = 120
+        db.update_product(product)
+        db.reprice_products([self.product_id], 10) # В тот же день - заменяет цену дня
+        db.upsert_products([["Ноутбук 15", "132"]]) # Та же цена - без изменений
+        self.assertEqual(db.get_price_history(self.product_id),
+                         [("1970-01-01", self.today, 100.0), (self.today, None, 132.0)])
+        self.assertEqual(db.price_at(self.product_id, self.month_ago), 100.0)
+        self.assertEqual(db.price_at(self.product_id, self.today), 132.0)
+        self.assertIsNone(db.price_at(999, self.today))
+
+        db.delete_product(self.product_id, soft=False) # История удаляется вместе с товаром
+        self.assertEqual(db.fetch_query("SELECT COUNT(*) FROM price_history"), [(0,)])
+
+    def test_set_price_and_order_prices(self):
+        """Тест цены с прошлой даты и цены позиций заказов без указанной цены"""
+        self.init()
+        week_ago = db.day_text(db.to_day(self.today) - 7)
+        self.assertTrue(db.set_product_price(self.product_id, 90, week_ago))
+        self.assertTrue(db.set_product_price(self.product_id, 80, self.month_ago)) # между прежними периодами
+        self.assertEqual(db.get_price_history(self.product_id), [("1970-01-01", self.month_ago, 100.0),
+                                                                (self.month_ago, week_ago, 80.0),
+                                                                (week_ago, None, 90.0)])
+        self.assertEqual(db.get_product(self.product_id).price, 90.0) # последняя цена - текущая
+        with self.assertRaises(ValueError):
+            db.set_product_price(self.product_id, 70, db.day_text(db.to_day(self.today) + 1))
+
+        order_id = db.add_order(Order(customer_id=self.customer_id, product_id=self.product_id, date=self.month_ago))
+        db.import_orders([(self.customer_id, self.product_id, "2020-01-01", 2),
+                          (self.customer_id, self.product_id, week_ago, 1),
+                          (self.customer_id, self.product_id, week_ago, 1, 50)])
+        self.assertEqual(db.get_order(order_id).items[0].unit_price, 80.0)
+        self.assertEqual(db.fetch_query("SELECT unit_price FROM order_items WHERE order_id > ? ORDER BY order_id",
+                                        (order_id,)), [(100.0,), (90.0,), (50.0,)])
+
+    def test_order_dialog_uses_price_at_order_date(self):
+        """Тест формы заказа: новая позиция показывается и сохраняется по цене на дату заказа"""
+        self.init()
+        db.set_product_price(self.product_id, 80, self.month_ago)
+        product = db.get_product(self.product_id)
+        product.price = 120
+        db.update_product(product)
+
+        dialog = mock.Mock(items=[], product_id_map={"Ноутбук": self.product_id},
+                           product_by_id={self.product_id: ("Ноутбук", 120.0)})
+        dialog.product_var.get.return_value = "Ноутбук"
+        dialog.quantity_spinbox.get.return_value = "2"
+        dialog.date_entry.get.return_value = self.month_ago
+        gui.EditOrderDialog.add_item(dialog)
+        self.assertIsNone(dialog.items[0].unit_price) # цену подставит база при сохранении
+        self.assertEqual(gui.EditOrderDialog.item_price(dialog, dialog.items[0]), 80.0)
+        dialog.date_entry.get.return_value = self.today # дату изменили - показанная цена пересчитана
+        self.assertEqual(gui.EditOrderDialog.item_price(dialog, dialog.items[0]), 120.0)
+        dialog.date_entry.get.return_value = "2024-13"
+        self.assertEqual(gui.EditOrderDialog.item_price(dialog, dialog.items[0]), 120.0)
+
+        order_id = db.add_order(Order(customer_id=self.customer_id, date=self.month_ago, items=dialog.items))
+        self.assertEqual(db.get_order(order_id).total, 160.0)
+
+    def test_report_refresh_after_past_price(self):
+        """Тест: отчет перестраивается после цены с прошлой даты, которая пишется только в историю цен"""
+        self.init()
+        db.set_product_price(self.product_id, 80, db.day_text(db.to_day(self.today) - 7))
+        app = mock.Mock(report_versions={}, data_version=None)
+        app.report_charts.current = "revenue"
+        gui.App.refresh_report(app)
+        self.addCleanup(app.data_version.close)
+        task, done = app.run_in_background.call_args.args[1:]
+        done(task())
+
+        app.run_in_background.reset_mock()
+        gui.App.refresh_report(app) # база не менялась - отчет не перестраивается
+        app.run_in_background.assert_not_called()
+        db.set_product_price(self.product_id, 70, self.month_ago) # не последняя цена - журнал не меняется
+        gui.App.refresh_report(app)
+        app.run_in_background.assert_called_once()
+
+    def test_revenue_report(self):
+        """Тест выручки по месяцам по ценам продажи и прайса, в том числе с архивом; план запроса"""
+        self.init()
+        db.set_product_price(self.product_id, 80, self.month_ago)
+        db.add_order(Order(customer_id=self.customer_id, product_id=self.product_id, date=self.month_ago))
+        db.import_orders([(self.customer_id, self.product_id, self.today, 2, 60)]) # скидка 20 с единицы
+        archive.archive_orders(self.today) # Заказ прошлого месяца уходит в архив
+        data = analysis.report_data("revenue")
+        self.assertEqual([row[1:] for row in data], [(80.0, 80.0), (120.0, 160.0)])
+        self.assertEqual([row[0] for row in data], [self.month_ago[:7], self.today[:7]])
+
+        charts = analysis.ReportCharts()
+        charts.show("revenue")
+        self.assertTrue(charts.update("revenue", data))
+        self.assertEqual(list(charts.revenue_lines[1].get_ydata()), [80.0, 160.0])
+
+        # Цена на дату - поиск по ключу истории, а не перебор ее строк
+        plan = db.fetch_query(f"EXPLAIN QUERY PLAN SELECT {db.PRICE_AT_ORDER_DATE.format(product='?')} "
+                              f"FROM orders", (1,))
+        self.assertIn("SEARCH price_history USING PRIMARY KEY (product_id=? AND valid_from<?)",
+                      [row[3] for row in plan])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+import unittest
+import random
+import db
+import testutil
+import analysis
+import archive
+import topk
+from models import Customer, Product, Order
+
+
+class TestTopK(testutil.DbTestCase):
+    """Тесты для счетчиков популярности товаров"""
+
+    def setUp(self):
+        super().setUp()
+        self.customers = [db.add_customer(Customer(name=f"Клиент {i}", phone=f"+7916{i:07d}")) for i in range(5)]
+        self.products = [db.add_product(Product(name=f"Товар {i}", price=10 + i)) for i in range(30)]
+        self.rnd = random.Random(1)
+        self.orders = [self.add_order(f"2024-01-{i % 28 + 1:02d}") for i in range(100)]
+
+    def add_order(self, day="2024-02-01"):
+        # Популярность товаров неравномерна: первые товары заказывают намного чаще
+        product = self.products[min(int(self.rnd.expovariate(0.25)), len(self.products) - 1)]
+        return db.add_order(Order(customer_id=self.rnd.choice(self.customers), product_id=product, date=day))
+
+    def exact(self):
+        return dict(analysis.top_products(len(self.products)))
+
+    def assert_bounds(self, limit=5):
+        """Каждая оценка не меньше точного значения и завышена не больше чем на error"""
+        exact = self.exact()
+        rows = topk.top_products(limit)
+        self.assertEqual(len(rows), min(limit, len(exact)))
+        for name, count, error in rows:
+            self.assertLessEqual(exact[name], count)
+            self.assertGreaterEqual(exact[name], count - error)
+        return rows
+
+    def test_disabled_by_default(self):
+        """Тест выключенных счетчиков: отчет строится точным запросом"""
+        self.assertIsNone(topk.top_products(5))
+        self.assertEqual(analysis.report_data("top_products"), analysis.top_products(analysis.TOP_LIMIT))
+        self.assertEqual(db.fetch_query("SELECT COUNT(*) FROM topk_counters"), [(0,)])
+
+    def test_streaming_updates_within_bound(self):
+        """Тест обновления счетчиков при вставке заказов формой и импортом, сверх числа счетчиков"""
+        topk.enable(5)
+        rows = topk.top_products(5)
+        self.assertEqual(topk.error_bound(rows), 0) # сразу после пересчета значения точные
+        self.assertEqual(sorted(count for _, count, _ in rows), sorted(self.exact().values())[-5:])
+        self.assertIsNone(topk.top_products(6)) # больше, чем отслеживается
+
+        for _ in range(200):
+            self.add_order()
+        result = db.import_orders([(self.customers[0], self.products[-1], "2024-03-01")] * 40)
+        self.assertEqual(result["imported"], 40)
+        rows = self.assert_bounds()
+        self.assertIn("Товар 29", [name for name, _, _ in rows])
+        self.assertLessEqual(db.fetch_query("SELECT COUNT(*) FROM topk_counters")[0][0], 5)
+        self.assertIn("завышение", analysis.accuracy_note(rows))
+
+    def test_deletes_and_stale_counters(self):
+        """Тест удаления заказов (вычитается сразу) и восстановления/удаления клиента (пересчет)"""
+        topk.enable(10)
+        self.assertEqual(analysis.report_data("top_products"), topk.top_products(analysis.TOP_LIMIT))
+        db.delete_orders(self.orders[:30])
+        self.assert_bounds()
+        db.delete_order(self.orders[30], soft=False)
+        self.assert_bounds()
+        self.assertEqual(db.fetch_query("SELECT stale FROM topk_state"), [(0,)])
+
+        db.restore_order(self.orders[0])
+        self.assertEqual(db.fetch_query("SELECT stale FROM topk_state"), [(1,)])
+        self.assertEqual(topk.error_bound(self.assert_bounds()), 0) # пересчитано перед ответом
+        db.delete_customer(self.customers[0])
+        self.assertEqual(db.fetch_query("SELECT stale FROM topk_state"), [(1,)])
+        self.assert_bounds()
+
+    def test_archive_and_disable(self):
+        """Тест переноса в архив (счетчики не меняются) и выключения счетчиков"""
+        topk.enable(10)
+        before = topk.top_products(10)
+        archive.archive_orders("2024-01-15")
+        self.assertEqual(topk.top_products(10), before)
+        topk.rebuild()
+        self.assertEqual(sorted(topk.top_products(10)), sorted(before))
+        topk.disable()
+        self.add_order()
+        self.assertIsNone(topk.top_products(5))
+        self.assertEqual(db.fetch_query("SELECT COUNT(*) FROM topk_counters"), [(0,)])
+
+
+if __name__ == "__main__":
+    unittest.main()
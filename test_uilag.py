@@ -0,0 +1,107 @@
+import unittest
+import os
+import csv
+import json
+import tempfile
+import time
+import uilag
+
+
+class FakeWindow:
+    """Окно без дисплея: запоминает запланированный пульс, тест вызывает его сам"""
+
+    def __init__(self):
+        self.pending = None
+        self.cancelled = []
+
+    def after(self, ms, func, *args):
+        self.pending = (func, args)
+        return f"after#{ms}"
+
+    def after_cancel(self, job):
+        self.cancelled.append(job)
+
+    def beat(self):
+        func, args = self.pending
+        func(*args)
+
+
+class TestUilag(unittest.TestCase):
+    """Тесты для измерения зависаний окна по обработчикам"""
+
+    def setUp(self):
+        self.window = FakeWindow()
+        uilag.reset()
+        uilag.start(self.window, interval_ms=1)
+
+    def tearDown(self):
+        uilag.stop()
+        uilag.reset()
+
+    def stalls(self):
+        return {item["name"]: item["stalls"] for item in uilag.stats()}
+
+    def test_stall_attribution(self):
+        """Тест: зависание приписывается внешнему обработчику, без обработчика - отдельной строке"""
+        @uilag.tracked("load_orders")
+        def load_orders():
+            time.sleep(0.12)
+
+        @uilag.tracked()
+        def apply_order_filters():
+            load_orders()
+
+        load_orders()
+        self.window.beat()
+        apply_order_filters()
+        self.window.beat()
+        self.window.beat() # пульс вовремя - не зависание
+        time.sleep(0.12)
+        self.window.beat()
+        self.assertEqual(self.stalls(), {"load_orders": 1, "apply_order_filters": 1, uilag.IDLE: 1})
+        self.assertGreaterEqual(uilag.stats()[0]["max"], 110)
+        self.assertEqual(uilag.overall()["beats"], 4)
+
+        uilag.stop()
+        self.assertEqual(self.window.cancelled, ["after#1"])
+        load_orders() # пульс выключен - обработчики не отмечаются
+        self.assertEqual(uilag._busy, {})
+
+    def test_running_handler(self):
+        """Тест обработчика, который сам обрабатывает события окна (модальный диалог, update())"""
+        with uilag.handler("import_order_csv"):
+            time.sleep(0.12) # чтение файла без обработки событий
+            self.window.beat() # окно обновилось во время обработчика
+            self.window.beat()
+        # Время до последнего пульса уже учтено, поэтому следующее зависание обработчику не приписывается
+        time.sleep(0.12)
+        self.window.beat()
+        self.assertEqual(self.stalls(), {"import_order_csv": 1, uilag.IDLE: 1})
+
+    def test_percentiles_and_export(self):
+        """Тест процентилей, порядка обработчиков и выгрузки в CSV и JSON"""
+        for ms in range(1, 101):
+            uilag._record("sort_treeview", ms / 1000)
+        uilag._record("load_orders", 0.5)
+        stats = uilag.stats()
+        self.assertEqual([item["name"] for item in stats], ["sort_treeview", "load_orders"])
+        self.assertAlmostEqual(stats[0]["total"], 5050)
+        self.assertEqual([round(stats[0][key]) for key in ("p50", "p90", "p99", "max")], [50, 90, 99, 100])
+        self.assertIn("sort_treeview", uilag.format_stats())
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            csv_path, json_path = os.path.join(tmpdir, "lag.csv"), os.path.join(tmpdir, "lag.json")
+            uilag.export(csv_path)
+            uilag.export(json_path)
+            with open(csv_path, newline="", encoding="utf-8") as f:
+                rows = list(csv.reader(f))
+            with open(json_path, encoding="utf-8") as f:
+                data = json.load(f)
+        self.assertEqual(rows[0][0], "Обработчик")
+        self.assertEqual(rows[1][:3], ["sort_treeview", "100", "5050.0"])
+        self.assertEqual(data["handlers"][1]["p99"], 500)
+        self.assertEqual(data["stall_ms"], uilag.STALL_MS)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+import db
+import testutil
+import validation
+
+
+class TestValidation(unittest.TestCase):
+    """Тесты для общей проверки данных форм и импорта"""
+
+    def test_fields(self):
+        """Тест проверки отдельных полей"""
+        self.assertEqual(validation.canonical_phone(" 8 (916) 123-45-67 "), "+79161234567")
+        self.assertEqual(validation.canonical_phone("+79161234567"), "+79161234567")
+        self.assertEqual(validation.canonical_phone(""), "")
+        for phone in ("123", "+7 916 abc 45 67", "+" + "1" * 16):
+            with self.assertRaises(ValueError):
+                validation.canonical_phone(phone)
+        self.assertTrue(validation.is_valid_email(""))
+        self.assertTrue(validation.is_valid_email("ivanov@example.ru"))
+        self.assertFalse(validation.is_valid_email("ivanov@example"))
+        self.assertEqual(validation.parse_price("199.99"), 199.99)
+        for price in ("0", "-5", "abc", "nan", "inf"):
+            with self.assertRaises(ValueError):
+                validation.parse_price(price)
+        self.assertEqual(validation.parse_price("0", allow_zero=True), 0.0) # импорт допускает нулевую цену
+        for price in ("-5", "nan"):
+            with self.assertRaises(ValueError):
+                validation.parse_price(price, allow_zero=True)
+        self.assertEqual(validation.parse_date(" 2024-02-29 "), "2024-02-29")
+        for day in ("2023-02-29", "2024-1-5", "20240105", "15.01.2024"):
+            with self.assertRaises(ValueError):
+                validation.parse_date(day)
+
+    def test_batch_error_vectors(self):
+        """Тест проверки пачки: списки значений и ошибок той же длины, что и пачка"""
+        values, errors = validation.check_orders([
+            ["1", "2", "2024-01-10"],
+            ["1", "2", "2024-01-10", "3", "99.5"],
+            ["1"],
+            ["x", "2", "2024-01-10"],
+            ["1", "2", "2024-01-10", "0"],
+            ["1", "2", "2024-13-10"],
+        ])
+        self.assertEqual(values[:2], [(1, 2, "2024-01-10", 1, None), (1, 2, "2024-01-10", 3, 99.5)])
+        self.assertEqual(values[2:], [None] * 4)
+        self.assertEqual(errors[:2], [None, None])
+        self.assertTrue(all(errors[2:]))
+
+        values, errors = validation.check_customers([
+            [" Иван Иванов ", "8 916 123 45 67", "", "Москва"],
+            ["Петр Петров", "", "petr@", ""],
+            ["", "+79160000000", "", ""],
+        ])
+        self.assertEqual(values[0], ("Иван Иванов", "+79161234567", "", "Москва"))
+        self.assertEqual(errors, [None, "некорректный email", "нужны ФИО и email или телефон"])
+
+    def test_importers_use_shared_rules(self):
+        """Тест импорта: ошибочные строки пропускаются с номером строки, телефон сохраняется в едином виде"""
+        with testutil.temp_db():
+            result = db.upsert_customers([["Иван Иванов", "8 (916) 123-45-67", "", ""],
+                                          ["Петр Петров", "", "не email", ""]], batch_size=1)
+            self.assertEqual((result["inserted"], result["errors"]), (1, [(3, "некорректный email")]))
+            self.assertEqual(db.get_all_customers()[0][2], "+79161234567")
+
+            result = db.upsert_products([["Ноутбук", "abc"], ["Мышь", "5"]])
+            self.assertEqual((result["inserted"], result["errors"]), (1, [(2, "некорректная цена")]))
+
+            result = db.import_orders([["1", "1", "2024-02-30"], ["1", "1", "2024-02-29"]])
+            self.assertEqual((result["imported"], [line for line, _ in result["errors"]]), (1, [2]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,44 @@
+"""
+Общая подготовка тестов: каждый тест работает со своей временной базой, чтобы не трогать store.db
+"""
+import contextlib
+import os
+import tempfile
+import unittest
+import db
+
+
+@contextlib.contextmanager
+def temp_db(init=True):
+    """
+    Временно переключает модуль db на базу test.db в новой временной папке и возвращает путь к папке.
+    init=False - файл базы не создается (тест сам готовит старую схему и вызывает db.init_db)
+    """
+    old_db_name = db.DB_NAME
+    with tempfile.TemporaryDirectory() as tmpdir:
+        db.DB_NAME = os.path.join(tmpdir, "test.db")
+        try:
+            if init:
+                db.init_db()
+            yield tmpdir
+        finally:
+            db.close_connections() # Закрываем долгоживущие соединения перед удалением файла базы
+            db.DB_NAME = old_db_name
+
+
+class TempDbMixin:
+    """
+    Временная база (temp_db) на каждый тест; путь к её папке - self.tmpdir.
+    Подклассы, которые заполняют базу в своем setUp, сначала вызывают super().setUp()
+    """
+    init_db = True # False - база создается в самом тесте
+
+    def setUp(self):
+        super().setUp()
+        stack = contextlib.ExitStack()
+        self.addCleanup(stack.close) # Выполняется после tearDown подкласса
+        self.tmpdir = stack.enter_context(temp_db(self.init_db))
+
+
+class DbTestCase(TempDbMixin, unittest.TestCase):
+    """TestCase с временной базой на каждый тест"""
@@ -0,0 +1,91 @@
+"""
+Мгновенный топ товаров по счетчикам популярности
+
+    python main.py topk --enable             # включить счетчики (сразу пересчитываются по таблицам)
+    python main.py topk --enable --capacity 500
+    python main.py topk --rebuild            # пересчитать заново
+    python main.py topk --disable
+    python main.py topk                      # показать топ по счетчикам и точность
+
+Точный топ товаров (analysis.top_products) группирует все позиции всех заказов, и на миллионах заказов
+это секунды. Счетчики хранят оценки числа позиций для capacity самых популярных товаров в таблице
+topk_counters и обновляются триггерами при каждой вставке позиций (алгоритм Space-Saving), поэтому
+топ любых N <= capacity товаров читается из нескольких строк. Счетчики хранятся в базе и переживают
+перезапуск программы; обновляют их все процессы, которые пишут в базу.
+
+Точность. Для каждого товара в топе точное число позиций лежит между count - error и count. Товар,
+которого нет среди счетчиков, встречается не чаще самого маленького счетчика, а error любого счетчика
+не больше (позиций, добавленных после пересчета) / capacity. Пересчет по таблицам дает точные значения
+(error = 0). После изменений, которые алгоритм не учитывает (восстановление заказа, удаление или
+восстановление клиента), счетчики помечаются устаревшими и пересчитываются при следующем запросе.
+"""
+import sqlite3
+import db
+
+# Сколько товаров отслеживают счетчики по умолчанию
+CAPACITY = 100
+
+
+def capacity(conn=None):
+    """Число отслеживаемых товаров (0 - счетчики выключены)"""
+    return (conn or db.shared_connection()).execute("SELECT capacity FROM topk_state").fetchone()[0]
+
+
+def rebuild():
+    """Пересчитывает счетчики по таблицам (вместе с архивом заказов): точные значения для самых популярных товаров"""
+    conn = db.shared_connection()
+    # Источники выбираются до начала транзакции: архив подключается только вне ее
+    query = db.with_archive(f"""SELECT orders.product_id, COUNT(*) FROM {{order_lines}} AS orders
+                                WHERE {db.ACTIVE_ORDERS}
+                                GROUP BY orders.product_id
+                                ORDER BY COUNT(*) DESC
+                                LIMIT ?""", conn=conn)
+    conn.execute("BEGIN IMMEDIATE") # Позиции, добавленные во время пересчета, дождутся его окончания
+    with conn:
+        conn.execute("DELETE FROM topk_counters")
+        conn.execute(f"INSERT INTO topk_counters (product_id, count) {query}", (capacity(conn),))
+        conn.execute("UPDATE topk_state SET stale = 0")
+
+
+def enable(size=CAPACITY):
+    """Включает счетчики для size товаров и заполняет их по таблицам"""
+    if size <= 0:
+        raise ValueError("Число отслеживаемых товаров должно быть положительным")
+    with db.shared_connection() as conn:
+        conn.execute("UPDATE topk_state SET capacity = ?", (size,))
+    rebuild()
+
+
+def disable():
+    """Выключает счетчики: триггеры больше их не обновляют"""
+    with db.shared_connection() as conn:
+        conn.execute("UPDATE topk_state SET capacity = 0, stale = 0")
+        conn.execute("DELETE FROM topk_counters")
+
+
+def top_products(limit=10):
+    """
+    Топ товаров по счетчикам: список (название, оценка числа заказов, возможное завышение оценки).
+    None, если счетчики выключены или limit больше числа отслеживаемых товаров (тогда нужен точный запрос).
+    Устаревшие счетчики сначала пересчитываются.
+    """
+    conn = db.shared_connection()
+    try:
+        size, stale = conn.execute("SELECT capacity, stale FROM topk_state").fetchone()
+    except sqlite3.OperationalError: # Схема базы еще не создана (init_db не вызывался)
+        return None
+    if not size or limit > size:
+        return None
+    if stale:
+        rebuild()
+    return conn.execute("""SELECT products.name, topk_counters.count, topk_counters.error
+                           FROM topk_counters
+                           JOIN products ON products.id = topk_counters.product_id
+                           WHERE topk_counters.count > 0
+                           ORDER BY topk_counters.count DESC
+                           LIMIT ?""", (limit,)).fetchall()
+
+
+def error_bound(rows):
+    """Наибольшее возможное завышение числа заказов среди строк top_products (0 - значения точные)"""
+    return max((error for _, _, error in rows), default=0)
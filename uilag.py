@@ -0,0 +1,191 @@
+"""
+Отзывчивость окна: насколько и из-за каких обработчиков замирает главный цикл Tk
+
+Пульс - обратный вызов after(), который каждые HEARTBEAT_MS миллисекунд планирует себя заново.
+Пока главный поток занят (загрузка списка, сортировка, импорт в обработчике кнопки), пульс не
+срабатывает; опоздание пульса и есть время, на которое окно переставало отвечать. Опоздание от
+STALL_MS считается зависанием и приписывается обработчику, который дольше всех выполнялся с
+предыдущего пульса (или выполняется сейчас, если обработчик сам крутит события окна); если
+дольше было время вне помеченных обработчиков (отрисовка, другие вызовы after), - строке IDLE.
+
+Выключено по умолчанию. Включается переменной окружения STORE_UILAG=1 или в окне
+"База данных" - "Отзывчивость окна". Обработчики помечаются так:
+
+    @uilag.tracked()
+    def load_orders(self): ...
+
+    with uilag.handler("load_orders"): # вставка строк списка в обратном вызове after()
+        ...
+"""
+import collections
+import csv
+import functools
+import json
+import time
+from loadtest import percentile
+
+HEARTBEAT_MS = 50  # Период пульса
+STALL_MS = 100  # Опоздание пульса, начиная с которого окно считается зависшим (заметно на глаз)
+MAX_SAMPLES = 1000  # Сколько последних значений хранить для процентилей (на обработчик)
+IDLE = "(вне обработчиков)"  # Зависания, во время которых помеченные обработчики не выполнялись
+
+_widget = None  # Окно, в котором работает пульс
+_job = None  # Запланированный вызов пульса (для after_cancel)
+_expected = 0.0  # Когда пульс должен сработать
+_last_beat = 0.0
+_stack = []  # Помеченные обработчики, выполняющиеся сейчас (вложенные вызовы)
+_busy = collections.Counter()  # обработчик -> секунд работы с предыдущего пульса
+_lags = collections.deque(maxlen=MAX_SAMPLES)  # опоздания всех пульсов, с
+_stalls = {}  # обработчик -> словарь счетчиков зависаний
+
+
+def running():
+    """Работает ли пульс"""
+    return _job is not None
+
+
+def start(widget, interval_ms=None):
+    """Запускает пульс в главном цикле окна widget (обычно App)"""
+    global _widget, _last_beat
+    stop()
+    _widget = widget
+    _last_beat = time.perf_counter()
+    _schedule(interval_ms or HEARTBEAT_MS)
+
+
+def stop():
+    """Останавливает пульс; собранная статистика сохраняется"""
+    global _job
+    if _job is not None:
+        try:
+            _widget.after_cancel(_job)
+        except Exception: # Окно уже закрыто
+            pass
+        _job = None
+
+
+def reset():
+    """Очищает собранную статистику"""
+    _busy.clear()
+    _lags.clear()
+    _stalls.clear()
+
+
+def _schedule(interval_ms):
+    global _job, _expected
+    _expected = time.perf_counter() + interval_ms / 1000
+    _job = _widget.after(interval_ms, _beat, interval_ms)
+
+
+def _beat(interval_ms):
+    global _last_beat
+    now = time.perf_counter()
+    lag = max(0.0, now - _expected)
+    _lags.append(lag)
+    if lag >= STALL_MS / 1000:
+        # Выполняющийся сейчас обработчик (он крутит события сам, например, через update()),
+        # иначе - тот, что дольше всех занимал окно с прошлого пульса (или время вне обработчиков)
+        if _stack:
+            name = _stack[0][0]
+        else:
+            candidates = dict(_busy)
+            candidates[IDLE] = now - _last_beat - sum(_busy.values())
+            name = max(candidates, key=candidates.get)
+        _record(name, lag)
+    _busy.clear()
+    _last_beat = now
+    _schedule(interval_ms)
+
+
+def _record(name, lag):
+    item = _stalls.setdefault(name, {"stalls": 0, "total": 0.0, "samples": collections.deque(maxlen=MAX_SAMPLES)})
+    item["stalls"] += 1
+    item["total"] += lag
+    item["samples"].append(lag)
+
+
+class handler:
+    """
+    Контекстный менеджер: отмечает, что главный поток выполняет обработчик name.
+    При вложенных вызовах зависание приписывается внешнему обработчику (тому, что вызвал пользователь).
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        _stack.append((self.name, time.perf_counter()))
+        return self
+
+    def __exit__(self, *exc_info):
+        name, started = _stack.pop()
+        if not _stack:
+            # Учитываем только время после последнего пульса: пульсы во время модальных диалогов
+            # обработчика уже показали, что окно отвечало
+            _busy[name] += time.perf_counter() - max(started, _last_beat)
+        return False
+
+
+def tracked(name=None):
+    """Декоратор: отмечает каждый вызов функции как обработчик (имя по умолчанию - имя функции)"""
+    def decorator(func):
+        label = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _job is None: # Пульс выключен - без накладных расходов
+                return func(*args, **kwargs)
+            with handler(label):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _summary(values):
+    values = sorted(values)
+    return {"p50": percentile(values, 0.50) * 1000, "p90": percentile(values, 0.90) * 1000,
+            "p99": percentile(values, 0.99) * 1000, "max": (values[-1] if values else 0.0) * 1000}
+
+
+def overall():
+    """Опоздания всех пульсов: словарь beats, p50, p90, p99, max (мс)"""
+    return dict(_summary(_lags), beats=len(_lags))
+
+
+def stats():
+    """
+    Зависания по обработчикам, сначала самые долгие в сумме: список словарей
+    name, stalls, total, p50, p90, p99, max (время в мс; процентили - по последним MAX_SAMPLES)
+    """
+    rows = [dict(_summary(item["samples"]), name=name, stalls=item["stalls"], total=item["total"] * 1000)
+            for name, item in _stalls.items()]
+    return sorted(rows, key=lambda row: row["total"], reverse=True)
+
+
+FIELDS = ("name", "stalls", "total", "p50", "p90", "p99", "max")
+HEADINGS = ("Обработчик", "Зависаний", "Всего, мс", "p50, мс", "p90, мс", "p99, мс", "max, мс")
+
+
+def format_stats():
+    """Текстовая таблица зависаний и строка об опозданиях всех пульсов"""
+    rows = [(s["name"], s["stalls"]) + tuple(f"{s[key]:.0f}" for key in FIELDS[2:]) for s in stats()]
+    widths = [max(len(str(x)) for x in column) for column in zip(HEADINGS, *rows)]
+    lines = ["  ".join(str(x).ljust(width) for x, width in zip(row, widths)) for row in [HEADINGS] + rows]
+    total = overall()
+    lines.append(f"Пульсов: {total['beats']}, опоздание p50 {total['p50']:.0f} мс, p99 {total['p99']:.0f} мс, "
+                 f"max {total['max']:.0f} мс")
+    return "\n".join(lines)
+
+
+def export(path):
+    """Сохраняет статистику в файл: .json - вместе с опозданиями всех пульсов, иначе - таблица CSV"""
+    if path.endswith(".json"):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"heartbeat_ms": HEARTBEAT_MS, "stall_ms": STALL_MS, "overall": overall(),
+                       "handlers": stats()}, f, ensure_ascii=False, indent=2)
+        return
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(HEADINGS)
+        writer.writerows([s[key] if key in ("name", "stalls") else round(s[key], 1) for key in FIELDS]
+                         for s in stats())
@@ -0,0 +1,202 @@
+"""
+Проверка и нормализация данных клиентов, товаров и заказов
+
+Одни и те же правила применяются в формах редактирования и при импорте (CSV, NumPy), поэтому
+строка, которую не примет форма, не попадет в базу и через импорт. Функции check_* проверяют пачку
+строк целиком и возвращают два списка той же длины: нормализованные значения (None у ошибочных строк)
+и ошибки (None у корректных строк). Шаблоны компилируются один раз при загрузке модуля, а проверка даты
+выполняется один раз на каждое различное значение в пачке - в заказах даты повторяются постоянно.
+
+Функции для отдельных полей (parse_price, parse_date и другие) возвращают нормализованное значение
+или вызывают ValueError с текстом ошибки - ими пользуются формы.
+"""
+import re
+import math
+import itertools
+from datetime import date
+
+# Шаблон email: имя@домен.зона
+EMAIL_RE = re.compile(r"[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}")
+# Телефон может содержать только цифры, пробелы, скобки, дефисы и + в начале
+PHONE_RE = re.compile(r"\+?[0-9 ()\-]+")
+DATE_RE = re.compile(r"[0-9]{4}-[0-9]{2}-[0-9]{2}")
+_NON_DIGITS = re.compile(r"[^0-9]")
+
+# Допустимое число цифр в телефоне (с кодом страны; по E.164 не больше 15)
+PHONE_DIGITS = (10, 15)
+
+
+def normalize_phone(phone):
+    """Приводит телефон к виду из одних цифр: '+7 (916) 123-45-67' и '89161234567' -> '79161234567'"""
+    digits = _NON_DIGITS.sub("", phone or "")
+    if len(digits) == 11 and digits.startswith("8"):
+        digits = "7" + digits[1:] # Российский номер через 8 приводим к коду страны
+    return digits
+
+
+def canonical_phone(phone):
+    """
+    Телефон в едином виде для хранения: '+' и цифры с кодом страны ('8 (916) 123-45-67' -> '+79161234567').
+    Пустой телефон остается пустым; некорректный вызывает ValueError.
+    """
+    phone = phone.strip()
+    if not phone:
+        return ""
+    if phone[0] == "+" and phone.isascii() and phone[1:].isdigit():
+        digits = phone[1:] # Уже в едином виде - регулярные выражения не нужны
+        if PHONE_DIGITS[0] <= len(digits) <= PHONE_DIGITS[1]:
+            return phone
+    digits = normalize_phone(phone)
+    if not PHONE_RE.fullmatch(phone) or not PHONE_DIGITS[0] <= len(digits) <= PHONE_DIGITS[1]:
+        raise ValueError("некорректный телефон")
+    return "+" + digits
+
+
+def is_valid_email(email):
+    """Проверяет формат email (пустой email допустим)"""
+    return not email or EMAIL_RE.fullmatch(email) is not None
+
+
+def parse_price(value, allow_zero=False):
+    """
+    Цена из строки или числа: конечное положительное число, иначе ValueError.
+    allow_zero=True - допускается и 0 (для импорта: с ценой 0 программа сама создает товары-заглушки)
+    """
+    try:
+        price = float(value)
+    except (TypeError, ValueError):
+        raise ValueError("некорректная цена") from None
+    valid = price >= 0 if allow_zero else price > 0 # сравнение с NaN всегда ложно
+    if not valid or not math.isfinite(price):
+        raise ValueError("некорректная цена")
+    return price
+
+
+def parse_quantity(value):
+    """Количество: целое положительное число, иначе ValueError"""
+    try:
+        quantity = int(value)
+    except (TypeError, ValueError):
+        raise ValueError("некорректное количество") from None
+    if quantity <= 0:
+        raise ValueError("некорректное количество")
+    return quantity
+
+
+def _is_date(text):
+    if not DATE_RE.fullmatch(text):
+        return False
+    try:
+        date.fromisoformat(text)
+    except ValueError: # 2024-02-30 и подобные
+        return False
+    return True
+
+
+def parse_date(text):
+    """Дата в формате ГГГГ-ММ-ДД (существующая в календаре), иначе ValueError"""
+    text = text.strip()
+    if not _is_date(text):
+        raise ValueError("некорректная дата")
+    return text
+
+
+def batches(rows, size):
+    """Разбивает итератор строк на списки по size строк для проверки пачками"""
+    rows = iter(rows)
+    while batch := list(itertools.islice(rows, size)):
+        yield batch
+
+
+def check_customers(rows):
+    """
+    Проверяет строки клиентов (ФИО, Телефон, Email, Адрес).
+    Значение корректной строки - кортеж без лишних пробелов с телефоном в виде canonical_phone.
+    """
+    values, errors = [], []
+    email_match = EMAIL_RE.fullmatch
+    for row in rows:
+        error = None
+        if len(row) < 4: # минимум 4 колонки
+            error = "недостаточно колонок"
+        else:
+            name, phone, email, address = row[0].strip(), row[1].strip(), row[2].strip(), row[3].strip()
+            if not name or not (phone or email):
+                error = "нужны ФИО и email или телефон"
+            elif email and email_match(email) is None:
+                error = "некорректный email"
+            elif phone:
+                try:
+                    phone = canonical_phone(phone)
+                except ValueError as e:
+                    error = str(e)
+        if error is None:
+            values.append((name, phone, email, address))
+            errors.append(None)
+        else:
+            values.append(None)
+            errors.append(error)
+    return values, errors
+
+
+def check_products(rows):
+    """Проверяет строки товаров (Название, Цена); значение корректной строки - (название, цена)"""
+    values, errors = [], []
+    for row in rows:
+        if len(row) < 2: # минимум 2 колонки
+            values.append(None)
+            errors.append("недостаточно колонок")
+            continue
+        name = row[0].strip()
+        if not name:
+            values.append(None)
+            errors.append("не указано название")
+            continue
+        try:
+            values.append((name, parse_price(row[1], allow_zero=True)))
+            errors.append(None)
+        except ValueError as e:
+            values.append(None)
+            errors.append(str(e))
+    return values, errors
+
+
+def check_orders(rows):
+    """
+    Проверяет строки заказов (ID клиента, ID товара, дата[, количество[, цена за единицу]]).
+    Значение корректной строки - (id клиента, id товара, дата, количество, цена или None).
+    """
+    values, errors = [], []
+    known_dates = {} # Каждая различная дата проверяется один раз на пачку
+    for row in rows:
+        error = None
+        if len(row) < 3: # минимум 3 колонки
+            error = "недостаточно колонок"
+        else:
+            try:
+                customer_id, product_id = int(row[0]), int(row[1])
+                if customer_id <= 0 or product_id <= 0:
+                    raise ValueError
+            except ValueError:
+                error = "ID клиента и товара должны быть целыми положительными числами"
+            else:
+                try:
+                    # Необязательные колонки: количество (по умолчанию 1) и цена за единицу
+                    quantity = parse_quantity(row[3]) if len(row) > 3 and str(row[3]).strip() else 1
+                    unit_price = parse_price(row[4], allow_zero=True) if len(row) > 4 and str(row[4]).strip() else None
+                except ValueError:
+                    error = "некорректное количество или цена"
+                else:
+                    day = row[2].strip()
+                    valid = known_dates.get(day)
+                    if valid is None:
+                        valid = known_dates[day] = _is_date(day)
+                    if not valid:
+                        error = "некорректная дата, нужен формат ГГГГ-ММ-ДД"
+        if error is None:
+            values.append((customer_id, product_id, day, quantity, unit_price))
+            errors.append(None)
+        else:
+            values.append(None)
+            errors.append(error)
+    return values, errors